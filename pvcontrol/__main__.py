@@ -36,7 +36,23 @@ logger.info(f"config:  {args.config}")
 logger.info(f"hostname:{args.hostname}")
 logger.info(f"Running on {platform.machine()} / {sys.platform}")
 config = json.loads(args.config)
-for c in ["wallbox", "meter", "car", "controller", "relay", "mqtt"]:
+for c in [
+    "wallbox",
+    "meter",
+    "car",
+    "controller",
+    "relay",
+    "mqtt",
+    "trace",
+    "loop_monitor",
+    "profiler",
+    "http",
+    "loadbalancer",
+    "forecast",
+    "tariff",
+    "ledger",
+    "checkpoint",
+]:
     if c not in config:
         config[c] = {}
 
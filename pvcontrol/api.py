@@ -1,15 +1,28 @@
+import asyncio
 import logging
-from typing import Annotated
+import secrets
+from datetime import datetime, time
+from typing import Annotated, Any, Literal
 
-from fastapi import APIRouter, Body, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, Field
 
 from pvcontrol import dependencies
 from pvcontrol.car import CarConfigTypes, CarData
 from pvcontrol.chargecontroller import ChargeControllerConfig, ChargeControllerData, ChargeMode, PhaseMode, Priority
+from pvcontrol.forecast import PvForecastData
+from pvcontrol.ledger import ChargingSession, EnergyTotals, Period
+from pvcontrol.loadbalancer import ChargePointData, LoadBalancerConfig, LoadBalancerData
+from pvcontrol.loopmonitor import BlockedLoop
 from pvcontrol.meter import MeterConfigTypes, MeterData
+from pvcontrol.planner import ChargePlanData, TariffPlanData
+from pvcontrol.profiler import ProfilerBusyError
 from pvcontrol.relay import PhaseRelayConfig, PhaseRelayData
 from pvcontrol.service import BaseConfig, BaseData, BaseService
+from pvcontrol.tariff import PriceData, PriceProviderConfigTypes
+from pvcontrol.timing import CycleTiming
 from pvcontrol.wallbox import CarStatus, SimulatedWallbox, WallboxConfigTypes, WallboxData
 
 logger = logging.getLogger(__name__)
@@ -67,6 +80,8 @@ async def put_controller_desired_mode(mode: Annotated[ChargeMode, Body()]) -> No
     - **OFF**, **MAX**: charge controller switches to selected mode without further controlling charging power.
     - **PV_ONLY**, **PV_ALL**: charge controller starts controlling charging power according to selected mode.
     - **MANUAL**: charge controller stops controlling charging power, last wallbox power setting is kept.
+    - **PLANNED**: charge controller charges the car to the target SOC until departure time, see `/controller/plan`.
+    - **TARIFF**: like PLANNED but grid energy is charged in the cheapest price slots of the dynamic tariff, see `/controller/tariff`.
     """
     dependencies.controller.set_desired_mode(mode)
 
@@ -83,6 +98,112 @@ async def put_controller_desired_priority(prio: Annotated[Priority, Body()]) ->
     dependencies.controller.set_desired_priority(prio)
 
 
+class PlanTarget(BaseModel):
+    target_soc: Annotated[float, Field(ge=0, le=100)]  # [%]
+    departure_time: time
+
+
+@router.get("/controller/plan")
+async def get_controller_plan() -> ChargePlanData:
+    """
+    Return the charge plan for mode PLANNED. The plan is re-calculated every control cycle while mode PLANNED is active.
+    """
+    return dependencies.controller.get_plan()
+
+
+# curl -X PUT http://localhost:8080/api/pvcontrol/controller/plan -H 'Content-Type: application/json' --data '{"target_soc": 80, "departure_time": "07:00"}'
+@router.put("/controller/plan", status_code=204)
+async def put_controller_plan(target: PlanTarget) -> None:
+    dependencies.controller.set_plan_target(target.target_soc, target.departure_time)
+
+
+@router.get("/controller/tariff")
+async def get_controller_tariff() -> TariffPlanData:
+    """
+    Return the charge schedule for mode TARIFF (target SOC and departure time of `/controller/plan`).
+    The schedule is re-calculated every control cycle while mode TARIFF is active.
+    """
+    return dependencies.controller.get_tariff_plan()
+
+
+@router.get("/tariff")
+async def get_tariff() -> ServiceResponse[PriceProviderConfigTypes, PriceData]:
+    """
+    Return the grid prices of the dynamic tariff.
+    """
+    if dependencies.price_provider is None:
+        raise HTTPException(status_code=404, detail="Dynamic tariff is disabled, configure tariff.type to enable it.")
+    return ServiceResponse[PriceProviderConfigTypes, PriceData](dependencies.price_provider)
+
+
+@router.get("/forecast")
+async def get_forecast() -> PvForecastData:
+    """
+    Return the PV forecast for the next 24h, learned from the PV history of the last days (no weather service).
+    """
+    return dependencies.forecaster.get_forecast(datetime.now())
+
+
+@router.get("/ledger/sessions")
+async def get_ledger_sessions(n: Annotated[int, Query(ge=1)] = 10) -> list[ChargingSession]:
+    """
+    Return the last n charging sessions (plug-in to unplug) incl. the session in progress, newest first.
+    """
+    return dependencies.ledger.get_sessions(n)
+
+
+@router.get("/ledger/totals")
+async def get_ledger_totals(period: Period = "day") -> list[EnergyTotals]:
+    """
+    Return charged energy, PV/grid share and cost of all sessions per day, month or year, oldest first.
+    """
+    return dependencies.ledger.get_totals(period)
+
+
+@router.get("/debug/cycles")
+async def get_debug_cycles(n: Annotated[int, Query(ge=1)] = 10) -> list[CycleTiming]:
+    """
+    Return the timing breakdown (stages, wallbox commands, outbound HTTP/Modbus requests) of the last n control cycles, newest first.
+    """
+    return dependencies.controller.get_cycle_timings(n)
+
+
+@router.get("/debug/blocked")
+async def get_debug_blocked() -> list[BlockedLoop]:
+    """
+    Return the stacks of code that blocked the event loop for more than loop_monitor.threshold seconds, newest first.
+    """
+    if dependencies.loop_monitor is None:
+        raise HTTPException(status_code=404, detail="Event loop monitor is disabled, configure loop_monitor.enabled to enable it.")
+    return dependencies.loop_monitor.get_blocked()
+
+
+def check_debug_token(credentials: Annotated[HTTPAuthorizationCredentials | None, Depends(HTTPBearer(auto_error=False))]) -> None:
+    token = dependencies.profiler.get_config().token
+    if not token:
+        raise HTTPException(status_code=403, detail="Profiler is disabled, configure profiler.token to enable it.")
+    if credentials is None or not secrets.compare_digest(credentials.credentials.encode(), token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+
+
+# curl -H "Authorization: Bearer $TOKEN" "http://localhost:8080/api/pvcontrol/debug/profile?seconds=30&format=speedscope" > profile.json
+@router.get("/debug/profile", dependencies=[Depends(check_debug_token)], response_model=None)
+async def get_debug_profile(
+    seconds: Annotated[float, Query(gt=0)] = 10, format: Literal["collapsed", "speedscope"] = "collapsed"
+) -> PlainTextResponse | dict[str, Any]:
+    """
+    Sample the stacks of all threads incl. the event loop for the given number of seconds (limited by profiler.max_seconds).
+    Returns collapsed stacks (flamegraph.pl, speedscope) or speedscope JSON. Only one profile can run at a time.
+    """
+    try:
+        profile = await asyncio.to_thread(dependencies.profiler.run, seconds)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    if format == "speedscope":
+        return profile.speedscope()
+    return PlainTextResponse(profile.collapsed())
+
+
 @router.get("/meter")
 async def get_meter() -> ServiceResponse[MeterConfigTypes, MeterData]:
     return ServiceResponse[MeterConfigTypes, MeterData](dependencies.meter)
@@ -93,6 +214,55 @@ async def get_wallbox() -> ServiceResponse[WallboxConfigTypes, WallboxData]:
     return ServiceResponse[WallboxConfigTypes, WallboxData](dependencies.wallbox)
 
 
+class ChargePointResponse(BaseModel):
+    type: str
+    charge_point: ChargePointData
+    wallbox: WallboxData
+
+
+class LoadBalancerResponse(BaseModel):
+    config: LoadBalancerConfig
+    data: LoadBalancerData
+    wallboxes: list[ChargePointResponse]
+
+
+def _load_balancer():
+    if dependencies.load_balancer is None:
+        raise HTTPException(status_code=404, detail="Load balancer is disabled, configure loadbalancer.wallboxes to enable it.")
+    return dependencies.load_balancer
+
+
+@router.get("/wallboxes")
+async def get_wallboxes() -> LoadBalancerResponse:
+    """
+    Return the load balancer state and per wallbox data (allocated current, mode, wallbox data) in order of priority.
+    """
+    lb = _load_balancer()
+    return LoadBalancerResponse(
+        config=lb.get_config(),
+        data=lb.get_data(),
+        wallboxes=[
+            ChargePointResponse(type=type(cp.wallbox).__name__, charge_point=cp.data, wallbox=cp.wallbox.get_data())
+            for cp in lb.get_charge_points()
+        ],
+    )
+
+
+# curl -X PUT http://localhost:8080/api/pvcontrol/wallboxes/garage/mode -H 'Content-Type: application/json' --data '"PV_ONLY"'
+@router.put("/wallboxes/{name}/mode", status_code=204)
+async def put_wallbox_mode(name: str, mode: Annotated[ChargeMode, Body()]) -> None:
+    """
+    Set the charge mode of a load balanced wallbox: **OFF**, **PV_ONLY** (share PV surplus) or **MAX** (up to the phase current limit).
+    """
+    lb = _load_balancer()
+    try:
+        lb.set_mode(name, mode)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown wallbox: {name}") from e
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+
 # for testing only: SimulatedWallbox
 # curl -X PUT http://localhost:8080/api/pvcontrol/wallbox/car_status -H 'Content-Type: application/json' --data 1..4
 # 1=NoVehicle, 2=Charging, 3=WaitingForVehicle, 4=ChargingFinished
@@ -1,33 +1,53 @@
+import asyncio
 import logging
+import re
+import time
+from contextlib import suppress
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from typing import Any, override
 
-from aiohttp import ClientSession
+from aiohttp import ClientResponseError, ClientSession
 from myskoda import MySkoda
-from myskoda.models.charging import Charging
+from myskoda.auth.authorization import (
+    AuthorizationError,
+    AuthorizationFailedError,
+    InvalidStatusError,
+    NotAuthorizedError,
+    TokenExpiredError,
+)
 from myskoda.models.health import Health
 from prometheus_client import Counter, Gauge
 
+from pvcontrol.httpclient import HttpClientFactory
+from pvcontrol.scheduler import AdaptiveAsyncScheduler
 from pvcontrol.service import BaseConfig, BaseData, BaseService
+from pvcontrol.wallbox import CarStatus, WallboxData
 
 logger = logging.getLogger(__name__)
 
 type CarConfigTypes = CarConfig | SkodaCarConfig
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CarData(BaseData):
     data_captured_at: datetime = datetime.min
     soc: float = 0  # [%] state of charge
     cruising_range: int = 0  # [km]
     mileage: int = 0  # [km]
+    estimated_soc: float = 0  # [%] soc estimated from wallbox charged energy since last car data
+    estimated_soc_confidence: float = 0  # [0..1], 0 = no estimation available
 
 
 @dataclass
 class CarConfig(BaseConfig):
-    cycle_time: int = 5 * 60  # [s] cycle time for reading car data, used by scheduler
+    cycle_time: int = 5 * 60  # [s] cycle time for reading car data when car is connected but not charging, used by scheduler
+    cycle_time_charging: int = 60  # [s] cycle time for reading car data while charging
+    cycle_time_max: int = 4 * 60 * 60  # [s] max cycle time when no vehicle is connected (exponential back-off from cycle_time)
+    max_requests_per_day: int = 1000  # budget for car data requests per day, 0 = unlimited
     energy_one_percent_soc: int = 580  # [Wh]
+    charging_efficiency: float = 0.9  # share of wallbox charged energy that ends up in the car battery
+    soc_estimation_rel_error: float = 0.1  # assumed relative error of the estimated soc increase, used for confidence
 
 
 class Car[C: CarConfig](BaseService[C, CarData]):
@@ -37,15 +57,29 @@ class Car[C: CarConfig](BaseService[C, CarData]):
     _metrics_pvc_car_range: Gauge = Gauge("pvcontrol_car_cruising_range_meters", "Remaining cruising range")
     _metrics_pvc_car_mileage: Gauge = Gauge("pvcontrol_car_mileage_meters", "Mileage")
     _metrics_pvc_car_energy_consumption: Counter = Counter("pvcontrol_car_energy_consumption_wh", "Energy Consumption")
+    _metrics_pvc_car_estimated_soc: Gauge = Gauge("pvcontrol_car_estimated_soc_ratio", "Estimated State of Charge")
 
     def __init__(self, config: C):
         super().__init__(config, CarData())
         self._last_soc: float = 0
+        # soc estimation: authoritative soc from car + energy charged since then
+        self._soc_anchor: CarData | None = None
+        self._charged_energy_since_anchor: float = 0.0  # [Wh]
+        self._last_charged_energy: float | None = None  # [Wh] last wallbox charged_energy, None = not initialized
 
     async def read_data(self) -> CarData:
         """Read meter data and report metrics. The data is cached."""
         d = await self._read_data()
-        self._set_data(d)
+        if (
+            self.get_error_counter() == 0
+            and d.data_captured_at != datetime.min
+            and (self._soc_anchor is None or d.data_captured_at != self._soc_anchor.data_captured_at or d.soc != self._soc_anchor.soc)
+        ):
+            # fresh car data -> re-anchor soc estimation
+            self._soc_anchor = d
+            self._charged_energy_since_anchor = 0.0
+        self._set_data(d.replace(**self._estimate_soc()))
+        d = self.get_data()
         Car._metrics_pvc_car_soc.set(d.soc / 100)
         Car._metrics_pvc_car_range.set(d.cruising_range * 1000)
         Car._metrics_pvc_car_mileage.set(d.mileage * 1000)
@@ -58,6 +92,29 @@ class Car[C: CarConfig](BaseService[C, CarData]):
     async def _read_data(self) -> CarData:
         return self.get_data()
 
+    def update_soc_estimation(self, wb: WallboxData) -> CarData:
+        """Integrate energy charged by the wallbox since the last car data. Called every controller cycle."""
+        if wb.error == 0:
+            if self._last_charged_energy is not None:
+                energy_inc = wb.charged_energy - self._last_charged_energy
+                # charged_energy is reset when a new charging session starts
+                if energy_inc < -1.0:
+                    energy_inc = wb.charged_energy
+                self._charged_energy_since_anchor += max(energy_inc, 0.0)
+            self._last_charged_energy = wb.charged_energy
+        return self._update_data(**self._estimate_soc())
+
+    def _estimate_soc(self) -> dict[str, float]:
+        if self._soc_anchor is None or self.get_error_counter() != 0:
+            return {"estimated_soc": 0, "estimated_soc_confidence": 0}
+        config = self.get_config()
+        soc_inc = self._charged_energy_since_anchor * config.charging_efficiency / config.energy_one_percent_soc
+        estimated_soc = min(self._soc_anchor.soc + soc_inc, 100)
+        # uncertainty [%] grows with the estimated soc increase, 10% uncertainty = confidence 0
+        confidence = max(1 - soc_inc * config.soc_estimation_rel_error / 10, 0)
+        Car._metrics_pvc_car_estimated_soc.set(estimated_soc / 100)
+        return {"estimated_soc": estimated_soc, "estimated_soc_confidence": confidence}
+
 
 class SimulatedCar(Car[CarConfig]):
     def __init__(self, config: CarConfig):
@@ -89,28 +146,57 @@ class SkodaCarConfig(CarConfig):
     vin: str = ""
     timeout: int = 10  # request timeout
     disabled: bool = False
+    health_cache_time: int = 6 * 60 * 60  # [s] mileage changes slowly -> read health data less often than charging data
+    retry_backoff_min: int = 60  # [s] initial back-off after errors
+    retry_backoff_max: int = 60 * 60  # [s] max back-off after repeated errors
+
+
+def _is_auth_error(e: BaseException) -> bool:
+    """Only auth errors require a new login, other errors (timeouts, 5xx) are retried with the existing session."""
+    if isinstance(e, ClientResponseError):
+        return e.status in (401, 403)
+    if isinstance(e, InvalidStatusError):
+        # status is only available in the message: "Received invalid HTTP status code 401."
+        status = re.search(r"\b(\d{3})\b", str(e))
+        return status is not None and status.group(1) in ("401", "403")
+    return isinstance(e, (AuthorizationError, AuthorizationFailedError, NotAuthorizedError, TokenExpiredError))
 
 
 # myskoda lib uses asyncio, so it assumes a running event loop
 class SkodaCar(Car[SkodaCarConfig]):
+    _metrics_pvc_car_logins: Counter = Counter("pvcontrol_car_logins_total", "Number of logins to the car cloud API")
+
     def __init__(self, config: SkodaCarConfig):
         super().__init__(config)
         self._session: ClientSession | None = None
         self._myskoda: MySkoda | None = None
+        self._health: Health | None = None
+        self._health_read_at: float = 0  # time.monotonic() of last health read
+        self._retry_backoff: float = 0  # [s] current back-off, 0 = no error
+        self._retry_at: float = 0  # time.monotonic() when next request is allowed
 
     @override
     async def _read_data(self) -> CarData:
         if self.get_config().disabled:
             self.inc_error_counter()
             return CarData()
+        if time.monotonic() < self._retry_at:
+            logger.debug("Skip reading car data during back-off")
+            return self.get_data()
 
         try:
             if self._myskoda is None:
                 self._myskoda = await self._connect()
 
             cfg = self.get_config()
-            charging: Charging = await self._myskoda.get_charging(cfg.vin)
-            health: Health = await self._myskoda.get_health(cfg.vin)
+            async with asyncio.timeout(cfg.timeout):
+                if self._health is None or time.monotonic() - self._health_read_at >= cfg.health_cache_time:
+                    charging, health = await asyncio.gather(self._myskoda.get_charging(cfg.vin), self._myskoda.get_health(cfg.vin))
+                    self._health = health
+                    self._health_read_at = time.monotonic()
+                else:
+                    charging = await self._myskoda.get_charging(cfg.vin)
+                    health = self._health
 
             soc = 0
             cruising_range = 0
@@ -129,6 +215,8 @@ class SkodaCar(Car[SkodaCarConfig]):
             else:
                 mileage = 0
             self.reset_error_counter()
+            self._retry_backoff = 0
+            self._retry_at = 0
             return CarData(
                 error=0,
                 data_captured_at=car_captured_timestamp,
@@ -139,26 +227,109 @@ class SkodaCar(Car[SkodaCarConfig]):
         except Exception as e:
             logger.error(repr(e))
             self.inc_error_counter()
-            await self.disconnect()  # enforce reconnection
+            cfg = self.get_config()
+            self._retry_backoff = min(max(2 * self._retry_backoff, cfg.retry_backoff_min), cfg.retry_backoff_max)
+            self._retry_at = time.monotonic() + self._retry_backoff
+            if _is_auth_error(e):
+                await self.disconnect()  # enforce reconnection
 
         return self.get_data()
 
     async def _connect(self) -> MySkoda:
         cfg = self.get_config()
-        self._session = ClientSession()
-        self._myskoda = MySkoda(self._session, mqtt_enabled=False)
-        await self._myskoda.connect(cfg.user, cfg.password)
-        return self._myskoda
+        if self._session is None:
+            self._session = HttpClientFactory.newSession()
+        myskoda = MySkoda(self._session, mqtt_enabled=False)
+        SkodaCar._metrics_pvc_car_logins.inc()
+        await myskoda.connect(cfg.user, cfg.password)
+        return myskoda
 
     async def disconnect(self):
+        self._health = None
         if self._myskoda:
-            await self._myskoda.disconnect()
+            with suppress(Exception):
+                await self._myskoda.disconnect()
             self._myskoda = None
         if self._session:
             await self._session.close()
             self._session = None
 
 
+class CarPoller:
+    """
+    Adaptive polling of car data driven by the wallbox state:
+    - poll every cycle_time_charging while charging
+    - poll every cycle_time while a car is connected but not charging
+    - exponential back-off up to cycle_time_max while no vehicle is connected
+    - immediate poll when the car gets plugged in or out
+    - at most max_requests_per_day polls per day
+    """
+
+    _metrics_pvc_car_requests: Counter = Counter("pvcontrol_car_requests_total", "Number of car data requests")
+    _metrics_pvc_car_poll_interval: Gauge = Gauge("pvcontrol_car_poll_interval_seconds", "Current car polling interval")
+
+    def __init__(self, car: Car[Any]):
+        self._car: Car[Any] = car
+        self._car_status: CarStatus | None = None  # last known wallbox car status, None = unknown
+        self._backoff: int = 1  # multiplier for cycle_time while no vehicle is connected
+        self._requests_day: date = date.today()
+        self._requests: int = 0  # requests on _requests_day
+        self._scheduler: AdaptiveAsyncScheduler = AdaptiveAsyncScheduler(self.next_interval, self.poll)
+
+    async def start(self) -> None:
+        await self._scheduler.start()
+
+    async def stop(self) -> None:
+        await self._scheduler.stop()
+
+    def on_wallbox_data(self, wb: WallboxData) -> None:
+        """Called every controller cycle. Updates the soc estimation and triggers an immediate poll on plug-in/plug-out."""
+        self._car.update_soc_estimation(wb)
+        if wb.error != 0:
+            return
+        old_status = self._car_status
+        self._car_status = wb.car_status
+        if old_status is not None and (old_status == CarStatus.NoVehicle) != (wb.car_status == CarStatus.NoVehicle):
+            logger.info(f"Car status changed {old_status.name} -> {wb.car_status.name}, trigger car data refresh")
+            self._backoff = 1
+            self._scheduler.trigger()
+
+    def next_interval(self) -> float:
+        """Time until next poll [s] depending on wallbox state and request budget."""
+        config = self._car.get_config()
+        if self._is_budget_exhausted():
+            tomorrow = datetime.combine(self._requests_day + timedelta(days=1), datetime.min.time())
+            interval = (tomorrow - datetime.now()).total_seconds()
+        elif self._car_status == CarStatus.Charging:
+            interval = config.cycle_time_charging
+        elif self._car_status == CarStatus.NoVehicle:
+            interval = min(config.cycle_time * self._backoff, config.cycle_time_max)
+        else:
+            interval = config.cycle_time
+        CarPoller._metrics_pvc_car_poll_interval.set(interval)
+        return interval
+
+    async def poll(self) -> None:
+        if self._is_budget_exhausted():
+            logger.warning(f"Car request budget exhausted: {self._requests} requests on {self._requests_day}")
+            return
+        self._requests += 1
+        CarPoller._metrics_pvc_car_requests.inc()
+        await self._car.read_data()
+        if self._car_status == CarStatus.NoVehicle:
+            self._backoff = min(2 * self._backoff, max(self._car.get_config().cycle_time_max // self._car.get_config().cycle_time, 1))
+        else:
+            self._backoff = 1
+
+    def _is_budget_exhausted(self) -> bool:
+        today = date.today()
+        if today != self._requests_day:
+            self._requests_day = today
+            self._requests = 0
+        budget = self._car.get_config().max_requests_per_day
+        return budget > 0 and self._requests >= budget
+
+
 class CarFactory:
     @classmethod
     def newCar(cls, type: str, **kwargs: Any) -> Car[Any]:
@@ -1,86 +1,269 @@
-import enum
+import asyncio
 import logging
 import math
+from collections import deque
+from collections.abc import Callable
 from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from time import monotonic
 from typing import Any
 
 import prometheus_client
-from prometheus_client import Counter, Enum
-
+from prometheus_client import Counter, Enum, Gauge
+
+from pvcontrol.car import Car
+from pvcontrol.controllerconfig import (
+    ChargeControllerConfig,
+    ChargeControllerData,
+    ChargeMode,
+    PhaseMode,
+    PhaseSwitchState,
+    Priority,
+)
+from pvcontrol.forecast import ForecastConfig, PvForecaster
 from pvcontrol.meter import Meter, MeterData
+from pvcontrol.planner import ChargePlanData, ChargePlanner, TariffPlanData, TariffPlanner
 from pvcontrol.relay import PhaseRelay
-from pvcontrol.service import BaseConfig, BaseData, BaseService
+from pvcontrol.service import BaseService
+from pvcontrol.strategy import ChargeStrategy, StrategyInput, new_strategy
+from pvcontrol.tariff import PriceProvider
+from pvcontrol.timing import CycleTimer, CycleTiming, span
 from pvcontrol.wallbox import CarStatus, Wallbox, WallboxData, WbError
 
 logger = logging.getLogger(__name__)
 
 
-@enum.unique
-class ChargeMode(enum.StrEnum):
+class PhaseSwitchGovernor:
     """
-    Charge Controller operation mode:
-
-    - **OFF**: Indicates that charging is switched off and charge controller is passive.
-      When set, charge controller switches charging off and then doesn't interfere/control anymore.
-    - **MAX**: Indicates that charging runs on max power (1x or 3x max current) and charge controller is passive.
-      When set, charge controller switches charging on to max power and then doesn't interfere/control anymore.
-    - **MANUAL**: Indicates that charging is switched on and charge controller is passive. Charging power is controlled externally, e.g. by wallbox app.
-      When set, charge controller stops controlling charging power, last wallbox power setting is kept.
-    - **PV_ONLY**: Charge controller tries to use only PV for charging. Grid power is avoided even if this means switching off charging.
-    - **PV_ALL**: Charge controller tries to use all available PV for charging. Grid power is used to fill up so that all PV can be used.
+    Prevents too fast PV driven phase switching. A switch is only allowed when
+    - the surplus (1->3) or deficit (3->1) energy relative to the phase switch threshold, integrated over a sliding window,
+      exceeds phase_switch_energy
+    - the current phase state was kept for at least phase_switch_min_dwell_time
+    - less than phase_switch_max_per_day PV driven switches happened today
+    The sliding window is reset when the charge mode or phase mode changes, as the samples depend on the switch threshold of the mode.
     """
 
-    OFF = "OFF"
-    PV_ONLY = "PV_ONLY"
-    PV_ALL = "PV_ALL"
-    MAX = "MAX"  # 1/3x16A
-    MANUAL = "MANUAL"  # wallbox may be controlled via app
-
-
-@enum.unique
-class PhaseMode(enum.StrEnum):
-    DISABLED = "DISABLED"  # phase relay is not in operation
-    AUTO = "AUTO"  # PV switches between 1 and 3 phases
-    CHARGE_1P = "CHARGE_1P"
-    CHARGE_3P = "CHARGE_3P"
-
-
-@enum.unique
-class Priority(enum.StrEnum):
-    AUTO = "AUTO"  # balance between home battery and car
-    HOME_BATTERY = "HOME_BATTERY"  # load home battery before car
-    CAR = "CAR"  # load car before home battery
+    def __init__(self, config: ChargeControllerConfig):
+        self._config: ChargeControllerConfig = config
+        self._samples: deque[float] = deque(maxlen=max(config.phase_switch_energy_window // config.cycle_time, 1))
+        self._last_switch: datetime | None = None
+        self._switches_day: date | None = None
+        self._switches: int = 0
+        self._modes: tuple[ChargeMode, PhaseMode] | None = None
+
+    def set_modes(self, mode: ChargeMode, phase_mode: PhaseMode) -> None:
+        """Effective charge mode and phase mode of the current cycle, resets the sliding window on change."""
+        if self._modes != (mode, phase_mode):
+            self._modes = (mode, phase_mode)
+            self._samples.clear()
+
+    def add_sample(self, power_delta: float) -> None:
+        """Add available power minus switch threshold of the current phase state, one sample per control cycle."""
+        self._samples.append(power_delta)
+
+    def energy(self) -> float:
+        """Surplus (+) or deficit (-) energy [Wh] relative to the phase switch threshold within the sliding window."""
+        return sum(self._samples) * self._config.cycle_time / 3600
+
+    def get_switches(self, now: datetime) -> int:
+        if self._switches_day != now.date():
+            self._switches_day = now.date()
+            self._switches = 0
+        return self._switches
+
+    def allow_switch(self, now: datetime, phases: int) -> bool:
+        config = self._config
+        if config.phase_switch_energy_window > 0:
+            if len(self._samples) < (self._samples.maxlen or 1):
+                return False
+            energy = self.energy()
+            if (phases == 3 and energy < config.phase_switch_energy) or (phases == 1 and energy > -config.phase_switch_energy):
+                return False
+        if self._last_switch is not None and (now - self._last_switch).total_seconds() < config.phase_switch_min_dwell_time:
+            return False
+        if config.phase_switch_max_per_day > 0 and self.get_switches(now) >= config.phase_switch_max_per_day:
+            return False
+        return True
+
+    def switched(self, now: datetime, governed: bool) -> None:
+        """Phase relay was switched, governed = PV driven switch counting against the daily budget."""
+        self._last_switch = now
+        self._samples.clear()
+        if governed:
+            self._switches = self.get_switches(now) + 1
+
+
+class GridCurrentLimiter:
+    """
+    Keeps the grid current of every phase below max_phase_current (house main fuse) by limiting the charging current.
+    Available charging current = max_phase_current - current of all other consumers on the phases used for charging.
+    The requested charging current (by controller or user) is remembered, a reduced MANUAL setting is restored when possible.
+    """
 
+    _metrics_pvc_limit_available: Gauge = Gauge(
+        "pvcontrol_controller_current_limit_available_amperes", "Max charging current per phase within grid current limit"
+    )
+    _metrics_pvc_limit_throttled: Counter = Counter(
+        "pvcontrol_controller_current_limit_throttled_seconds_total", "Time charging current was reduced by grid current limit"
+    )
+    _metrics_pvc_limit_actions: Counter = Counter(
+        "pvcontrol_controller_current_limit_actions_total", "Charging current reductions by grid current limit", ["action"]
+    )
 
-@dataclass
-class ChargeControllerData(BaseData):
+    def __init__(self, config: ChargeControllerConfig):
+        self._config: ChargeControllerConfig = config
+        self.available: int | None = None  # [A] None = limit disabled
+        self.requested: int = 0  # [A] charging current requested by controller or user, 0 = off
+        self.limited_to: int | None = None  # [A] max_current set by the limiter, None = not reduced
+        self.switched_off: bool = False  # charging was switched off by the limiter
+        self._last_update: float = 0  # monotonic()
+
+    def update(self, m: MeterData, wb: WallboxData) -> int | None:
+        """Calculate the available charging current from the current meter and wallbox data, called by control cycle and fast loop."""
+        cfg = self._config
+        if cfg.max_phase_current <= 0:
+            return None
+        now = monotonic()
+        if self.is_throttled():
+            GridCurrentLimiter._metrics_pvc_limit_throttled.inc(now - self._last_update)
+        self._last_update = now
+        phases = wb.phases_out or wb.phases_in
+        charging_phases = (0, 1, 2) if phases > 1 else (cfg.wallbox_grid_phase - 1,)
+        car_current = wb.power / wb.phases_out / cfg.line_voltage if wb.phases_out > 0 else 0
+        grid = (m.current_l1, m.current_l2, m.current_l3)
+        others = max(grid[p] - car_current for p in charging_phases)
+        self.available = max(math.floor(cfg.max_phase_current - others), 0)
+        GridCurrentLimiter._metrics_pvc_limit_available.set(self.available)
+        return self.available
+
+    def is_throttled(self) -> bool:
+        return self.available is not None and self.requested > self.available
+
+    def blocks_charging(self, min_current: int) -> bool:
+        return self.available is not None and self.available < min_current
+
+    def limit(self, current: int, min_current: int) -> int:
+        """Current reduced to the available current, at least min_current (charging is switched off below)."""
+        if self.available is None or current <= self.available:
+            return current
+        return max(self.available, min_current)
+
+    def request_current(self, current: int, min_current: int) -> int:
+        """Remember the charging current requested by controller or user, returns the current to set within the limit."""
+        self.requested = current
+        limited = self.limit(current, min_current)
+        self.limited_to = limited if limited < current else None
+        return limited
+
+    def request_charging(self, on: bool, min_current: int) -> bool:
+        """Remember allow_charging requested by controller or user, returns False if charging must stay off due to the limit."""
+        if not on:
+            self.requested = 0
+            self.switched_off = False
+            return False
+        self.switched_off = self.blocks_charging(min_current)
+        return not self.switched_off
+
+    def count(self, action: str) -> None:
+        GridCurrentLimiter._metrics_pvc_limit_actions.labels(action).inc()
+
+
+class BatteryPriorityOptimizer:
     """
-    Charge controller data:
-    - mode: current charge mode, converges to desired_mode
-    - desired_mode: desired charge mode as set by user
-    - phase_mode: current phase mode
-    - priority: currently used priority for charging (HOME_BATTERY, CAR)
-    - desired_priority: priority as set by user (AUTO, HOME, CAR), used to decide whether to charge home battery or car first
+    Priority AUTO: the car may take the PV surplus as long as the remaining PV surplus of the day (PV forecast minus home consumption,
+    limited by the battery charging power) is enough to fill the home battery until sunset. The current forecast slot is not counted
+    as the car takes its surplus. Home consumption is smoothed over ~1h, the max battery charging power is learned from meter data.
     """
 
-    mode: ChargeMode = ChargeMode.OFF
-    desired_mode: ChargeMode = ChargeMode.OFF
-    phase_mode: PhaseMode = PhaseMode.AUTO
-    priority: Priority = Priority.AUTO
-    desired_priority: Priority = Priority.AUTO
-
+    def __init__(self, config: ChargeControllerConfig, forecaster: PvForecaster):
+        self._config: ChargeControllerConfig = config
+        self._forecaster: PvForecaster = forecaster
+        self._home_power: float | None = None  # [W] smoothed home consumption (without car), None = no data yet
+        self._battery_charge_power: float = config.battery_max_charge_power  # [W]
+
+    def add_sample(self, m: MeterData, wb: WallboxData) -> None:
+        cfg = self._config
+        home = m.power_consumption - wb.power
+        if self._home_power is None:
+            self._home_power = home
+        else:
+            self._home_power += min(cfg.cycle_time / 3600, 1) * (home - self._home_power)
+        if cfg.battery_max_charge_power <= 0:
+            self._battery_charge_power = max(self._battery_charge_power, -m.power_battery)
+
+    def battery_energy(self, now: datetime) -> float:
+        """PV energy [Wh] that can be charged into the home battery from the next forecast slot until end of day."""
+        slot_time = self._forecaster.get_config().slot_time
+        seconds = now.hour * 3600 + now.minute * 60 + now.second
+        t = now + timedelta(seconds=slot_time - seconds % slot_time, microseconds=-now.microsecond)
+        end = datetime.combine(now.date(), time(), now.tzinfo) + timedelta(days=1)
+        energy = 0.0
+        while t < end:
+            energy += min(self.pv_surplus(t), self._battery_charge_power) * slot_time / 3600
+            t += timedelta(seconds=slot_time)
+        return energy
+
+    def pv_surplus(self, t: datetime) -> float:
+        """Forecasted PV surplus [W] for the time slot of t: PV forecast minus smoothed home consumption."""
+        return max(self._forecaster.forecast(t) - (self._home_power or 0), 0)
+
+    def priority(self, now: datetime, soc_battery: float, current: Priority) -> Priority | None:
+        """CAR or HOME_BATTERY, None if battery capacity, charging power or PV forecast is unknown."""
+        cfg = self._config
+        if cfg.battery_capacity <= 0 or self._home_power is None or self._battery_charge_power <= 0:
+            return None
+        if self._forecaster.learned_slots() == 0:
+            return None
+        needed = max(100 - soc_battery, 0) / 100 * cfg.battery_capacity
+        available = self.battery_energy(now)
+        # hysteresis: switch to CAR with margin, back to HOME_BATTERY when it gets tight
+        if current == Priority.CAR:
+            return Priority.CAR if available >= needed else Priority.HOME_BATTERY
+        return Priority.CAR if available >= needed * cfg.prio_auto_energy_margin else Priority.HOME_BATTERY
+
+
+@dataclass(frozen=True, slots=True)
+class ControllerCycle:
+    """Inputs and outputs of one control cycle, used for decision traces and replay (see trace.py)."""
+
+    time: datetime
+    # inputs
+    meter: MeterData
+    wallbox: WallboxData
+    car_soc: float | None  # soc used for planning, None = unknown
+    desired_mode: ChargeMode
+    desired_priority: Priority
+    phase_mode: PhaseMode
+    pv_allow_charging_delay: int
+    charge_mode_pv_to_off_delay: int
+    # outputs
+    data: ChargeControllerData
+    max_current: int | None = None  # wallbox commands issued, None = not issued
+    allow_charging: bool | None = None
+    phases_in: int | None = None
+    resets: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class ControllerState:
+    """
+    Controller state that survives a restart (see checkpoint.py):
+    - data: modes and priorities, a running phase switch sequence is not resumed
+    - target_soc, departure_time: charge plan target
+    - pv_allow_charging_*, charge_mode_pv_to_off_delay: delay timers [s]
+    - last_*: energy counter baselines for charged energy metrics [Wh]
+    """
 
-@dataclass
-class ChargeControllerConfig(BaseConfig):
-    cycle_time: int = 30  # [s] control loop cycle time, used by scheduler
-    enable_auto_phase_switching: bool = True  # automatic phase switching depending on available PV
-    enable_charging_when_connecting_car: ChargeMode = ChargeMode.OFF
-    line_voltage: float = 230  # [V]
-    current_rounding_offset: float = 0.1  # [A] offset for max_current rounding
-    power_hysteresis: float = 200  # [W] hysteresis for switching on/off and between 1 and 3 phases
-    pv_all_min_power: float = 500  # [W] min available power for charging in mode PV_ALL
-    pv_allow_charging_delay: int = 120  # [s] min stable allow_charging time before switching on/off (PV modes only)
-    prio_auto_soc_threshold: float = 50  # [%] threshold for switching between CAR and HOME_BATTERY prio in AUTO mode
+    data: ChargeControllerData
+    target_soc: float
+    departure_time: time
+    pv_allow_charging_value: bool
+    pv_allow_charging_delay: int
+    charge_mode_pv_to_off_delay: int
+    last_charged_energy: float | None
+    last_charged_energy_5m: float
+    last_energy_consumption: float
+    last_energy_consumption_grid: float
 
 
 # metrics - used as annotation -> can't move into class
@@ -102,11 +285,44 @@ class ChargeController(BaseService[ChargeControllerConfig, ChargeControllerData]
     )
 
     # hostname - optional parameter to enable/disable phase switching depending on where pvcontrol runs (k8s hostname)
-    def __init__(self, config: ChargeControllerConfig, meter: Meter[Any], wallbox: Wallbox[Any], relay: PhaseRelay):
+    def __init__(
+        self,
+        config: ChargeControllerConfig,
+        meter: Meter[Any],
+        wallbox: Wallbox[Any],
+        relay: PhaseRelay,
+        car: Car[Any] | None = None,
+        forecaster: PvForecaster | None = None,
+        price_provider: PriceProvider[Any] | None = None,
+    ):
         super().__init__(config, ChargeControllerData())
         self._meter: Meter[Any] = meter
         self._wallbox: Wallbox[Any] = wallbox
         self._relay: PhaseRelay = relay
+        self._car: Car[Any] | None = car
+        self._price_provider: PriceProvider[Any] | None = price_provider
+        self._now: Callable[[], datetime] = datetime.now  # replaceable for tests
+        self._forecaster: PvForecaster = forecaster or PvForecaster(ForecastConfig())
+        self._battery_optimizer: BatteryPriorityOptimizer = BatteryPriorityOptimizer(config, self._forecaster)
+        # planners use the PV surplus forecast of the battery optimizer (PV forecast minus smoothed home consumption)
+        pv_surplus = self._battery_optimizer.pv_surplus
+        self._planner: ChargePlanner = ChargePlanner(pv_surplus, config.planner_slot_time)
+        self._tariff_planner: TariffPlanner = TariffPlanner(pv_surplus, self._forecaster.get_config().slot_time)
+        self._tariff_plan: TariffPlanData = TariffPlanData()
+        self._phase_governor: PhaseSwitchGovernor = PhaseSwitchGovernor(config)
+        self._last_cycle: ControllerCycle | None = None
+        self._timer: CycleTimer = CycleTimer(config.timing_history)
+        self._commands: dict[str, Any] = {}  # wallbox commands issued in current cycle
+        self._limiter: GridCurrentLimiter = GridCurrentLimiter(config)
+        self._lock: asyncio.Lock = asyncio.Lock()  # control cycle vs. current limit fast loop
+        # phase switch sequence
+        self._phase_switch_from: int = 0
+        self._phase_switch_to: int = 0
+        self._phase_switch_governed: bool = False
+        self._phase_switch_deadline: datetime = datetime.min
+        self._plan: ChargePlanData = ChargePlanData(
+            target_soc=config.planner_target_soc, departure_time=time.fromisoformat(config.planner_departure_time)
+        )
         self._charge_mode_pv_to_off_delay: int = 5 * 60  # configurable?
         self._pv_allow_charging_value: bool = False
         self._pv_allow_charging_delay: int = 0
@@ -120,51 +336,135 @@ class ChargeController(BaseService[ChargeControllerConfig, ChargeControllerData]
             self.set_phase_mode(PhaseMode.DISABLED)
         self._min_supported_current: int = wallbox.get_config().min_supported_current
         self._max_supported_current: int = wallbox.get_config().max_supported_current
-        min_power_1phase = self._min_supported_current * config.line_voltage
-        max_power_1phase = self._max_supported_current * config.line_voltage
-        min_power_3phases = 3 * self._min_supported_current * config.line_voltage
-        self._pv_only_on: float = min_power_1phase + config.power_hysteresis
-        self._pv_only_off: float = min_power_1phase
-        self._pv_only_1_3_phase_threshold: float = min_power_3phases + config.power_hysteresis
-        self._pv_only_3_1_phase_threshold: float = min_power_3phases
-        self._pv_all_on: float = config.pv_all_min_power
-        self._pv_all_off: float = max(config.pv_all_min_power - config.power_hysteresis, 100)
-        self._pv_all_1_3_phase_threshold: float = max_power_1phase
-        self._pv_all_3_1_phase_threshold: float = max_power_1phase - config.power_hysteresis
+        self._strategies: dict[ChargeMode, ChargeStrategy] = {
+            mode: new_strategy(name, config, self._min_supported_current, self._max_supported_current)
+            for mode, name in ((ChargeMode.PV_ONLY, config.pv_only_strategy), (ChargeMode.PV_ALL, config.pv_all_strategy))
+        }
+        self._power_history: deque[float] = deque(maxlen=config.strategy_history)  # available power of previous cycles
         # init metrics with labels
         ChargeController._metrics_pvc_controller_charged_energy.labels("grid")
         ChargeController._metrics_pvc_controller_charged_energy.labels("pv")
 
     def set_desired_mode(self, mode: ChargeMode) -> None:
         logger.info(f"set_desired_mode: {self.get_data().desired_mode} -> {mode}")
-        self.get_data().desired_mode = mode
+        self._update_data(desired_mode=mode)
 
     def set_phase_mode(self, mode: PhaseMode) -> None:
         if not self._enable_phase_switching:
             mode = PhaseMode.DISABLED
-        self.get_data().phase_mode = mode
+        self._update_data(phase_mode=mode)
 
     def set_desired_priority(self, priority: Priority) -> None:
-        self.get_data().desired_priority = priority
+        self._update_data(desired_priority=priority)
+
+    def get_last_cycle(self) -> ControllerCycle | None:
+        return self._last_cycle
+
+    def get_cycle_timings(self, n: int) -> list[CycleTiming]:
+        return self._timer.get_cycles(n)
+
+    def get_forecaster(self) -> PvForecaster:
+        return self._forecaster
+
+    def get_plan(self) -> ChargePlanData:
+        return self._plan
+
+    def get_tariff_plan(self) -> TariffPlanData:
+        return self._tariff_plan
+
+    def get_price_provider(self) -> PriceProvider[Any] | None:
+        return self._price_provider
+
+    def get_state(self) -> ControllerState:
+        return ControllerState(
+            data=self.get_data(),
+            target_soc=self._plan.target_soc,
+            departure_time=self._plan.departure_time,
+            pv_allow_charging_value=self._pv_allow_charging_value,
+            pv_allow_charging_delay=self._pv_allow_charging_delay,
+            charge_mode_pv_to_off_delay=self._charge_mode_pv_to_off_delay,
+            last_charged_energy=self._last_charged_energy,
+            last_charged_energy_5m=self._last_charged_energy_5m,
+            last_energy_consumption=self._last_energy_consumption,
+            last_energy_consumption_grid=self._last_energy_consumption_grid,
+        )
+
+    def restore_state(self, state: ControllerState) -> None:
+        """
+        Restore state saved before a restart. Charging was switched off on shutdown: if PV control had allowed charging,
+        the allow charging delay is skipped to resume charging in the first cycle.
+        """
+        d = state.data
+        self._update_data(mode=d.mode, desired_mode=d.desired_mode, priority=d.priority, desired_priority=d.desired_priority)
+        self.set_phase_mode(d.phase_mode)
+        self._plan = self._plan.replace(target_soc=state.target_soc, departure_time=state.departure_time)
+        self._pv_allow_charging_value = state.pv_allow_charging_value
+        self._pv_allow_charging_delay = 0 if state.pv_allow_charging_value else state.pv_allow_charging_delay
+        self._charge_mode_pv_to_off_delay = state.charge_mode_pv_to_off_delay
+        self._last_charged_energy = state.last_charged_energy
+        self._last_charged_energy_5m = state.last_charged_energy_5m
+        self._last_energy_consumption = state.last_energy_consumption
+        self._last_energy_consumption_grid = state.last_energy_consumption_grid
+
+    def set_plan_target(self, target_soc: float, departure_time: time) -> None:
+        logger.info(f"set_plan_target: target_soc={target_soc}, departure_time={departure_time}")
+        self._plan = self._plan.replace(target_soc=target_soc, departure_time=departure_time)
 
     @_metrics_pvc_controller_processing.time()
     async def run(self) -> None:
         """Read charger data from wallbox and calculate set point"""
 
-        # read current state: order is important for simulation
-        wb = await self._wallbox.read_data()
-        m = await self._meter.read_data()
-
-        self._meter_charged_energy(m, wb)
-        self._control_charge_mode(wb)
-        self._control_priority(m)
-        # skip one cycle whe switching phases
-        if not await self._converge_phases(m, wb):
-            await self._control_charging(m, wb)
+        now = self._now()
+        async with self._lock:
+            with self._timer.cycle(now):
+                await self._run(now)
 
         # metrics
         ChargeController._metrics_pvc_controller_mode.state(self.get_data().mode)
 
+    async def _run(self, now: datetime) -> None:
+        # read current state: order is important for simulation
+        with span("wallbox_read"):
+            wb = await self._wallbox.read_data()
+        with span("meter_read"):
+            m = await self._meter.read_data()
+        self._limiter.update(m, wb)
+        ctl = self.get_data()
+        cycle_inputs: dict[str, Any] = dict(
+            time=now,
+            meter=m,
+            wallbox=wb,
+            car_soc=self._car_soc(),
+            desired_mode=ctl.desired_mode,
+            desired_priority=ctl.desired_priority,
+            phase_mode=ctl.phase_mode,
+            pv_allow_charging_delay=self._pv_allow_charging_delay,
+            charge_mode_pv_to_off_delay=self._charge_mode_pv_to_off_delay,
+        )
+        self._commands = {"resets": 0}
+
+        with span("energy"):
+            self._meter_charged_energy(m, wb)
+        with span("plan"):
+            self._update_plan(m, wb)
+        with span("mode"):
+            self._control_charge_mode(wb)
+            if m.error == 0 and wb.error == 0:
+                self._battery_optimizer.add_sample(m, wb)
+            self._control_priority(m)
+        # skip one cycle whe switching phases
+        with span("phases"):
+            converging = await self._converge_phases(m, wb)
+        if not converging:
+            with span("charging"):
+                await self._control_charging(m, wb)
+        with span("current_limit"):
+            await self._enforce_current_limit(wb)
+        if m.error == 0 and wb.error == 0:
+            self._power_history.append(self._available_power(m, wb))
+
+        self._last_cycle = ControllerCycle(data=self.get_data(), **cycle_inputs, **self._commands)
+
     def _meter_charged_energy(self, m: MeterData, wb: WallboxData):
         """Calculates energy charged into car by source and updates metrics."""
         if self._last_charged_energy is not None:
@@ -214,12 +514,109 @@ class ChargeController(BaseService[ChargeControllerConfig, ChargeControllerData]
         self._last_energy_consumption_grid = m.energy_consumption_grid
         self._last_charged_energy = wb.charged_energy
 
+    def _update_plan(self, m: MeterData, wb: WallboxData) -> None:
+        """Update PV forecast every cycle, re-plan in mode PLANNED and TARIFF."""
+        now = self._now()
+        if m.error == 0:
+            self._forecaster.add_sample(now, m.power_pv)
+        desired_mode = self.get_data().desired_mode
+        if desired_mode == ChargeMode.TARIFF:
+            self._update_tariff_plan(now, wb)
+        if desired_mode != ChargeMode.PLANNED:
+            return
+
+        config = self.get_config()
+        departure, soc, energy_needed = self._plan_target(now)
+        slots = self._planner.plan(
+            now,
+            departure,
+            energy_needed,
+            self._min_supported_current * config.line_voltage,
+            self._max_charging_power(wb),
+            config.pv_all_min_power,
+        )
+        self._plan = self._plan.replace(
+            departure=departure,
+            soc=soc if soc is not None else -1,
+            energy_needed=energy_needed,
+            energy_pv=sum((s.power_charging - s.power_grid) * s.hours() for s in slots),
+            energy_grid=sum(s.power_grid * s.hours() for s in slots),
+            slots=tuple(slots),
+        )
+
+    def _update_tariff_plan(self, now: datetime, wb: WallboxData) -> None:
+        """Re-plan mode TARIFF, the price ranking is rebuilt only when the price provider delivered new prices."""
+        prices = self._price_provider.get_data() if self._price_provider is not None else None
+        if prices is not None and self._tariff_planner.update_prices(prices.prices):
+            logger.info(f"Tariff: new prices from {prices.updated_at}")
+        config = self.get_config()
+        departure, soc, energy_needed = self._plan_target(now)
+        slots = self._tariff_planner.plan(
+            now,
+            departure,
+            energy_needed,
+            self._min_supported_current * config.line_voltage,
+            self._max_charging_power(wb),
+            config.tariff_max_price,
+        )
+        grid = [s.power_grid * s.hours() for s in slots]
+        self._tariff_plan = TariffPlanData(
+            departure=departure,
+            soc=soc if soc is not None else -1,
+            energy_needed=energy_needed,
+            energy_pv=sum((s.power_charging - s.power_grid) * s.hours() for s in slots),
+            energy_grid=sum(grid),
+            cost=sum(g / 1000 * s.price for g, s in zip(grid, slots, strict=True)),
+            prices_updated_at=prices.updated_at if prices is not None else datetime.min,
+            slots=tuple(slots),
+        )
+
+    def _plan_target(self, now: datetime) -> tuple[datetime, float | None, float]:
+        """Next departure, car SOC and energy needed [Wh] to reach the target SOC of the charge plan."""
+        departure = datetime.combine(now.date(), self._plan.departure_time)
+        if departure <= now:
+            departure += timedelta(days=1)
+        soc = self._car_soc()
+        energy_needed = 0.0  # unknown soc: don't use grid energy
+        if soc is not None and self._car is not None:
+            car_config = self._car.get_config()
+            energy_needed = max(self._plan.target_soc - soc, 0) * car_config.energy_one_percent_soc / car_config.charging_efficiency
+        return departure, soc, energy_needed
+
+    def _max_charging_power(self, wb: WallboxData) -> float:
+        phases = 3 if self._enable_phase_switching else max(wb.phases_in, 1)
+        return self._max_supported_current * self.get_config().line_voltage * phases
+
+    def _car_soc(self) -> float | None:
+        """Car SOC for planning: estimated SOC if available, None if unknown."""
+        if self._car is None:
+            return None
+        c = self._car.get_data()
+        if c.estimated_soc_confidence > 0:
+            return c.estimated_soc
+        if c.error == 0 and c.data_captured_at != datetime.min:  # datetime.min: car never read
+            return c.soc
+        return None
+
+    def _effective_mode(self) -> ChargeMode:
+        """Desired mode, in mode PLANNED and TARIFF the mode of the current plan slot."""
+        mode = self.get_data().desired_mode
+        if mode == ChargeMode.PLANNED:
+            return self._plan.slots[0].mode if self._plan.slots else ChargeMode.PV_ONLY
+        if mode == ChargeMode.TARIFF:
+            return self._tariff_plan.slots[0].mode if self._tariff_plan.slots else ChargeMode.PV_ONLY
+        return mode
+
     # TODO rename
     def _control_charge_mode(self, wb: WallboxData) -> None:
         ctl = self.get_data()
         # Switch to OFF when car gets unplugged (NoVehicle)
         # 5 min delay to allow PV mode before connecting car
-        if ctl.mode in [ChargeMode.PV_ONLY, ChargeMode.PV_ALL] and wb.error == 0 and wb.car_status == CarStatus.NoVehicle:
+        if (
+            ctl.mode in [ChargeMode.PV_ONLY, ChargeMode.PV_ALL, ChargeMode.PLANNED, ChargeMode.TARIFF]
+            and wb.error == 0
+            and wb.car_status == CarStatus.NoVehicle
+        ):
             self._charge_mode_pv_to_off_delay -= self.get_config().cycle_time
             if self._charge_mode_pv_to_off_delay <= 0:
                 self.set_desired_mode(ChargeMode.OFF)
@@ -238,35 +635,110 @@ class ChargeController(BaseService[ChargeControllerConfig, ChargeControllerData]
     def _control_priority(self, m: MeterData) -> Priority:
         config = self.get_config()
         priority = self.get_data().desired_priority
-        # priority AUTO: charge home battery until 50% and then prefer car
         if priority == Priority.AUTO:
-            priority = Priority.HOME_BATTERY if m.soc_battery < config.prio_auto_soc_threshold else Priority.CAR
-        self.get_data().priority = priority
+            # prefer car as long as the home battery gets full anyway, see BatteryPriorityOptimizer
+            optimized = self._battery_optimizer.priority(self._now(), m.soc_battery, self.get_data().priority)
+            if optimized is not None:
+                priority = optimized
+            else:
+                # charge home battery until 50% and then prefer car
+                priority = Priority.HOME_BATTERY if m.soc_battery < config.prio_auto_soc_threshold else Priority.CAR
+        self._update_data(priority=priority)
         return priority
 
-    # TODO: prevent too fast switching, use energy to grid and time instead of power
     async def _converge_phases(self, m: MeterData, wb: WallboxData) -> bool:
+        """Start or advance a phase switch, returns True while switching (= skip charging control)."""
+        if self.get_data().phase_switch != PhaseSwitchState.IDLE and await self._advance_phase_switch(wb):
+            return True
+
         if wb.error == 0 and wb.wb_error in [WbError.PHASE, WbError.PHASE_RELAY_ERR]:
             # may happen on raspberry reboot -> phase relay is switched off
             # TODO: back-off needed?
-            await self._wallbox.trigger_reset()
+            await self._trigger_reset()
             return True
 
         if self._enable_phase_switching:
             available_power = -m.power_grid + wb.power
             desired_phases = self._desired_phases(available_power, wb.phases_in)
+            threshold = self._phase_switch_threshold(wb.phases_in)
+            self._phase_governor.set_modes(self._effective_mode(), self.get_data().phase_mode)
+            if threshold is not None:
+                # PV driven phase switching, no samples from stale wallbox data
+                if wb.error == 0:
+                    self._phase_governor.add_sample(available_power - threshold)
+                if desired_phases != wb.phases_in and not self._phase_governor.allow_switch(self._now(), desired_phases):
+                    desired_phases = wb.phases_in
             if wb.error == 0 and desired_phases != wb.phases_in:
+                logger.info(f"Start phase switch {wb.phases_in} -> {desired_phases}")
+                self._phase_switch_from = wb.phases_in
+                self._phase_switch_to = desired_phases
+                self._phase_switch_governed = threshold is not None
+                self._set_phase_switch_state(PhaseSwitchState.CHARGING_OFF, self.get_config().phase_switch_timeout)
+                return await self._advance_phase_switch(wb)
+        return False
+
+    def _set_phase_switch_state(self, state: PhaseSwitchState, timeout: float = 0) -> None:
+        self._phase_switch_deadline = self._now() + timedelta(seconds=timeout)
+        self._update_data(phase_switch=state)
+
+    async def _advance_phase_switch(self, wb: WallboxData) -> bool:
+        """Advance the phase switch sequence as far as possible without waiting, returns False when done."""
+        while True:
+            state = self.get_data().phase_switch
+            now = self._now()
+            if state == PhaseSwitchState.CHARGING_OFF:
                 # switch phase relay only if charging is off
-                if wb.phases_out == 0:
-                    await self._wallbox.set_phases_in(desired_phases)
+                if wb.error == 0 and wb.phases_out == 0:
+                    self._set_phase_switch_state(PhaseSwitchState.RELAY_SWITCH)
+                elif now >= self._phase_switch_deadline:
+                    logger.warning(f"Phase switch {self._phase_switch_from} -> {self._phase_switch_to} aborted: charging not off")
+                    self._set_phase_switch_state(PhaseSwitchState.IDLE)
+                    return False
                 else:
-                    # charging off and wait one cylce
-                    await self._set_allow_charging(False, skip_delay=True)
+                    # charging off and wait one cycle
+                    await self._request_charging(False, skip_delay=True)
+                    return True
+            elif state == PhaseSwitchState.RELAY_SWITCH:
+                await self._set_phases_in(self._phase_switch_to)
+                self._phase_governor.switched(now, self._phase_switch_governed)
+                self._set_phase_switch_state(PhaseSwitchState.SETTLE, self._wallbox.get_config().switch_phases_reset_delay)
+            elif state == PhaseSwitchState.SETTLE:
+                if now < self._phase_switch_deadline:
+                    return True
+                self._set_phase_switch_state(PhaseSwitchState.RESET)
+            elif state == PhaseSwitchState.RESET:
+                await self._trigger_reset()
+                # verify with wallbox data of next cycle
+                self._set_phase_switch_state(PhaseSwitchState.VERIFY, self.get_config().phase_switch_timeout)
                 return True
-        return False
+            elif state == PhaseSwitchState.VERIFY:
+                relay_err = wb.error == 0 and wb.wb_error == WbError.PHASE_RELAY_ERR
+                if not relay_err and wb.error == 0 and wb.phases_in == self._phase_switch_to:
+                    logger.info(f"Phase switch {self._phase_switch_from} -> {self._phase_switch_to} done")
+                    self._set_phase_switch_state(PhaseSwitchState.IDLE)
+                    return False
+                if relay_err or now >= self._phase_switch_deadline:
+                    logger.error(
+                        f"Phase switch {self._phase_switch_from} -> {self._phase_switch_to} failed, rollback: "
+                        f"wb_error={wb.wb_error}, phases_in={wb.phases_in}"
+                    )
+                    await self._set_phases_in(self._phase_switch_from)
+                    await self._trigger_reset()
+                    self._set_phase_switch_state(PhaseSwitchState.IDLE)
+                return True
+            else:  # IDLE
+                return False
+
+    def _phase_switch_threshold(self, current_phases: int) -> float | None:
+        """Power threshold for leaving the current phase state, None if phases are not switched depending on PV."""
+        strategy = self._strategies.get(self._effective_mode())
+        if strategy is None or self.get_data().phase_mode != PhaseMode.AUTO or not self.get_config().enable_auto_phase_switching:
+            return None
+        to_3, to_1 = strategy.phase_thresholds()
+        return to_3 if current_phases == 1 else to_1
 
     def _desired_phases(self, available_power: float, current_phases: int):
-        mode = self.get_data().desired_mode
+        mode = self._effective_mode()
         phase_mode = self.get_data().phase_mode
 
         if phase_mode == PhaseMode.CHARGE_1P:
@@ -274,47 +746,30 @@ class ChargeController(BaseService[ChargeControllerConfig, ChargeControllerData]
         elif phase_mode == PhaseMode.CHARGE_3P:
             return 3
         else:  # AUTO
-            if mode == ChargeMode.PV_ONLY:
-                if not self.get_config().enable_auto_phase_switching:
-                    return 1
-                elif current_phases == 1:
-                    if available_power >= self._pv_only_1_3_phase_threshold:
-                        return 3
-                    else:
-                        return 1
-                else:
-                    if available_power >= self._pv_only_3_1_phase_threshold:
-                        return 3
-                    else:
-                        return 1
-            elif mode == ChargeMode.PV_ALL:
-                if not self.get_config().enable_auto_phase_switching:
+            if mode in self._strategies:
+                threshold = self._phase_switch_threshold(current_phases)
+                if threshold is None:
                     return 1
-                elif current_phases == 1:
-                    if available_power >= self._pv_all_1_3_phase_threshold:
-                        return 3
-                    else:
-                        return 1
-                else:
-                    if available_power >= self._pv_all_3_1_phase_threshold:
-                        return 3
-                    else:
-                        return 1
+                return 3 if available_power >= threshold else 1
             elif mode == ChargeMode.MAX:
                 return 3
             else:  # OFF, MANUAL
                 return current_phases
 
     async def _control_charging(self, m: MeterData, wb: WallboxData) -> None:
-        mode = self.get_data().desired_mode
+        desired_mode = self.get_data().desired_mode
+        planned = desired_mode in [ChargeMode.PLANNED, ChargeMode.TARIFF]
+        mode = self._effective_mode()
         if mode == ChargeMode.OFF:
-            await self._set_allow_charging(False, skip_delay=True)
+            await self._request_charging(False, skip_delay=True)
             self.set_desired_mode(ChargeMode.MANUAL)
         elif mode == ChargeMode.MAX:
-            await self._wallbox.set_max_current(self._max_supported_current)
-            await self._set_allow_charging(True, skip_delay=True)
-            self.set_desired_mode(ChargeMode.MANUAL)
+            await self._request_current(self._max_supported_current)
+            await self._request_charging(True, skip_delay=True)
+            if not planned:
+                self.set_desired_mode(ChargeMode.MANUAL)
         elif mode == ChargeMode.MANUAL:
+            await self._restore_current_limit(wb)
             # calc effective (manual) mode for UI
             if not wb.allow_charging:
                 mode = ChargeMode.OFF
@@ -327,33 +782,13 @@ class ChargeController(BaseService[ChargeControllerConfig, ChargeControllerData]
                 phases = wb.phases_in
             config = self.get_config()
 
-            priority = self.get_data().priority
-            if priority == Priority.CAR:
-                # Priority.CAR neither charge nor discharge home battery
-                available_power = -m.power_grid + wb.power - m.power_battery
-            else:  # Priority.HOME_BATTERY
-                available_power = -m.power_grid + wb.power
-                if m.power_battery > 0:
-                    # don't discharge home battery
-                    available_power -= m.power_battery
-                else:
-                    # TODO: reduce a little to allow home battery to increase charging power
-                    pass
-
-            if mode == ChargeMode.PV_ONLY:
-                if not wb.allow_charging and available_power < self._pv_only_on:
-                    max_current = 0
-                else:
-                    max_current = math.floor(available_power / config.line_voltage / phases + config.current_rounding_offset)
-                    if max_current < self._min_supported_current:
-                        max_current = 0
-            elif mode == ChargeMode.PV_ALL:
-                if (not wb.allow_charging and available_power < self._pv_all_on) or available_power < self._pv_all_off:
-                    max_current = 0
-                else:
-                    max_current = math.ceil(available_power / config.line_voltage / phases - config.current_rounding_offset)
-                    if max_current < self._min_supported_current:
-                        max_current = self._min_supported_current
+            strategy = self._strategies.get(mode)
+            if strategy is not None:
+                priority = self.get_data().priority
+                available_power = self._available_power(m, wb)
+                pv_forecast = self._forecaster.forecast(self._now() + timedelta(seconds=self._forecaster.get_config().slot_time))
+                s = StrategyInput(m, wb, priority, available_power, phases, tuple(self._power_history), pv_forecast)
+                max_current = strategy.charging_current(s)
             else:
                 # should not happen
                 logger.warning(f"Unexpected/unhandled charge mode: {mode}")
@@ -367,25 +802,126 @@ class ChargeController(BaseService[ChargeControllerConfig, ChargeControllerData]
             else:
                 max_current = self._min_supported_current
                 desired_allow_charging = False
-            await self._wallbox.set_max_current(max_current)
+            await self._request_current(max_current)
+            if not desired_allow_charging:
+                self._limiter.requested = 0  # no charging requested -> not throttled
 
             # set allow_charging if changed for at least allow_charging_delay
             if wb.allow_charging != desired_allow_charging:
                 self._pv_allow_charging_delay -= config.cycle_time
                 if self._pv_allow_charging_delay <= 0:
-                    await self._set_allow_charging(desired_allow_charging)
+                    await self._request_charging(desired_allow_charging)
             else:
                 self._pv_allow_charging_delay = config.pv_allow_charging_delay
 
-        self.get_data().mode = mode
+        self._update_data(mode=desired_mode if planned else mode)
+
+    def _available_power(self, m: MeterData, wb: WallboxData) -> float:
+        """Power available for charging (incl. current charging power) according to priority."""
+        if self.get_data().priority == Priority.CAR:
+            # Priority.CAR neither charge nor discharge home battery
+            return -m.power_grid + wb.power - m.power_battery
+        # Priority.HOME_BATTERY
+        available_power = -m.power_grid + wb.power
+        if m.power_battery > 0:
+            # don't discharge home battery
+            available_power -= m.power_battery
+        # TODO: reduce a little to allow home battery to increase charging power
+        return available_power
+
+    async def limit_current(self) -> None:
+        """
+        Fast loop between control cycles (current_limit_interval): reduces the charging current or switches off charging
+        as soon as a phase exceeds max_phase_current. Increasing the current is left to the control cycle.
+        """
+        if self._lock.locked():
+            return  # control cycle is running and enforces the limit
+        async with self._lock:
+            # read current state: order is important for simulation
+            wb = await self._wallbox.read_data()
+            m = await self._meter.read_data()
+            self._commands = {}
+            if self._limiter.update(m, wb) is not None:
+                await self._enforce_current_limit(wb)
+
+    async def _enforce_current_limit(self, wb: WallboxData) -> None:
+        """Reduce the charging current or switch off charging if the grid current limit is exceeded."""
+        lim = self._limiter
+        allow = self._commands.get("allow_charging", wb.allow_charging)
+        max_current = self._commands.get("max_current", wb.max_current)
+        if lim.available is None or not allow or max_current <= lim.available:
+            return
+        if max_current != lim.limited_to:
+            lim.requested = max_current  # not set by the limiter, e.g. MANUAL mode
+        if lim.blocks_charging(self._min_supported_current):
+            logger.warning(f"Grid current limit: switch off charging, available current {lim.available}A")
+            await self._set_allow_charging(False, skip_delay=True)
+            lim.switched_off = True
+            lim.count("off")
+        else:
+            logger.info(f"Grid current limit: reduce charging current {max_current}A -> {lim.available}A")
+            await self._set_max_current(lim.available)
+            lim.limited_to = lim.available
+            lim.count("reduce")
+
+    async def _restore_current_limit(self, wb: WallboxData) -> None:
+        """MANUAL mode: restore the setting that was reduced by the grid current limit when there is enough headroom."""
+        lim = self._limiter
+        if lim.switched_off:
+            if wb.allow_charging:
+                lim.switched_off = False  # switched on by user
+            elif not lim.blocks_charging(self._min_supported_current):
+                await self._request_current(lim.requested)
+                await self._request_charging(True, skip_delay=True)
+        elif lim.limited_to is not None:
+            if wb.max_current != lim.limited_to:
+                lim.limited_to = None  # changed by user
+            elif lim.limit(lim.requested, self._min_supported_current) > wb.max_current:
+                await self._request_current(lim.requested)
+
+    async def _request_current(self, max_current: int):
+        """Set max_current requested by the control cycle, reduced to the grid current limit."""
+        await self._set_max_current(self._limiter.request_current(max_current, self._min_supported_current))
+
+    async def _request_charging(self, v: bool, skip_delay: bool = False):
+        """Set allow_charging requested by the control cycle, charging stays off if the grid current limit leaves less than min current."""
+        allowed = self._limiter.request_charging(v, self._min_supported_current)
+        await self._set_allow_charging(allowed, skip_delay or allowed != v)
 
     async def _set_allow_charging(self, v: bool, skip_delay: bool = False):
         self._pv_allow_charging_value = v  # remember last set allow_charging value set by PV control
         self._pv_allow_charging_delay = self.get_config().pv_allow_charging_delay if not skip_delay else 0
-        await self._wallbox.allow_charging(v)
+        self._commands["allow_charging"] = v
+        with span("wallbox_cmd", "allow_charging"):
+            await self._wallbox.allow_charging(v)
+
+    # wallbox commands, recorded for the decision trace
+    async def _set_max_current(self, max_current: int):
+        self._commands["max_current"] = max_current
+        with span("wallbox_cmd", "max_current"):
+            await self._wallbox.set_max_current(max_current)
+
+    async def _set_phases_in(self, phases: int):
+        self._commands["phases_in"] = phases
+        with span("wallbox_cmd", "phases_in"):
+            await self._wallbox.set_phases_in(phases)
+
+    async def _trigger_reset(self):
+        self._commands["resets"] = self._commands.get("resets", 0) + 1
+        with span("wallbox_cmd", "reset"):
+            await self._wallbox.trigger_reset()
 
 
 class ChargeControllerFactory:
     @classmethod
-    def newController(cls, meter: Meter[Any], wb: Wallbox[Any], relay: PhaseRelay, **kwargs: Any) -> ChargeController:
-        return ChargeController(ChargeControllerConfig(**kwargs), meter, wb, relay)
+    def newController(
+        cls,
+        meter: Meter[Any],
+        wb: Wallbox[Any],
+        relay: PhaseRelay,
+        car: Car[Any] | None = None,
+        forecaster: PvForecaster | None = None,
+        price_provider: PriceProvider[Any] | None = None,
+        **kwargs: Any,
+    ) -> ChargeController:
+        return ChargeController(ChargeControllerConfig(**kwargs), meter, wb, relay, car, forecaster, price_provider)
@@ -0,0 +1,205 @@
+"""
+Crash-safe checkpoint of the controller state in a local file, restored at startup so that charging resumes without
+waiting for the retained MQTT state. Writes go to a temporary file that is renamed atomically over the checkpoint.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import time as dtime
+from typing import Any, final
+
+from pvcontrol.chargecontroller import (
+    ChargeController,
+    ChargeControllerData,
+    ChargeMode,
+    ControllerState,
+    PhaseMode,
+    Priority,
+)
+from pvcontrol.ledger import ChargingSession, LedgerState, SessionLedger
+from pvcontrol.service import BaseConfig
+
+logger = logging.getLogger(__name__)
+
+_VERSION = 1
+
+
+@dataclass
+class CheckpointConfig(BaseConfig):
+    file: str = ""  # checkpoint file, empty = disabled
+    min_interval: float = 60  # [s] timer and energy counter changes within this interval are coalesced into one write
+
+
+def _encode_session(s: ChargingSession | None) -> dict[str, Any] | None:
+    if s is None:
+        return None
+    return {
+        "start": s.start.isoformat(),
+        "energy": s.energy,
+        "energy_pv": s.energy_pv,
+        "energy_grid": s.energy_grid,
+        "pv_share": s.pv_share,
+        "cost": s.cost,
+        "peak_power": s.peak_power,
+    }
+
+
+def _decode_session(d: dict[str, Any] | None) -> ChargingSession | None:
+    if d is None:
+        return None
+    return ChargingSession(
+        datetime.fromisoformat(d["start"]),
+        None,
+        d["energy"],
+        d["energy_pv"],
+        d["energy_grid"],
+        d["pv_share"],
+        d["cost"],
+        d["peak_power"],
+    )
+
+
+def encode_state(controller: ControllerState, ledger: LedgerState | None) -> dict[str, Any]:
+    d = controller.data
+    state: dict[str, Any] = {
+        "version": _VERSION,
+        "controller": {
+            "mode": d.mode,
+            "desired_mode": d.desired_mode,
+            "phase_mode": d.phase_mode,
+            "priority": d.priority,
+            "desired_priority": d.desired_priority,
+            "target_soc": controller.target_soc,
+            "departure_time": controller.departure_time.isoformat(),
+            "pv_allow_charging_value": controller.pv_allow_charging_value,
+            "pv_allow_charging_delay": controller.pv_allow_charging_delay,
+            "charge_mode_pv_to_off_delay": controller.charge_mode_pv_to_off_delay,
+            "last_charged_energy": controller.last_charged_energy,
+            "last_charged_energy_5m": controller.last_charged_energy_5m,
+            "last_energy_consumption": controller.last_energy_consumption,
+            "last_energy_consumption_grid": controller.last_energy_consumption_grid,
+        },
+    }
+    if ledger is not None:
+        state["ledger"] = {
+            "session": _encode_session(ledger.session),
+            "last_charged_energy": ledger.last_charged_energy,
+            "grid_share": ledger.grid_share,
+            "grid_price": ledger.grid_price,
+        }
+    return state
+
+
+def decode_state(state: dict[str, Any]) -> tuple[ControllerState, LedgerState | None]:
+    if state.get("version") != _VERSION:
+        raise ValueError(f"Unsupported checkpoint version: {state.get('version')}")
+    c = state["controller"]
+    controller = ControllerState(
+        data=ChargeControllerData(
+            mode=ChargeMode(c["mode"]),
+            desired_mode=ChargeMode(c["desired_mode"]),
+            phase_mode=PhaseMode(c["phase_mode"]),
+            priority=Priority(c["priority"]),
+            desired_priority=Priority(c["desired_priority"]),
+        ),
+        target_soc=c["target_soc"],
+        departure_time=dtime.fromisoformat(c["departure_time"]),
+        pv_allow_charging_value=c["pv_allow_charging_value"],
+        pv_allow_charging_delay=c["pv_allow_charging_delay"],
+        charge_mode_pv_to_off_delay=c["charge_mode_pv_to_off_delay"],
+        last_charged_energy=c["last_charged_energy"],
+        last_charged_energy_5m=c["last_charged_energy_5m"],
+        last_energy_consumption=c["last_energy_consumption"],
+        last_energy_consumption_grid=c["last_energy_consumption_grid"],
+    )
+    ledger = None
+    if (lg := state.get("ledger")) is not None:
+        ledger = LedgerState(_decode_session(lg["session"]), lg["last_charged_energy"], lg["grid_share"], lg["grid_price"])
+    return controller, ledger
+
+
+def _user_settings(state: dict[str, Any]) -> tuple[Any, ...]:
+    c = state["controller"]
+    return (c["desired_mode"], c["phase_mode"], c["desired_priority"], c["target_soc"], c["departure_time"])
+
+
+@final
+class Checkpointer:
+    """
+    Saves the state of the charge controller (and the session in progress of the ledger) after each control cycle if it changed.
+    Changes of user settings (desired mode, phase mode, priority, plan target) are written immediately, timer and energy counter
+    changes at most every min_interval. Files are written in a worker thread: temp file, fsync, rename, fsync of the directory.
+    """
+
+    def __init__(self, config: CheckpointConfig, controller: ChargeController, ledger: SessionLedger | None = None):
+        self._config: CheckpointConfig = config
+        self._controller: ChargeController = controller
+        self._ledger: SessionLedger | None = ledger
+        self._saved: dict[str, Any] | None = None  # last written state
+        self._saved_at: float = 0  # time.monotonic() of last write
+        self._monotonic = time.monotonic  # replaceable for tests
+
+    def get_config(self) -> CheckpointConfig:
+        return self._config
+
+    def restore(self) -> bool:
+        """Restore controller and ledger state from the checkpoint file, False if there is no (valid) checkpoint."""
+        start = time.perf_counter()
+        try:
+            with open(self._config.file, "rb") as f:
+                state = json.loads(f.read())
+            controller, ledger = decode_state(state)
+        except FileNotFoundError:
+            logger.info(f"No checkpoint {self._config.file}, starting with defaults")
+            return False
+        except Exception as e:
+            logger.warning(f"Ignoring invalid checkpoint {self._config.file}: {e}")
+            return False
+        self._controller.restore_state(controller)
+        if self._ledger is not None and ledger is not None:
+            self._ledger.restore_state(ledger)
+        self._saved = state
+        logger.info(
+            f"Restored controller state from {self._config.file} in {(time.perf_counter() - start) * 1000:.1f}ms: {controller.data}"
+        )
+        return True
+
+    async def save(self, force: bool = False) -> None:
+        """Write the current state if it changed, coalesced to min_interval unless user settings changed or force is set."""
+        state = encode_state(self._controller.get_state(), self._ledger.get_state() if self._ledger is not None else None)
+        if state == self._saved:
+            return
+        now = self._monotonic()
+        if (
+            not force
+            and self._saved is not None
+            and _user_settings(state) == _user_settings(self._saved)
+            and now - self._saved_at < self._config.min_interval
+        ):
+            return
+        try:
+            await asyncio.to_thread(self._write, json.dumps(state).encode())
+            self._saved = state
+            self._saved_at = now
+        except Exception as e:
+            logger.warning(f"Writing checkpoint {self._config.file} failed: {e}")
+
+    def _write(self, data: bytes) -> None:
+        path = self._config.file
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        # persist the rename
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,125 @@
+"""
+Charge modes, configuration and data of the charge controller, in a module of their own so that charge strategies (strategy.py)
+and planners (planner.py) can use them without importing the controller.
+"""
+
+import enum
+from dataclasses import dataclass
+
+from pvcontrol.service import BaseConfig, BaseData
+
+
+@enum.unique
+class ChargeMode(enum.StrEnum):
+    """
+    Charge Controller operation mode:
+
+    - **OFF**: Indicates that charging is switched off and charge controller is passive.
+      When set, charge controller switches charging off and then doesn't interfere/control anymore.
+    - **MAX**: Indicates that charging runs on max power (1x or 3x max current) and charge controller is passive.
+      When set, charge controller switches charging on to max power and then doesn't interfere/control anymore.
+    - **MANUAL**: Indicates that charging is switched on and charge controller is passive. Charging power is controlled externally, e.g. by wallbox app.
+      When set, charge controller stops controlling charging power, last wallbox power setting is kept.
+    - **PV_ONLY**: Charge controller tries to use only PV for charging. Grid power is avoided even if this means switching off charging.
+    - **PV_ALL**: Charge controller tries to use all available PV for charging. Grid power is used to fill up so that all PV can be used.
+    - **PLANNED**: Charge controller charges the car to the target SOC until departure time.
+      A charge plan selects PV_ONLY, PV_ALL or MAX per time slot so that as little grid energy as possible is used.
+    - **TARIFF**: Charge controller charges the car to the target SOC until departure time (same target as PLANNED) with a dynamic
+      grid tariff: PV_ONLY in general, MAX in the cheapest price slots for the energy that the PV surplus doesn't deliver.
+    """
+
+    OFF = "OFF"
+    PV_ONLY = "PV_ONLY"
+    PV_ALL = "PV_ALL"
+    MAX = "MAX"  # 1/3x16A
+    MANUAL = "MANUAL"  # wallbox may be controlled via app
+    PLANNED = "PLANNED"  # reach target SOC until departure time
+    TARIFF = "TARIFF"  # reach target SOC until departure time, grid energy in cheapest price slots
+
+
+@enum.unique
+class PhaseMode(enum.StrEnum):
+    DISABLED = "DISABLED"  # phase relay is not in operation
+    AUTO = "AUTO"  # PV switches between 1 and 3 phases
+    CHARGE_1P = "CHARGE_1P"
+    CHARGE_3P = "CHARGE_3P"
+
+
+@enum.unique
+class Priority(enum.StrEnum):
+    AUTO = "AUTO"  # balance between home battery and car
+    HOME_BATTERY = "HOME_BATTERY"  # load home battery before car
+    CAR = "CAR"  # load car before home battery
+
+
+@enum.unique
+class PhaseSwitchState(enum.StrEnum):
+    """
+    Phase switch sequence: IDLE -> CHARGING_OFF -> RELAY_SWITCH -> SETTLE -> RESET -> VERIFY -> IDLE.
+    The sequence is advanced by the control loop without blocking it, charging control is skipped while switching.
+    """
+
+    IDLE = "IDLE"
+    CHARGING_OFF = "CHARGING_OFF"  # wait until charging is off
+    RELAY_SWITCH = "RELAY_SWITCH"  # switch phase relay
+    SETTLE = "SETTLE"  # wait switch_phases_reset_delay before wallbox reset
+    RESET = "RESET"  # trigger wallbox reset
+    VERIFY = "VERIFY"  # wait until wallbox reports the new phases_in, rollback on PHASE_RELAY_ERR or timeout
+
+
+@dataclass(frozen=True, slots=True)
+class ChargeControllerData(BaseData):
+    """
+    Charge controller data:
+    - mode: current charge mode, converges to desired_mode
+    - desired_mode: desired charge mode as set by user
+    - phase_mode: current phase mode
+    - priority: currently used priority for charging (HOME_BATTERY, CAR)
+    - desired_priority: priority as set by user (AUTO, HOME, CAR), used to decide whether to charge home battery or car first
+    - phase_switch: state of phase switch sequence
+    """
+
+    mode: ChargeMode = ChargeMode.OFF
+    desired_mode: ChargeMode = ChargeMode.OFF
+    phase_mode: PhaseMode = PhaseMode.AUTO
+    priority: Priority = Priority.AUTO
+    desired_priority: Priority = Priority.AUTO
+    phase_switch: PhaseSwitchState = PhaseSwitchState.IDLE
+
+
+@dataclass
+class ChargeControllerConfig(BaseConfig):
+    cycle_time: int = 30  # [s] control loop cycle time, used by scheduler
+    enable_auto_phase_switching: bool = True  # automatic phase switching depending on available PV
+    enable_charging_when_connecting_car: ChargeMode = ChargeMode.OFF
+    line_voltage: float = 230  # [V]
+    current_rounding_offset: float = 0.1  # [A] offset for max_current rounding
+    power_hysteresis: float = 200  # [W] hysteresis for switching on/off and between 1 and 3 phases
+    pv_all_min_power: float = 500  # [W] min available power for charging in mode PV_ALL
+    pv_allow_charging_delay: int = 120  # [s] min stable allow_charging time before switching on/off (PV modes only)
+    prio_auto_soc_threshold: float = 50  # [%] threshold for switching between CAR and HOME_BATTERY prio in AUTO mode
+    # priority AUTO optimizer, uses prio_auto_soc_threshold as long as battery capacity or PV forecast is not known
+    battery_capacity: float = 0  # [Wh] usable capacity of home battery, 0 = disabled
+    battery_max_charge_power: float = 0  # [W] max charging power of home battery, 0 = learned from meter data
+    prio_auto_energy_margin: float = 1.2  # remaining PV energy for battery must exceed needed energy by this factor to switch to CAR
+    planner_target_soc: float = 80  # [%] target SOC for mode PLANNED
+    planner_departure_time: str = "07:00"  # departure time (local time) for mode PLANNED
+    planner_slot_time: int = 15 * 60  # [s] time slot of charge plan, the PV forecast has its own slot time (forecast.slot_time)
+    tariff_max_price: float = 0  # [ct/kWh] no grid charging in mode TARIFF above this price, 0 = no limit
+    # phase switch governor (PV modes with phase mode AUTO only)
+    phase_switch_energy_window: int = 5 * 60  # [s] sliding window for surplus/deficit energy, 0 = decide on power only
+    phase_switch_energy: float = 20  # [Wh] min surplus/deficit energy relative to phase switch threshold within window
+    phase_switch_min_dwell_time: int = 10 * 60  # [s] min time between phase switches
+    phase_switch_max_per_day: int = 12  # max PV driven phase switches per day, 0 = unlimited
+    phase_switch_timeout: int = 2 * 60  # [s] max time for switching charging off and for wallbox to report new phases_in
+    timing_history: int = 100  # number of cycle timing breakdowns kept for /debug/cycles
+    # grid current limit (dynamic load management)
+    max_phase_current: float = 0  # [A] grid current limit per phase (house main fuse), 0 = disabled, needs per phase currents from meter
+    # [s] fast loop between control cycles for reducing charging current, 0 = control cycle only. Each run reads wallbox and
+    # meter, i.e. cycle_time / current_limit_interval times the device requests of the control cycle (6x for 30s / 5s)
+    current_limit_interval: float = 5
+    wallbox_grid_phase: int = 1  # grid phase (1..3) used for 1 phase charging
+    # charge strategies of the PV modes: registered name (see register_strategy) or "module:Class" for custom strategies
+    pv_only_strategy: str = "pv_only"
+    pv_all_strategy: str = "pv_all"
+    strategy_history: int = 10  # number of previous cycles of available power passed to strategies
@@ -2,12 +2,22 @@ import logging
 from argparse import Namespace
 from typing import Any
 
-from pvcontrol.car import Car, CarFactory
+from pvcontrol.car import Car, CarFactory, CarPoller
 from pvcontrol.chargecontroller import ChargeController, ChargeControllerFactory
+from pvcontrol.checkpoint import CheckpointConfig, Checkpointer
+from pvcontrol.forecast import ForecastConfig, PvForecaster
+from pvcontrol.httpclient import HttpClientConfig, HttpClientFactory
+from pvcontrol.ledger import LedgerConfig, SessionLedger
+from pvcontrol.loadbalancer import LoadBalancer, LoadBalancerFactory
+from pvcontrol.loopmonitor import LoopMonitor, LoopMonitorConfig
 from pvcontrol.meter import Meter, MeterFactory
 from pvcontrol.mqtt import MqttConfig, MqttPublisher
+from pvcontrol.offload import shutdown_offloader, start_offloader
+from pvcontrol.profiler import ProfilerConfig, SamplingProfiler
 from pvcontrol.relay import PhaseRelay, PhaseRelayFactory
 from pvcontrol.scheduler import AsyncScheduler
+from pvcontrol.tariff import PriceProvider, PriceProviderFactory
+from pvcontrol.trace import TraceConfig, TraceRecorder
 from pvcontrol.wallbox import Wallbox, WallboxFactory
 
 logger = logging.getLogger(__name__)
@@ -25,35 +35,132 @@ relay: PhaseRelay = None  # ty:ignore[invalid-assignment]
 wallbox: Wallbox[Any] = None  # ty:ignore[invalid-assignment]
 meter: Meter[Any] = None  # ty:ignore[invalid-assignment]
 controller: ChargeController = None  # ty:ignore[invalid-assignment]
+forecaster: PvForecaster = None  # ty:ignore[invalid-assignment]
 car: Car[Any] = None  # ty:ignore[invalid-assignment]
 controller_scheduler: AsyncScheduler = None  # ty:ignore[invalid-assignment]
-car_scheduler: AsyncScheduler = None  # ty:ignore[invalid-assignment]
+current_limit_scheduler: AsyncScheduler | None = None
+car_poller: CarPoller = None  # ty:ignore[invalid-assignment]
 mqtt_publisher: MqttPublisher | None = None
 mqtt_scheduler: AsyncScheduler | None = None
+trace_recorder: TraceRecorder | None = None
+loop_monitor: LoopMonitor | None = None
+profiler: SamplingProfiler = None  # ty:ignore[invalid-assignment]
+load_balancer: LoadBalancer | None = None
+price_provider: PriceProvider[Any] | None = None
+price_scheduler: AsyncScheduler | None = None
+ledger: SessionLedger = None  # ty:ignore[invalid-assignment]
+checkpointer: Checkpointer | None = None
 
 
 async def init(args: Namespace, config: dict[str, Any]) -> None:
     logger.info("Initializing depencencies.")
-    global controller_scheduler, car_scheduler, relay, wallbox, meter, car, controller, mqtt_publisher, mqtt_scheduler
+    global controller_scheduler, car_poller, relay, wallbox, meter, car, controller, mqtt_publisher, mqtt_scheduler
+    global trace_recorder, loop_monitor, profiler, load_balancer, current_limit_scheduler, forecaster, price_provider, price_scheduler
+    global ledger, checkpointer
+    HttpClientFactory.configure(HttpClientConfig(**config.get("http", {})))
+    start_offloader()
+    load_balancing = bool(config.get("loadbalancer", {}).get("wallboxes"))
+    if load_balancing:
+        check_load_balancer_config(args, config)
     relay = PhaseRelayFactory.newPhaseRelay(args.relay, args.hostname, **config["relay"])
     wallbox = WallboxFactory.newWallbox(args.wallbox, relay, **config["wallbox"])
     meter = MeterFactory.newMeter(args.meter, wallbox, **config["meter"])
     car = CarFactory.newCar(args.car, **config["car"])
-    controller = ChargeControllerFactory.newController(meter, wallbox, relay, **config["controller"])
+    trace_config = TraceConfig(**config.get("trace", {}))
+    if trace_config.file:
+        logger.info(f"Recording controller decision trace to {trace_config.file}")
+        trace_recorder = TraceRecorder(trace_config)
+    forecaster = PvForecaster(ForecastConfig(**config.get("forecast", {})))
+    if trace_recorder:
+        # learn PV profile from recorded cycles
+        forecaster.load_history((c.time, c.meter.power_pv) for c in trace_recorder.cycles() if c.meter.error == 0)
+    tariff_config = dict(config.get("tariff", {}))
+    if "type" in tariff_config:
+        price_provider = PriceProviderFactory.newPriceProvider(tariff_config.pop("type"), **tariff_config)
+        logger.info(f"Dynamic tariff: prices from {type(price_provider).__name__}")
+    controller = ChargeControllerFactory.newController(meter, wallbox, relay, car, forecaster, price_provider, **config["controller"])
+    ledger = SessionLedger(LedgerConfig(**config.get("ledger", {})), price_provider.price if price_provider else None)
+    checkpoint_config = CheckpointConfig(**config.get("checkpoint", {}))
+    if checkpoint_config.file:
+        # restore before the first control cycle, retained MQTT state (if any) is applied later
+        checkpointer = Checkpointer(checkpoint_config, controller, ledger)
+        checkpointer.restore()
+    if load_balancing:
+        # several wallboxes: the load balancer controls all of them instead of the single wallbox charge controller
+        load_balancer = LoadBalancerFactory.newLoadBalancer(meter, **config["loadbalancer"])
+        logger.info(f"Load balancing wallboxes: {[cp.name for cp in load_balancer.get_charge_points()]}")
 
-    controller_scheduler = AsyncScheduler(controller.get_config().cycle_time, controller.run)
-    car_scheduler = AsyncScheduler(car.get_config().cycle_time, car.read_data)
+    profiler = SamplingProfiler(ProfilerConfig(**config.get("profiler", {})))
+    loop_monitor_config = LoopMonitorConfig(**config.get("loop_monitor", {}))
+    if loop_monitor_config.enabled:
+        loop_monitor = LoopMonitor(loop_monitor_config)
+        await loop_monitor.start()
+
+    car_poller = CarPoller(car)
+    if price_provider:
+        price_scheduler = AsyncScheduler(price_provider.get_config().refresh_interval, price_provider.read_data)
+        await price_scheduler.start()
+    if load_balancer:
+        # car polling without wallbox state: every car cycle_time, the car is not bound to a load balanced wallbox
+        controller_scheduler = AsyncScheduler(load_balancer.get_config().cycle_time, load_balancer.run)
+    else:
+        controller_scheduler = AsyncScheduler(controller.get_config().cycle_time, run_controller)
+        controller_config = controller.get_config()
+        if controller_config.max_phase_current > 0 and controller_config.current_limit_interval > 0:
+            current_limit_scheduler = AsyncScheduler(controller_config.current_limit_interval, controller.limit_current)
     await controller_scheduler.start()
-    await car_scheduler.start()
+    if current_limit_scheduler:
+        await current_limit_scheduler.start()
+    await car_poller.start()
 
     if args.mqtt:
         mqtt_config = MqttConfig(**config["mqtt"])
-        mqtt_publisher = MqttPublisher(mqtt_config, version, controller=controller, meter=meter, wallbox=wallbox, relay=relay, car=car)
+        mqtt_publisher = MqttPublisher(
+            mqtt_config,
+            version,
+            controller=controller,
+            meter=meter,
+            wallbox=wallbox,
+            relay=relay,
+            car=car,
+            load_balancer=load_balancer,
+            price_provider=price_provider,
+        )
         await mqtt_publisher.start()
-        mqtt_scheduler = AsyncScheduler(controller.get_config().cycle_time, mqtt_publisher.publish_state)
+        cycle_time = load_balancer.get_config().cycle_time if load_balancer else controller.get_config().cycle_time
+        mqtt_scheduler = AsyncScheduler(cycle_time, mqtt_publisher.publish_state)
         await mqtt_scheduler.start()
 
 
+def check_load_balancer_config(args: Namespace, config: dict[str, Any]) -> None:
+    """
+    The load balancer replaces the single wallbox charge controller, which is not scheduled then. Reject settings that only
+    apply to the charge controller instead of silently ignoring them: a real single wallbox or phase relay would be left
+    uncontrolled, trace, ledger and checkpoint record the charge controller cycle.
+    """
+    unsupported: list[str] = []
+    if args.wallbox != "SimulatedWallbox":
+        unsupported.append(f"--wallbox {args.wallbox}")
+    if args.relay != "SimulatedPhaseRelay":
+        unsupported.append(f"--relay {args.relay}")
+    unsupported += [f"{c}.file" for c in ("trace", "ledger", "checkpoint") if config.get(c, {}).get("file")]
+    if unsupported:
+        raise ValueError(f"{', '.join(unsupported)} only apply to the single wallbox charge controller, not to loadbalancer.wallboxes")
+
+
+async def run_controller() -> None:
+    """One control cycle, car polling adapts to the wallbox state."""
+    await controller.run()
+    if trace_recorder:
+        trace_recorder.record(controller)
+    cycle = controller.get_last_cycle()
+    if cycle:
+        ledger.record(cycle)
+    if checkpointer:
+        await checkpointer.save()
+    car_poller.on_wallbox_data(wallbox.get_data())
+
+
 # shutdown components and event loop
 async def shutdown():
     if mqtt_scheduler:
@@ -61,10 +168,27 @@ async def shutdown():
     if mqtt_publisher:
         await mqtt_publisher.stop()
     await controller_scheduler.stop()
-    await car_scheduler.stop()
-    # disable charging to play it safe
-    # TODO: see ChargeMode.INIT handling
-    logger.info("Set wallbox.allow_charging=False on shutdown.")
-    await wallbox.allow_charging(False)
+    if checkpointer:
+        await checkpointer.save(force=True)
+    if current_limit_scheduler:
+        await current_limit_scheduler.stop()
+    await car_poller.stop()
+    if price_scheduler:
+        await price_scheduler.stop()
+    # after all schedulers that read meter and wallbox
+    shutdown_offloader()
+    if trace_recorder:
+        trace_recorder.close()
+    ledger.close()
+    if loop_monitor:
+        await loop_monitor.stop()
+    if load_balancer:
+        # switches off all load balanced wallboxes, the single wallbox is not controlled
+        await load_balancer.close()
+    else:
+        # disable charging to play it safe
+        # TODO: see ChargeMode.INIT handling
+        logger.info("Set wallbox.allow_charging=False on shutdown.")
+        await wallbox.allow_charging(False)
     await wallbox.close()
     await meter.close()
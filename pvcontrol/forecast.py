@@ -0,0 +1,149 @@
+import logging
+import math
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import UTC, datetime, time, timedelta
+from typing import final
+
+from prometheus_client import Gauge
+
+from pvcontrol.service import BaseConfig, BaseData
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ForecastConfig(BaseConfig):
+    slot_time: int = 15 * 60  # [s] time slot of the forecast
+    smoothing: float = 0.3  # exponential smoothing factor per day, higher = faster adaption to recent days
+    latitude: float = 48.1  # [°] location of the PV system for the clear-sky model
+    longitude: float = 11.6  # [°]
+    min_clear_sky: float = 0.05  # slots with a lower clear-sky factor (night, sunrise, sunset) are forecasted as 0
+
+
+def clear_sky(t: datetime, latitude: float, longitude: float) -> float:
+    """
+    Clear-sky factor 0..1 = sine of the sun elevation at t (naive datetime = local time), 0 when the sun is below the horizon.
+    Simple astronomical model without equation of time, good enough for normalizing PV power per time slot.
+    """
+    utc = t.astimezone(UTC)
+    day = utc.timetuple().tm_yday
+    declination = math.radians(23.44) * math.sin(2 * math.pi * (284 + day) / 365)
+    solar_time = utc.hour + utc.minute / 60 + utc.second / 3600 + longitude / 15
+    hour_angle = math.radians(15 * (solar_time - 12))
+    lat = math.radians(latitude)
+    s = math.sin(lat) * math.sin(declination) + math.cos(lat) * math.cos(declination) * math.cos(hour_angle)
+    return max(s, 0.0)
+
+
+@dataclass(frozen=True, slots=True)
+class ForecastSlot:
+    start: datetime
+    power_pv: float = 0  # [W] forecasted average PV power
+
+
+@dataclass(frozen=True, slots=True)
+class PvForecastData(BaseData):
+    """
+    Rolling PV forecast for the next 24h, the first slot is the current one:
+    - energy: forecasted PV energy of all slots [Wh]
+    - learned_slots: number of time-of-day slots with PV history, 0 = nothing learned yet
+    """
+
+    slots: tuple[ForecastSlot, ...] = ()
+    energy: float = 0
+    learned_slots: int = 0
+
+
+@final
+class PvForecaster:
+    """
+    Learns a PV production profile per time-of-day slot from power_pv samples, works offline without weather service.
+
+    Each slot stores the ratio of measured PV power to the clear-sky factor, exponentially smoothed over days. The clear-sky model
+    covers the season, the learned ratio covers orientation, shading and recent weather. Forecast of a slot = ratio * clear-sky factor.
+    add_sample() is O(1): samples are accumulated for the current slot, when the slot is complete its ratio and its entry in the
+    rolling 24h forecast (= next occurrence of the slot) are updated.
+    """
+
+    _metrics_pvc_forecast_energy: Gauge = Gauge("pvcontrol_forecast_energy_wh", "Forecasted PV energy of the next 24h")
+
+    def __init__(self, config: ForecastConfig):
+        self._config: ForecastConfig = config
+        self._slots_per_day: int = 24 * 60 * 60 // config.slot_time
+        self._ratio: list[float | None] = [None] * self._slots_per_day  # [W] PV power at clear-sky factor 1, None = no history
+        self._forecast: list[float] = [0.0] * self._slots_per_day  # [W] per slot of day, for the next occurrence of the slot
+        self._forecast_energy: float = 0.0  # [Wh] sum of _forecast
+        # current slot
+        self._slot_start: datetime | None = None
+        self._sum_power: float = 0.0
+        self._count: int = 0
+
+    def get_config(self) -> ForecastConfig:
+        return self._config
+
+    def _slot_index(self, t: datetime) -> int:
+        return (t.hour * 3600 + t.minute * 60 + t.second) // self._config.slot_time
+
+    def _slot_start_of(self, t: datetime) -> datetime:
+        return datetime.combine(t.date(), time(), t.tzinfo) + timedelta(seconds=self._slot_index(t) * self._config.slot_time)
+
+    def _clear_sky(self, slot_start: datetime) -> float:
+        cfg = self._config
+        return clear_sky(slot_start + timedelta(seconds=cfg.slot_time / 2), cfg.latitude, cfg.longitude)
+
+    def add_sample(self, t: datetime, power_pv: float) -> None:
+        """Add a PV power sample [W], samples must be added in time order."""
+        start = self._slot_start_of(t)
+        if start != self._slot_start:
+            self._close_slot()
+            self._slot_start = start
+        self._sum_power += power_pv
+        self._count += 1
+
+    def load_history(self, samples: Iterable[tuple[datetime, float]]) -> None:
+        """Learn from recorded (time, power_pv) samples in time order, e.g. from the decision trace on startup."""
+        for t, power_pv in samples:
+            self.add_sample(t, power_pv)
+        logger.info(f"PV forecast: learned {self.learned_slots()} time slots from history")
+
+    def _close_slot(self) -> None:
+        start = self._slot_start
+        if start is not None and self._count > 0:
+            cfg = self._config
+            idx = self._slot_index(start)
+            clear = self._clear_sky(start)
+            if clear >= cfg.min_clear_sky:
+                ratio = self._sum_power / self._count / clear
+                prev = self._ratio[idx]
+                self._ratio[idx] = ratio if prev is None else prev + cfg.smoothing * (ratio - prev)
+            # next occurrence of the slot is tomorrow
+            power = self._slot_forecast(idx, start + timedelta(days=1))
+            self._forecast_energy += (power - self._forecast[idx]) * cfg.slot_time / 3600
+            self._forecast[idx] = power
+            PvForecaster._metrics_pvc_forecast_energy.set(self._forecast_energy)
+        self._sum_power = 0.0
+        self._count = 0
+
+    def _slot_forecast(self, idx: int, slot_start: datetime) -> float:
+        ratio = self._ratio[idx]
+        if ratio is None:
+            return 0.0
+        clear = self._clear_sky(slot_start)
+        return ratio * clear if clear >= self._config.min_clear_sky else 0.0
+
+    def learned_slots(self) -> int:
+        return sum(r is not None for r in self._ratio)
+
+    def forecast(self, t: datetime) -> float:
+        """Forecasted PV power [W] of the time slot of t within the next 24h, O(1)."""
+        return self._forecast[self._slot_index(t)]
+
+    def get_forecast(self, now: datetime) -> PvForecastData:
+        """Rolling forecast for the next 24h starting with the current slot."""
+        slot_time = timedelta(seconds=self._config.slot_time)
+        start = self._slot_start_of(now)
+        idx = self._slot_index(now)
+        n = self._slots_per_day
+        slots = tuple(ForecastSlot(start + i * slot_time, self._forecast[(idx + i) % n]) for i in range(n))
+        return PvForecastData(slots=slots, energy=self._forecast_energy, learned_slots=self.learned_slots())
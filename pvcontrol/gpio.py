@@ -0,0 +1,170 @@
+import logging
+from collections.abc import Callable
+from typing import Any, final, override
+
+logger = logging.getLogger(__name__)
+
+
+class GpioBackend:
+    """
+    Minimal GPIO interface needed by the phase relay: output channels with level read back and optional edge notification.
+    Levels are booleans, True = HIGH.
+    """
+
+    def setup_output(self, channel: int, initial: bool) -> None:
+        """Configure channel as output. initial is only applied if channel is not already an output (keep state on app restart)."""
+        pass
+
+    def read(self, channel: int) -> bool:
+        return False
+
+    def write(self, channel: int, v: bool) -> None:
+        pass
+
+    def add_edge_callback(self, channel: int, callback: Callable[[], None]) -> bool:
+        """Register callback for level changes not caused by write(). Returns False if edge detection is not supported."""
+        return False
+
+    def close(self) -> None:
+        pass
+
+
+@final
+class RpiGpio(GpioBackend):
+    """RPi.GPIO based backend, the RPi.GPIO module is only available on raspi."""
+
+    def __init__(self):
+        import RPi.GPIO as GPIO  # ty:ignore[unresolved-import]
+
+        logger.info("Initializing RPi.GPIO")
+        self._gpio: Any = GPIO
+        GPIO.setwarnings(True)
+        GPIO.setmode(GPIO.BCM)
+
+    @override
+    def setup_output(self, channel: int, initial: bool) -> None:
+        GPIO = self._gpio
+        ch_function = GPIO.gpio_function(channel)
+        logger.info(f"Before channel {channel} setup: function={ch_function}")
+        if ch_function == GPIO.OUT:
+            GPIO.setup(channel, GPIO.OUT)
+        else:
+            GPIO.setup(channel, GPIO.OUT, initial=GPIO.HIGH if initial else GPIO.LOW)
+        logger.info(f"After channel {channel} setup : level={GPIO.input(channel)}")
+
+    @override
+    def read(self, channel: int) -> bool:
+        return self._gpio.input(channel) == self._gpio.HIGH
+
+    @override
+    def write(self, channel: int, v: bool) -> None:
+        self._gpio.output(channel, self._gpio.HIGH if v else self._gpio.LOW)
+
+    @override
+    def add_edge_callback(self, channel: int, callback: Callable[[], None]) -> bool:
+        # callback runs in a RPi.GPIO thread
+        try:
+            self._gpio.add_event_detect(channel, self._gpio.BOTH, callback=lambda _: callback())
+            return True
+        except RuntimeError as e:
+            # edge detection is not supported on output channels by all kernel/library versions
+            logger.info(f"No edge detection on channel {channel}: {e}")
+            return False
+
+    @override
+    def close(self) -> None:
+        # don't call GPIO.cleanup(), it would reset the relay
+        pass
+
+
+@final
+class GpiodGpio(GpioBackend):
+    """libgpiod (v2) character device backend, e.g. chip=/dev/gpiochip0. Edge detection is not available for output lines."""
+
+    def __init__(self, chip: str):
+        import gpiod  # ty:ignore[unresolved-import]
+
+        logger.info(f"Initializing gpiod on {chip}")
+        self._gpiod: Any = gpiod
+        self._chip: str = chip
+        self._requests: dict[int, Any] = {}
+
+    @override
+    def setup_output(self, channel: int, initial: bool) -> None:
+        gpiod = self._gpiod
+        Direction = gpiod.line.Direction
+        Value = gpiod.line.Value
+        with gpiod.Chip(self._chip) as chip:
+            is_output = chip.get_line_info(channel).direction == Direction.OUTPUT
+        request = gpiod.request_lines(self._chip, consumer="pvcontrol", config={channel: gpiod.LineSettings(direction=Direction.AS_IS)})
+        if is_output:
+            # keep state on app restart
+            initial = request.get_value(channel) == Value.ACTIVE
+        request.reconfigure_lines(
+            config={channel: gpiod.LineSettings(direction=Direction.OUTPUT, output_value=Value.ACTIVE if initial else Value.INACTIVE)}
+        )
+        self._requests[channel] = request
+        logger.info(f"Channel {channel} setup: was_output={is_output}, level={initial}")
+
+    @override
+    def read(self, channel: int) -> bool:
+        return self._requests[channel].get_value(channel) == self._gpiod.line.Value.ACTIVE
+
+    @override
+    def write(self, channel: int, v: bool) -> None:
+        Value = self._gpiod.line.Value
+        self._requests[channel].set_value(channel, Value.ACTIVE if v else Value.INACTIVE)
+
+    @override
+    def close(self) -> None:
+        for request in self._requests.values():
+            request.release()
+        self._requests.clear()
+
+
+@final
+class FakeGpio(GpioBackend):
+    """Pure-Python GPIO for tests and simulation, counts reads and supports edge callbacks on external level changes."""
+
+    def __init__(self):
+        self._levels: dict[int, bool] = {}
+        self._callbacks: dict[int, list[Callable[[], None]]] = {}
+        self.read_count: int = 0
+
+    @override
+    def setup_output(self, channel: int, initial: bool) -> None:
+        self._levels.setdefault(channel, initial)
+
+    @override
+    def read(self, channel: int) -> bool:
+        self.read_count += 1
+        return self._levels[channel]
+
+    @override
+    def write(self, channel: int, v: bool) -> None:
+        self._levels[channel] = v
+
+    @override
+    def add_edge_callback(self, channel: int, callback: Callable[[], None]) -> bool:
+        self._callbacks.setdefault(channel, []).append(callback)
+        return True
+
+    def set_level_externally(self, channel: int, v: bool) -> None:
+        """Simulate a level change that is not caused by write(), e.g. manual relay switch or other process."""
+        if self._levels.get(channel) != v:
+            self._levels[channel] = v
+            for callback in self._callbacks.get(channel, []):
+                callback()
+
+
+class GpioFactory:
+    @classmethod
+    def newGpio(cls, type: str, chip: str) -> GpioBackend:
+        if type == "RPi.GPIO":
+            return RpiGpio()
+        elif type == "gpiod":
+            return GpiodGpio(chip)
+        elif type == "fake":
+            return FakeGpio()
+        else:
+            raise ValueError(f"Bad gpio backend type: {type}")
@@ -0,0 +1,95 @@
+import logging
+import socket
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+from prometheus_client import Counter, Histogram
+
+from pvcontrol.service import BaseConfig
+from pvcontrol.utils import aiohttp_trace_config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HttpClientConfig(BaseConfig):
+    limit_per_host: int = 4  # embedded devices handle only a few parallel connections
+    keepalive_timeout: float = 75  # [s] longer than the poll cycle to reuse connections between polls
+    dns_cache_ttl: int = 300  # [s]
+    async_dns: bool = True  # aiodns resolver instead of getaddrinfo() in a thread
+    tcp_nodelay: bool = True
+
+
+_metrics_pvc_http_connections = Counter("pvcontrol_http_connections_total", "HTTP requests by connection reuse", ["host", "reused"])
+_metrics_pvc_http_connect = Histogram(
+    "pvcontrol_http_connect_seconds",
+    "Time for establishing a new connection incl. TLS handshake",
+    ["host", "tls"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+
+async def _on_request_start(_session: aiohttp.ClientSession, ctx: SimpleNamespace, params: aiohttp.TraceRequestStartParams):
+    ctx.host = params.url.host or ""
+    ctx.tls = str(params.url.scheme == "https").lower()
+
+
+async def _on_connection_create_start(_session: aiohttp.ClientSession, ctx: SimpleNamespace, _params: Any):
+    ctx.connect_start = time.perf_counter()
+
+
+async def _on_connection_create_end(_session: aiohttp.ClientSession, ctx: SimpleNamespace, _params: Any):
+    _metrics_pvc_http_connect.labels(ctx.host, ctx.tls).observe(time.perf_counter() - ctx.connect_start)
+    _metrics_pvc_http_connections.labels(ctx.host, "false").inc()
+
+
+async def _on_connection_reuseconn(_session: aiohttp.ClientSession, ctx: SimpleNamespace, _params: Any):
+    _metrics_pvc_http_connections.labels(ctx.host, "true").inc()
+
+
+metrics_trace_config = aiohttp.TraceConfig()
+metrics_trace_config.on_request_start.append(_on_request_start)
+metrics_trace_config.on_connection_create_start.append(_on_connection_create_start)
+metrics_trace_config.on_connection_create_end.append(_on_connection_create_end)
+metrics_trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+
+
+def _nodelay_socket(addr_info: Any) -> socket.socket:
+    family, type, proto, _, _ = addr_info
+    sock = socket.socket(family=family, type=type, proto=proto)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+class HttpClientFactory:
+    """Creates aiohttp sessions for device and cloud access with common connection pool settings, see HttpClientConfig."""
+
+    _config: HttpClientConfig = HttpClientConfig()
+
+    @classmethod
+    def configure(cls, config: HttpClientConfig) -> None:
+        cls._config = config
+
+    @classmethod
+    def newSession(cls, verify_ssl: bool = True) -> aiohttp.ClientSession:
+        """Needs a running event loop."""
+        cfg = cls._config
+        resolver: AbstractResolver | None = None
+        if cfg.async_dns:
+            try:
+                resolver = aiohttp.AsyncResolver()
+            except Exception as e:
+                logger.warning(f"aiodns resolver not available, using default resolver: {e}")
+        connector = aiohttp.TCPConnector(
+            limit_per_host=cfg.limit_per_host,
+            keepalive_timeout=cfg.keepalive_timeout,
+            ttl_dns_cache=cfg.dns_cache_ttl,
+            resolver=resolver,
+            socket_factory=_nodelay_socket if cfg.tcp_nodelay else None,
+            ssl=verify_ssl,
+        )
+        return aiohttp.ClientSession(connector=connector, trace_configs=[aiohttp_trace_config, metrics_trace_config])
@@ -0,0 +1,261 @@
+"""
+Charging session ledger: energy charged per plug-in session, attributed to PV and grid every control cycle,
+persisted as compact fixed size records in an append-only file.
+"""
+
+import dataclasses
+import logging
+import os
+import struct
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Literal, Self, final
+
+from pvcontrol.chargecontroller import ControllerCycle
+from pvcontrol.service import BaseConfig
+from pvcontrol.wallbox import CarStatus
+
+logger = logging.getLogger(__name__)
+
+type Period = Literal["day", "month", "year"]
+
+_RECORD = struct.Struct("<ddfffff")  # start, end (POSIX timestamps), energy, energy_pv, energy_grid, cost, peak_power
+_HEADER = struct.Struct("<4sHH")  # magic, version, record size
+_MAGIC = b"PVCL"
+_VERSION = 1
+
+
+@dataclass
+class LedgerConfig(BaseConfig):
+    file: str = ""  # ledger file, empty = sessions are kept in memory only
+    grid_price: float = 30  # [ct/kWh] grid price for session cost, the dynamic tariff price is used if configured
+    pv_price: float = 0  # [ct/kWh] value of PV energy for session cost, e.g. feed-in tariff
+
+
+@dataclass(frozen=True, slots=True)
+class ChargingSession:
+    """
+    One plug-in session (car connected until car disconnected):
+    - end: None = session in progress
+    - energy, energy_pv, energy_grid: charged energy and its attribution to PV (incl. home battery) and grid [Wh]
+    - pv_share: energy_pv / energy, 0 if nothing was charged
+    - cost: grid energy * grid price + PV energy * pv_price [ct]
+    - peak_power: max charging power [W]
+    """
+
+    start: datetime
+    end: datetime | None = None
+    energy: float = 0
+    energy_pv: float = 0
+    energy_grid: float = 0
+    pv_share: float = 0
+    cost: float = 0
+    peak_power: float = 0
+
+
+@dataclass(frozen=True, slots=True)
+class EnergyTotals:
+    """Sum of sessions of a period (day: 2024-06-01, month: 2024-06, year: 2024), sessions are counted by start time."""
+
+    period: str
+    sessions: int = 0
+    energy: float = 0  # [Wh]
+    energy_pv: float = 0  # [Wh]
+    energy_grid: float = 0  # [Wh]
+    pv_share: float = 0
+    cost: float = 0  # [ct]
+    peak_power: float = 0  # [W]
+
+    def add(self, s: ChargingSession) -> Self:
+        energy = self.energy + s.energy
+        energy_pv = self.energy_pv + s.energy_pv
+        return type(self)(
+            self.period,
+            self.sessions + 1,
+            energy,
+            energy_pv,
+            self.energy_grid + s.energy_grid,
+            energy_pv / energy if energy > 0 else 0,
+            self.cost + s.cost,
+            max(self.peak_power, s.peak_power),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class LedgerState:
+    """Session in progress and attribution baselines of the previous cycle, survives a restart (see checkpoint.py)."""
+
+    session: ChargingSession | None
+    last_charged_energy: float
+    grid_share: float
+    grid_price: float
+
+
+def _period_key(t: datetime, period: Period) -> str:
+    if period == "day":
+        return t.date().isoformat()
+    if period == "month":
+        return f"{t.year:04}-{t.month:02}"
+    return f"{t.year:04}"
+
+
+def encode_session(s: ChargingSession) -> bytes:
+    assert s.end is not None
+    return _RECORD.pack(s.start.timestamp(), s.end.timestamp(), s.energy, s.energy_pv, s.energy_grid, s.cost, s.peak_power)
+
+
+def decode_session(b: bytes) -> ChargingSession:
+    start, end, energy, energy_pv, energy_grid, cost, peak_power = _RECORD.unpack(b)
+    pv_share = energy_pv / energy if energy > 0 else 0
+    return ChargingSession(
+        datetime.fromtimestamp(start), datetime.fromtimestamp(end), energy, energy_pv, energy_grid, pv_share, cost, peak_power
+    )
+
+
+@final
+class LedgerFile:
+    """
+    Append-only file of fixed size session records after a header. A partial last record (e.g. power loss while writing)
+    is cut off on open. A file with unknown format is moved aside to <file>.bad.
+    """
+
+    def __init__(self, path: str):
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        header = os.pread(self._fd, _HEADER.size, 0)
+        if len(header) == _HEADER.size and _HEADER.unpack(header) != (_MAGIC, _VERSION, _RECORD.size):
+            logger.error(f"Unknown ledger file format, moving {path} to {path}.bad")
+            os.close(self._fd)
+            os.replace(path, f"{path}.bad")
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            header = b""
+        if len(header) < _HEADER.size:
+            os.ftruncate(self._fd, 0)
+            os.write(self._fd, _HEADER.pack(_MAGIC, _VERSION, _RECORD.size))
+        size = os.fstat(self._fd).st_size
+        tail = (size - _HEADER.size) % _RECORD.size
+        if tail:
+            logger.warning(f"Ledger file {path}: dropping partial record of {tail} bytes")
+            os.ftruncate(self._fd, size - tail)
+
+    def append(self, record: bytes) -> None:
+        os.write(self._fd, record)
+        os.fsync(self._fd)
+
+    def read_all(self) -> list[bytes]:
+        data = os.pread(self._fd, os.fstat(self._fd).st_size - _HEADER.size, _HEADER.size)
+        return [data[i : i + _RECORD.size] for i in range(0, len(data) - _RECORD.size + 1, _RECORD.size)]
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+@final
+class SessionLedger:
+    """
+    Tracks plug-in sessions from the control cycles, called after each ChargeController.run().
+
+    The energy charged between two cycles is taken from the wallbox energy counter and attributed to grid and PV by the
+    grid power during that interval, i.e. of the previous cycle: grid share = grid import (limited to charging power) / charging power.
+    Totals per day, month and year are updated when a session ends, queries are O(number of periods).
+    """
+
+    def __init__(self, config: LedgerConfig, price: Callable[[datetime], float | None] | None = None):
+        self._config: LedgerConfig = config
+        self._price: Callable[[datetime], float | None] = price or (lambda _: None)  # dynamic grid price [ct/kWh]
+        self._file: LedgerFile | None = LedgerFile(config.file) if config.file else None
+        self._sessions: list[ChargingSession] = []  # closed sessions, oldest first
+        self._totals: dict[Period, dict[str, EnergyTotals]] = {"day": {}, "month": {}, "year": {}}
+        # session in progress
+        self._session: ChargingSession | None = None
+        self._last_charged_energy: float = 0  # [Wh] wallbox counter of the previous cycle
+        self._grid_share: float = 0  # grid share of charging power of the previous cycle
+        self._grid_price: float = 0  # [ct/kWh] grid price of the previous cycle
+        if self._file:
+            for b in self._file.read_all():
+                self._add(decode_session(b))
+            logger.info(f"Ledger: loaded {len(self._sessions)} charging sessions from {config.file}")
+
+    def get_config(self) -> LedgerConfig:
+        return self._config
+
+    def record(self, cycle: ControllerCycle) -> None:
+        wb = cycle.wallbox
+        m = cycle.meter
+        if wb.error != 0:
+            return
+        connected = wb.car_status != CarStatus.NoVehicle
+        s = self._session
+        if s is None:
+            if not connected:
+                return
+            logger.info(f"Ledger: charging session started at {cycle.time}")
+            s = ChargingSession(cycle.time)
+        else:
+            energy = wb.charged_energy - self._last_charged_energy
+            if energy < -1.0:  # counter reset by wallbox when charging starts
+                energy = wb.charged_energy
+            energy = max(energy, 0.0)
+            if energy > 0:
+                grid = energy * self._grid_share
+                pv = energy - grid
+                s = dataclasses.replace(
+                    s,
+                    energy=s.energy + energy,
+                    energy_pv=s.energy_pv + pv,
+                    energy_grid=s.energy_grid + grid,
+                    pv_share=(s.energy_pv + pv) / (s.energy + energy),
+                    cost=s.cost + (grid * self._grid_price + pv * self._config.pv_price) / 1000,
+                )
+        s = dataclasses.replace(s, peak_power=max(s.peak_power, wb.power))
+        self._last_charged_energy = wb.charged_energy
+        if m.error == 0:
+            self._grid_share = min(max(m.power_grid, 0), wb.power) / wb.power if wb.power > 0 else 0
+        price = self._price(cycle.time)
+        self._grid_price = price if price is not None else self._config.grid_price
+
+        if connected:
+            self._session = s
+        else:
+            s = dataclasses.replace(s, end=cycle.time)
+            logger.info(f"Ledger: charging session ended, energy={s.energy:.0f}Wh, pv_share={s.pv_share:.2f}, cost={s.cost:.0f}ct")
+            self._session = None
+            if self._file:
+                self._file.append(encode_session(s))
+            self._add(s)
+
+    def _add(self, s: ChargingSession) -> None:
+        self._sessions.append(s)
+        for period, totals in self._totals.items():
+            key = _period_key(s.start, period)
+            totals[key] = totals.get(key, EnergyTotals(key)).add(s)
+
+    def get_state(self) -> LedgerState:
+        return LedgerState(self._session, self._last_charged_energy, self._grid_share, self._grid_price)
+
+    def restore_state(self, state: LedgerState) -> None:
+        self._session = state.session
+        self._last_charged_energy = state.last_charged_energy
+        self._grid_share = state.grid_share
+        self._grid_price = state.grid_price
+
+    def get_session(self) -> ChargingSession | None:
+        """Session in progress, None if no car is connected."""
+        return self._session
+
+    def get_sessions(self, n: int) -> list[ChargingSession]:
+        """Last n sessions incl. the session in progress, newest first."""
+        sessions = ([self._session] if self._session else []) + self._sessions[: -n - 1 : -1]
+        return sessions[:n]
+
+    def get_totals(self, period: Period) -> list[EnergyTotals]:
+        """Totals per period incl. the session in progress, oldest first."""
+        totals = dict(self._totals[period])
+        if self._session:
+            key = _period_key(self._session.start, period)
+            totals[key] = totals.get(key, EnergyTotals(key)).add(self._session)
+        return [totals[k] for k in sorted(totals)]
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
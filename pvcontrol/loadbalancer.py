@@ -0,0 +1,303 @@
+import asyncio
+import logging
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from typing import Any, final
+
+from prometheus_client import Gauge
+
+from pvcontrol.chargecontroller import ChargeMode
+from pvcontrol.meter import Meter
+from pvcontrol.relay import DisabledPhaseRelay, PhaseRelayConfig
+from pvcontrol.service import BaseConfig, BaseData, BaseService
+from pvcontrol.wallbox import CarStatus, Wallbox, WallboxData, WallboxFactory, WbError
+
+logger = logging.getLogger(__name__)
+
+# modes supported per wallbox, PV_ONLY shares the PV surplus, MAX may use grid power up to the phase current limit
+LOAD_BALANCER_MODES = (ChargeMode.OFF, ChargeMode.PV_ONLY, ChargeMode.MAX)
+
+
+@dataclass
+class LoadBalancerConfig(BaseConfig):
+    cycle_time: int = 30  # [s] control loop cycle time, used by scheduler
+    strategy: str = "fair"  # fair = round-robin in 1A steps, priority = fill up wallboxes in order of priority
+    max_phase_current: float = 32  # [A] current limit per phase of the house connection (main fuse)
+    line_voltage: float = 230  # [V]
+    power_hysteresis: float = 200  # [W] PV_ONLY: additional PV power for switching charging on
+    pv_allow_charging_delay: int = 120  # [s] PV_ONLY: min stable allow_charging time before switching on/off
+    # wallbox entries: {"name": "garage", "type": "GoeWallbox", "priority": 0, "phase": 1, "mode": "PV_ONLY", ...wallbox config}
+    # phase = grid phase (1..3) a wallbox uses when charging on 1 phase, higher priority is served first
+    wallboxes: list[dict[str, Any]] = field(default_factory=list)
+
+
+@dataclass(frozen=True, slots=True)
+class LoadBalancerData(BaseData):
+    available_power: float = 0  # [W] PV surplus for charging (pv - home consumption without wallboxes)
+    phase_currents: tuple[float, float, float] = (0, 0, 0)  # [A] estimated grid current per phase incl. allocated charging current
+
+
+@dataclass(frozen=True, slots=True)
+class ChargePointData(BaseData):
+    name: str = ""
+    mode: ChargeMode = ChargeMode.OFF
+    priority: int = 0
+    phase: int = 1  # grid phase for 1 phase charging
+    current: int = 0  # [A] allocated current per phase, 0 = charging off
+
+
+@dataclass(frozen=True, slots=True)
+class ChargeRequest:
+    """Input of allocate_currents(): grid phases (0..2) used by the wallbox and the supported current range."""
+
+    phases: tuple[int, ...]
+    min_current: int
+    max_current: int
+    pv_only: bool
+    hysteresis: float = 0  # [W] additional PV power for switching on (PV_ONLY with charging off)
+
+
+def allocate_currents(
+    requests: Sequence[ChargeRequest], pv_power: float, phase_budget: Sequence[float], line_voltage: float, strategy: str
+) -> list[int]:
+    """
+    Distribute current in 1A steps, requests must be sorted by priority (highest first).
+    MAX requests are served first and are limited by the phase budget only, PV_ONLY requests share the remaining pv_power.
+    Within each group min_current is granted in order of priority, the remaining current is distributed round-robin (fair)
+    or in order of priority. Returns the allocated current per request, 0 = not enough power for min_current (plus hysteresis).
+    """
+    currents = [0] * len(requests)
+    budget = list(phase_budget)
+    pv = pv_power
+
+    def grant(i: int, amps: int, hysteresis: float = 0) -> bool:
+        nonlocal pv
+        r = requests[i]
+        power = amps * len(r.phases) * line_voltage
+        if (r.pv_only and pv < power + hysteresis) or any(budget[p] < amps for p in r.phases):
+            return False
+        for p in r.phases:
+            budget[p] -= amps
+        pv -= power
+        currents[i] += amps
+        return True
+
+    for pv_only in (False, True):
+        group = [i for i, r in enumerate(requests) if r.pv_only == pv_only and r.max_current >= r.min_current]
+        active = [i for i in group if grant(i, requests[i].min_current, requests[i].hysteresis)]
+        if strategy == "priority":
+            for i in active:
+                while currents[i] < requests[i].max_current and grant(i, 1):
+                    pass
+        else:
+            while active:
+                active = [i for i in active if currents[i] < requests[i].max_current and grant(i, 1)]
+    return currents
+
+
+@final
+class ChargePoint:
+    """A wallbox managed by the load balancer."""
+
+    def __init__(self, name: str, wallbox: Wallbox[Any], priority: int = 0, phase: int = 1, mode: ChargeMode = ChargeMode.OFF):
+        if phase not in (1, 2, 3):
+            raise ValueError(f"Bad phase {phase} for wallbox {name}, must be 1..3")
+        self.wallbox: Wallbox[Any] = wallbox
+        self.data: ChargePointData = ChargePointData(name=name, mode=mode, priority=priority, phase=phase)
+        # error counter per wallbox, BaseService uses the class name as label
+        wallbox.set_service_label(f"{type(wallbox).__name__}[{name}]")
+        self.allow_charging_delay: int = 0  # [s] PV_ONLY: remaining time until allow_charging may be switched
+
+    @property
+    def name(self) -> str:
+        return self.data.name
+
+    def grid_phases(self, wb: WallboxData) -> tuple[int, ...]:
+        return (self.data.phase - 1,) if wb.phases_in == 1 else (0, 1, 2)
+
+    def wants_charging(self, wb: WallboxData) -> bool:
+        return (
+            self.data.mode != ChargeMode.OFF
+            and wb.car_status in (CarStatus.Charging, CarStatus.WaitingForVehicle)
+            and wb.wb_error == WbError.OK
+        )
+
+
+class LoadBalancer(BaseService[LoadBalancerConfig, LoadBalancerData]):
+    """
+    Controls several wallboxes that share one PV surplus and one house connection. Each cycle reads all wallboxes and the meter
+    concurrently, distributes the available current with allocate_currents() and sends the wallbox commands concurrently.
+    Phases are not switched. Like the charge controller, PV_ONLY wallboxes are switched on with power_hysteresis and only after
+    the desired allow_charging state was stable for pv_allow_charging_delay. The phase budget is based on the per phase grid
+    currents of the meter, home consumption is assumed to be distributed evenly over the 3 phases if the meter doesn't report them.
+    Wallboxes with read errors keep their last setting, its current is reserved in the phase budget.
+    """
+
+    _metrics_pvc_lb_current: Gauge = Gauge(
+        "pvcontrol_loadbalancer_current_amperes", "Allocated current per phase and wallbox (0 = off)", ["wallbox"]
+    )
+    _metrics_pvc_lb_power: Gauge = Gauge("pvcontrol_loadbalancer_wallbox_power_watts", "Charging power per wallbox", ["wallbox"])
+    _metrics_pvc_lb_available_power: Gauge = Gauge("pvcontrol_loadbalancer_available_power_watts", "PV surplus for charging")
+
+    def __init__(self, config: LoadBalancerConfig, meter: Meter[Any], charge_points: list[ChargePoint]):
+        super().__init__(config, LoadBalancerData())
+        if config.strategy not in ("fair", "priority"):
+            raise ValueError(f"Bad load balancer strategy: {config.strategy}")
+        names = [cp.name for cp in charge_points]
+        if len(names) != len(set(names)):
+            raise ValueError("Wallbox names must be unique")
+        self._meter: Meter[Any] = meter
+        # sorted by priority, stable for equal priority
+        self._charge_points: list[ChargePoint] = sorted(charge_points, key=lambda cp: -cp.data.priority)
+        self._by_name: dict[str, ChargePoint] = {cp.name: cp for cp in charge_points}
+
+    def get_charge_points(self) -> list[ChargePoint]:
+        """Charge points in order of priority."""
+        return self._charge_points
+
+    def get_charge_point(self, name: str) -> ChargePoint | None:
+        return self._by_name.get(name)
+
+    def set_mode(self, name: str, mode: ChargeMode) -> None:
+        cp = self._by_name.get(name)
+        if cp is None:
+            raise KeyError(name)
+        if mode not in LOAD_BALANCER_MODES:
+            raise ValueError(f"Mode {mode} is not supported by the load balancer")
+        cp.data = cp.data.replace(mode=mode)
+
+    async def run(self) -> None:
+        """Called by scheduler every cycle_time."""
+        try:
+            await self._run()
+            self.reset_error_counter()
+        except Exception as e:
+            logger.exception(f"Load balancer cycle failed: {e}")
+            self.inc_error_counter()
+
+    async def _run(self) -> None:
+        cfg = self.get_config()
+        cps = self._charge_points
+        wbs, m = await asyncio.gather(asyncio.gather(*(cp.wallbox.read_data() for cp in cps)), self._meter.read_data())
+
+        home_power = m.power_consumption - sum(wb.power for wb in wbs)
+        available_power = m.power_pv - home_power
+        grid_currents = (m.current_l1, m.current_l2, m.current_l3)
+        if any(grid_currents):
+            # per phase grid current without the wallboxes
+            phase_budget = [cfg.max_phase_current - c for c in grid_currents]
+            for cp, wb in zip(cps, wbs, strict=True):
+                if wb.phases_out > 0:
+                    for p in cp.grid_phases(wb):
+                        phase_budget[p] += wb.power / wb.phases_out / cfg.line_voltage
+        else:
+            home_current = max(home_power, 0) / (3 * cfg.line_voltage)
+            phase_budget = [cfg.max_phase_current - home_current] * 3
+
+        requests: list[ChargeRequest] = []
+        for cp, wb in zip(cps, wbs, strict=True):
+            phases = cp.grid_phases(wb)
+            wb_cfg = cp.wallbox.get_config()
+            if wb.error > 0:
+                # unknown state: reserve last setting
+                reserved = wb.max_current if wb.allow_charging else 0
+                for p in phases:
+                    phase_budget[p] -= reserved
+                available_power -= wb.power
+                requests.append(ChargeRequest(phases, 1, 0, True))  # never granted
+            elif cp.wants_charging(wb):
+                pv_only = cp.data.mode == ChargeMode.PV_ONLY
+                hysteresis = cfg.power_hysteresis if pv_only and not wb.allow_charging else 0
+                requests.append(ChargeRequest(phases, wb_cfg.min_supported_current, wb_cfg.max_supported_current, pv_only, hysteresis))
+            else:
+                requests.append(ChargeRequest(phases, 1, 0, True))
+
+        currents = allocate_currents(requests, available_power, phase_budget, cfg.line_voltage, cfg.strategy)
+        self._delay_allow_charging(wbs, requests, currents, phase_budget)
+
+        phase_currents = [cfg.max_phase_current - b for b in phase_budget]
+        commands: list[Any] = []
+        for cp, wb, r, current in zip(cps, wbs, requests, currents, strict=True):
+            for p in r.phases:
+                phase_currents[p] += current
+            LoadBalancer._metrics_pvc_lb_power.labels(cp.name).set(wb.power)
+            if wb.error > 0:
+                continue
+            cp.data = cp.data.replace(current=current)
+            LoadBalancer._metrics_pvc_lb_current.labels(cp.name).set(current)
+            commands.append(self._apply(cp.wallbox, wb, current))
+        await asyncio.gather(*commands)
+
+        LoadBalancer._metrics_pvc_lb_available_power.set(available_power)
+        self._set_data(
+            LoadBalancerData(available_power=available_power, phase_currents=(phase_currents[0], phase_currents[1], phase_currents[2]))
+        )
+
+    def _delay_allow_charging(
+        self, wbs: Sequence[WallboxData], requests: Sequence[ChargeRequest], currents: list[int], phase_budget: Sequence[float]
+    ) -> None:
+        """
+        PV_ONLY: switch allow_charging only if the allocation wants it for at least pv_allow_charging_delay, like the charge controller.
+        Until then a switched off wallbox stays off and a charging wallbox keeps charging with min_current if the phase budget allows.
+        """
+        cfg = self.get_config()
+        remaining = list(phase_budget)
+        for r, current in zip(requests, currents, strict=True):
+            for p in r.phases:
+                remaining[p] -= current
+        for i, (cp, wb, r) in enumerate(zip(self._charge_points, wbs, requests, strict=True)):
+            if wb.error > 0:
+                continue
+            if not (r.pv_only and cp.wants_charging(wb)):
+                cp.allow_charging_delay = 0
+            elif wb.allow_charging == (currents[i] > 0):
+                cp.allow_charging_delay = cfg.pv_allow_charging_delay
+            else:
+                cp.allow_charging_delay -= cfg.cycle_time
+                if cp.allow_charging_delay <= 0:
+                    cp.allow_charging_delay = cfg.pv_allow_charging_delay  # switched
+                    continue
+                if currents[i] > 0:
+                    amps = -currents[i]
+                elif all(remaining[p] >= r.min_current for p in r.phases):
+                    amps = r.min_current
+                else:
+                    continue  # phase limit exceeded: switch off immediately
+                for p in r.phases:
+                    remaining[p] -= amps
+                currents[i] += amps
+
+    @staticmethod
+    async def _apply(wallbox: Wallbox[Any], wb: WallboxData, current: int) -> None:
+        if current > 0:
+            if wb.max_current != current:
+                await wallbox.set_max_current(current)
+            if not wb.allow_charging:
+                await wallbox.allow_charging(True)
+        elif wb.allow_charging:
+            await wallbox.allow_charging(False)
+
+    async def close(self) -> None:
+        """Switch off charging and close all wallboxes."""
+        for cp in self._charge_points:
+            await cp.wallbox.allow_charging(False)
+            await cp.wallbox.close()
+
+
+class LoadBalancerFactory:
+    @classmethod
+    def newLoadBalancer(cls, meter: Meter[Any], **kwargs: Any) -> LoadBalancer:
+        config = LoadBalancerConfig(**kwargs)
+        charge_points: list[ChargePoint] = []
+        for entry in config.wallboxes:
+            wb_kwargs = dict(entry)
+            name = wb_kwargs.pop("name")
+            wb_type = wb_kwargs.pop("type", "SimulatedWallbox")
+            priority = int(wb_kwargs.pop("priority", 0))
+            phase = int(wb_kwargs.pop("phase", 1))
+            mode = ChargeMode(wb_kwargs.pop("mode", ChargeMode.OFF))
+            if mode not in LOAD_BALANCER_MODES:
+                raise ValueError(f"Mode {mode} of wallbox {name} is not supported by the load balancer")
+            wallbox = WallboxFactory.newWallbox(wb_type, DisabledPhaseRelay(PhaseRelayConfig()), **wb_kwargs)
+            charge_points.append(ChargePoint(name, wallbox, priority, phase, mode))
+        return LoadBalancer(config, meter, charge_points)
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import suppress
+from dataclasses import dataclass
+from datetime import datetime
+from typing import final
+
+from prometheus_client import Counter, Histogram
+
+from pvcontrol.service import BaseConfig
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoopMonitorConfig(BaseConfig):
+    enabled: bool = True
+    interval: float = 0.25  # [s] heartbeat interval
+    threshold: float = 1.0  # [s] loop blocked longer than threshold -> capture stack of blocking code
+
+
+@dataclass(frozen=True, slots=True)
+class BlockedLoop:
+    time: datetime
+    task: str  # name of the task that was running, empty for plain callbacks
+    stack: str
+
+
+@final
+class LoopMonitor:
+    """
+    Measures event loop scheduling lag with a heartbeat task. A watchdog thread captures the stack of the event loop thread
+    when the heartbeat is overdue by more than threshold, i.e. while the blocking code is still running.
+    """
+
+    _metrics_pvc_loop_lag: Histogram = Histogram(
+        "pvcontrol_event_loop_lag_seconds",
+        "Event loop scheduling lag of heartbeat",
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    )
+    _metrics_pvc_loop_blocked: Counter = Counter("pvcontrol_event_loop_blocked_total", "Event loop blocked longer than threshold")
+
+    def __init__(self, config: LoopMonitorConfig):
+        self._config = config
+        self._task: asyncio.Task[None] | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int = 0
+        self._beat: float = 0  # time.monotonic() of last heartbeat
+        self._blocked: deque[BlockedLoop] = deque(maxlen=10)
+
+    async def start(self) -> None:
+        if self._task:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            task = self._task
+            self._task = None
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        if self._watchdog:
+            self._watchdog.join()
+            self._watchdog = None
+
+    def get_blocked(self) -> list[BlockedLoop]:
+        """Last captured blocking stacks, newest first."""
+        return list(reversed(self._blocked))
+
+    async def _heartbeat(self) -> None:
+        interval = self._config.interval
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            self._beat = time.monotonic()
+            LoopMonitor._metrics_pvc_loop_lag.observe(max(self._beat - expected, 0))
+
+    def _watch(self) -> None:
+        # runs in watchdog thread
+        interval = self._config.interval
+        reported_beat = -1.0
+        while not self._stop.wait(interval):
+            beat = self._beat
+            if beat != reported_beat and time.monotonic() - beat > interval + self._config.threshold:
+                reported_beat = beat  # report once per blocking episode
+                self._capture()
+
+    def _capture(self) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)  # pyright: ignore[reportPrivateUsage]
+        if frame is None:
+            return
+        stack = "".join(traceback.format_stack(frame))
+        task = None
+        with suppress(RuntimeError):
+            task = asyncio.current_task(self._loop)
+        blocked = BlockedLoop(datetime.now(), task.get_name() if task else "", stack)
+        self._blocked.append(blocked)
+        LoopMonitor._metrics_pvc_loop_blocked.inc()
+        logger.warning(f"Event loop blocked for more than {self._config.threshold}s, task={blocked.task}:\n{stack}")
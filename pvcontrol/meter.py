@@ -1,3 +1,6 @@
+import asyncio
+import dataclasses
+import json
 import logging
 import math
 import time
@@ -8,20 +11,23 @@ from typing import Any, cast, override
 import aiohttp
 import pysmaplus
 import pysmaplus.definitions_webconnect
+import pysmaplus.exceptions
 import pysmaplus.sensor
-from prometheus_client import Gauge
+from prometheus_client import Counter, Gauge, Histogram
 from pymodbus.client import AsyncModbusTcpClient
 
+from pvcontrol.httpclient import HttpClientFactory
+from pvcontrol.offload import offload
 from pvcontrol.service import BaseConfig, BaseData, BaseService
-from pvcontrol.utils import aiohttp_trace_config
+from pvcontrol.timing import span
 from pvcontrol.wallbox import Wallbox
 
 logger = logging.getLogger(__name__)
 
-type MeterConfigTypes = KostalMeterConfig | SimulatedMeterConfig | SolarWattMeterConfig | SmaTripowerMeterConfig
+type MeterConfigTypes = KostalMeterConfig | SimulatedMeterConfig | SolarWattMeterConfig | SmaTripowerMeterConfig | CompositeMeterConfig
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class MeterData(BaseData):
     power_pv: float = 0  # power delivered by PV [W]
     power_consumption: float = (
@@ -34,17 +40,28 @@ class MeterData(BaseData):
     energy_consumption: float = 0  # [Wh], energy data is needed by chargecontroller (energy charged from pv vs grid)
     energy_consumption_grid: float = 0  # [Wh]
     energy_consumption_pv: float = 0  # [Wh]
+    # grid current per phase [A], + from grid, - to grid, 0 if not supported by the meter
+    current_l1: float = 0
+    current_l2: float = 0
+    current_l3: float = 0
 
     # based on math.isclose() to avoid rounding issues
     @override
     def __eq__(self, value: object) -> bool:
         if not isinstance(value, MeterData):
             return False
-        for field in self.__dataclass_fields__:
-            if not math.isclose(getattr(self, field), getattr(value, field), abs_tol=0.01):
+        a = self.values()
+        b = value.values()
+        if a == b:
+            return True
+        for x, y in zip(a, b, strict=True):
+            if abs(x - y) > 0.01 and not math.isclose(x, y, abs_tol=0.01):
                 return False
         return True
 
+    # must be consistent with the tolerant __eq__ -> hash only the (integer) error field
+    __hash__ = BaseData.__hash__
+
 
 class Meter[C: BaseConfig](BaseService[C, MeterData]):
     """Base class / interface for meters"""
@@ -53,17 +70,21 @@ class Meter[C: BaseConfig](BaseService[C, MeterData]):
     _metrics_pvc_meter_power_consumption_total: Gauge = Gauge(
         "pvcontrol_meter_power_consumption_total_watts", "Total home power consumption"
     )
+    _metrics_pvc_meter_grid_current: Gauge = Gauge("pvcontrol_meter_grid_current_amperes", "Grid current per phase", ["phase"])
 
     def __init__(self, config: C):
         super().__init__(config, MeterData())
 
     async def read_data(self) -> MeterData:
         """Read meter data and report metrics. The data is cached."""
-        m = await self._read_data()
-        self._set_data(m)
+        self._set_data(await self._read_data())
+        m = self.get_data()
         Meter._metrics_pvc_meter_power.labels("pv").set(m.power_pv)
         Meter._metrics_pvc_meter_power.labels("grid").set(m.power_grid)
         Meter._metrics_pvc_meter_power_consumption_total.set(m.power_consumption)
+        Meter._metrics_pvc_meter_grid_current.labels("L1").set(m.current_l1)
+        Meter._metrics_pvc_meter_grid_current.labels("L2").set(m.current_l2)
+        Meter._metrics_pvc_meter_grid_current.labels("L3").set(m.current_l3)
         return m
 
     async def _read_data(self) -> MeterData:
@@ -125,6 +146,7 @@ class SimulatedMeter(Meter[SimulatedMeterConfig]):
         self._energy_consumption_grid += delta_grid / 120
         self._energy_consumption_pv += delta_pv / 120
 
+        current = grid / 3 / 230  # assume grid power is distributed evenly
         return MeterData(
             0,
             pv,
@@ -135,6 +157,9 @@ class SimulatedMeter(Meter[SimulatedMeterConfig]):
             self._energy_consumption_grid + self._energy_consumption_pv,
             self._energy_consumption_grid,
             self._energy_consumption_pv,
+            current,
+            current,
+            current,
         )
 
 
@@ -150,13 +175,15 @@ class TestMeter(Meter[TestMeterConfig]):
         self._wallbox: Wallbox[Any] = wallbox
         self.set_data(0, 0)
         self._soc: float = 0.0
+        self._home_currents: tuple[float, float, float] | None = None  # None = no per phase currents (like SolarWattMeter)
         self._energy_consumption_grid: float = 0.0
         self._energy_consumption_pv: float = 0.0
 
     @override
     async def _read_data(self) -> MeterData:
         config = self.get_config()
-        power_car = self._wallbox.get_data().power
+        wb = self._wallbox.get_data()
+        power_car = wb.power
         pv = self._pv
         consumption = self._home + power_car
 
@@ -168,6 +195,11 @@ class TestMeter(Meter[TestMeterConfig]):
             battery = 0
         grid = excess_power - battery
 
+        # car charges on L1 (1 phase) or L1..L3
+        currents = list(self._home_currents or (0, 0, 0))
+        if self._home_currents and wb.phases_out > 0:
+            for p in range(3 if wb.phases_out > 1 else 1):
+                currents[p] += power_car / wb.phases_out / 230
         return MeterData(
             0,
             pv,
@@ -178,6 +210,7 @@ class TestMeter(Meter[TestMeterConfig]):
             self._energy_consumption_grid + self._energy_consumption_pv,
             self._energy_consumption_grid,
             self._energy_consumption_pv,
+            *currents,
         )
 
     def set_data(
@@ -191,24 +224,29 @@ class TestMeter(Meter[TestMeterConfig]):
         if soc >= 0:
             self._soc = soc
 
-    # Simulate time tick of 30s and increase energy consumption and battery SOC
-    async def tick(self) -> None:
+    def set_phase_currents(self, l1: float, l2: float, l3: float) -> None:
+        """Grid current per phase without car charging [A]."""
+        self._home_currents = (l1, l2, l3)
+
+    # Simulate time tick (default 30s cycle time) and increase energy consumption and battery SOC
+    async def tick(self, seconds: float = 30) -> None:
         config = self.get_config()
         data = await self.read_data()
+        hours = seconds / 3600
 
         if config.battery_capacity > 0:
-            delta_battery = data.power_battery / 120  # [Wh] assuming a 30s cycle time
+            delta_battery = data.power_battery * hours  # [Wh]
             self._soc += -delta_battery / config.battery_capacity * 100  # [0..100%]
         if self._soc < 0:
             self._soc = 0
         elif self._soc > 100:
             self._soc = 100
 
-        # energy consumption in Wh, assuming a 30s cycle time
+        # energy consumption in Wh
         delta_grid = data.power_grid if data.power_grid > 0 else 0
         delta_pv = data.power_consumption - delta_grid
-        self._energy_consumption_grid += delta_grid / 120
-        self._energy_consumption_pv += delta_pv / 120
+        self._energy_consumption_grid += delta_grid * hours
+        self._energy_consumption_pv += delta_pv * hours
 
 
 @dataclass
@@ -233,16 +271,24 @@ class KostalMeter(Meter[KostalMeterConfig]):
             # kpc_home_power_consumption_watts (grid=108, pv=116) -> consumption
             # kpc_ac_power_total_watts #172 -> pv
             # kpc_powermeter_total_watts #252 -> grid
+            # powermeter current/active power per phase: #224/#226 (L1), #234/#236 (L2), #244/#246 (L3)
             # TODO: read battery data
-            regs_grid = await self._modbusClient.read_holding_registers(252, count=2, device_id=self._unit)
+            with span("modbus", "252"):
+                regs_grid = await self._modbusClient.read_holding_registers(252, count=2, device_id=self._unit)
             if regs_grid.isError():
                 raise Exception(f"Error reading grid data: {regs_grid}")
-            regs_consumption = await self._modbusClient.read_holding_registers(108, count=12, device_id=self._unit)
+            with span("modbus", "108"):
+                regs_consumption = await self._modbusClient.read_holding_registers(108, count=12, device_id=self._unit)
             if regs_consumption.isError():
                 raise Exception(f"Error reading consumption data: {regs_grid}")
-            regs_pv = await self._modbusClient.read_holding_registers(172, count=2, device_id=self._unit)
+            with span("modbus", "172"):
+                regs_pv = await self._modbusClient.read_holding_registers(172, count=2, device_id=self._unit)
             if regs_pv.isError():
                 raise Exception(f"Error reading pv data: {regs_grid}")
+            with span("modbus", "224"):
+                regs_phases = await self._modbusClient.read_holding_registers(224, count=24, device_id=self._unit)
+            if regs_phases.isError():
+                raise Exception(f"Error reading phase data: {regs_phases}")
 
             grid = cast(float, AsyncModbusTcpClient.convert_from_registers(regs_grid.registers, AsyncModbusTcpClient.DATATYPE.FLOAT32))
             consumption = cast(
@@ -254,9 +300,23 @@ class KostalMeter(Meter[KostalMeterConfig]):
             consumption_pv = consumption[4]
             energy_consumption = consumption[5]
             pv = cast(float, AsyncModbusTcpClient.convert_from_registers(regs_pv.registers, AsyncModbusTcpClient.DATATYPE.FLOAT32))
+            phases = cast(
+                list[float], AsyncModbusTcpClient.convert_from_registers(regs_phases.registers, AsyncModbusTcpClient.DATATYPE.FLOAT32)
+            )
+            # powermeter reports current without sign, sign of active power: + from grid, - to grid
+            currents = [math.copysign(phases[i], phases[i + 1]) for i in (0, 5, 10)]
             self.reset_error_counter()
             return MeterData(
-                0, pv, consumption_grid + consumption_pv, grid, 0, 0, energy_consumption, energy_consumption_grid, energy_consumption_pv
+                0,
+                pv,
+                consumption_grid + consumption_pv,
+                grid,
+                0,
+                0,
+                energy_consumption,
+                energy_consumption_grid,
+                energy_consumption_pv,
+                *currents,
             )
         except Exception as e:
             logger.error(e)
@@ -284,16 +344,18 @@ class SolarWattMeter(Meter[SolarWattMeterConfig]):
         self._power_flow_url: str = f"{config.url}/rest/kiwigrid/wizard/devices"
         self._location_guid: str = config.location_guid
         self._timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=config.timeout)
-        self._session: aiohttp.ClientSession = aiohttp.ClientSession(trace_configs=[aiohttp_trace_config])
+        self._session: aiohttp.ClientSession = HttpClientFactory.newSession()
 
     @override
     async def _read_data(self) -> MeterData:
         try:
             async with self._session.get(self._power_flow_url, timeout=self._timeout) as res:
                 res.raise_for_status()
-                meter_data = self._json_2_meter_data(await res.json())
-                self.reset_error_counter()
-                return meter_data
+                body = await res.read()
+            # 100+ KB json
+            meter_data = await offload("solarwatt", len(body), lambda: self._json_2_meter_data(json.loads(body)))
+            self.reset_error_counter()
+            return meter_data
         except Exception as e:
             logger.error(e)
             errcnt = self.inc_error_counter()
@@ -324,14 +386,20 @@ class SmaTripowerMeterConfig(BaseConfig):
     verify_ssl: bool = False  # don't verify SSL certificate, useful for self-signed certificates
     password: str = ""
     device_id: str = ""  # device id of the tripower inverter
+    session_refresh_time: int = 60 * 60  # [s] re-login before the inverter expires the session
+    login_backoff_min: int = 30  # [s] delay after failed login, doubled on every failure
+    login_backoff_max: int = 15 * 60  # [s]
 
 
 class SmaTripowerMeter(Meter[SmaTripowerMeterConfig]):
+    _metrics_pvc_meter_sma_logins: Counter = Counter("pvcontrol_meter_sma_logins_total", "SMA webconnect logins", ["result"])
+    _metrics_pvc_meter_sma_read: Histogram = Histogram(
+        "pvcontrol_meter_sma_read_seconds", "SMA webconnect sensor read latency", buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    )
+
     def __init__(self, config: SmaTripowerMeterConfig):
         super().__init__(config)
-        self._session: aiohttp.ClientSession = aiohttp.ClientSession(
-            trace_configs=[aiohttp_trace_config], connector=aiohttp.TCPConnector(ssl=config.verify_ssl)
-        )
+        self._session: aiohttp.ClientSession = HttpClientFactory.newSession(verify_ssl=config.verify_ssl)
         self._smaDevice: pysmaplus.SMAwebconnect = pysmaplus.SMAwebconnect(self._session, config.url, password=config.password)
         self._deviceId: str = config.device_id
         self._sensors: pysmaplus.sensor.Sensors = pysmaplus.sensor.Sensors(
@@ -348,24 +416,63 @@ class SmaTripowerMeter(Meter[SmaTripowerMeterConfig]):
                 pysmaplus.definitions_webconnect.total_yield,
                 pysmaplus.definitions_webconnect.metering_total_yield,
                 pysmaplus.definitions_webconnect.metering_total_absorbed,
+                pysmaplus.definitions_webconnect.metering_current_l1,
+                pysmaplus.definitions_webconnect.metering_current_l2,
+                pysmaplus.definitions_webconnect.metering_current_l3,
+                pysmaplus.definitions_webconnect.metering_active_power_draw_l1,
+                pysmaplus.definitions_webconnect.metering_active_power_draw_l2,
+                pysmaplus.definitions_webconnect.metering_active_power_draw_l3,
+                pysmaplus.definitions_webconnect.metering_active_power_feed_l1,
+                pysmaplus.definitions_webconnect.metering_active_power_feed_l2,
+                pysmaplus.definitions_webconnect.metering_active_power_feed_l3,
             ]
         )
         for sensor in self._sensors:
             sensor.enabled = True  # enable all sensors
+        self._login_at: float = 0  # time.monotonic() of last successful login
+        self._login_backoff: float = 0  # [s] current login backoff, 0 = no failed login
+        self._login_retry_at: float = 0  # time.monotonic() of next login attempt
+
+    def _has_session(self) -> bool:
+        return self._smaDevice._sid is not None  # pyright: ignore[reportPrivateUsage]
+
+    async def _login(self) -> None:
+        cfg = self.get_config()
+        now = time.monotonic()
+        if self._has_session() and now - self._login_at > cfg.session_refresh_time:
+            logger.info("Refreshing SMA session")
+            with suppress(Exception):
+                await self._smaDevice.close_session()
+        if self._has_session():
+            return
+        if now < self._login_retry_at:
+            raise Exception(f"SMA login backoff, next attempt in {self._login_retry_at - now:.0f}s")
+        try:
+            await self._smaDevice.new_session()
+        except Exception:
+            SmaTripowerMeter._metrics_pvc_meter_sma_logins.labels("failed").inc()
+            self._login_backoff = min(max(2 * self._login_backoff, cfg.login_backoff_min), cfg.login_backoff_max)
+            self._login_retry_at = now + self._login_backoff
+            raise
+        SmaTripowerMeter._metrics_pvc_meter_sma_logins.labels("ok").inc()
+        self._login_at = now
+        self._login_backoff = 0
 
     @override
     async def _read_data(self) -> MeterData:
         try:
-            if self._smaDevice._sid is None:  # pyright: ignore[reportPrivateUsage]
-                await self._smaDevice.new_session()
-            await self._smaDevice.read(self._sensors, self._deviceId)
+            await self._login()
+            with SmaTripowerMeter._metrics_pvc_meter_sma_read.time():
+                await self._smaDevice.read(self._sensors, self._deviceId)
             meter_data = self._sensors_2_meter_data()
             self.reset_error_counter()
             return meter_data
         except Exception as e:
             logger.error(e)
-            with suppress(Exception):
-                await self._smaDevice.close_session()
+            # keep the session on network errors, pysmaplus closes it on error replies (e.g. expired session)
+            if not isinstance(e, (pysmaplus.exceptions.SmaConnectionException, TimeoutError)):
+                with suppress(Exception):
+                    await self._smaDevice.close_session()
             errcnt = self.inc_error_counter()
             if errcnt > 3:
                 return MeterData(errcnt)
@@ -401,7 +508,21 @@ class SmaTripowerMeter(Meter[SmaTripowerMeterConfig]):
         energy_battery_charge = self._sensors[pysmaplus.definitions_webconnect.battery_charge_total.key].value * 1000
         energy_consumption_pv = energy_pv - energy_to_grid - energy_battery_charge + energy_battery_discharge
         energy_consumption = energy_consumption_grid + energy_consumption_pv
-        return MeterData(0, pv, consumption, grid, battery, soc, energy_consumption, energy_consumption_grid, energy_consumption_pv)
+
+        # grid current per phase, sign from active power draw (+) vs feed (-)
+        wc = pysmaplus.definitions_webconnect
+        currents = [
+            self._signed_current(wc.metering_current_l1, wc.metering_active_power_draw_l1, wc.metering_active_power_feed_l1),
+            self._signed_current(wc.metering_current_l2, wc.metering_active_power_draw_l2, wc.metering_active_power_feed_l2),
+            self._signed_current(wc.metering_current_l3, wc.metering_active_power_draw_l3, wc.metering_active_power_feed_l3),
+        ]
+        return MeterData(
+            0, pv, consumption, grid, battery, soc, energy_consumption, energy_consumption_grid, energy_consumption_pv, *currents
+        )
+
+    def _signed_current(self, current: pysmaplus.sensor.Sensor, draw: pysmaplus.sensor.Sensor, feed: pysmaplus.sensor.Sensor) -> float:
+        i = self._sensors[current.key].value or 0
+        return -i if (self._sensors[feed.key].value or 0) > (self._sensors[draw.key].value or 0) else i
 
     @override
     async def close(self):
@@ -409,9 +530,160 @@ class SmaTripowerMeter(Meter[SmaTripowerMeterConfig]):
         await self._session.close()
 
 
+class CachingMeter(Meter[Any]):
+    """
+    Wraps a meter: concurrent read_data() calls are coalesced into one device request (single-flight) and data not older
+    than max_age is served from cache. Config, data and error counter are the ones of the wrapped meter.
+    """
+
+    _metrics_pvc_meter_cache: Counter = Counter("pvcontrol_meter_cache_total", "Meter reads by cache result", ["result"])
+
+    def __init__(self, meter: Meter[Any], max_age: float = 0):
+        super().__init__(meter.get_config())
+        self._meter: Meter[Any] = meter
+        self._max_age: float = max_age  # [s], 0 = coalesce concurrent reads only
+        self._read_at: float = -math.inf  # time.monotonic() when last successful read was started
+        self._inflight: asyncio.Task[MeterData] | None = None
+        for result in ["hit", "miss", "coalesced"]:
+            CachingMeter._metrics_pvc_meter_cache.labels(result)
+
+    def get_meter(self) -> Meter[Any]:
+        return self._meter
+
+    @override
+    def get_data(self) -> MeterData:
+        return self._meter.get_data()
+
+    @override
+    def get_error_counter(self) -> int:
+        return self._meter.get_error_counter()
+
+    @override
+    async def read_data(self) -> MeterData:
+        if self._inflight is not None:
+            CachingMeter._metrics_pvc_meter_cache.labels("coalesced").inc()
+            # shield: a cancelled reader must not cancel the request of the others
+            return await asyncio.shield(self._inflight)
+        if time.monotonic() - self._read_at <= self._max_age:
+            CachingMeter._metrics_pvc_meter_cache.labels("hit").inc()
+            return self._meter.get_data()
+        CachingMeter._metrics_pvc_meter_cache.labels("miss").inc()
+        started = time.monotonic()
+        self._inflight = asyncio.create_task(self._meter.read_data())
+        try:
+            m = await asyncio.shield(self._inflight)
+        finally:
+            if self._inflight.done():
+                self._inflight = None
+            else:
+                self._inflight.add_done_callback(self._done)
+        if self._meter.get_error_counter() == 0:
+            self._read_at = started
+        return m
+
+    def _done(self, task: asyncio.Task[MeterData]) -> None:
+        if self._inflight is task:
+            self._inflight = None
+
+    @override
+    async def close(self):
+        await self._meter.close()
+
+
+@dataclass
+class CompositeMeterConfig(BaseConfig):
+    # one entry per meter: {"type": "SmaTripowerMeter", "role": "grid" | "pv", "battery_capacity": [Wh], ...meter config}
+    # exactly one meter must have role "grid"
+    meters: list[dict[str, Any]] = dataclasses.field(default_factory=list)
+
+
+class CompositeMeter(Meter[CompositeMeterConfig]):
+    """
+    Combines several meters of split PV/battery systems, the meters are read concurrently:
+    - power_pv, power_battery: sum of all meters
+    - power_grid, energy_consumption_grid: from the grid meter
+    - soc_battery: average weighted by battery_capacity (meters with battery_capacity=0 are ignored), soc of grid meter if no capacity is configured
+    - power_consumption = power_pv + power_grid + power_battery
+    - energy_consumption_pv: sum of all meters, energy_consumption = energy_consumption_grid + energy_consumption_pv
+    One failing pv meter is tolerated: its power is counted as 0 (less PV is the safe side) and its last good energy values are used.
+    """
+
+    def __init__(self, config: CompositeMeterConfig, meters: list[Meter[Any]]):
+        super().__init__(config)
+        roles = [m.get("role", "pv") for m in config.meters]
+        if len(meters) != len(roles) or roles.count("grid") != 1:
+            raise ValueError("CompositeMeter needs exactly one meter with role 'grid'")
+        self._meters: list[Meter[Any]] = meters
+        self._grid_index: int = roles.index("grid")
+        self._capacities: list[float] = [float(m.get("battery_capacity", 0)) for m in config.meters]
+        self._last_good: list[MeterData] = [MeterData() for _ in meters]
+        for i, m in enumerate(meters):
+            # error counter per meter, BaseService uses the class name as label
+            m.set_service_label(f"{type(m).__name__}[{i}]")
+
+    def get_meters(self) -> list[Meter[Any]]:
+        return self._meters
+
+    @override
+    async def _read_data(self) -> MeterData:
+        data = await asyncio.gather(*(m.read_data() for m in self._meters))
+        failed = [i for i, d in enumerate(data) if d.error != 0]
+        if self._grid_index in failed or len(failed) > 1:
+            logger.error(f"CompositeMeter: failed meters {failed}")
+            errcnt = self.inc_error_counter()
+            if errcnt > 3:
+                return MeterData(errcnt)
+            else:
+                return self.get_data()
+        for i, d in enumerate(data):
+            if i not in failed:
+                self._last_good[i] = d
+        if failed:
+            logger.warning(f"CompositeMeter: ignoring failed meter {failed[0]}")
+        self.reset_error_counter()
+        return self._merge([d if i not in failed else MeterData() for i, d in enumerate(data)])
+
+    def _merge(self, data: list[MeterData]) -> MeterData:
+        grid = data[self._grid_index]
+        pv = sum(d.power_pv for d in data)
+        battery = sum(d.power_battery for d in data)
+        capacity = sum(self._capacities)
+        if capacity > 0:
+            soc = sum(d.soc_battery * c for d, c in zip(self._last_good, self._capacities, strict=True)) / capacity
+        else:
+            soc = grid.soc_battery
+        energy_pv = sum(d.energy_consumption_pv for d in self._last_good)
+        return MeterData(
+            0,
+            pv,
+            pv + grid.power_grid + battery,
+            grid.power_grid,
+            battery,
+            soc,
+            grid.energy_consumption_grid + energy_pv,
+            grid.energy_consumption_grid,
+            energy_pv,
+            grid.current_l1,
+            grid.current_l2,
+            grid.current_l3,
+        )
+
+    @override
+    async def close(self):
+        for m in self._meters:
+            await m.close()
+
+
 class MeterFactory:
     @classmethod
     def newMeter(cls, type: str, wb: Wallbox[Any], **kwargs: Any) -> Meter[Any]:
+        """cache_max_age [s] wraps the meter into a CachingMeter."""
+        cache_max_age: float | None = kwargs.pop("cache_max_age", None)
+        meter = cls._newMeter(type, wb, **kwargs)
+        return meter if cache_max_age is None else CachingMeter(meter, cache_max_age)
+
+    @classmethod
+    def _newMeter(cls, type: str, wb: Wallbox[Any], **kwargs: Any) -> Meter[Any]:
         if type == "KostalMeter":
             return KostalMeter(KostalMeterConfig(**kwargs))
         if type == "SolarWattMeter":
@@ -420,5 +692,12 @@ class MeterFactory:
             return SmaTripowerMeter(SmaTripowerMeterConfig(**kwargs))
         if type == "SimulatedMeter":
             return SimulatedMeter(SimulatedMeterConfig(**kwargs), wb)
+        if type == "CompositeMeter":
+            config = CompositeMeterConfig(**kwargs)
+            meters = [
+                cls.newMeter(m["type"], wb, **{k: v for k, v in m.items() if k not in ("type", "role", "battery_capacity")})
+                for m in config.meters
+            ]
+            return CompositeMeter(config, meters)
         else:
             raise ValueError(f"Bad meter type: {type}")
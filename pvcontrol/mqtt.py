@@ -1,5 +1,4 @@
 import asyncio
-import dataclasses
 import enum
 import json
 import logging
@@ -14,10 +13,13 @@ from typing import Any
 import aiomqtt
 
 from pvcontrol.car import Car
-from pvcontrol.chargecontroller import ChargeController, ChargeMode, PhaseMode, Priority
+from pvcontrol.chargecontroller import ChargeController, ChargeMode, PhaseMode, PhaseSwitchState, Priority
+from pvcontrol.loadbalancer import LOAD_BALANCER_MODES, ChargePointData, LoadBalancer
 from pvcontrol.meter import Meter
+from pvcontrol.planner import TariffPlanData
 from pvcontrol.relay import PhaseRelay
-from pvcontrol.wallbox import CarStatus, Wallbox, WbError
+from pvcontrol.tariff import PriceProvider
+from pvcontrol.wallbox import CarStatus, Wallbox, WallboxData, WbError
 
 logger = logging.getLogger(__name__)
 
@@ -230,6 +232,15 @@ ENTITY_DEFINITIONS: list[EntityDef] = [
         command_topic="controller/desired_priority/set",
         handler=lambda c, v: _validate_enum_and_set(v, Priority, c.set_desired_priority, "controller/desired_priority/set"),
     ),
+    EntityDef(
+        "sensor",
+        "controller_phase_switch",
+        "Phase Switch",
+        "{{ value_json.controller.phase_switch }}",
+        device_class="enum",
+        options=[s.value for s in PhaseSwitchState],
+        entity_category="diagnostic",
+    ),
     # Car
     EntityDef(
         "sensor",
@@ -240,6 +251,15 @@ ENTITY_DEFINITIONS: list[EntityDef] = [
         state_class="measurement",
         unit_of_measurement="%",
     ),
+    EntityDef(
+        "sensor",
+        "car_estimated_soc",
+        "Car Estimated SoC",
+        "{{ value_json.car.estimated_soc | round(0) }}",
+        device_class="battery",
+        state_class="measurement",
+        unit_of_measurement="%",
+    ),
     EntityDef(
         "sensor",
         "car_cruising_range",
@@ -291,6 +311,15 @@ ENTITY_DEFINITIONS: list[EntityDef] = [
         entity_category="diagnostic",
     ),
     EntityDef("sensor", "car_error", "Car Errors", "{{ value_json.car.error }}", state_class="measurement", entity_category="diagnostic"),
+    EntityDef(
+        "sensor",
+        "car_estimated_soc_confidence",
+        "Car Estimated SoC Confidence",
+        "{{ (value_json.car.estimated_soc_confidence * 100) | round(0) }}",
+        state_class="measurement",
+        unit_of_measurement="%",
+        entity_category="diagnostic",
+    ),
     EntityDef(
         "sensor",
         "car_data_captured_at",
@@ -336,6 +365,88 @@ _COMMAND_HANDLERS: dict[str, Callable[[ChargeController, str], None]] = {
 }
 
 
+def _wallbox_mode_handler(load_balancer: LoadBalancer, name: str, topic: str) -> Callable[[ChargeController, str], None]:
+    def set_mode(mode: ChargeMode) -> None:
+        load_balancer.set_mode(name, mode)
+
+    return lambda _c, v: _validate_enum_and_set(v, ChargeMode, set_mode, topic, lambda m: m in LOAD_BALANCER_MODES)
+
+
+def _wallbox_entities(load_balancer: LoadBalancer) -> list[EntityDef]:
+    """Entities per load balanced wallbox, state in value_json.wallboxes[name]."""
+    entities: list[EntityDef] = []
+    for cp in load_balancer.get_charge_points():
+        name = cp.name
+        wb = f"value_json.wallboxes['{name}']"
+        mode_topic = f"wallboxes/{name}/mode/set"
+        entities += [
+            EntityDef(
+                "sensor",
+                f"wallbox_{name}_power",
+                f"Wallbox {name} Power",
+                f"{{{{ {wb}.power | round(0) }}}}",
+                device_class="power",
+                state_class="measurement",
+                unit_of_measurement="W",
+            ),
+            EntityDef(
+                "sensor",
+                f"wallbox_{name}_current",
+                f"Wallbox {name} Current",
+                f"{{{{ {wb}.current }}}}",
+                device_class="current",
+                state_class="measurement",
+                unit_of_measurement="A",
+            ),
+            EntityDef(
+                "sensor",
+                f"wallbox_{name}_car_status",
+                f"Wallbox {name} Car Status",
+                f"{{{{ {wb}.car_status }}}}",
+                device_class="enum",
+                options=[s.name for s in CarStatus],
+            ),
+            EntityDef(
+                "select",
+                f"wallbox_{name}_mode",
+                f"Wallbox {name} Charge Mode",
+                f"{{{{ {wb}.mode }}}}",
+                device_class="enum",
+                options=[m.value for m in LOAD_BALANCER_MODES],
+                command_topic=mode_topic,
+                handler=_wallbox_mode_handler(load_balancer, name, mode_topic),
+            ),
+        ]
+    return entities
+
+
+# Dynamic tariff, state in value_json.tariff
+TARIFF_ENTITY_DEFINITIONS: list[EntityDef] = [
+    EntityDef(
+        "sensor", "tariff_price", "Grid Price", "{{ value_json.tariff.price }}", state_class="measurement", unit_of_measurement="ct/kWh"
+    ),
+    EntityDef(
+        "sensor", "tariff_next_grid_charging", "Next Grid Charging", "{{ value_json.tariff.next_grid_charging }}", device_class="timestamp"
+    ),
+    EntityDef(
+        "sensor",
+        "tariff_energy_grid",
+        "Planned Grid Energy",
+        "{{ value_json.tariff.energy_grid | round(0) }}",
+        state_class="measurement",
+        unit_of_measurement="Wh",
+    ),
+    EntityDef(
+        "sensor",
+        "tariff_cost",
+        "Planned Grid Cost",
+        "{{ value_json.tariff.cost | round(1) }}",
+        state_class="measurement",
+        unit_of_measurement="ct",
+    ),
+]
+
+
 class MqttPublisher:
     def __init__(
         self,
@@ -346,6 +457,8 @@ class MqttPublisher:
         wallbox: Wallbox,
         relay: PhaseRelay,
         car: Car,
+        load_balancer: LoadBalancer | None = None,
+        price_provider: PriceProvider[Any] | None = None,
     ):
         self._config = config
         self._version = version
@@ -354,6 +467,12 @@ class MqttPublisher:
         self._wallbox = wallbox
         self._relay = relay
         self._car = car
+        self._load_balancer = load_balancer
+        self._price_provider = price_provider
+        self._entities = ENTITY_DEFINITIONS + (_wallbox_entities(load_balancer) if load_balancer else [])
+        if price_provider:
+            self._entities += TARIFF_ENTITY_DEFINITIONS
+        self._tariff_schedule_key: Any = None  # last published tariff schedule, see _publish_tariff_schedule()
         self._client: aiomqtt.Client | None = None
         self._next_reconnect_at: float = 0
         self._client_id: str = uuid.uuid4().hex[:8]
@@ -361,8 +480,8 @@ class MqttPublisher:
         self._retained_state: dict[str, Any] | None = None
         self._state_received = asyncio.Event()  # signals when retained state message received
         self._state_restore_timeout_s: float = 2.0  # tests can set to 0 to skip waiting
-        # Use module-level command handlers (single source of truth)
-        self._command_handlers = _COMMAND_HANDLERS
+        # Module-level command handlers (single source of truth) plus handlers of load balanced wallboxes
+        self._command_handlers = {e.command_topic: e.handler for e in self._entities if e.command_topic and e.handler}
         # Message handler runs as background task after connection
         self._message_task: asyncio.Task | None = None
         # Retry window (seconds) for the initial connect; tests set it to 0 to disable retrying.
@@ -421,23 +540,63 @@ class MqttPublisher:
         try:
             state = {
                 "version": self._version,
-                "controller": dataclasses.asdict(self._controller.get_data()),
-                "meter": dataclasses.asdict(self._meter.get_data()),
-                "wallbox": dataclasses.asdict(self._wallbox.get_data()),
-                "relay": dataclasses.asdict(self._relay.get_data()),
-                "car": dataclasses.asdict(self._car.get_data()),
+                "controller": self._controller.get_data().as_dict(),
+                "meter": self._meter.get_data().as_dict(),
+                "wallbox": self._wallbox.get_data().as_dict(),
+                "relay": self._relay.get_data().as_dict(),
+                "car": self._car.get_data().as_dict(),
             }
             state["wallbox"]["car_status"] = CarStatus(state["wallbox"]["car_status"]).name
             state["wallbox"]["wb_error"] = WbError(state["wallbox"]["wb_error"]).name
+            if self._load_balancer:
+                state["wallboxes"] = {
+                    cp.name: self._wallbox_state(cp.wallbox.get_data(), cp.data) for cp in self._load_balancer.get_charge_points()
+                }
+            if self._price_provider:
+                state["tariff"] = self._tariff_state(self._price_provider, self._controller.get_tariff_plan())
 
             payload = json.dumps(state, default=_json_default)
             await self._client.publish(f"{self._config.topic_prefix}/state", payload=payload, retain=True)
+            if self._price_provider:
+                await self._publish_tariff_schedule(self._controller.get_tariff_plan())
         except aiomqtt.MqttError as e:
             logger.warning("MQTT publish failed: %s", e)
             await self._disconnect()
         except Exception:
             logger.exception("MQTT publish error")
 
+    @staticmethod
+    def _wallbox_state(wb: WallboxData, cp: ChargePointData) -> dict[str, Any]:
+        state = wb.as_dict()
+        state["car_status"] = CarStatus(wb.car_status).name
+        state["wb_error"] = WbError(wb.wb_error).name
+        state["mode"] = cp.mode
+        state["current"] = cp.current
+        return state
+
+    @staticmethod
+    def _tariff_state(price_provider: PriceProvider[Any], plan: TariffPlanData) -> dict[str, Any]:
+        next_grid_charging = next((s.start for s in plan.slots if s.mode == ChargeMode.MAX), None)
+        return {
+            "price": price_provider.price(datetime.now()),
+            "next_grid_charging": next_grid_charging.astimezone() if next_grid_charging else None,
+            "energy_grid": plan.energy_grid,
+            "cost": plan.cost,
+        }
+
+    async def _publish_tariff_schedule(self, plan: TariffPlanData) -> None:
+        """Publish the tariff schedule (retained) when the prices or the selected grid charging slots changed."""
+        assert self._client is not None
+        key = (plan.prices_updated_at, plan.departure, tuple((s.end, s.mode) for s in plan.slots))
+        if key == self._tariff_schedule_key:
+            return
+        slots = [{"start": s.start, "end": s.end, "price": s.price, "mode": s.mode} for s in plan.slots]
+        payload = json.dumps(
+            {"departure": plan.departure, "energy_grid": plan.energy_grid, "cost": plan.cost, "slots": slots}, default=_json_default
+        )
+        await self._client.publish(f"{self._config.topic_prefix}/tariff/schedule", payload=payload, retain=True)
+        self._tariff_schedule_key = key
+
     async def _connect_once(self) -> bool:
         """Attempt a single connection. Returns True on success, False on failure."""
         try:
@@ -503,7 +662,7 @@ class MqttPublisher:
             "payload_available": "online",
             "payload_not_available": "offline",
         }
-        for entity in ENTITY_DEFINITIONS:
+        for entity in self._entities:
             topic = f"{self._config.ha_discovery_prefix}/{entity.component}/pvcontrol_{entity.object_id}/config"
             payload: dict[str, Any] = {
                 "name": entity.name,
@@ -573,3 +732,8 @@ class MqttPublisher:
             if handler:
                 handler(self._controller, value_str)
                 logger.info("Restored %s: %s", key, value_str)
+        for name, wallbox_state in payload.get("wallboxes", {}).items():
+            handler = self._command_handlers.get(f"wallboxes/{name}/mode/set")
+            if handler and "mode" in wallbox_state:
+                handler(self._controller, wallbox_state["mode"])
+                logger.info("Restored wallbox %s mode: %s", name, wallbox_state["mode"])
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import final
+
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+
+@final
+class Offloader:
+    """
+    Runs CPU heavy parsing of large payloads in a bounded thread pool to keep the event loop responsive.
+    Small payloads are parsed inline as the thread hand-over costs more than parsing them.
+    At most max_pending jobs are submitted at once, further callers wait on the event loop (counted as queue time).
+    """
+
+    _metrics_pvc_offload_queue: Histogram = Histogram(
+        "pvcontrol_offload_queue_seconds",
+        "Time from offload request until parsing starts in worker thread",
+        ["name"],
+        buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1),
+    )
+    _metrics_pvc_offload_run: Histogram = Histogram(
+        "pvcontrol_offload_run_seconds",
+        "Parsing time in worker thread",
+        ["name"],
+        buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1),
+    )
+    _metrics_pvc_offload: Counter = Counter("pvcontrol_offload_total", "Parsed payloads", ["name", "mode"])
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 4, threshold: int = 32 * 1024):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pvcontrol-offload")
+        self._pending = asyncio.Semaphore(max_pending)
+        self.threshold = threshold  # [bytes] min payload size for offloading
+
+    async def run[T](self, name: str, size: int, fn: Callable[[], T]) -> T:
+        """Run fn in the worker pool if size >= threshold, otherwise inline."""
+        if size < self.threshold:
+            Offloader._metrics_pvc_offload.labels(name, "inline").inc()
+            return fn()
+        Offloader._metrics_pvc_offload.labels(name, "offloaded").inc()
+        requested = time.perf_counter()
+        async with self._pending:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._run, name, requested, fn)
+
+    @staticmethod
+    def _run[T](name: str, requested: float, fn: Callable[[], T]) -> T:
+        started = time.perf_counter()
+        Offloader._metrics_pvc_offload_queue.labels(name).observe(started - requested)
+        try:
+            return fn()
+        finally:
+            Offloader._metrics_pvc_offload_run.labels(name).observe(time.perf_counter() - started)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# shared by all meter and wallbox backends, started and shut down with the other components in dependencies
+_offloader: Offloader | None = None
+
+
+def start_offloader() -> Offloader:
+    global _offloader
+    if _offloader is None:
+        _offloader = Offloader()
+    return _offloader
+
+
+def shutdown_offloader() -> None:
+    global _offloader
+    if _offloader is not None:
+        _offloader.shutdown()
+        _offloader = None
+
+
+async def offload[T](name: str, size: int, fn: Callable[[], T]) -> T:
+    """Run fn with the shared offloader, see Offloader.run(). Inline if no offloader is started (e.g. in unit tests)."""
+    if _offloader is None:
+        return fn()
+    return await _offloader.run(name, size, fn)
@@ -0,0 +1,229 @@
+"""
+Charge planners for mode PLANNED (PV forecast only) and TARIFF (PV forecast and dynamic grid prices), re-planned every control cycle.
+"""
+
+import bisect
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+
+from pvcontrol.controllerconfig import ChargeMode
+from pvcontrol.service import BaseData
+from pvcontrol.tariff import PriceSlot
+
+
+@dataclass(frozen=True, slots=True)
+class ChargePlanSlot:
+    """One time slot of a charge plan, powers are averages over the slot."""
+
+    start: datetime
+    end: datetime
+    mode: ChargeMode = ChargeMode.PV_ONLY
+    power_pv: float = 0  # [W] forecasted PV surplus (excluding car charging)
+    power_charging: float = 0  # [W] planned charging power
+    power_grid: float = 0  # [W] planned charging power from grid
+
+    def hours(self) -> float:
+        return (self.end - self.start).total_seconds() / 3600
+
+
+@dataclass(frozen=True, slots=True)
+class ChargePlanData(BaseData):
+    """
+    Charge plan for mode PLANNED:
+    - target_soc, departure_time: as set by user
+    - departure: next departure
+    - soc: car SOC used for planning (-1 = unknown, no grid charging planned)
+    - energy_needed: energy to charge until departure [Wh]
+    - energy_pv, energy_grid: planned charging energy from PV and grid [Wh]
+    - slots: planned mode per time slot until departure, first slot is the current one
+    """
+
+    target_soc: float = 80
+    departure_time: time = time(7, 0)
+    departure: datetime | None = None
+    soc: float = -1
+    energy_needed: float = 0
+    energy_pv: float = 0
+    energy_grid: float = 0
+    slots: tuple[ChargePlanSlot, ...] = ()
+
+
+class ChargePlanner:
+    """
+    Plans the cheapest mix of PV_ONLY, PV_ALL and MAX time slots to charge a given energy until departure.
+    The PV surplus per slot (PV minus home consumption without car) is taken from the PV forecast, see BatteryPriorityOptimizer.pv_surplus().
+    """
+
+    def __init__(self, forecast: Callable[[datetime], float], slot_time: int):
+        self._forecast: Callable[[datetime], float] = forecast  # PV surplus forecast [W]
+        self._slot_time: int = slot_time
+
+    def _slot_index(self, t: datetime) -> int:
+        return (t.hour * 3600 + t.minute * 60 + t.second) // self._slot_time
+
+    @staticmethod
+    def slot_power(mode: ChargeMode, power_pv: float, min_power: float, max_power: float, pv_all_min_power: float) -> float:
+        """Approximated charging power of a mode at a given PV surplus."""
+        if mode == ChargeMode.MAX:
+            return max_power
+        elif mode == ChargeMode.PV_ALL:
+            return min(max(power_pv, min_power), max_power) if power_pv >= pv_all_min_power else 0
+        else:  # PV_ONLY
+            return min(power_pv, max_power) if power_pv >= min_power else 0
+
+    def plan(
+        self, now: datetime, departure: datetime, energy_needed: float, min_power: float, max_power: float, pv_all_min_power: float
+    ) -> list[ChargePlanSlot]:
+        """
+        Start with PV_ONLY everywhere and upgrade slots to PV_ALL or MAX in the order of grid energy per additional
+        charged energy until the needed energy is reached. Ties are resolved in favour of later slots.
+        """
+        # time slots until departure, the first one starts now and ends at the next slot boundary
+        starts: list[datetime] = []
+        ends: list[datetime] = []
+        t = now
+        while t < departure:
+            slot_end = datetime.combine(t.date(), time()) + timedelta(seconds=(self._slot_index(t) + 1) * self._slot_time)
+            slot_end = min(slot_end, departure)
+            starts.append(t)
+            ends.append(slot_end)
+            t = slot_end
+        hours = [(end - start).total_seconds() / 3600 for start, end in zip(starts, ends, strict=True)]
+        pvs = [self._forecast(t) for t in starts]
+
+        def power(i: int, mode: ChargeMode) -> float:
+            return ChargePlanner.slot_power(mode, pvs[i], min_power, max_power, pv_all_min_power)
+
+        modes = [ChargeMode.PV_ONLY] * len(starts)
+        energy = sum(power(i, ChargeMode.PV_ONLY) * hours[i] for i in range(len(starts)))
+        if energy < energy_needed:
+            candidates: list[tuple[float, int, ChargeMode]] = []
+            for i in range(len(starts)):
+                base = power(i, ChargeMode.PV_ONLY)
+                for mode in (ChargeMode.PV_ALL, ChargeMode.MAX):
+                    p = power(i, mode)
+                    if p > base:
+                        grid = p - min(pvs[i], p)
+                        candidates.append((grid / (p - base), -i, mode))
+            candidates.sort()
+            for _, neg_i, mode in candidates:
+                i = -neg_i
+                p_current = power(i, modes[i])
+                p = power(i, mode)
+                if p > p_current:
+                    modes[i] = mode
+                    energy += (p - p_current) * hours[i]
+                    if energy >= energy_needed:
+                        break
+
+        slots: list[ChargePlanSlot] = []
+        for i, start in enumerate(starts):
+            p = power(i, modes[i])
+            slots.append(ChargePlanSlot(start, ends[i], modes[i], pvs[i], p, p - min(pvs[i], p)))
+        return slots
+
+
+@dataclass(frozen=True, slots=True)
+class TariffPlanSlot:
+    """One price slot of a tariff schedule, powers are averages over the slot."""
+
+    start: datetime
+    end: datetime
+    price: float  # [ct/kWh]
+    mode: ChargeMode = ChargeMode.PV_ONLY
+    power_pv: float = 0  # [W] forecasted PV surplus (excluding car charging)
+    power_charging: float = 0  # [W] planned charging power
+    power_grid: float = 0  # [W] planned charging power from grid
+
+    def hours(self) -> float:
+        return (self.end - self.start).total_seconds() / 3600
+
+
+@dataclass(frozen=True, slots=True)
+class TariffPlanData(BaseData):
+    """
+    Charge schedule for mode TARIFF, target_soc and departure_time are taken from the charge plan (see ChargePlanData):
+    - departure: next departure
+    - soc: car SOC used for planning (-1 = unknown, no grid charging planned)
+    - energy_needed: energy to charge until departure [Wh]
+    - energy_pv, energy_grid: planned charging energy from PV and grid [Wh]
+    - cost: planned grid energy cost [ct]
+    - prices_updated_at: time when the prices of the schedule were read
+    - slots: price slots until departure, first slot is the current one, MAX = grid charging
+    """
+
+    departure: datetime | None = None
+    soc: float = -1
+    energy_needed: float = 0
+    energy_pv: float = 0
+    energy_grid: float = 0
+    cost: float = 0
+    prices_updated_at: datetime = datetime.min
+    slots: tuple[TariffPlanSlot, ...] = ()
+
+
+class TariffPlanner:
+    """
+    Selects the cheapest price slots until departure for the energy that the PV surplus can't deliver, all other slots use PV_ONLY.
+    The price ranking is only rebuilt when the prices change, re-planning every cycle is a linear walk over the price slots.
+    """
+
+    def __init__(self, forecast: Callable[[datetime], float], forecast_slot_time: int):
+        self._forecast: Callable[[datetime], float] = forecast  # PV surplus forecast [W]
+        self._forecast_slot_time: timedelta = timedelta(seconds=forecast_slot_time)
+        self._prices: tuple[PriceSlot, ...] = ()
+        self._ranking: list[int] = []  # indexes of _prices, cheapest first, earlier slot first on equal prices
+
+    def update_prices(self, prices: tuple[PriceSlot, ...]) -> bool:
+        """Rank new prices, returns False if the prices are unchanged."""
+        if prices is self._prices:
+            return False
+        self._prices = prices
+        self._ranking = sorted(range(len(prices)), key=lambda i: (prices[i].price, i))
+        return True
+
+    def _pv_surplus(self, start: datetime, end: datetime) -> float:
+        """Average forecasted PV surplus [W] of a price slot."""
+        powers: list[float] = []
+        t = start
+        while t < end:
+            powers.append(self._forecast(t))
+            t += self._forecast_slot_time
+        return sum(powers) / len(powers) if powers else 0
+
+    def plan(
+        self, now: datetime, departure: datetime, energy_needed: float, min_power: float, max_power: float, max_price: float = 0
+    ) -> list[TariffPlanSlot]:
+        prices = self._prices
+        first = bisect.bisect_right(prices, now, key=lambda s: s.end)
+        last = bisect.bisect_left(prices, departure, key=lambda s: s.start)
+        starts = [max(prices[i].start, now) for i in range(first, last)]
+        ends = [min(prices[i].end, departure) for i in range(first, last)]
+        hours = [(end - start).total_seconds() / 3600 for start, end in zip(starts, ends, strict=True)]
+        pvs = [self._pv_surplus(start, end) for start, end in zip(starts, ends, strict=True)]
+        pv_powers = [ChargePlanner.slot_power(ChargeMode.PV_ONLY, pv, min_power, max_power, 0) for pv in pvs]
+
+        grid_energy: dict[int, float] = {}  # slot -> additional energy charged in mode MAX [Wh]
+        remaining = energy_needed - sum(p * h for p, h in zip(pv_powers, hours, strict=True))
+        if remaining > 0:
+            for i in self._ranking:
+                if not first <= i < last:
+                    continue
+                if max_price > 0 and prices[i].price > max_price:
+                    break
+                j = i - first
+                additional = min((max_power - pv_powers[j]) * hours[j], remaining)
+                if additional > 0:
+                    grid_energy[j] = additional
+                    remaining -= additional
+                    if remaining <= 0:
+                        break
+
+        slots: list[TariffPlanSlot] = []
+        for j, start in enumerate(starts):
+            mode = ChargeMode.MAX if j in grid_energy else ChargeMode.PV_ONLY
+            # last selected slot is only partially needed: MAX until the target is reached
+            p = pv_powers[j] + grid_energy.get(j, 0) / hours[j] if hours[j] > 0 else 0
+            slots.append(TariffPlanSlot(start, ends[j], prices[first + j].price, mode, pvs[j], p, p - min(pvs[j], p)))
+        return slots
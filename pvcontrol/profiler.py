@@ -0,0 +1,119 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from types import FrameType
+from typing import Any, final
+
+from pvcontrol.service import BaseConfig
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProfilerConfig(BaseConfig):
+    token: str = ""  # bearer token for /debug/profile, empty = profiler endpoint disabled
+    interval: float = 0.005  # [s] sampling interval
+    max_seconds: int = 60  # max profiling duration
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+@final
+class Profile:
+    """Sampled stacks, root frame first. Stacks of the event loop thread are prefixed with the thread name."""
+
+    def __init__(self, samples: Counter[tuple[str, ...]], interval: float, duration: float):
+        self.samples = samples
+        self.interval = interval
+        self.duration = duration
+
+    def collapsed(self) -> str:
+        """Collapsed stack format as used by flamegraph.pl and speedscope: 'frame;frame;frame count' per line."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+    def speedscope(self) -> dict[str, Any]:
+        """speedscope file format with one sampled profile, see https://www.speedscope.app/file-format-schema.json"""
+        frame_index: dict[str, int] = {}
+        samples: list[list[int]] = []
+        weights: list[int] = []
+        for stack, count in self.samples.items():
+            samples.append([frame_index.setdefault(f, len(frame_index)) for f in stack])
+            weights.append(count)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": [{"name": f} for f in frame_index]},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": "pvcontrol",
+                    "unit": "none",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+            "name": "pvcontrol",
+            "exporter": "pvcontrol",
+        }
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+@final
+class SamplingProfiler:
+    """
+    In-process sampling profiler: a thread samples the stacks of all other threads (incl. the event loop) via
+    sys._current_frames(). Only one profile can run at a time.
+    """
+
+    def __init__(self, config: ProfilerConfig):
+        self._config = config
+        self._lock = threading.Lock()
+
+    def get_config(self) -> ProfilerConfig:
+        return self._config
+
+    def is_running(self) -> bool:
+        return self._lock.locked()
+
+    def run(self, seconds: float) -> Profile:
+        """Blocking, call via asyncio.to_thread() from the event loop. Raises ProfilerBusyError if a profile is already running."""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("Profiler is already running")
+        try:
+            logger.info(f"Start profiling for {seconds}s")
+            return self._sample(min(seconds, self._config.max_seconds))
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float) -> Profile:
+        interval = self._config.interval
+        own_id = threading.get_ident()
+        samples: Counter[tuple[str, ...]] = Counter()
+        start = time.monotonic()
+        end = start + seconds
+        while (now := time.monotonic()) < end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():  # pyright: ignore[reportPrivateUsage]
+                if thread_id == own_id:
+                    continue
+                stack: list[str] = []
+                f: FrameType | None = frame
+                while f is not None:
+                    stack.append(_frame_name(f))
+                    f = f.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stack.reverse()
+                samples[tuple(stack)] += 1
+            time.sleep(max(interval - (time.monotonic() - now), 0))
+        return Profile(samples, interval, time.monotonic() - start)
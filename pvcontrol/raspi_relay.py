@@ -1,19 +1,15 @@
 # pyright: reportImportCycles=false
 # this module is imported by PhaseRelayFactory to avoid import cycles
 import logging
+import time
+from collections.abc import Callable
 from typing import final, override
 
-# GPIO is only awailable on raspi
-import RPi.GPIO as GPIO  # ty:ignore[unresolved-import]
-
+from pvcontrol.gpio import GpioBackend, GpioFactory
 from pvcontrol.relay import PhaseRelay, PhaseRelayConfig, PhaseRelayData
 
 logger = logging.getLogger(__name__)
 
-logger.info("Initializing RPi.GPIO")
-GPIO.setwarnings(True)
-GPIO.setmode(GPIO.BCM)
-
 
 # https://www.waveshare.com/wiki/RPi_Relay_Board
 # Relay OFF = false = GPIO.HIGH
@@ -24,40 +20,63 @@ class GPIORelay:
     CHANNEL_2 = 20
     CHANNEL_3 = 21
 
-    def __init__(self, channel: int):
+    def __init__(self, gpio: GpioBackend, channel: int):
+        self._gpio = gpio
         self._channel = channel
-        ch_function = GPIO.gpio_function(channel)
-        logger.info(f"Before channel {channel} setup: function={ch_function}")
-        if ch_function == GPIO.OUT:
-            # keep state if channel is already OUT (= app restart)
-            GPIO.setup(channel, GPIO.OUT)
-        else:
-            # init to GPIO.HIGH = OFF to avoid switching on reboot
-            GPIO.setup(channel, GPIO.OUT, initial=GPIO.HIGH)
-        logger.info(f"After channel {channel} setup : relay={GPIO.input(channel)}")
+        # init to GPIO.HIGH = OFF to avoid switching on reboot
+        gpio.setup_output(channel, initial=True)
 
     def read(self) -> bool:
-        return GPIO.input(self._channel) == GPIO.LOW
+        return not self._gpio.read(self._channel)
 
     def write(self, v: bool):
         logger.info(f"write channel {self._channel}={v}")
-        GPIO.output(self._channel, GPIO.LOW if v else GPIO.HIGH)
+        self._gpio.write(self._channel, not v)
+
+    def add_edge_callback(self, callback: Callable[[], None]) -> bool:
+        return self._gpio.add_edge_callback(self._channel, callback)
 
 
 class RaspiPhaseRelay(PhaseRelay):
-    def __init__(self, config: PhaseRelayConfig):
+    """
+    Phase relay on a GPIO channel. The relay state is cached and only read from GPIO after writes,
+    on GPIO edge events (if supported by the backend) and every verification_interval.
+    """
+
+    def __init__(self, config: PhaseRelayConfig, gpio: GpioBackend | None = None):
         super().__init__(config, PhaseRelayData(enabled=True))
-        self._gpio_relay: GPIORelay = GPIORelay(GPIORelay.CHANNEL_1)  # TODO: configurable
-        self.get_phases()
+        if gpio is None:
+            gpio = GpioFactory.newGpio(config.gpio_backend, config.gpio_chip)
+        self._gpio_relay: GPIORelay = GPIORelay(gpio, config.gpio_channel)
+        self._verify_at: float = 0  # time.monotonic() of next verification read
+        self._changed: bool = False  # set by edge callback, may be called from a GPIO thread
+        if not self._gpio_relay.add_edge_callback(self._on_edge):
+            logger.info(f"No GPIO edge detection, verifying relay state every {config.verification_interval}s")
+        self._update_relay_state(self._read_relay())
+
+    def _on_edge(self):
+        self._changed = True
+
+    def _read_relay(self) -> bool:
+        self._changed = False
+        self._verify_at = time.monotonic() + self.get_config().verification_interval
+        return self._gpio_relay.read()
 
     @override
     def get_phases(self):
-        ch = self._gpio_relay.read()
-        self._update_relay_state(ch)
+        if self._changed or time.monotonic() >= self._verify_at:
+            ch = self._read_relay()
+            if ch != self.get_data().phase_relay:
+                logger.warning(f"Phase relay changed externally: {self.get_data().phase_relay} -> {ch}")
+                self._update_relay_state(ch)
         return self.get_data().phases
 
     @override
     def set_phases(self, phases: int):
         ch = self._phases_to_relay(phases)
         self._gpio_relay.write(ch)
-        self._update_relay_state(ch)
+        # read back to verify the write
+        ch_read = self._read_relay()
+        if ch_read != ch:
+            logger.error(f"Phase relay write failed: wrote {ch}, read {ch_read}")
+        self._update_relay_state(ch_read)
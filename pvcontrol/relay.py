@@ -20,9 +20,13 @@ class PhaseRelayConfig(BaseConfig):
     enable_phase_switching: bool = True  # set to False of phase relay is not in operation
     installed_on_host: str = ""  # if set, phase switching is only allowed when running on specified host (passed to pvcontrol via --hostname option, e.g. k8s nodeName)
     phase_relay_type: RelayType = RelayType.NO
+    gpio_backend: str = "RPi.GPIO"  # RaspiPhaseRelay only: RPi.GPIO | gpiod | fake
+    gpio_chip: str = "/dev/gpiochip0"  # gpiod only
+    gpio_channel: int = 26  # BCM channel of phase relay
+    verification_interval: int = 5 * 60  # [s] re-read cached relay state from GPIO (in addition to edge events and after writes)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PhaseRelayData(BaseData):
     enabled: bool = False  # indicates if phase relay is available
     phase_relay: bool = False  # on/off - mapping to 1 or 3 phases depends on relay type/wiring
@@ -92,7 +96,7 @@ class PhaseRelayFactory:
 
         if enabled:
             if type == "RaspiPhaseRelay":
-                # import only when configured and enabled = running on pi1 (RPi.GPIO module is not available on other platforms)
+                # import only when configured and enabled = running on pi1 (GPIO libraries are not available on other platforms)
                 from pvcontrol.raspi_relay import RaspiPhaseRelay
 
                 return RaspiPhaseRelay(config)
@@ -70,3 +70,47 @@ class AsyncScheduler:
                 self._coro(),
                 asyncio.sleep(self._interval),
             )
+
+
+@final
+class AdaptiveAsyncScheduler:
+    """
+    Async scheduler with an interval that is re-calculated after every run.
+    trigger() interrupts the current wait and starts the next run immediately.
+    """
+
+    def __init__(self, interval: Callable[[], float], coro: Callable[[], Awaitable[Any]]):
+        self._interval = interval
+        self._coro = coro
+        self._task = None
+        self._wakeup = asyncio.Event()
+
+    async def start(self):
+        if self._task:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            task = self._task
+            self._task = None
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+    def is_started(self) -> bool:
+        return self._task is not None
+
+    def trigger(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # triggers that arrive while the coroutine runs cause an immediate re-run
+            self._wakeup.clear()
+            started_at = loop.time()
+            await self._coro()
+            timeout = max(self._interval() - (loop.time() - started_at), 0)
+            with suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
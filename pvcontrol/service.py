@@ -1,5 +1,8 @@
+import dataclasses
+import operator
+from collections.abc import Callable
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Self
 
 from prometheus_client import Gauge
 
@@ -9,10 +12,59 @@ class BaseConfig:
     pass
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class BaseData:
+    """
+    Immutable snapshot of service data. Snapshots can be shared safely between controller, API and MQTT.
+    Use replace() to derive a modified copy.
+    """
+
     error: int = 0  # error counter, 0=OK
 
+    @classmethod
+    def field_names(cls) -> tuple[str, ...]:
+        """Field names of the record, computed once per class."""
+        return _fields(cls)[0]
+
+    def values(self) -> tuple[Any, ...]:
+        """All field values in field order."""
+        return _fields(type(self))[1](self)
+
+    def replace(self, **changes: Any) -> Self:
+        """
+        Return a copy with changed fields. Copies the slots without calling __init__ (records have no __post_init__),
+        faster than dataclasses.replace(). Unknown fields raise AttributeError.
+        """
+        cls = type(self)
+        names, values = _fields(cls)
+        new = object.__new__(cls)
+        for name, value in zip(names, values(self), strict=True):
+            _setattr(new, name, value)
+        for name, value in changes.items():
+            _setattr(new, name, value)
+        return new
+
+    def as_dict(self) -> dict[str, Any]:
+        """Shallow dict of all fields (cheaper than dataclasses.asdict, fields are scalar values)."""
+        names, values = _fields(type(self))
+        return dict(zip(names, values(self), strict=True))
+
+
+type _Fields = tuple[tuple[str, ...], Callable[[Any], tuple[Any, ...]]]
+
+_record_fields: dict[type[BaseData], _Fields] = {}
+_setattr = object.__setattr__
+
+
+def _fields(cls: type[BaseData]) -> _Fields:
+    """Field names and a getter for all field values of a record class, computed once per class."""
+    f = _record_fields.get(cls)
+    if f is None:
+        names = tuple(f.name for f in dataclasses.fields(cls))
+        getter = operator.attrgetter(*names)
+        f = _record_fields[cls] = (names, getter if len(names) > 1 else lambda o: (getter(o),))
+    return f
+
 
 class BaseService[C: BaseConfig, D: BaseData]:
     _metrics_pvc_error: Gauge = Gauge("pvcontrol_error", "Error counter per service. 0 = ok.", ["service"])
@@ -32,8 +84,22 @@ class BaseService[C: BaseConfig, D: BaseData]:
         return self._data
 
     def _set_data(self, data: D) -> None:
-        data.error = self.get_error_counter()
-        self._data = data
+        errcnt = self.get_error_counter()
+        self._data = data if data.error == errcnt else data.replace(error=errcnt)
+
+    def _update_data(self, **changes: Any) -> D:
+        """Replace fields of the current data snapshot."""
+        self._data = self._data.replace(**changes)
+        return self._data
+
+    def get_service_label(self) -> str:
+        """Label of the error counter metric, the class name by default."""
+        return self._service_label
+
+    def set_service_label(self, label: str) -> None:
+        """Set the label of the error counter metric, e.g. to distinguish several instances of one service class."""
+        self._service_label = label
+        BaseService._metrics_pvc_error.labels(label).set(self._data.error)
 
     def get_error_counter(self) -> int:
         v: float | Any = BaseService._metrics_pvc_error.labels(self._service_label)._value.get()  # pyright: ignore[reportPrivateUsage, reportUnknownVariableType]
@@ -44,9 +110,10 @@ class BaseService[C: BaseConfig, D: BaseData]:
     def inc_error_counter(self) -> int:
         BaseService._metrics_pvc_error.labels(self._service_label).inc()
         errcnt = self.get_error_counter()
-        self._data.error = errcnt
+        self._update_data(error=errcnt)
         return errcnt
 
     def reset_error_counter(self):
         BaseService._metrics_pvc_error.labels(self._service_label).set(0)
-        self._data.error = 0
+        if self._data.error != 0:
+            self._update_data(error=0)
@@ -0,0 +1,145 @@
+import dataclasses
+import math
+import random
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any
+
+from pvcontrol.chargecontroller import ChargeController, ChargeControllerConfig, ChargeMode, ControllerCycle
+from pvcontrol.meter import TestMeter, TestMeterConfig
+from pvcontrol.relay import PhaseRelayConfig, SimulatedPhaseRelay
+from pvcontrol.strategy import get_strategies
+from pvcontrol.wallbox import CarStatus, SimulatedWallbox, WallboxConfig
+
+
+@dataclass(frozen=True, slots=True)
+class PowerSample:
+    time: datetime
+    power_pv: float  # [W]
+    power_home: float  # [W] home consumption without car charging
+
+
+def samples_from_cycles(cycles: Sequence[ControllerCycle]) -> list[PowerSample]:
+    """PV and home consumption of a recorded trace (see trace.py), cycles with meter or wallbox errors are skipped."""
+    return [
+        PowerSample(c.time, c.meter.power_pv, c.meter.power_consumption - c.wallbox.power)
+        for c in cycles
+        if c.meter.error == 0 and c.wallbox.error == 0
+    ]
+
+
+def synthetic_day(
+    day: date, peak_power: float, clouds: float = 0, home_power: float = 400, cycle_time: int = 30, seed: int = 0
+) -> list[PowerSample]:
+    """
+    PV and home power of one day (0:00 - 24:00), PV with a sine shaped clear sky curve between 6:00 and 20:00. clouds = 0..1 is
+    the probability that a cloud reduces PV power in a cycle, clouds last a few minutes. Home consumption is constant.
+    Same seed = same day.
+    """
+    rnd = random.Random(seed)
+    start = datetime.combine(day, datetime.min.time())
+    samples: list[PowerSample] = []
+    shade = 0
+    for i in range(24 * 3600 // cycle_time):
+        t = start + timedelta(seconds=i * cycle_time)
+        hour = i * cycle_time / 3600
+        pv = 0.0
+        if 6 <= hour < 20:
+            if shade > 0:
+                shade -= 1
+            elif rnd.random() < clouds / 10:
+                shade = rnd.randint(2, 20)
+            pv = peak_power * math.sin(math.pi * (hour - 6) / 14)
+            if shade > 0:
+                pv *= 0.2
+        samples.append(PowerSample(t, pv, home_power))
+    return samples
+
+
+def synthetic_days(start: date, days: int, peak_power: float, clouds: Sequence[float], **kwargs: Any) -> list[PowerSample]:
+    """Several synthetic days, clouds per day are taken round robin."""
+    samples: list[PowerSample] = []
+    for i in range(days):
+        samples += synthetic_day(start + timedelta(days=i), peak_power, clouds[i % len(clouds)], seed=i, **kwargs)
+    return samples
+
+
+@dataclass(frozen=True, slots=True)
+class StrategyScore:
+    strategy: str
+    energy_pv: float = 0  # [Wh] charged from PV (incl. home battery)
+    energy_grid: float = 0  # [Wh] charged from grid
+    energy_unused: float = 0  # [Wh] PV surplus fed into grid while the car was connected
+    switches: int = 0  # charging switched on or off
+    phase_switches: int = 0
+    battery_soc_sunset: float = 0  # [%] average SOC of home battery at the end of the PV day, 0 without battery
+
+    def score(self) -> float:
+        """PV energy charged minus grid energy charged [Wh], higher is better."""
+        return self.energy_pv - self.energy_grid
+
+
+async def simulate(
+    strategy: str,
+    samples: Sequence[PowerSample],
+    config: ChargeControllerConfig | None = None,
+    wallbox_config: WallboxConfig | None = None,
+    meter_config: TestMeterConfig | None = None,
+) -> StrategyScore:
+    """
+    Run a ChargeController with a simulated wallbox (car always connected) and meter (optionally with home battery) on the PV and
+    home power samples with a virtual clock. The controller runs in mode PV_ONLY and priority AUTO with strategy as pv_only_strategy.
+    cycle_time is taken from the sample interval.
+    """
+    config = dataclasses.replace(config or ChargeControllerConfig(), pv_only_strategy=strategy)
+    if len(samples) > 1:
+        config = dataclasses.replace(config, cycle_time=int((samples[1].time - samples[0].time).total_seconds()))
+    wallbox = SimulatedWallbox(wallbox_config or WallboxConfig())
+    wallbox.set_car_status(CarStatus.Charging)
+    meter = TestMeter(meter_config or TestMeterConfig(), wallbox)
+    controller = ChargeController(config, meter, wallbox, SimulatedPhaseRelay(PhaseRelayConfig()))
+    now = samples[0].time if samples else datetime.min
+    controller._now = lambda: now  # pyright: ignore[reportPrivateUsage]
+    controller.set_desired_mode(ChargeMode.PV_ONLY)
+
+    energy_pv = energy_grid = energy_unused = 0.0
+    switches = phase_switches = 0
+    sunset_socs: list[float] = []
+    pv_day = False
+    last = wallbox.get_data()
+    for i, sample in enumerate(samples):
+        now = sample.time
+        meter.set_data(sample.power_pv, sample.power_home)
+        await controller.run()
+        cycle = controller.get_last_cycle()
+        if cycle is None:
+            continue
+        # wallbox power is constant until the next cycle
+        hours = ((samples[i + 1].time - now) if i + 1 < len(samples) else timedelta(seconds=config.cycle_time)).total_seconds() / 3600
+        await meter.tick(hours * 3600)
+        wb = cycle.wallbox
+        grid = min(max(cycle.meter.power_grid, 0), wb.power)  # home battery is used before grid
+        energy_pv += (wb.power - grid) * hours
+        energy_grid += grid * hours
+        energy_unused += max(-cycle.meter.power_grid, 0) * hours
+        switches += wb.allow_charging != last.allow_charging
+        phase_switches += wb.phases_in != last.phases_in
+        last = wb
+        if pv_day and sample.power_pv <= 0:
+            sunset_socs.append(cycle.meter.soc_battery)
+        pv_day = sample.power_pv > 0
+    if pv_day:
+        sunset_socs.append(meter.get_data().soc_battery)
+    battery_soc_sunset = sum(sunset_socs) / len(sunset_socs) if sunset_socs else 0
+    return StrategyScore(strategy, energy_pv, energy_grid, energy_unused, switches, phase_switches, battery_soc_sunset)
+
+
+async def benchmark(
+    samples: Sequence[PowerSample],
+    config: ChargeControllerConfig | None = None,
+    strategies: Sequence[str] | None = None,
+) -> list[StrategyScore]:
+    """Score strategies (default: all registered strategies) on the same samples, best score first."""
+    scores = [await simulate(s, samples, config) for s in strategies or get_strategies()]
+    return sorted(scores, key=lambda s: -s.score())
@@ -0,0 +1,148 @@
+"""
+Charge strategies: calculate the charging current of the PV charge modes, registered by name and selected per mode in the config.
+"""
+
+import abc
+import importlib
+import inspect
+import math
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import override
+
+from pvcontrol.controllerconfig import ChargeControllerConfig, Priority
+from pvcontrol.meter import MeterData
+from pvcontrol.wallbox import WallboxData
+
+
+@dataclass(frozen=True, slots=True)
+class StrategyInput:
+    """Snapshot of a control cycle passed to ChargeStrategy.charging_current()."""
+
+    meter: MeterData
+    wallbox: WallboxData
+    priority: Priority  # effective priority: CAR or HOME_BATTERY
+    available_power: float  # [W] power available for charging according to priority, incl. current charging power
+    phases: int  # phases used for charging
+    history: tuple[float, ...]  # [W] available power of the previous cycles, oldest first
+    pv_forecast: float = 0  # [W] forecasted PV power of the next time slot (see forecast.py), 0 = unknown
+
+
+class ChargeStrategy(abc.ABC):
+    """
+    Calculates the charging current of a PV charge mode. Strategies are registered by name with @register_strategy and
+    selected per mode via ChargeControllerConfig.pv_only_strategy and pv_all_strategy. Strategies must implement all abstract methods.
+    The controller takes care of allow_charging delay, max supported current, grid current limit and phase switching.
+    """
+
+    def __init__(self, config: ChargeControllerConfig, min_current: int, max_current: int):
+        self.config: ChargeControllerConfig = config
+        self.min_current: int = min_current  # [A] min supported current of wallbox
+        self.max_current: int = max_current  # [A] max supported current of wallbox
+
+    @abc.abstractmethod
+    def phase_thresholds(self) -> tuple[float, float]:
+        """Available power for switching from 1 to 3 phases and from 3 to 1 phase (phase mode AUTO)."""
+
+    @abc.abstractmethod
+    def charging_current(self, s: StrategyInput) -> int:
+        """Charging current per phase, 0 = charging off."""
+
+
+_strategies: dict[str, type[ChargeStrategy]] = {}
+
+
+def register_strategy[T: type[ChargeStrategy]](name: str) -> Callable[[T], T]:
+    """Class decorator for registering a charge strategy under name, raises ValueError if the strategy is incomplete."""
+
+    def register(cls: T) -> T:
+        if inspect.isabstract(cls):
+            raise ValueError(f"Charge strategy {name} does not implement {', '.join(sorted(cls.__abstractmethods__))}")
+        _strategies[name] = cls
+        return cls
+
+    return register
+
+
+def get_strategies() -> list[str]:
+    """Names of all registered strategies."""
+    return sorted(_strategies)
+
+
+def new_strategy(name: str, config: ChargeControllerConfig, min_current: int, max_current: int) -> ChargeStrategy:
+    """Create a registered strategy or a custom strategy given as "module:Class"."""
+    cls = _strategies.get(name)
+    if cls is None and ":" in name:
+        module, _, attr = name.partition(":")
+        cls = getattr(importlib.import_module(module), attr, None)
+    if not isinstance(cls, type) or not issubclass(cls, ChargeStrategy) or inspect.isabstract(cls):
+        raise ValueError(f"Unknown charge strategy: {name}")
+    return cls(config, min_current, max_current)
+
+
+@register_strategy("pv_only")
+class PvOnlyStrategy(ChargeStrategy):
+    """PV_ONLY: charging current is rounded down so that no grid power is used, charging is switched off below min current."""
+
+    def __init__(self, config: ChargeControllerConfig, min_current: int, max_current: int):
+        super().__init__(config, min_current, max_current)
+        min_power_1phase = min_current * config.line_voltage
+        min_power_3phases = 3 * min_current * config.line_voltage
+        self.on: float = min_power_1phase + config.power_hysteresis
+        self.phase_1_3_threshold: float = min_power_3phases + config.power_hysteresis
+        self.phase_3_1_threshold: float = min_power_3phases
+
+    @override
+    def phase_thresholds(self) -> tuple[float, float]:
+        return self.phase_1_3_threshold, self.phase_3_1_threshold
+
+    @override
+    def charging_current(self, s: StrategyInput) -> int:
+        return self._current(s, s.available_power)
+
+    def _current(self, s: StrategyInput, available_power: float) -> int:
+        config = self.config
+        if not s.wallbox.allow_charging and available_power < self.on:
+            return 0
+        current = math.floor(available_power / config.line_voltage / s.phases + config.current_rounding_offset)
+        return current if current >= self.min_current else 0
+
+
+@register_strategy("pv_only_smoothed")
+class SmoothedPvOnlyStrategy(PvOnlyStrategy):
+    """
+    PV_ONLY for cloudy days: increases the charging current only when the average available power of the history window allows it,
+    decreases it immediately. Avoids charging current and on/off flapping on fast changing PV power.
+    """
+
+    @override
+    def charging_current(self, s: StrategyInput) -> int:
+        power = s.available_power
+        if s.history:
+            power = min(power, (sum(s.history) + power) / (len(s.history) + 1))
+        return self._current(s, power)
+
+
+@register_strategy("pv_all")
+class PvAllStrategy(ChargeStrategy):
+    """PV_ALL: charging current is rounded up so that all PV is used, grid power fills up to min current."""
+
+    def __init__(self, config: ChargeControllerConfig, min_current: int, max_current: int):
+        super().__init__(config, min_current, max_current)
+        max_power_1phase = max_current * config.line_voltage
+        self.on: float = config.pv_all_min_power
+        self.off: float = max(config.pv_all_min_power - config.power_hysteresis, 100)
+        self.phase_1_3_threshold: float = max_power_1phase
+        self.phase_3_1_threshold: float = max_power_1phase - config.power_hysteresis
+
+    @override
+    def phase_thresholds(self) -> tuple[float, float]:
+        return self.phase_1_3_threshold, self.phase_3_1_threshold
+
+    @override
+    def charging_current(self, s: StrategyInput) -> int:
+        config = self.config
+        if (not s.wallbox.allow_charging and s.available_power < self.on) or s.available_power < self.off:
+            return 0
+        current = math.ceil(s.available_power / config.line_voltage / s.phases - config.current_rounding_offset)
+        return max(current, self.min_current)
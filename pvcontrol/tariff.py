@@ -0,0 +1,145 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, override
+
+from prometheus_client import Gauge
+
+from pvcontrol.service import BaseConfig, BaseData, BaseService
+
+logger = logging.getLogger(__name__)
+
+type PriceProviderConfigTypes = PriceProviderConfig | FilePriceProviderConfig
+
+
+@dataclass(frozen=True, slots=True)
+class PriceSlot:
+    start: datetime
+    end: datetime
+    price: float  # [ct/kWh] grid price
+
+
+@dataclass(frozen=True, slots=True)
+class PriceData(BaseData):
+    """
+    Grid price time series of a dynamic tariff:
+    - prices: price slots in time order
+    - updated_at: time when the prices were read, datetime.min = no prices yet
+    """
+
+    prices: tuple[PriceSlot, ...] = ()
+    updated_at: datetime = datetime.min
+
+
+@dataclass
+class PriceProviderConfig(BaseConfig):
+    refresh_interval: int = 15 * 60  # [s] interval for reading prices, used by scheduler
+
+
+def parse_prices(entries: Sequence[dict[str, Any]], slot_time: int) -> tuple[PriceSlot, ...]:
+    """
+    Price slots from [{"start": "2024-06-01T13:00:00", "price": 21.5, "end": ...}, ...] (ISO times, naive = local time).
+    end is optional and defaults to the start of the next slot, slot_time [s] for the last slot.
+    """
+    starts = sorted((datetime.fromisoformat(e["start"]), e) for e in entries)
+    slots: list[PriceSlot] = []
+    for i, (start, e) in enumerate(starts):
+        if "end" in e:
+            end = datetime.fromisoformat(e["end"])
+        elif i + 1 < len(starts):
+            end = starts[i + 1][0]
+        else:
+            end = start + timedelta(seconds=slot_time)
+        slots.append(PriceSlot(start, end, float(e["price"])))
+    return tuple(slots)
+
+
+class PriceProvider[C: PriceProviderConfig](BaseService[C, PriceData]):
+    """Base class / interface for grid price providers. Prices are kept on read errors."""
+
+    _metrics_pvc_tariff_price: Gauge = Gauge("pvcontrol_tariff_price", "Current grid price [ct/kWh]")
+
+    def __init__(self, config: C):
+        super().__init__(config, PriceData())
+
+    async def read_data(self) -> PriceData:
+        """Read prices if changed, called every refresh_interval."""
+        try:
+            prices = await self._read_prices()
+            if prices is not None:
+                self._set_data(PriceData(prices=prices, updated_at=datetime.now()))
+                logger.info(f"Read {len(prices)} price slots")
+            self.reset_error_counter()
+        except Exception as e:
+            logger.warning(f"Reading prices failed: {e}")
+            self.inc_error_counter()
+        price = self.price(datetime.now())
+        if price is not None:
+            PriceProvider._metrics_pvc_tariff_price.set(price)
+        return self.get_data()
+
+    async def _read_prices(self) -> tuple[PriceSlot, ...] | None:
+        """New prices, None if unchanged."""
+        return None
+
+    def price(self, t: datetime) -> float | None:
+        """Price at time t, None if unknown."""
+        prices = self.get_data().prices
+        i = bisect.bisect_right(prices, t, key=lambda s: s.start) - 1
+        if i >= 0 and t < prices[i].end:
+            return prices[i].price
+        return None
+
+
+class SimulatedPriceProvider(PriceProvider[PriceProviderConfig]):
+    """Local stand-in for a price service, prices are set via set_prices()."""
+
+    def __init__(self, config: PriceProviderConfig):
+        super().__init__(config)
+
+    def set_prices(self, prices: Sequence[PriceSlot]) -> None:
+        self._set_data(PriceData(prices=tuple(prices), updated_at=datetime.now()))
+
+
+@dataclass
+class FilePriceProviderConfig(PriceProviderConfig):
+    file: str = ""  # JSON file with price slots, see parse_prices(), e.g. written by a cron job from the tariff API
+    slot_time: int = 60 * 60  # [s] duration of the last price slot if it has no end
+
+
+class FilePriceProvider(PriceProvider[FilePriceProviderConfig]):
+    """Reads prices from a local JSON file, the file is only parsed when it was modified."""
+
+    def __init__(self, config: FilePriceProviderConfig):
+        super().__init__(config)
+        self._mtime: float | None = None
+
+    @override
+    async def _read_prices(self) -> tuple[PriceSlot, ...] | None:
+        mtime = os.stat(self.get_config().file).st_mtime
+        if mtime == self._mtime:
+            return None
+        prices = await asyncio.to_thread(self._load)
+        self._mtime = mtime
+        return prices
+
+    def _load(self) -> tuple[PriceSlot, ...]:
+        config = self.get_config()
+        with open(config.file) as f:
+            return parse_prices(json.load(f), config.slot_time)
+
+
+class PriceProviderFactory:
+    @classmethod
+    def newPriceProvider(cls, type: str, **kwargs: Any) -> PriceProvider[Any]:
+        if type == "SimulatedPriceProvider":
+            return SimulatedPriceProvider(PriceProviderConfig(**kwargs))
+        elif type == "FilePriceProvider":
+            return FilePriceProvider(FilePriceProviderConfig(**kwargs))
+        else:
+            raise ValueError(f"Bad price provider type: {type}")
@@ -0,0 +1,116 @@
+"""
+Latency instrumentation of the control cycle: hierarchical timing spans, exported as Prometheus histogram per stage
+and kept as per-cycle breakdown for the last cycles.
+
+Spans are tracked in a context variable, i.e. span() can be used anywhere in the call tree of a cycle (e.g. around
+outbound HTTP or Modbus requests) and is a cheap no-op outside of a cycle.
+"""
+
+import time
+from collections import deque
+from collections.abc import Generator
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from datetime import datetime
+
+from prometheus_client import Histogram
+
+
+@dataclass(frozen=True, slots=True)
+class Span:
+    stage: str  # hierarchical stage name, e.g. "wallbox_read/http"
+    start: float  # [s] since cycle start
+    duration: float  # [s]
+    detail: str = ""  # e.g. request url
+
+
+@dataclass(frozen=True, slots=True)
+class CycleTiming:
+    time: datetime
+    duration: float  # [s]
+    spans: tuple[Span, ...]  # in order of span end
+
+
+@dataclass(slots=True)
+class _Cycle:
+    start: float
+    spans: list[Span]
+
+
+_current: ContextVar[_Cycle | None] = ContextVar("pvcontrol_cycle", default=None)
+# current stage path, separate context variable so that concurrent tasks of a cycle (gather) each nest their own spans
+_stage: ContextVar[str] = ContextVar("pvcontrol_stage", default="")
+
+type SpanToken = tuple[_Cycle, str, Token[str], float]
+
+_metrics_pvc_stage_duration = Histogram(
+    "pvcontrol_controller_stage_duration_seconds",
+    "Duration of control cycle stages incl. outbound requests",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+_stage_histograms: dict[str, Histogram] = {}  # labels() lookup is relatively expensive
+
+
+def _observe(stage: str, duration: float) -> None:
+    h = _stage_histograms.get(stage)
+    if h is None:
+        h = _stage_histograms[stage] = _metrics_pvc_stage_duration.labels(stage)
+    h.observe(duration)
+
+
+def start_span(stage: str) -> SpanToken | None:
+    """Low level API for callbacks that can't use span() (e.g. aiohttp tracing). Returns None outside of a cycle."""
+    c = _current.get()
+    if c is None:
+        return None
+    parent = _stage.get()
+    path = f"{parent}/{stage}" if parent else stage
+    return c, path, _stage.set(path), time.perf_counter()
+
+
+def end_span(token: SpanToken | None, detail: str = "") -> None:
+    if token is None:
+        return
+    c, path, stage_token, start = token
+    duration = time.perf_counter() - start
+    c.spans.append(Span(path, start - c.start, duration, detail))
+    _observe(path, duration)
+    _stage.reset(stage_token)
+
+
+@contextmanager
+def span(stage: str, detail: str = "") -> Generator[None]:
+    """Time a stage of the current cycle, nested spans get a hierarchical stage name."""
+    token = start_span(stage)
+    try:
+        yield
+    finally:
+        end_span(token, detail)
+
+
+class CycleTimer:
+    """Times control cycles and keeps the span breakdown of the last history_size cycles."""
+
+    def __init__(self, history_size: int):
+        self._history: deque[CycleTiming] = deque(maxlen=history_size)
+
+    @contextmanager
+    def cycle(self, t: datetime) -> Generator[None]:
+        c = _Cycle(time.perf_counter(), [])
+        token = _current.set(c)
+        stage_token = _stage.set("")
+        try:
+            yield
+        finally:
+            _stage.reset(stage_token)
+            _current.reset(token)
+            duration = time.perf_counter() - c.start
+            _observe("cycle", duration)
+            self._history.append(CycleTiming(t, duration, tuple(c.spans)))
+
+    def get_cycles(self, n: int) -> list[CycleTiming]:
+        """Last n cycle breakdowns, newest first."""
+        h = self._history
+        return [h[-i] for i in range(1, min(n, len(h)) + 1)]
@@ -0,0 +1,355 @@
+"""
+Decision trace of the charge controller: one compact binary record per control cycle in a bounded on-disk ring,
+and a replay engine that feeds a trace back through a ChargeController with a virtual clock.
+
+Replay a trace and report decisions that differ from the recorded ones:
+    uv run -m pvcontrol.trace /data/pvcontrol.trace -c '{"controller": {...}, "wallbox": {...}}'
+"""
+
+import argparse
+import asyncio
+import enum
+import json
+import logging
+import math
+import os
+import struct
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, final, override
+
+from pvcontrol.car import Car, CarConfig, CarData
+from pvcontrol.chargecontroller import (
+    ChargeController,
+    ChargeControllerConfig,
+    ChargeControllerData,
+    ChargeMode,
+    ControllerCycle,
+    PhaseMode,
+    PhaseSwitchState,
+    Priority,
+)
+from pvcontrol.meter import Meter, MeterData
+from pvcontrol.relay import DisabledPhaseRelay, PhaseRelayConfig, SimulatedPhaseRelay
+from pvcontrol.service import BaseConfig
+from pvcontrol.simulation import benchmark, samples_from_cycles
+from pvcontrol.wallbox import CarStatus, Wallbox, WallboxConfig, WallboxData, WbError
+
+logger = logging.getLogger(__name__)
+
+# enums are stored by index -> only append new enum members
+_ENUM_INDEX: dict[type[enum.Enum], dict[Any, int]] = {
+    e: {m: i for i, m in enumerate(e)} for e in (ChargeMode, PhaseMode, Priority, PhaseSwitchState)
+}
+_ENUM_MEMBERS: dict[type[enum.Enum], list[Any]] = {e: list(e) for e in _ENUM_INDEX}
+
+# little endian, no padding
+_RECORD = struct.Struct(
+    "<d"  # time (POSIX timestamp of virtual/local clock)
+    "Hfffffddd"  # meter: error, power_pv, power_consumption, power_grid, power_battery, soc_battery, energies
+    "HHBB?BBfddf"  # wallbox: error, wb_error, car_status, max_current, allow_charging, phases_in, phases_out, power, charged/total energy, temperature
+    "f"  # car soc, NaN = unknown
+    "BBBii"  # desired_mode, desired_priority, phase_mode, pv_allow_charging_delay, charge_mode_pv_to_off_delay
+    "BBBBBBH"  # data after cycle: mode, desired_mode, phase_mode, priority, desired_priority, phase_switch, error
+    "bbbB"  # commands: max_current, allow_charging, phases_in (-1 = not issued), resets
+    "fff"  # meter: current_l1..l3
+)
+_HEADER = struct.Struct("<4sHHIII")  # magic, version, record size, capacity, next write index, count
+_MAGIC = b"PVCT"
+_VERSION = 2
+
+
+def encode_cycle(c: ControllerCycle) -> bytes:
+    m = c.meter
+    wb = c.wallbox
+    d = c.data
+    return _RECORD.pack(
+        c.time.timestamp(),
+        m.error,
+        m.power_pv,
+        m.power_consumption,
+        m.power_grid,
+        m.power_battery,
+        m.soc_battery,
+        m.energy_consumption,
+        m.energy_consumption_grid,
+        m.energy_consumption_pv,
+        wb.error,
+        wb.wb_error,
+        wb.car_status,
+        wb.max_current,
+        wb.allow_charging,
+        wb.phases_in,
+        wb.phases_out,
+        wb.power,
+        wb.charged_energy,
+        wb.total_energy,
+        wb.temperature,
+        math.nan if c.car_soc is None else c.car_soc,
+        _ENUM_INDEX[ChargeMode][c.desired_mode],
+        _ENUM_INDEX[Priority][c.desired_priority],
+        _ENUM_INDEX[PhaseMode][c.phase_mode],
+        c.pv_allow_charging_delay,
+        c.charge_mode_pv_to_off_delay,
+        _ENUM_INDEX[ChargeMode][d.mode],
+        _ENUM_INDEX[ChargeMode][d.desired_mode],
+        _ENUM_INDEX[PhaseMode][d.phase_mode],
+        _ENUM_INDEX[Priority][d.priority],
+        _ENUM_INDEX[Priority][d.desired_priority],
+        _ENUM_INDEX[PhaseSwitchState][d.phase_switch],
+        d.error,
+        -1 if c.max_current is None else c.max_current,
+        -1 if c.allow_charging is None else int(c.allow_charging),
+        -1 if c.phases_in is None else c.phases_in,
+        c.resets,
+        m.current_l1,
+        m.current_l2,
+        m.current_l3,
+    )
+
+
+def decode_cycle(b: bytes) -> ControllerCycle:
+    v = _RECORD.unpack(b)
+    modes = _ENUM_MEMBERS[ChargeMode]
+    priorities = _ENUM_MEMBERS[Priority]
+    phase_modes = _ENUM_MEMBERS[PhaseMode]
+    return ControllerCycle(
+        time=datetime.fromtimestamp(v[0]),
+        meter=MeterData(*v[1:10], *v[38:41]),
+        wallbox=WallboxData(v[10], WbError(v[11]), CarStatus(v[12]), *v[13:21]),
+        car_soc=None if math.isnan(v[21]) else v[21],
+        desired_mode=modes[v[22]],
+        desired_priority=priorities[v[23]],
+        phase_mode=phase_modes[v[24]],
+        pv_allow_charging_delay=v[25],
+        charge_mode_pv_to_off_delay=v[26],
+        data=ChargeControllerData(
+            error=v[33],
+            mode=modes[v[27]],
+            desired_mode=modes[v[28]],
+            phase_mode=phase_modes[v[29]],
+            priority=priorities[v[30]],
+            desired_priority=priorities[v[31]],
+            phase_switch=_ENUM_MEMBERS[PhaseSwitchState][v[32]],
+        ),
+        max_current=None if v[34] < 0 else v[34],
+        allow_charging=None if v[35] < 0 else bool(v[35]),
+        phases_in=None if v[36] < 0 else v[36],
+        resets=v[37],
+    )
+
+
+@final
+class TraceRing:
+    """
+    Bounded ring of fixed size records in a file: header + capacity * record_size bytes.
+    The file is re-initialized if it doesn't match record size or capacity.
+
+    readonly: opens an existing trace without modifying it, capacity is taken from the header.
+    Raises FileNotFoundError or ValueError if the file is missing or not a trace of this format.
+    """
+
+    def __init__(self, path: str, capacity: int = 0, record_size: int = _RECORD.size, readonly: bool = False):
+        self._record_size = record_size
+        self._capacity = capacity
+        self._fd = os.open(path, os.O_RDONLY if readonly else os.O_RDWR | os.O_CREAT, 0o644)
+        self._next = 0
+        self._count = 0
+        header = os.pread(self._fd, _HEADER.size, 0)
+        if len(header) == _HEADER.size:
+            magic, version, size, cap, next, count = _HEADER.unpack(header)
+            if magic == _MAGIC and version == _VERSION and size == record_size and (cap == capacity or readonly):
+                self._capacity = cap
+                self._next = next
+                self._count = count
+                return
+            if readonly:
+                os.close(self._fd)
+                raise ValueError(f"Unknown trace file format {path}: version={version}, record_size={size}")
+            logger.warning(f"Re-initializing trace file {path}: version={version}, record_size={size}, capacity={cap}")
+        elif readonly:
+            os.close(self._fd)
+            raise ValueError(f"Not a trace file: {path}")
+        os.ftruncate(self._fd, 0)
+        self._write_header()
+
+    def _write_header(self) -> None:
+        os.pwrite(self._fd, _HEADER.pack(_MAGIC, _VERSION, self._record_size, self._capacity, self._next, self._count), 0)
+
+    def append(self, record: bytes) -> None:
+        os.pwrite(self._fd, record, _HEADER.size + self._next * self._record_size)
+        self._next = (self._next + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+        self._write_header()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def read_all(self) -> list[bytes]:
+        """All records, oldest first."""
+        start = (self._next - self._count) % self._capacity
+        records: list[bytes] = []
+        for i in range(self._count):
+            offset = _HEADER.size + ((start + i) % self._capacity) * self._record_size
+            records.append(os.pread(self._fd, self._record_size, offset))
+        return records
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def read_trace(path: str) -> list[ControllerCycle]:
+    """All cycles of a trace file, oldest first. The file is opened read-only."""
+    ring = TraceRing(path, readonly=True)
+    try:
+        return [decode_cycle(b) for b in ring.read_all()]
+    finally:
+        ring.close()
+
+
+@dataclass
+class TraceConfig(BaseConfig):
+    file: str = ""  # trace file, empty = tracing disabled
+    capacity: int = 7 * 24 * 60 * 2  # number of cycles, default: one week of 30s cycles (~1MB)
+
+
+@final
+class TraceRecorder:
+    """Records the last cycle of the charge controller, called after each ChargeController.run()."""
+
+    def __init__(self, config: TraceConfig):
+        self._config: TraceConfig = config
+        self._ring = TraceRing(config.file, config.capacity)
+
+    def record(self, controller: ChargeController) -> None:
+        cycle = controller.get_last_cycle()
+        if cycle is not None:
+            self._ring.append(encode_cycle(cycle))
+
+    def cycles(self) -> list[ControllerCycle]:
+        return read_trace(self._config.file)
+
+    def close(self) -> None:
+        self._ring.close()
+
+
+class _ReplayMeter(Meter[BaseConfig]):
+    def __init__(self):
+        super().__init__(BaseConfig())
+
+    def set_recorded(self, m: MeterData) -> None:
+        self._data = m
+
+    @override
+    async def read_data(self) -> MeterData:
+        return self._data
+
+
+class _ReplayWallbox(Wallbox[WallboxConfig]):
+    """Returns recorded data, commands are no-ops (they are recorded by the controller)."""
+
+    def set_recorded(self, wb: WallboxData) -> None:
+        self._data = wb
+
+    @override
+    async def read_data(self) -> WallboxData:
+        return self._data
+
+
+class _ReplayCar(Car[CarConfig]):
+    def set_recorded(self, soc: float | None, t: datetime) -> None:
+        self._data = CarData() if soc is None else CarData(data_captured_at=t, soc=soc)
+
+
+@dataclass(frozen=True, slots=True)
+class ReplayMismatch:
+    index: int
+    recorded: ControllerCycle
+    replayed: ControllerCycle
+
+
+def _outputs(c: ControllerCycle) -> tuple[Any, ...]:
+    d = c.data
+    return (d.mode, d.desired_mode, d.priority, d.phase_switch, c.max_current, c.allow_charging, c.phases_in, c.resets)
+
+
+async def replay(
+    cycles: list[ControllerCycle],
+    config: ChargeControllerConfig,
+    wallbox_config: WallboxConfig | None = None,
+    car_config: CarConfig | None = None,
+) -> list[ReplayMismatch]:
+    """
+    Feed recorded cycles through a new ChargeController with a virtual clock and return the cycles with different decisions.
+    User inputs (desired mode/priority, phase mode) are taken from the trace. Internal state that is not part of the trace
+    (e.g. PV forecast history, phase switch governor) is rebuilt during replay, i.e. the first cycles may differ.
+    """
+    if not cycles:
+        return []
+    meter = _ReplayMeter()
+    wallbox = _ReplayWallbox(wallbox_config or WallboxConfig())
+    car = _ReplayCar(car_config or CarConfig())
+    relay_config = PhaseRelayConfig()
+    relay = DisabledPhaseRelay(relay_config) if cycles[0].phase_mode == PhaseMode.DISABLED else SimulatedPhaseRelay(relay_config)
+    controller = ChargeController(config, meter, wallbox, relay, car)
+    now = cycles[0].time
+    controller._now = lambda: now  # pyright: ignore[reportPrivateUsage]
+    controller._pv_allow_charging_delay = cycles[0].pv_allow_charging_delay  # pyright: ignore[reportPrivateUsage]
+    controller._charge_mode_pv_to_off_delay = cycles[0].charge_mode_pv_to_off_delay  # pyright: ignore[reportPrivateUsage]
+
+    mismatches: list[ReplayMismatch] = []
+    for i, c in enumerate(cycles):
+        now = c.time
+        meter.set_recorded(c.meter)
+        wallbox.set_recorded(c.wallbox)
+        car.set_recorded(c.car_soc, c.time)
+        ctl = controller.get_data()
+        if ctl.desired_mode != c.desired_mode:
+            controller.set_desired_mode(c.desired_mode)
+        if ctl.desired_priority != c.desired_priority:
+            controller.set_desired_priority(c.desired_priority)
+        if ctl.phase_mode != c.phase_mode:
+            controller.set_phase_mode(c.phase_mode)
+        await controller.run()
+        replayed = controller.get_last_cycle()
+        if replayed is not None and _outputs(replayed) != _outputs(c):
+            mismatches.append(ReplayMismatch(i, c, replayed))
+    return mismatches
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a charge controller decision trace")
+    parser.add_argument("file")
+    parser.add_argument("-c", "--config", default="{}", help="json with 'controller', 'wallbox' and 'car' configuration")
+    parser.add_argument("--dump", action="store_true", default=False, help="print all recorded cycles")
+    parser.add_argument(
+        "--benchmark", action="store_true", default=False, help="score all registered charge strategies on the PV and home power"
+    )
+    args = parser.parse_args()
+    config = json.loads(args.config)
+
+    cycles = read_trace(args.file)
+    if args.dump:
+        for c in cycles:
+            print(c)
+    if args.benchmark:
+        controller_config = ChargeControllerConfig(**config.get("controller", {}))
+        for score in await benchmark(samples_from_cycles(cycles), controller_config):
+            print(
+                f"{score.strategy}: score={score.score():.0f}Wh, pv={score.energy_pv:.0f}Wh, grid={score.energy_grid:.0f}Wh, "
+                f"unused={score.energy_unused:.0f}Wh, switches={score.switches}, phase_switches={score.phase_switches}"
+            )
+        return
+    mismatches = await replay(
+        cycles,
+        ChargeControllerConfig(**config.get("controller", {})),
+        WallboxConfig(**config.get("wallbox", {})),
+        CarConfig(**config.get("car", {})),
+    )
+    for mm in mismatches:
+        print(f"#{mm.index} {mm.recorded.time}: recorded={_outputs(mm.recorded)}, replayed={_outputs(mm.replayed)}")
+    print(f"{len(cycles)} cycles replayed, {len(mismatches)} different decisions")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -3,17 +3,28 @@ from types import SimpleNamespace
 
 import aiohttp
 
+from pvcontrol import timing
+
 aiohttp_logger = logging.getLogger("aiohttp.trace")
 
 
-async def on_request_start(_session: aiohttp.ClientSession, _trace_config_ctx: SimpleNamespace, params: aiohttp.TraceRequestStartParams):
+async def on_request_start(_session: aiohttp.ClientSession, trace_config_ctx: SimpleNamespace, params: aiohttp.TraceRequestStartParams):
     aiohttp_logger.debug(f"{params.method} {params.url}")
+    trace_config_ctx.span = timing.start_span("http")
 
 
-async def on_request_end(_session: aiohttp.ClientSession, _trace_config_ctx: SimpleNamespace, params: aiohttp.TraceRequestEndParams):
+async def on_request_end(_session: aiohttp.ClientSession, trace_config_ctx: SimpleNamespace, params: aiohttp.TraceRequestEndParams):
     aiohttp_logger.debug(f"{params.method} {params.url} - {params.response.status}")
+    timing.end_span(trace_config_ctx.span, f"{params.method} {params.url.host}{params.url.path} - {params.response.status}")
+
+
+async def on_request_exception(
+    _session: aiohttp.ClientSession, trace_config_ctx: SimpleNamespace, params: aiohttp.TraceRequestExceptionParams
+):
+    timing.end_span(trace_config_ctx.span, f"{params.method} {params.url.host}{params.url.path} - {type(params.exception).__name__}")
 
 
 aiohttp_trace_config = aiohttp.TraceConfig()
 aiohttp_trace_config.on_request_start.append(on_request_start)
 aiohttp_trace_config.on_request_end.append(on_request_end)
+aiohttp_trace_config.on_request_exception.append(on_request_exception)
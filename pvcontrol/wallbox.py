@@ -1,5 +1,5 @@
-import asyncio
 import enum
+import json
 import logging
 from dataclasses import dataclass
 from typing import Any, override
@@ -7,9 +7,10 @@ from typing import Any, override
 import aiohttp
 from prometheus_client import Gauge
 
+from pvcontrol.httpclient import HttpClientFactory
+from pvcontrol.offload import offload
 from pvcontrol.relay import PhaseRelay
 from pvcontrol.service import BaseConfig, BaseData, BaseService
-from pvcontrol.utils import aiohttp_trace_config
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,7 @@ type WallboxConfigTypes = WallboxConfig | GoeWallboxConfig
 class WallboxConfig(BaseConfig):
     min_supported_current: int = 6
     max_supported_current: int = 16
+    switch_phases_reset_delay: int = 0  # [s] delay between switching phase relay and trigger WB reset
 
 
 @enum.unique
@@ -41,7 +43,7 @@ class WbError(enum.IntEnum):
     PHASE_RELAY_ERR = 100  # inconsistency between phase relay and phases-in
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class WallboxData(BaseData):
     wb_error: WbError = WbError.OK  # wb error status (!= error which means communication error)
     car_status: CarStatus = CarStatus.NoVehicle
@@ -72,9 +74,8 @@ class Wallbox[C: WallboxConfig](BaseService[C, WallboxData]):
 
     async def read_data(self) -> WallboxData:
         """Read wallbox data and report metrics. The data is cached."""
-        wb = await self._read_data()
-        self._set_data(wb)
-        return wb
+        self._set_data(await self._read_data())
+        return self.get_data()
 
     async def _read_data(self) -> WallboxData:
         """Override in sub classes"""
@@ -118,39 +119,35 @@ class SimulatedWallbox(Wallbox[WallboxConfig]):
 
     @override
     async def _read_data(self) -> WallboxData:
-        old = self.get_data()
-        wb = WallboxData(**old.__dict__)
+        wb = self.get_data()
         if wb.allow_charging and wb.car_status not in [CarStatus.NoVehicle, CarStatus.ChargingFinished]:
-            if not old.allow_charging:
-                wb.charged_energy = 0
-            wb.phases_out = wb.phases_in
-            wb.power = wb.phases_out * wb.max_current * 230
-            wb.charged_energy += wb.power / 120  # assumption 30s cycle time
-            wb.total_energy += wb.power / 120
+            power = wb.phases_in * wb.max_current * 230
+            return wb.replace(
+                phases_out=wb.phases_in,
+                power=power,
+                charged_energy=wb.charged_energy + power / 120,  # assumption 30s cycle time
+                total_energy=wb.total_energy + power / 120,
+            )
         else:
-            wb.phases_out = 0
-            wb.power = 0
-            if wb.car_status == CarStatus.NoVehicle:
-                wb.allow_charging = False
-        return wb
+            return wb.replace(phases_out=0, power=0, allow_charging=wb.allow_charging and wb.car_status != CarStatus.NoVehicle)
 
     def set_wb_error(self, err: WbError):
-        self.get_data().wb_error = err
+        self._update_data(wb_error=err)
 
     def set_car_status(self, status: CarStatus):
-        self.get_data().car_status = status
+        self._update_data(car_status=status)
 
     @override
     async def set_phases_in(self, phases: int):
-        self.get_data().phases_in = phases
+        self._update_data(phases_in=phases)
 
     @override
     async def set_max_current(self, max_current: int):
-        self.get_data().max_current = max_current
+        self._update_data(max_current=max_current)
 
     @override
     async def allow_charging(self, f: bool):
-        self.get_data().allow_charging = f
+        self._update_data(allow_charging=f)
 
     @override
     async def trigger_reset(self):
@@ -160,8 +157,7 @@ class SimulatedWallbox(Wallbox[WallboxConfig]):
         """needed for chargecontroller tests"""
         wb = self.get_data()
         if wb.allow_charging:
-            wb.charged_energy -= wb.power / 120
-            wb.total_energy -= wb.power / 120
+            self._update_data(charged_energy=wb.charged_energy - wb.power / 120, total_energy=wb.total_energy - wb.power / 120)
 
 
 class SimulatedWallboxWithRelay(SimulatedWallbox):
@@ -173,8 +169,7 @@ class SimulatedWallboxWithRelay(SimulatedWallbox):
     @override
     async def _read_data(self) -> WallboxData:
         wb = await super()._read_data()
-        wb.phases_in = self._relay.get_phases()
-        return wb
+        return wb.replace(phases_in=self._relay.get_phases())
 
     @override
     async def set_phases_in(self, phases: int):
@@ -195,18 +190,17 @@ class GoeWallbox(Wallbox[GoeWallboxConfig]):
         self._status_url: str = f"{config.url}/status"
         self._mqtt_url: str = f"{config.url}/mqtt"
         self._timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=config.timeout)
-        self._session: aiohttp.ClientSession = aiohttp.ClientSession(trace_configs=[aiohttp_trace_config])
+        self._session: aiohttp.ClientSession = HttpClientFactory.newSession()
 
     @override
     async def set_phases_in(self, phases: int):
+        """Switch phase relay only, the wallbox reset after switch_phases_reset_delay is up to the caller (see ChargeController)."""
         errcnt = self.get_error_counter()
         phases_out = self.get_data().phases_out
         if errcnt == 0 and phases_out == 0:
             # relay ON = 1 phase
             self._relay.set_phases(phases)
             logger.debug(f"set phases_in={phases}")
-            await asyncio.sleep(self.get_config().switch_phases_reset_delay)
-            await self.trigger_reset()
         else:
             logger.warning(f"Rejected set_phases_in({phases}): phases_out={phases_out}, error_counter={errcnt}")
 
@@ -217,7 +211,7 @@ class GoeWallbox(Wallbox[GoeWallboxConfig]):
                 logger.debug(f"set max_current={max_current}")
                 async with self._session.get(self._mqtt_url, timeout=self._timeout, params={"payload": f"amx={max_current}"}) as res:
                     res.raise_for_status()
-                    wb = self._json_2_wallbox_data(await res.json())
+                    wb = await self._parse_response(res)
                     self._set_data(wb)
             except Exception as e:
                 logger.error(e)
@@ -229,7 +223,7 @@ class GoeWallbox(Wallbox[GoeWallboxConfig]):
                 logger.debug(f"set allow_charging={f}")
                 async with self._session.get(self._mqtt_url, timeout=self._timeout, params={"payload": f"alw={int(f)}"}) as res:
                     res.raise_for_status()
-                    wb = self._json_2_wallbox_data(await res.json())
+                    wb = await self._parse_response(res)
                     self._set_data(wb)
             except Exception as e:
                 logger.error(e)
@@ -240,7 +234,7 @@ class GoeWallbox(Wallbox[GoeWallboxConfig]):
             logger.debug("trigger reset")
             async with self._session.get(self._mqtt_url, timeout=self._timeout, params={"payload": "rst=1"}) as res:
                 res.raise_for_status()
-                wb = self._json_2_wallbox_data(await res.json())
+                wb = await self._parse_response(res)
                 self._set_data(wb)
         except Exception as e:
             logger.error(e)
@@ -250,7 +244,7 @@ class GoeWallbox(Wallbox[GoeWallboxConfig]):
         try:
             async with self._session.get(self._status_url, timeout=self._timeout) as res:
                 res.raise_for_status()
-                wb = self._json_2_wallbox_data(await res.json())
+                wb = await self._parse_response(res)
                 self.reset_error_counter()
                 return wb
         except Exception as e:
@@ -259,7 +253,14 @@ class GoeWallbox(Wallbox[GoeWallboxConfig]):
             # always return last known data - there is no safe state that would somehow help
             return self.get_data()
 
-    def _json_2_wallbox_data(self, json: dict[str, Any]) -> WallboxData:
+    async def _parse_response(self, res: aiohttp.ClientResponse) -> WallboxData:
+        body = await res.read()
+        # only the pure json mapping may run in a worker thread, the phase relay is accessed on the event loop
+        wb = await offload("goe", len(body), lambda: GoeWallbox._json_2_wallbox_data(json.loads(body)))
+        return self._check_phase_relay(wb)
+
+    @staticmethod
+    def _json_2_wallbox_data(json: dict[str, Any]) -> WallboxData:
         wb_error = WbError(int(json["err"]))
         car_status = CarStatus(int(json["car"]))
         max_current = int(json["amp"])
@@ -279,10 +280,6 @@ class GoeWallbox(Wallbox[GoeWallboxConfig]):
             temperature = min(json["tma"])
         else:
             temperature = int(json["tmp"])
-        # check if phases_in is consistent with phase relay state (if enabled), WB errors dominate
-        if self._relay.is_enabled() and (wb_error == WbError.OK or wb_error > WbError.INTERNAL):
-            if phases_in != self._relay.get_phases():
-                wb_error = WbError.PHASE_RELAY_ERR
         wb = WallboxData(
             0,
             wb_error,
@@ -298,6 +295,13 @@ class GoeWallbox(Wallbox[GoeWallboxConfig]):
         )
         return wb
 
+    def _check_phase_relay(self, wb: WallboxData) -> WallboxData:
+        """Check if phases_in is consistent with phase relay state (if enabled), WB errors dominate."""
+        if self._relay.is_enabled() and (wb.wb_error == WbError.OK or wb.wb_error > WbError.INTERNAL):
+            if wb.phases_in != self._relay.get_phases():
+                return wb.replace(wb_error=WbError.PHASE_RELAY_ERR)
+        return wb
+
     @override
     async def close(self):
         await self._session.close()
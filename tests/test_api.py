@@ -1,4 +1,5 @@
 import unittest
+from datetime import datetime, timedelta
 from typing import final, override
 
 from fastapi.encoders import jsonable_encoder
@@ -6,6 +7,10 @@ from fastapi.testclient import TestClient
 
 from pvcontrol import dependencies
 from pvcontrol.app import app
+from pvcontrol.loadbalancer import LoadBalancerFactory
+from pvcontrol.loopmonitor import BlockedLoop
+from pvcontrol.profiler import ProfilerConfig, SamplingProfiler
+from pvcontrol.tariff import PriceProviderConfig, PriceSlot, SimulatedPriceProvider
 
 
 @final
@@ -79,6 +84,103 @@ class PvcontrolApiTest(unittest.TestCase):
             self.assertEqual(422, response.status_code)
             self.assertEqual(dependencies.controller.get_data().desired_priority, "HOME_BATTERY")
 
+    def test_controller_plan(self):
+        with TestClient(self.app) as client:
+            response = client.put("/api/pvcontrol/controller/plan", json={"target_soc": 70, "departure_time": "06:30"})
+            self.assertEqual(204, response.status_code)
+            response = client.get("/api/pvcontrol/controller/plan")
+            self.assertEqual(200, response.status_code)
+            json = response.json()
+            self.assertEqual(70, json["target_soc"])
+            self.assertEqual("06:30:00", json["departure_time"])
+            self.assertEqual(jsonable_encoder(dependencies.controller.get_plan()), json)
+
+            response = client.put("/api/pvcontrol/controller/plan", json={"target_soc": 70, "departure_time": "invalid"})
+            self.assertEqual(422, response.status_code)
+            for soc in (-1, 101):
+                response = client.put("/api/pvcontrol/controller/plan", json={"target_soc": soc, "departure_time": "06:30"})
+                self.assertEqual(422, response.status_code)
+            self.assertEqual(70, dependencies.controller.get_plan().target_soc)
+
+    def test_tariff(self):
+        with TestClient(self.app) as client:
+            response = client.get("/api/pvcontrol/tariff")
+            self.assertEqual(404, response.status_code)
+            response = client.get("/api/pvcontrol/controller/tariff")
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(jsonable_encoder(dependencies.controller.get_tariff_plan()), response.json())
+
+            provider = SimulatedPriceProvider(PriceProviderConfig())
+            t = datetime(2024, 6, 1, 12, 0)
+            provider.set_prices([PriceSlot(t, t + timedelta(hours=1), 25.5)])
+            dependencies.price_provider = provider
+            try:
+                response = client.get("/api/pvcontrol/tariff")
+                self.assertEqual(200, response.status_code)
+                json = response.json()
+                self.assertEqual("SimulatedPriceProvider", json["type"])
+                self.assertEqual([{"start": "2024-06-01T12:00:00", "end": "2024-06-01T13:00:00", "price": 25.5}], json["data"]["prices"])
+            finally:
+                dependencies.price_provider = None
+
+    def test_forecast(self):
+        with TestClient(self.app) as client:
+            response = client.get("/api/pvcontrol/forecast")
+            self.assertEqual(200, response.status_code)
+            json = response.json()
+            self.assertEqual(96, len(json["slots"]))
+            self.assertIn("power_pv", json["slots"][0])
+            self.assertEqual(dependencies.forecaster.learned_slots(), json["learned_slots"])
+            self.assertIs(dependencies.forecaster, dependencies.controller.get_forecaster())
+
+    def test_ledger(self):
+        with TestClient(self.app) as client:
+            response = client.get("/api/pvcontrol/ledger/sessions?n=5")
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(jsonable_encoder(dependencies.ledger.get_sessions(5)), response.json())
+            response = client.get("/api/pvcontrol/ledger/totals?period=month")
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(jsonable_encoder(dependencies.ledger.get_totals("month")), response.json())
+            response = client.get("/api/pvcontrol/ledger/totals?period=week")
+            self.assertEqual(422, response.status_code)
+
+    def test_debug_cycles(self):
+        with TestClient(self.app) as client:
+            response = client.get("/api/pvcontrol/debug/cycles?n=5")
+            self.assertEqual(200, response.status_code)
+            json = response.json()
+            self.assertEqual(jsonable_encoder(dependencies.controller.get_cycle_timings(5)), json)
+            self.assertLessEqual(len(json), 5)
+            response = client.get("/api/pvcontrol/debug/cycles?n=0")
+            self.assertEqual(422, response.status_code)
+
+    def test_debug_blocked(self):
+        with TestClient(self.app) as client:
+            assert dependencies.loop_monitor is not None
+            blocked = BlockedLoop(datetime(2024, 6, 1, 12, 0), "controller", 'File "x.py", line 1, in run')
+            dependencies.loop_monitor._blocked.append(blocked)  # pyright: ignore[reportPrivateUsage]
+            response = client.get("/api/pvcontrol/debug/blocked")
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(jsonable_encoder([blocked]), response.json())
+
+    def test_debug_profile(self):
+        with TestClient(self.app) as client:
+            response = client.get("/api/pvcontrol/debug/profile?seconds=0.1")
+            self.assertEqual(403, response.status_code)
+
+            dependencies.profiler = SamplingProfiler(ProfilerConfig(token="secret"))
+            response = client.get("/api/pvcontrol/debug/profile?seconds=0.1")
+            self.assertEqual(401, response.status_code)
+            response = client.get("/api/pvcontrol/debug/profile?seconds=0.1", headers={"Authorization": "Bearer wrong"})
+            self.assertEqual(401, response.status_code)
+
+            response = client.get("/api/pvcontrol/debug/profile?seconds=0.1", headers={"Authorization": "Bearer secret"})
+            self.assertEqual(200, response.status_code)
+            self.assertRegex(response.text.splitlines()[0], r"^[^;]+;.* \d+$")
+            response = client.get("/api/pvcontrol/debug/profile?seconds=0.1&format=speedscope", headers={"Authorization": "Bearer secret"})
+            self.assertEqual(200, response.status_code)
+            self.assertEqual("sampled", response.json()["profiles"][0]["type"])
+
     def test_get_meter(self):
         with TestClient(self.app) as client:
             response = client.get("/api/pvcontrol/meter")
@@ -97,6 +199,32 @@ class PvcontrolApiTest(unittest.TestCase):
             self.assertEqual(jsonable_encoder(dependencies.wallbox.get_config()), json["config"])
             self.assertEqual(jsonable_encoder(dependencies.wallbox.get_data()), json["data"])
 
+    def test_wallboxes(self):
+        with TestClient(self.app) as client:
+            response = client.get("/api/pvcontrol/wallboxes")
+            self.assertEqual(404, response.status_code)
+
+            dependencies.load_balancer = LoadBalancerFactory.newLoadBalancer(
+                dependencies.meter, wallboxes=[{"name": "garage", "priority": 1}, {"name": "carport", "mode": "PV_ONLY"}]
+            )
+            try:
+                response = client.get("/api/pvcontrol/wallboxes")
+                self.assertEqual(200, response.status_code)
+                json = response.json()
+                self.assertEqual(["garage", "carport"], [wb["charge_point"]["name"] for wb in json["wallboxes"]])
+                self.assertEqual("SimulatedWallbox", json["wallboxes"][0]["type"])
+                self.assertEqual("PV_ONLY", json["wallboxes"][1]["charge_point"]["mode"])
+
+                response = client.put("/api/pvcontrol/wallboxes/garage/mode", json="MAX")
+                self.assertEqual(204, response.status_code)
+                self.assertEqual("MAX", dependencies.load_balancer.get_charge_points()[0].data.mode)
+                response = client.put("/api/pvcontrol/wallboxes/garage/mode", json="PLANNED")
+                self.assertEqual(422, response.status_code)
+                response = client.put("/api/pvcontrol/wallboxes/unknown/mode", json="MAX")
+                self.assertEqual(404, response.status_code)
+            finally:
+                dependencies.load_balancer = None
+
     def test_get_relay(self):
         with TestClient(self.app) as client:
             response = client.get("/api/pvcontrol/relay")
@@ -3,16 +3,23 @@ import json
 import logging
 import os
 import unittest
+from types import SimpleNamespace
 from typing import Any, final, override
+from unittest.mock import AsyncMock, Mock, patch
+
+from aiohttp import ClientResponseError
+from myskoda.auth.authorization import InvalidStatusError
 
 from pvcontrol.car import (
     Car,
     CarConfig,
     CarData,
+    CarPoller,
     SimulatedCar,
     SkodaCar,
     SkodaCarConfig,
 )
+from pvcontrol.wallbox import CarStatus, WallboxData
 
 # pyright: reportUninitializedInstanceVariable=false
 # pyright: reportPrivateUsage=false
@@ -69,6 +76,188 @@ class SimulatedCarTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(2 * 5800, Car._metrics_pvc_car_energy_consumption._value.get())
 
 
+@final
+class SocEstimationTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    def setUp(self):
+        self.car = SimulatedCar(CarConfig(energy_one_percent_soc=500, charging_efficiency=0.9))
+
+    async def test_estimation(self):
+        c = await self.car.read_data()
+        self.assertEqual(50, c.estimated_soc)
+        self.assertEqual(1, c.estimated_soc_confidence)
+
+        self.car.update_soc_estimation(WallboxData(charged_energy=100))  # init
+        c = self.car.update_soc_estimation(WallboxData(charged_energy=1100))
+        self.assertAlmostEqual(51.8, c.estimated_soc)
+        self.assertAlmostEqual(0.982, c.estimated_soc_confidence)
+        self.assertEqual(50, c.soc)
+
+        # new charging session resets wallbox charged energy
+        c = self.car.update_soc_estimation(WallboxData(charged_energy=500))
+        self.assertAlmostEqual(52.7, c.estimated_soc)
+        # wallbox errors are ignored
+        c = self.car.update_soc_estimation(WallboxData(error=1, charged_energy=0))
+        c = self.car.update_soc_estimation(WallboxData(charged_energy=500))
+        self.assertAlmostEqual(52.7, c.estimated_soc)
+
+        # polling car without fresh data keeps estimation
+        c = await self.car.read_data()
+        self.assertAlmostEqual(52.7, c.estimated_soc)
+
+        # fresh car data -> re-anchor
+        self.car.set_data(CarData(data_captured_at=datetime.datetime.now(), soc=53))
+        c = await self.car.read_data()
+        self.assertEqual(53, c.estimated_soc)
+        self.assertEqual(1, c.estimated_soc_confidence)
+
+    async def test_estimation_max(self):
+        await self.car.read_data()
+        self.car.update_soc_estimation(WallboxData(charged_energy=0))
+        c = self.car.update_soc_estimation(WallboxData(charged_energy=100000))
+        self.assertEqual(100, c.estimated_soc)
+        self.assertEqual(0, c.estimated_soc_confidence)
+
+    async def test_no_car_data(self):
+        self.car.inc_error_counter()
+        c = self.car.update_soc_estimation(WallboxData(charged_energy=100))
+        self.assertEqual(0, c.estimated_soc)
+        self.assertEqual(0, c.estimated_soc_confidence)
+
+
+@final
+class CarPollerTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    def setUp(self):
+        self.car = SimulatedCar(CarConfig(cycle_time=300, cycle_time_charging=60, cycle_time_max=3600, max_requests_per_day=3))
+        self.poller = CarPoller(self.car)
+        patcher = patch.object(self.poller._scheduler, "trigger")
+        self.trigger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_next_interval(self):
+        self.assertEqual(300, self.poller.next_interval())
+        self.poller.on_wallbox_data(WallboxData(car_status=CarStatus.Charging))
+        self.assertEqual(60, self.poller.next_interval())
+        self.poller.on_wallbox_data(WallboxData(car_status=CarStatus.ChargingFinished))
+        self.assertEqual(300, self.poller.next_interval())
+
+    async def test_backoff_no_vehicle(self):
+        self.car.get_config().max_requests_per_day = 0
+        self.poller.on_wallbox_data(WallboxData(car_status=CarStatus.NoVehicle))
+        intervals: list[float] = []
+        for _ in range(6):
+            await self.poller.poll()
+            intervals.append(self.poller.next_interval())
+        self.assertEqual([600, 1200, 2400, 3600, 3600, 3600], intervals)
+
+    async def test_trigger_on_plug_in_and_out(self):
+        self.poller.on_wallbox_data(WallboxData(car_status=CarStatus.NoVehicle))
+        await self.poller.poll()
+        self.assertEqual(600, self.poller.next_interval())
+        self.trigger.assert_not_called()
+
+        self.poller.on_wallbox_data(WallboxData(car_status=CarStatus.WaitingForVehicle))
+        self.trigger.assert_called_once()
+        self.poller.on_wallbox_data(WallboxData(car_status=CarStatus.Charging))
+        self.trigger.assert_called_once()
+        self.poller.on_wallbox_data(WallboxData(car_status=CarStatus.NoVehicle))
+        self.assertEqual(2, self.trigger.call_count)
+        self.assertEqual(300, self.poller.next_interval())  # back-off reset
+
+        # wallbox communication errors are ignored
+        self.poller.on_wallbox_data(WallboxData(error=1, car_status=CarStatus.Charging))
+        self.assertEqual(2, self.trigger.call_count)
+
+    async def test_request_budget(self):
+        self.car.read_data = AsyncMock()
+        for _ in range(5):
+            await self.poller.poll()
+        self.assertEqual(3, self.car.read_data.call_count)
+        self.assertGreater(self.poller.next_interval(), 0)
+        self.assertLessEqual(self.poller.next_interval(), 24 * 60 * 60)
+
+        # new day
+        self.poller._requests_day -= datetime.timedelta(days=1)
+        await self.poller.poll()
+        self.assertEqual(4, self.car.read_data.call_count)
+        self.assertEqual(300, self.poller.next_interval())
+
+
+@final
+class SkodaCarMockedTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    def setUp(self):
+        self.car = SkodaCar(SkodaCarConfig(vin="VIN"))
+        self.myskoda = AsyncMock()
+        self.myskoda.get_charging.return_value = SimpleNamespace(
+            car_captured_timestamp=datetime.datetime(2024, 1, 1, 12, 0),
+            status=SimpleNamespace(battery=SimpleNamespace(state_of_charge_in_percent=50, remaining_cruising_range_in_meters=200_000)),
+        )
+        self.myskoda.get_health.return_value = SimpleNamespace(mileage_in_km=12345)
+        self.car._myskoda = self.myskoda
+
+    async def test_read_data(self):
+        c = await self.car.read_data()
+        self.assertEqual(0, c.error)
+        self.assertEqual(50, c.soc)
+        self.assertEqual(200, c.cruising_range)
+        self.assertEqual(12345, c.mileage)
+        self.myskoda.get_charging.assert_awaited_once_with("VIN")
+        self.myskoda.get_health.assert_awaited_once_with("VIN")
+
+    async def test_health_cached(self):
+        await self.car.read_data()
+        c = await self.car.read_data()
+        self.assertEqual(12345, c.mileage)
+        self.assertEqual(2, self.myskoda.get_charging.await_count)
+        self.assertEqual(1, self.myskoda.get_health.await_count)
+        self.car._health_read_at -= self.car.get_config().health_cache_time
+        await self.car.read_data()
+        self.assertEqual(2, self.myskoda.get_health.await_count)
+
+    async def test_transient_error_keeps_session(self):
+        self.myskoda.get_charging.side_effect = TimeoutError()
+        c = await self.car.read_data()
+        self.assertEqual(1, c.error)
+        self.assertIs(self.myskoda, self.car._myskoda)
+        self.myskoda.disconnect.assert_not_awaited()
+
+    async def test_auth_error_disconnects(self):
+        self.myskoda.get_charging.side_effect = ClientResponseError(Mock(), (), status=401)
+        c = await self.car.read_data()
+        self.assertEqual(1, c.error)
+        self.assertIsNone(self.car._myskoda)
+        self.myskoda.disconnect.assert_awaited_once()
+
+    async def test_invalid_status(self):
+        self.myskoda.get_charging.side_effect = InvalidStatusError(503)
+        await self.car.read_data()
+        self.assertIs(self.myskoda, self.car._myskoda)
+        self.car._retry_at = 0
+        self.myskoda.get_charging.side_effect = InvalidStatusError(403)
+        await self.car.read_data()
+        self.assertIsNone(self.car._myskoda)
+
+    async def test_backoff(self):
+        self.myskoda.get_charging.side_effect = TimeoutError()
+        await self.car.read_data()
+        self.assertEqual(60, self.car._retry_backoff)
+        # no request during back-off
+        await self.car.read_data()
+        self.assertEqual(1, self.myskoda.get_charging.await_count)
+        self.car._retry_at = 0
+        await self.car.read_data()
+        self.assertEqual(2, self.myskoda.get_charging.await_count)
+        self.assertEqual(120, self.car._retry_backoff)
+        # success resets back-off
+        self.myskoda.get_charging.side_effect = None
+        self.car._retry_at = 0
+        c = await self.car.read_data()
+        self.assertEqual(0, c.error)
+        self.assertEqual(0, self.car._retry_backoff)
+
+
 @unittest.skipUnless(len(car_config) > 0, "needs car_test_config.json")
 @final
 class SkodaCarTest(unittest.IsolatedAsyncioTestCase):
@@ -1,10 +1,27 @@
 import json
+import math
+import random
 import unittest
+from datetime import datetime, time, timedelta
 from typing import Any, final, override
 
-from pvcontrol.chargecontroller import ChargeController, ChargeControllerConfig, ChargeMode, PhaseMode, Priority
+from pvcontrol.car import CarConfig, CarData, SimulatedCar
+from pvcontrol.chargecontroller import (
+    BatteryPriorityOptimizer,
+    ChargeController,
+    ChargeControllerConfig,
+    ChargeMode,
+    GridCurrentLimiter,
+    PhaseMode,
+    PhaseSwitchGovernor,
+    PhaseSwitchState,
+    Priority,
+)
+from pvcontrol.forecast import ForecastConfig, PvForecaster, clear_sky
 from pvcontrol.meter import MeterData, TestMeter, TestMeterConfig
 from pvcontrol.relay import DisabledPhaseRelay, PhaseRelayConfig, SimulatedPhaseRelay
+from pvcontrol.strategy import PvAllStrategy, PvOnlyStrategy, SmoothedPvOnlyStrategy
+from pvcontrol.tariff import PriceProviderConfig, PriceSlot, SimulatedPriceProvider
 from pvcontrol.wallbox import CarStatus, SimulatedWallbox, WallboxConfig, WallboxData, WbError
 
 # pyright: reportUninitializedInstanceVariable=false
@@ -29,7 +46,7 @@ class ChargeControllerTest(unittest.IsolatedAsyncioTestCase):
 
     def test_data(self):
         self.assertEqual(self.controller._data, self.controller.get_data())
-        self.controller.get_data().phase_mode = PhaseMode.CHARGE_1P
+        self.controller.set_phase_mode(PhaseMode.CHARGE_1P)
         self.assertEqual(self.controller._data, self.controller.get_data())
         self.controller.inc_error_counter()
         self.assertEqual(self.controller._data, self.controller.get_data())
@@ -47,29 +64,39 @@ class ChargeControllerTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(6, ctl._min_supported_current)
         self.assertEqual(16, ctl._max_supported_current)
         hys = ctl.get_config().power_hysteresis
-        self.assertEqual(6 * 230 + hys, ctl._pv_only_on)
-        self.assertEqual(6 * 230, ctl._pv_only_off)
-        self.assertEqual(3 * 6 * 230 + hys, ctl._pv_only_1_3_phase_threshold)
-        self.assertEqual(3 * 6 * 230, ctl._pv_only_3_1_phase_threshold)
-        self.assertEqual(ctl.get_config().pv_all_min_power, ctl._pv_all_on)
-        self.assertEqual(ctl.get_config().pv_all_min_power - hys, ctl._pv_all_off)
-        self.assertEqual(16 * 230, ctl._pv_all_1_3_phase_threshold)
-        self.assertEqual(16 * 230 - hys, ctl._pv_all_3_1_phase_threshold)
+        pv_only = ctl._strategies[ChargeMode.PV_ONLY]
+        assert isinstance(pv_only, PvOnlyStrategy)
+        self.assertEqual(6 * 230 + hys, pv_only.on)
+        self.assertEqual(3 * 6 * 230 + hys, pv_only.phase_1_3_threshold)
+        self.assertEqual(3 * 6 * 230, pv_only.phase_3_1_threshold)
+        pv_all = ctl._strategies[ChargeMode.PV_ALL]
+        assert isinstance(pv_all, PvAllStrategy)
+        self.assertEqual(ctl.get_config().pv_all_min_power, pv_all.on)
+        self.assertEqual(ctl.get_config().pv_all_min_power - hys, pv_all.off)
+        self.assertEqual(16 * 230, pv_all.phase_1_3_threshold)
+        self.assertEqual(16 * 230 - hys, pv_all.phase_3_1_threshold)
+
+    def test_strategy_config(self):
+        config = ChargeControllerConfig(pv_only_strategy="pv_only_smoothed", pv_all_strategy="pv_only")
+        ctl = ChargeController(config, self.meter, self.wallbox, self.relay)
+        self.assertIsInstance(ctl._strategies[ChargeMode.PV_ONLY], SmoothedPvOnlyStrategy)
+        self.assertIsInstance(ctl._strategies[ChargeMode.PV_ALL], PvOnlyStrategy)
+        with self.assertRaises(ValueError):
+            ChargeController(ChargeControllerConfig(pv_only_strategy="unknown"), self.meter, self.wallbox, self.relay)
 
     async def test_init(self):
-        c = self.controller.get_data()
-        self.assertEqual(ChargeMode.OFF, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
-        self.assertEqual(PhaseMode.AUTO, c.phase_mode)
-        self.assertEqual(Priority.AUTO, c.desired_priority)
-        self.assertEqual(Priority.AUTO, c.priority)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
+        self.assertEqual(PhaseMode.AUTO, self.controller.get_data().phase_mode)
+        self.assertEqual(Priority.AUTO, self.controller.get_data().desired_priority)
+        self.assertEqual(Priority.AUTO, self.controller.get_data().priority)
         await self.wallbox.set_phases_in(3)
         await self.controller.run()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
-        self.assertEqual(PhaseMode.AUTO, c.phase_mode)
-        self.assertEqual(Priority.AUTO, c.desired_priority)
-        self.assertEqual(Priority.HOME_BATTERY, c.priority)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
+        self.assertEqual(PhaseMode.AUTO, self.controller.get_data().phase_mode)
+        self.assertEqual(Priority.AUTO, self.controller.get_data().desired_priority)
+        self.assertEqual(Priority.HOME_BATTERY, self.controller.get_data().priority)
 
     def test_desired_phases_OFF(self):
         ctl = self.controller
@@ -198,74 +225,69 @@ class ChargeControllerTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(0, metric_value_charged_energy_grid.get())
         self.assertEqual(0, metric_value_charged_energy_pv.get())
 
-        m.energy_consumption = 1000
-        m.energy_consumption_grid = 1000
+        m = m.replace(energy_consumption=1000, energy_consumption_grid=1000)
         ctl._meter_charged_energy(m, wb)
         self.assertEqual(0, metric_value_total_charged_energy.get())
         self.assertEqual(0, metric_value_charged_energy_grid.get())
         self.assertEqual(0, metric_value_charged_energy_pv.get())
 
         # start charging
-        wb.allow_charging = True
+        wb = wb.replace(allow_charging=True)
         ctl._meter_charged_energy(m, wb)
         self.assertEqual(0, metric_value_total_charged_energy.get())
         self.assertEqual(0, metric_value_charged_energy_grid.get())
         self.assertEqual(0, metric_value_charged_energy_pv.get())
 
-        wb.charged_energy = 100
+        wb = wb.replace(charged_energy=100)
         ctl._meter_charged_energy(m, wb)
         self.assertEqual(100, metric_value_total_charged_energy.get())
         self.assertEqual(0, metric_value_charged_energy_grid.get())
         self.assertEqual(0, metric_value_charged_energy_pv.get())
 
-        wb.charged_energy = 200
+        wb = wb.replace(charged_energy=200)
         ctl._meter_charged_energy(m, wb)
         self.assertEqual(200, metric_value_total_charged_energy.get())
         self.assertEqual(0, metric_value_charged_energy_grid.get())
         self.assertEqual(0, metric_value_charged_energy_pv.get())
 
         # energy tick from meter
-        m.energy_consumption += 300
-        m.energy_consumption_grid += 100
-        wb.charged_energy = 300
+        m = m.replace(energy_consumption=m.energy_consumption + 300, energy_consumption_grid=m.energy_consumption_grid + 100)
+        wb = wb.replace(charged_energy=300)
         ctl._meter_charged_energy(m, wb)
         self.assertEqual(300, metric_value_total_charged_energy.get())
         self.assertEqual(100, metric_value_charged_energy_grid.get())
         self.assertEqual(200, metric_value_charged_energy_pv.get())
 
         # Off, grid/pv != charged due to 5min energy resolution
-        wb.allow_charging = False
-        wb.charged_energy = 400
+        wb = wb.replace(allow_charging=False, charged_energy=400)
         ctl._meter_charged_energy(m, wb)
         self.assertEqual(400, metric_value_total_charged_energy.get())
         self.assertEqual(100, metric_value_charged_energy_grid.get())
         self.assertEqual(200, metric_value_charged_energy_pv.get())
 
         # home consumption but no charging
-        m.energy_consumption += 400
-        m.energy_consumption_grid += 400
+        m = m.replace(energy_consumption=m.energy_consumption + 400, energy_consumption_grid=m.energy_consumption_grid + 400)
         ctl._meter_charged_energy(m, wb)
         self.assertEqual(400, metric_value_total_charged_energy.get())
         self.assertEqual(100, metric_value_charged_energy_grid.get())
         self.assertEqual(200, metric_value_charged_energy_pv.get())
 
         # start charging again
-        wb.allow_charging = True
-        wb.charged_energy = 0
+        wb = wb.replace(allow_charging=True, charged_energy=0)
         ctl._meter_charged_energy(m, wb)
         self.assertEqual(400, metric_value_total_charged_energy.get())
         self.assertEqual(100, metric_value_charged_energy_grid.get())
         self.assertEqual(200, metric_value_charged_energy_pv.get())
 
-        wb.charged_energy = 100
+        wb = wb.replace(charged_energy=100)
         ctl._meter_charged_energy(m, wb)
         self.assertEqual(500, metric_value_total_charged_energy.get())
         self.assertEqual(100, metric_value_charged_energy_grid.get())
         self.assertEqual(200, metric_value_charged_energy_pv.get())
 
         # charge from PV only
-        m.energy_consumption += 300
-        wb.charged_energy = 200
+        m = m.replace(energy_consumption=m.energy_consumption + 300)
+        wb = wb.replace(charged_energy=200)
         ctl._meter_charged_energy(m, wb)
         self.assertEqual(600, metric_value_total_charged_energy.get())
         self.assertEqual(100, metric_value_charged_energy_grid.get())
@@ -280,18 +302,16 @@ class ChargeControllerTest(unittest.IsolatedAsyncioTestCase):
         metric_value_charged_energy_grid = ChargeController._metrics_pvc_controller_charged_energy.labels("grid")._value
         metric_value_charged_energy_pv = ChargeController._metrics_pvc_controller_charged_energy.labels("pv")._value
 
-        m.energy_consumption += 400
-        m.energy_consumption_grid += 200
+        m = m.replace(energy_consumption=m.energy_consumption + 400, energy_consumption_grid=m.energy_consumption_grid + 200)
         ctl._meter_charged_energy(m, wb)
         self.assertEqual(0, metric_value_total_charged_energy.get())
         self.assertEqual(0, metric_value_charged_energy_grid.get())
         self.assertEqual(0, metric_value_charged_energy_pv.get())
 
-        wb.allow_charging = True
+        wb = wb.replace(allow_charging=True)
         ctl._meter_charged_energy(m, wb)
-        wb.charged_energy += 100
-        m.energy_consumption += 100
-        m.energy_consumption_grid -= 1
+        wb = wb.replace(charged_energy=wb.charged_energy + 100)
+        m = m.replace(energy_consumption=m.energy_consumption + 100, energy_consumption_grid=m.energy_consumption_grid - 1)
         ctl._meter_charged_energy(m, wb)
         self.assertEqual(100, metric_value_total_charged_energy.get())
         self.assertEqual(0, metric_value_charged_energy_grid.get())
@@ -311,28 +331,25 @@ class ChargeControllerDisabledPhaseSwitchingTest(unittest.IsolatedAsyncioTestCas
     async def test_3P(self):
         await self.wallbox.set_phases_in(3)
         await self.controller.run()  # init
-
-        c = self.controller.get_data()
-        self.assertEqual(ChargeMode.OFF, c.mode)
-        self.assertEqual(PhaseMode.DISABLED, c.phase_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
+        self.assertEqual(PhaseMode.DISABLED, self.controller.get_data().phase_mode)
         self.assertEqual(3, self.wallbox.get_data().phases_in)
 
         self.controller.set_phase_mode(PhaseMode.CHARGE_1P)
         await self.controller.run()
-        self.assertEqual(PhaseMode.DISABLED, c.phase_mode)
+        self.assertEqual(PhaseMode.DISABLED, self.controller.get_data().phase_mode)
         self.assertEqual(3, self.wallbox.get_data().phases_in)
 
     async def test_1P(self):
         await self.controller.run()  # init
-        c = self.controller.get_data()
 
-        self.assertEqual(ChargeMode.OFF, c.mode)
-        self.assertEqual(PhaseMode.DISABLED, c.phase_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
+        self.assertEqual(PhaseMode.DISABLED, self.controller.get_data().phase_mode)
         self.assertEqual(1, self.wallbox.get_data().phases_in)
 
         self.controller.set_phase_mode(PhaseMode.AUTO)
         await self.controller.run()
-        self.assertEqual(PhaseMode.DISABLED, c.phase_mode)
+        self.assertEqual(PhaseMode.DISABLED, self.controller.get_data().phase_mode)
         self.assertEqual(1, self.wallbox.get_data().phases_in)
 
 
@@ -349,57 +366,54 @@ class ChargeControllerManualModeTest(unittest.IsolatedAsyncioTestCase):
         await self.controller.run()  # init
 
     async def test_mode_FULL_POWER(self):
-        c = self.controller.get_data()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
-        self.assertEqual(PhaseMode.AUTO, c.phase_mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
+        self.assertEqual(PhaseMode.AUTO, self.controller.get_data().phase_mode)
         self.assertEqual(1, self.wallbox.get_data().phases_in)
 
         self.controller.set_desired_mode(ChargeMode.MAX)
         # 1 to 3 phase switch
         await self.controller.run()
-        self.assertEqual(ChargeMode.MAX, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
+        self.assertEqual(ChargeMode.MAX, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
 
         await self.controller.run()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.MAX, c.mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.MAX, self.controller.get_data().mode)
 
         await self.controller.run()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.MAX, c.mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.MAX, self.controller.get_data().mode)
         self.assertEqual(3, self.wallbox.get_data().phases_out)
 
     async def test_mode_MANUAL_OFF(self):
-        c = self.controller.get_data()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
-        self.assertEqual(PhaseMode.AUTO, c.phase_mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
+        self.assertEqual(PhaseMode.AUTO, self.controller.get_data().phase_mode)
         self.assertEqual(1, self.wallbox.get_data().phases_in)
         self.assertEqual(0, self.wallbox.get_data().phases_out)
 
         await self.wallbox.allow_charging(True)
         await self.wallbox.set_max_current(10)
         await self.controller.run()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.MANUAL, c.mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().mode)
         self.assertEqual(1, self.wallbox.get_data().phases_out)
 
         self.controller.set_desired_mode(ChargeMode.OFF)
         await self.controller.run()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
 
         await self.controller.run()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
         self.assertEqual(0, self.wallbox.get_data().phases_out)
 
     async def test_mode_1P_3P_1P(self):
-        c = self.controller.get_data()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
-        self.assertEqual(PhaseMode.AUTO, c.phase_mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
+        self.assertEqual(PhaseMode.AUTO, self.controller.get_data().phase_mode)
         self.assertEqual(1, self.wallbox.get_data().phases_in)
 
         self.controller.set_phase_mode(PhaseMode.CHARGE_3P)
@@ -411,10 +425,9 @@ class ChargeControllerManualModeTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(1, self.wallbox.get_data().phases_in)
 
     async def test_mode_1P_3P_while_charging(self):
-        c = self.controller.get_data()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
-        self.assertEqual(PhaseMode.AUTO, c.phase_mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
+        self.assertEqual(PhaseMode.AUTO, self.controller.get_data().phase_mode)
         wb = self.wallbox.get_data()
         self.assertEqual(1, wb.phases_in)
 
@@ -429,14 +442,13 @@ class ChargeControllerManualModeTest(unittest.IsolatedAsyncioTestCase):
         wb = self.wallbox.get_data()
         self.assertEqual(3, wb.phases_in)
         self.assertEqual(0, wb.phases_out)
-        self.assertEqual(ChargeMode.OFF, c.mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
 
     async def test_mode_3P_1P_while_charging(self):
         self.controller.set_phase_mode(PhaseMode.CHARGE_3P)
         await self.controller.run()
-        c = self.controller.get_data()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
         wb = self.wallbox.get_data()
         self.assertEqual(3, wb.phases_in)
 
@@ -454,44 +466,43 @@ class ChargeControllerManualModeTest(unittest.IsolatedAsyncioTestCase):
 
     async def test_mode_1P_PV(self):
         self.controller.set_phase_mode(PhaseMode.CHARGE_1P)
-        c = self.controller.get_data()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
 
         self.controller.set_desired_mode(ChargeMode.PV_ONLY)
-        self.assertEqual(ChargeMode.OFF, c.mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
         await self.controller.run()
-        self.assertEqual(ChargeMode.PV_ONLY, c.mode)
-        self.assertEqual(ChargeMode.PV_ONLY, c.desired_mode)
+        self.assertEqual(ChargeMode.PV_ONLY, self.controller.get_data().mode)
+        self.assertEqual(ChargeMode.PV_ONLY, self.controller.get_data().desired_mode)
 
         await self.controller.run()
-        self.assertEqual(ChargeMode.PV_ONLY, c.mode)
+        self.assertEqual(ChargeMode.PV_ONLY, self.controller.get_data().mode)
 
         self.controller.set_desired_mode(ChargeMode.MANUAL)
         await self.controller.run()
-        self.assertEqual(ChargeMode.OFF, c.mode)
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
 
     async def test_mode_1P_3P_phase_err(self):
         self.controller.set_phase_mode(PhaseMode.CHARGE_1P)
-        c = self.controller.get_data()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
         self.assertEqual(1, self.wallbox.get_data().phases_in)
 
         self.controller.set_phase_mode(PhaseMode.CHARGE_3P)
         await self.controller.run()
         self.assertEqual(3, self.wallbox.get_data().phases_in)
+        # reset after phase switch
+        self.assertEqual(1, self.wallbox.trigger_reset_cnt)
 
         self.wallbox.set_wb_error(WbError.PHASE)
         await self.controller.run()
-        self.assertEqual(1, self.wallbox.trigger_reset_cnt)
+        self.assertEqual(2, self.wallbox.trigger_reset_cnt)
 
     async def test_inconsistent_phase_relay_err(self):
         self.controller.set_phase_mode(PhaseMode.CHARGE_1P)
-        c = self.controller.get_data()
-        self.assertEqual(ChargeMode.MANUAL, c.desired_mode)
-        self.assertEqual(ChargeMode.OFF, c.mode)
+        self.assertEqual(ChargeMode.MANUAL, self.controller.get_data().desired_mode)
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().mode)
         self.assertEqual(1, self.wallbox.get_data().phases_in)
 
         self.wallbox.set_wb_error(WbError.PHASE_RELAY_ERR)
@@ -506,7 +517,9 @@ class ChargeControllerPVTest(unittest.IsolatedAsyncioTestCase):
         self.relay = SimulatedPhaseRelay(PhaseRelayConfig())
         self.wallbox = SimulatedWallbox(WallboxConfig())
         self.meter = TestMeter(TestMeterConfig(), self.wallbox)
-        self.controller = ChargeController(ChargeControllerConfig(pv_allow_charging_delay=0), self.meter, self.wallbox, self.relay)
+        # phase switch governor disabled: test data covers switching thresholds
+        config = ChargeControllerConfig(pv_allow_charging_delay=0, phase_switch_energy_window=0, phase_switch_min_dwell_time=0)
+        self.controller = ChargeController(config, self.meter, self.wallbox, self.relay)
         reset_controller_metrics()
         await self.controller.run()  # init
 
@@ -520,23 +533,21 @@ class ChargeControllerPVTest(unittest.IsolatedAsyncioTestCase):
                 await self.controller.run()
                 # re-read meter and wallbox to avoid 1 cycle delay -> makes test data easier
                 # order is important: test meter needs wallbox data
-                wb = await self.wallbox.read_data()
+                await self.wallbox.read_data()
                 self.wallbox.decrement_charge_energy_for_tests()  # TODO: replace by tick()
+                wb = self.wallbox.get_data()
                 m = await self.meter.read_data()
                 print(f"Test idx={idx}: Meter: {m}, Wallbox: {wb}")
                 expected_m = d["expected_m"]
                 # skip checking of energy consumption if not explicitly specified
                 if expected_m.energy_consumption == 0:
-                    m.energy_consumption = 0
-                    m.energy_consumption_grid = 0
-                    m.energy_consumption_pv = 0
+                    m = m.replace(energy_consumption=0, energy_consumption_grid=0, energy_consumption_pv=0)
                 expected_wb = d["expected_wb"]
                 # skip checking of car_status by setting it to wb value
-                expected_wb.car_status = wb.car_status
+                expected_wb = expected_wb.replace(car_status=wb.car_status)
                 # skip checking charged_energy if not explicitly specified
                 if expected_wb.charged_energy == 0:
-                    wb.charged_energy = 0
-                    wb.total_energy = 0
+                    wb = wb.replace(charged_energy=0, total_energy=0)
                 self.assertEqual(expected_m, m)
                 self.assertEqual(expected_wb, wb)
 
@@ -1487,3 +1498,587 @@ class ChargeControllerPVTest(unittest.IsolatedAsyncioTestCase):
             },
         ]
         await self.run_controller_test(data)
+
+
+@final
+class ChargeControllerPlannedModeTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    def setUp(self) -> None:
+        self.relay = SimulatedPhaseRelay(PhaseRelayConfig())
+        self.wallbox = SimulatedWallbox(WallboxConfig())
+        self.meter = TestMeter(TestMeterConfig(), self.wallbox)
+        self.car = SimulatedCar(CarConfig())
+        self.controller = ChargeController(ChargeControllerConfig(), self.meter, self.wallbox, self.relay, self.car)
+        self.now = datetime(2024, 6, 1, 22, 0)
+        self.controller._now = lambda: self.now
+        self.controller.set_plan_target(80, time(7, 0))
+        self.wallbox.set_car_status(CarStatus.WaitingForVehicle)
+        reset_controller_metrics()
+
+    async def run_cycle(self, pv: float, minutes: int = 15):
+        self.meter.set_data(pv, 0)
+        await self.meter.tick()
+        await self.controller.run()
+        self.now += timedelta(minutes=minutes)
+
+    async def test_target_reached(self):
+        self.car.set_data(CarData(data_captured_at=self.now, soc=80))
+        self.controller.set_desired_mode(ChargeMode.PLANNED)
+        await self.run_cycle(0)
+        plan = self.controller.get_plan()
+        self.assertEqual(datetime(2024, 6, 2, 7, 0), plan.departure)
+        self.assertEqual(0, plan.energy_needed)
+        self.assertEqual(0, plan.energy_grid)
+        self.assertEqual(ChargeMode.PLANNED, self.controller.get_data().mode)
+        self.assertEqual(ChargeMode.PLANNED, self.controller.get_data().desired_mode)
+        self.assertFalse(self.wallbox.get_data().allow_charging)
+
+    async def test_pv_forecast(self):
+        # forecast learns from the PV history of the controller cycles
+        for _ in range(4 * 24):
+            await self.run_cycle(3000 if 8 <= self.now.hour < 18 else 0)
+        forecaster = self.controller.get_forecaster()
+        self.assertGreater(forecaster.learned_slots(), 0)
+        self.assertGreater(forecaster.forecast(datetime(2024, 6, 2, 12, 0)), 0)
+        self.assertEqual(0, forecaster.forecast(datetime(2024, 6, 2, 23, 0)))
+
+    async def test_unknown_soc(self):
+        self.car.inc_error_counter()
+        self.controller.set_desired_mode(ChargeMode.PLANNED)
+        await self.run_cycle(0)
+        plan = self.controller.get_plan()
+        self.assertEqual(-1, plan.soc)
+        self.assertEqual(0, plan.energy_grid)
+
+    async def test_car_never_read(self):
+        self.car.set_data(CarData())
+        self.controller.set_desired_mode(ChargeMode.PLANNED)
+        await self.run_cycle(0)
+        plan = self.controller.get_plan()
+        self.assertEqual(-1, plan.soc)
+        self.assertEqual(0, plan.energy_grid)
+        self.assertFalse(self.wallbox.get_data().allow_charging)
+
+    async def test_charge_until_departure(self):
+        # 20% = 11.6kWh / 0.9 -> 1.2h MAX
+        self.car.set_data(CarData(data_captured_at=self.now, soc=60))
+        self.controller.set_desired_mode(ChargeMode.PLANNED)
+        modes: list[ChargeMode] = []
+        while self.now < datetime(2024, 6, 2, 7, 0):
+            await self.run_cycle(0)
+            modes.append(self.controller._effective_mode())
+            wb = self.wallbox.get_data()
+            if modes[-2:] == [ChargeMode.MAX] * 2:
+                # first MAX cycle switches to 3 phases
+                self.assertTrue(wb.allow_charging)
+                self.assertEqual(16, wb.max_current)
+            self.assertEqual(ChargeMode.PLANNED, self.controller.get_data().mode)
+        self.assertEqual([ChargeMode.MAX] * 5, modes[-5:])
+        self.assertTrue(all(m == ChargeMode.PV_ONLY for m in modes[:-5]))
+        self.assertTrue(self.wallbox.get_data().allow_charging)
+        self.assertEqual(3, self.wallbox.get_data().phases_in)
+
+    async def test_replan_with_pv_history(self):
+        self.car.set_data(CarData(data_captured_at=self.now, soc=70))
+        self.now = datetime(2024, 6, 1, 8, 0)
+        self.controller.set_plan_target(80, time(18, 0))
+        # yesterday: 4kW PV from 10:00 - 14:00, learned by the PV forecast
+        samples = [datetime(2024, 5, 31, 8, 0) + timedelta(minutes=m) for m in range(0, 24 * 60, 15)]
+        self.controller.get_forecaster().load_history((t, 4000 if 10 <= t.hour < 14 else 0) for t in samples)
+        self.controller.set_desired_mode(ChargeMode.PLANNED)
+        await self.run_cycle(0)
+        plan = self.controller.get_plan()
+        self.assertEqual(0, plan.energy_grid)
+        self.assertGreaterEqual(plan.energy_pv, plan.energy_needed)
+        self.assertEqual(ChargeMode.PV_ONLY, self.controller._effective_mode())
+        noon = next(slot for slot in plan.slots if slot.start == datetime(2024, 6, 1, 12, 0))
+        self.assertAlmostEqual(self.controller.get_forecaster().forecast(noon.start), noon.power_pv)  # no home consumption
+        # higher target needs grid energy: PV_ALL can't add energy to 4kW PV -> MAX
+        self.controller.set_plan_target(100, time(18, 0))
+        await self.run_cycle(0)
+        plan = self.controller.get_plan()
+        self.assertGreater(plan.energy_grid, 0)
+        self.assertGreaterEqual(plan.energy_pv + plan.energy_grid, plan.energy_needed)
+
+
+def _hourly_prices(start: datetime, prices: list[float]) -> tuple[PriceSlot, ...]:
+    return tuple(PriceSlot(start + timedelta(hours=i), start + timedelta(hours=i + 1), p) for i, p in enumerate(prices))
+
+
+@final
+class ChargeControllerTariffModeTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    def setUp(self) -> None:
+        self.relay = SimulatedPhaseRelay(PhaseRelayConfig())
+        self.wallbox = SimulatedWallbox(WallboxConfig())
+        self.meter = TestMeter(TestMeterConfig(), self.wallbox)
+        self.car = SimulatedCar(CarConfig())
+        self.prices = SimulatedPriceProvider(PriceProviderConfig())
+        self.controller = ChargeController(
+            ChargeControllerConfig(), self.meter, self.wallbox, self.relay, self.car, price_provider=self.prices
+        )
+        self.now = datetime(2024, 6, 1, 22, 0)
+        self.controller._now = lambda: self.now
+        self.controller.set_plan_target(80, time(7, 0))
+        self.wallbox.set_car_status(CarStatus.WaitingForVehicle)
+        # 20% = 11.6kWh / 0.9 -> 1.2h MAX
+        self.car.set_data(CarData(data_captured_at=self.now, soc=60))
+        self.prices.set_prices(_hourly_prices(self.now, [30, 25, 20, 10, 12, 15, 18, 22, 28]))
+        reset_controller_metrics()
+
+    async def run_cycle(self, pv: float = 0, minutes: int = 15):
+        self.meter.set_data(pv, 0)
+        await self.meter.tick()
+        await self.controller.run()
+        self.now += timedelta(minutes=minutes)
+
+    async def test_charge_in_cheapest_slots(self):
+        self.controller.set_desired_mode(ChargeMode.TARIFF)
+        modes: dict[datetime, ChargeMode] = {}
+        while self.now < datetime(2024, 6, 2, 7, 0):
+            t = self.now
+            await self.run_cycle()
+            modes[t] = self.controller._effective_mode()
+            self.assertEqual(ChargeMode.TARIFF, self.controller.get_data().mode)
+            self.assertEqual(ChargeMode.TARIFF, self.controller.get_data().desired_mode)
+            if modes[t] == ChargeMode.MAX:
+                # car SOC increases by 11kW for 15min
+                soc = self.car.get_data().soc + 11040 / 4 * 0.9 / 580
+                self.car.set_data(CarData(data_captured_at=self.now, soc=soc))
+        grid = sorted(t for t, m in modes.items() if m == ChargeMode.MAX)
+        # 01:00 - 02:00 (10) and 1st cycle of 02:00 - 03:00 (12)
+        self.assertEqual(datetime(2024, 6, 2, 1, 0), grid[0])
+        self.assertEqual(datetime(2024, 6, 2, 2, 0), grid[-1])
+        self.assertEqual(5, len(grid))
+        self.assertGreaterEqual(self.car.get_data().soc, 80)
+        self.assertTrue(all(m in [ChargeMode.MAX, ChargeMode.PV_ONLY] for m in modes.values()))
+
+    async def test_plan(self):
+        self.controller.set_desired_mode(ChargeMode.TARIFF)
+        await self.run_cycle()
+        plan = self.controller.get_tariff_plan()
+        self.assertEqual(datetime(2024, 6, 2, 7, 0), plan.departure)
+        self.assertEqual(60, plan.soc)
+        self.assertAlmostEqual(20 * 580 / 0.9, plan.energy_needed)
+        self.assertAlmostEqual(plan.energy_needed, plan.energy_grid)
+        self.assertAlmostEqual(11040 / 1000 * 10 + (plan.energy_needed - 11040) / 1000 * 12, plan.cost)
+        self.assertEqual(self.prices.get_data().updated_at, plan.prices_updated_at)
+        self.assertEqual(9, len(plan.slots))
+        self.assertFalse(self.wallbox.get_data().allow_charging)
+
+    async def test_price_update(self):
+        self.controller.set_desired_mode(ChargeMode.TARIFF)
+        await self.run_cycle()
+        self.assertEqual(
+            datetime(2024, 6, 2, 1, 0), next(s.start for s in self.controller.get_tariff_plan().slots if s.mode == ChargeMode.MAX)
+        )
+        # new prices: cheapest slot now
+        self.prices.set_prices(_hourly_prices(datetime(2024, 6, 1, 22, 0), [5, 25, 20, 10, 12, 15, 18, 22, 28]))
+        await self.run_cycle()
+        self.assertEqual(ChargeMode.MAX, self.controller._effective_mode())
+        await self.run_cycle()
+        self.assertTrue(self.wallbox.get_data().allow_charging)
+        self.assertEqual(ChargeMode.TARIFF, self.controller.get_data().mode)
+
+    async def test_unknown_soc_pv_only(self):
+        self.car.inc_error_counter()
+        self.controller.set_desired_mode(ChargeMode.TARIFF)
+        await self.run_cycle()
+        plan = self.controller.get_tariff_plan()
+        self.assertEqual(-1, plan.soc)
+        self.assertEqual(0, plan.energy_grid)
+        self.assertTrue(all(s.mode == ChargeMode.PV_ONLY for s in plan.slots))
+
+    async def test_no_price_provider(self):
+        controller = ChargeController(ChargeControllerConfig(), self.meter, self.wallbox, self.relay, self.car)
+        controller._now = lambda: self.now
+        controller.set_desired_mode(ChargeMode.TARIFF)
+        await controller.run()
+        self.assertEqual((), controller.get_tariff_plan().slots)
+        self.assertEqual(ChargeMode.PV_ONLY, controller._effective_mode())
+        self.assertEqual(ChargeMode.TARIFF, controller.get_data().mode)
+
+
+@final
+class PhaseSwitchGovernorTest(unittest.TestCase):
+    @override
+    def setUp(self) -> None:
+        self.config = ChargeControllerConfig()
+        self.governor = PhaseSwitchGovernor(self.config)
+        self.now = datetime(2024, 6, 1, 12, 0)
+
+    def fill(self, power_delta: float):
+        for _ in range(10):
+            self.governor.add_sample(power_delta)
+
+    def test_energy(self):
+        self.assertFalse(self.governor.allow_switch(self.now, 3))
+        self.fill(240)
+        self.assertAlmostEqual(20, self.governor.energy())
+        self.assertTrue(self.governor.allow_switch(self.now, 3))
+        self.assertFalse(self.governor.allow_switch(self.now, 1))
+        # short dip doesn't prevent switching, longer deficit does
+        self.governor.add_sample(-200)
+        self.assertFalse(self.governor.allow_switch(self.now, 3))
+        self.fill(-240)
+        self.assertTrue(self.governor.allow_switch(self.now, 1))
+
+    def test_reset_on_mode_change(self):
+        self.governor.set_modes(ChargeMode.PV_ONLY, PhaseMode.AUTO)
+        self.fill(1000)
+        self.governor.set_modes(ChargeMode.PV_ONLY, PhaseMode.AUTO)
+        self.assertTrue(self.governor.allow_switch(self.now, 3))
+        self.governor.set_modes(ChargeMode.PV_ALL, PhaseMode.AUTO)
+        self.assertEqual(0, self.governor.energy())
+        self.assertFalse(self.governor.allow_switch(self.now, 3))
+        self.fill(1000)
+        self.governor.set_modes(ChargeMode.PV_ALL, PhaseMode.CHARGE_1P)
+        self.assertFalse(self.governor.allow_switch(self.now, 3))
+
+    def test_dwell_time(self):
+        self.governor.switched(self.now, governed=True)
+        self.fill(1000)
+        self.assertFalse(self.governor.allow_switch(self.now + timedelta(minutes=9), 3))
+        self.assertTrue(self.governor.allow_switch(self.now + timedelta(minutes=10), 3))
+
+    def test_switches_per_day(self):
+        for i in range(12):
+            self.governor.switched(self.now + timedelta(minutes=i), governed=True)
+        self.governor.switched(self.now, governed=False)
+        self.assertEqual(12, self.governor.get_switches(self.now))
+        self.fill(1000)
+        self.assertFalse(self.governor.allow_switch(self.now + timedelta(hours=1), 3))
+        self.assertTrue(self.governor.allow_switch(self.now + timedelta(days=1), 3))
+        self.assertEqual(0, self.governor.get_switches(self.now + timedelta(days=1)))
+
+
+def _learn_sunny_day(forecaster: PvForecaster, day: datetime, peak_power: float) -> None:
+    cfg = forecaster.get_config()
+    for m in range(0, 24 * 60 + 15, 5):
+        t = day + timedelta(minutes=m)
+        forecaster.add_sample(t, peak_power * clear_sky(t, cfg.latitude, cfg.longitude))
+
+
+@final
+class BatteryPriorityOptimizerTest(unittest.TestCase):
+    @override
+    def setUp(self) -> None:
+        self.config = ChargeControllerConfig(battery_capacity=10000)
+        self.forecaster = PvForecaster(ForecastConfig())
+        self.optimizer = BatteryPriorityOptimizer(self.config, self.forecaster)
+        self.day = datetime(2024, 6, 2)
+
+    def add_sample(self, power_battery: float = -3000, home: float = 500):
+        self.optimizer.add_sample(MeterData(power_consumption=home, power_battery=power_battery), WallboxData())
+
+    def test_unknown(self):
+        # no home consumption, no forecast
+        self.assertIsNone(self.optimizer.priority(self.day + timedelta(hours=8), 20, Priority.HOME_BATTERY))
+        self.add_sample()
+        self.assertIsNone(self.optimizer.priority(self.day + timedelta(hours=8), 20, Priority.HOME_BATTERY))
+        _learn_sunny_day(self.forecaster, self.day - timedelta(days=1), 5000)
+        self.assertIsNotNone(self.optimizer.priority(self.day + timedelta(hours=8), 20, Priority.HOME_BATTERY))
+        # disabled
+        optimizer = BatteryPriorityOptimizer(ChargeControllerConfig(), self.forecaster)
+        optimizer.add_sample(MeterData(power_battery=-3000), WallboxData())
+        self.assertIsNone(optimizer.priority(self.day + timedelta(hours=8), 20, Priority.HOME_BATTERY))
+
+    def test_learn_charge_power(self):
+        self.add_sample(power_battery=-1000)
+        self.add_sample(power_battery=-2500)
+        self.add_sample(power_battery=500)
+        self.assertEqual(2500, self.optimizer._battery_charge_power)
+        optimizer = BatteryPriorityOptimizer(ChargeControllerConfig(battery_max_charge_power=4000), self.forecaster)
+        optimizer.add_sample(MeterData(power_battery=-5000), WallboxData())
+        self.assertEqual(4000, optimizer._battery_charge_power)
+
+    def test_priority(self):
+        _learn_sunny_day(self.forecaster, self.day - timedelta(days=1), 5000)
+        self.add_sample()
+        morning = self.day + timedelta(hours=8)
+        evening = self.day + timedelta(hours=17)
+        self.assertGreater(self.optimizer.battery_energy(morning), 10000 * 1.2)
+        self.assertGreater(self.optimizer.battery_energy(morning), self.optimizer.battery_energy(evening))
+        self.assertEqual(0, self.optimizer.battery_energy(self.day + timedelta(hours=22)))
+        # enough PV left to fill the battery -> car first
+        self.assertEqual(Priority.CAR, self.optimizer.priority(morning, 0, Priority.HOME_BATTERY))
+        self.assertEqual(Priority.HOME_BATTERY, self.optimizer.priority(evening, 20, Priority.CAR))
+        self.assertEqual(Priority.CAR, self.optimizer.priority(evening, 100, Priority.HOME_BATTERY))
+
+    def test_hysteresis(self):
+        _learn_sunny_day(self.forecaster, self.day - timedelta(days=1), 5000)
+        self.add_sample()
+        t = self.day + timedelta(hours=16)
+        available = self.optimizer.battery_energy(t)
+        soc = 100 - available / 1.1 / 10000 * 100  # needed = available / 1.1
+        self.assertGreater(soc, 0)
+        self.assertEqual(Priority.HOME_BATTERY, self.optimizer.priority(t, soc, Priority.HOME_BATTERY))
+        self.assertEqual(Priority.CAR, self.optimizer.priority(t, soc, Priority.CAR))
+
+
+@final
+class ChargeControllerPriorityOptimizerTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    def setUp(self) -> None:
+        self.wallbox = SimulatedWallbox(WallboxConfig())
+        self.meter = TestMeter(TestMeterConfig(battery_capacity=10000, battery_max=3000), self.wallbox)
+        self.forecaster = PvForecaster(ForecastConfig())
+        config = ChargeControllerConfig(battery_capacity=10000)
+        self.controller = ChargeController(
+            config, self.meter, self.wallbox, SimulatedPhaseRelay(PhaseRelayConfig()), forecaster=self.forecaster
+        )
+        self.now = datetime(2024, 6, 2, 8, 0)
+        self.controller._now = lambda: self.now
+        self.controller.set_desired_mode(ChargeMode.PV_ONLY)
+        self.controller.set_desired_priority(Priority.AUTO)
+
+    async def test_fallback_to_soc_threshold(self):
+        # no PV forecast yet: soc below prio_auto_soc_threshold -> home battery
+        self.meter.set_data(5000, 500)
+        await self.controller.run()
+        self.assertEqual(Priority.HOME_BATTERY, self.controller.get_data().priority)
+
+    async def test_sunny_morning(self):
+        _learn_sunny_day(self.forecaster, datetime(2024, 6, 1), 5000)
+        self.meter.set_data(5000, 500)
+        await self.controller.run()
+        self.assertEqual(Priority.CAR, self.controller.get_data().priority)
+        self.assertEqual(Priority.AUTO, self.controller.get_data().desired_priority)
+        # late afternoon, battery still empty -> home battery
+        self.now = datetime(2024, 6, 2, 17, 0)
+        await self.controller.run()
+        self.assertEqual(Priority.HOME_BATTERY, self.controller.get_data().priority)
+
+
+@final
+class PhaseSwitchSimulationTest(unittest.IsolatedAsyncioTestCase):
+    async def simulate(self, config: ChargeControllerConfig) -> tuple[int, float]:
+        """Simulate a day with passing clouds around the 1/3 phase threshold, returns number of switches and charged PV energy."""
+        relay = SimulatedPhaseRelay(PhaseRelayConfig())
+        wallbox = SimulatedWallbox(WallboxConfig())
+        meter = TestMeter(TestMeterConfig(), wallbox)
+        controller = ChargeController(config, meter, wallbox, relay)
+        now = datetime(2024, 6, 1, 8, 0)
+        controller._now = lambda: now
+        controller.set_desired_mode(ChargeMode.PV_ONLY)
+        wallbox.set_car_status(CarStatus.Charging)
+        rnd = random.Random(42)
+        switches = 0
+        energy_pv = 0.0
+        cloud = 0.0
+        restart_cycles = 0
+        for _ in range(10 * 60 * 2):  # 10h of 30s cycles
+            # 4-8kW clear sky, clouds reduce PV randomly for a few minutes
+            pv = 6000 + 2000 * math.sin(math.pi * (now.hour + now.minute / 60 - 8) / 10)
+            if rnd.random() < 0.15:
+                cloud = rnd.uniform(0, 0.5)
+            meter.set_data(pv * (1 - cloud), 500)
+            phases = wallbox.get_data().phases_in
+            await controller.run()
+            # wallbox reset after phase switch: car needs ~2min to resume charging
+            restart_cycles -= 1
+            wallbox.set_car_status(CarStatus.ChargingFinished if restart_cycles > 0 else CarStatus.Charging)
+            await wallbox.read_data()
+            if wallbox.get_data().phases_in != phases:
+                switches += 1
+                restart_cycles = 4
+            energy_pv += min(wallbox.get_data().power, max(pv * (1 - cloud) - 500, 0)) / 120
+            now += timedelta(seconds=30)
+        return switches, energy_pv
+
+    async def test_governor(self):
+        switches_power, energy_power = await self.simulate(
+            ChargeControllerConfig(phase_switch_energy_window=0, phase_switch_min_dwell_time=0, phase_switch_max_per_day=0)
+        )
+        switches, energy = await self.simulate(ChargeControllerConfig())
+        self.assertLess(switches, switches_power)
+        self.assertLessEqual(switches, ChargeControllerConfig().phase_switch_max_per_day)
+        self.assertGreater(energy, energy_power)
+
+
+@final
+class PhaseSwitchSequenceTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    async def asyncSetUp(self) -> None:
+        self.relay = SimulatedPhaseRelay(PhaseRelayConfig())
+        self.wallbox = SimulatedWallbox(WallboxConfig(switch_phases_reset_delay=2))
+        self.meter = TestMeter(TestMeterConfig(), self.wallbox)
+        self.controller = ChargeController(ChargeControllerConfig(), self.meter, self.wallbox, self.relay)
+        self.now = datetime(2024, 6, 1, 12, 0)
+        self.controller._now = lambda: self.now
+        self.wallbox.set_car_status(CarStatus.Charging)
+        await self.wallbox.allow_charging(True)
+        await self.wallbox.read_data()
+        self.controller.set_phase_mode(PhaseMode.CHARGE_3P)
+
+    async def run_cycle(self, seconds: int = 30) -> PhaseSwitchState:
+        await self.controller.run()
+        self.now += timedelta(seconds=seconds)
+        return self.controller.get_data().phase_switch
+
+    async def test_switch(self):
+        self.assertEqual(PhaseSwitchState.CHARGING_OFF, await self.run_cycle())
+        self.assertFalse(self.wallbox.get_data().allow_charging)
+        self.assertEqual(1, self.wallbox.get_data().phases_in)
+        self.assertEqual(PhaseSwitchState.SETTLE, await self.run_cycle(1))
+        self.assertEqual(3, self.wallbox.get_data().phases_in)
+        self.assertEqual(0, self.wallbox.trigger_reset_cnt)
+        # settle time not over yet
+        self.assertEqual(PhaseSwitchState.SETTLE, await self.run_cycle(1))
+        self.assertEqual(PhaseSwitchState.VERIFY, await self.run_cycle())
+        self.assertEqual(1, self.wallbox.trigger_reset_cnt)
+        self.assertEqual(PhaseSwitchState.IDLE, await self.run_cycle())
+        self.assertEqual(3, self.wallbox.get_data().phases_in)
+        self.assertEqual(1, self.wallbox.trigger_reset_cnt)
+
+    async def test_rollback_on_relay_error(self):
+        for _ in range(3):
+            await self.run_cycle()
+        self.assertEqual(PhaseSwitchState.VERIFY, self.controller.get_data().phase_switch)
+        self.wallbox.set_wb_error(WbError.PHASE_RELAY_ERR)
+        self.assertEqual(PhaseSwitchState.IDLE, await self.run_cycle())
+        self.assertEqual(1, self.wallbox.get_data().phases_in)
+        self.assertEqual(2, self.wallbox.trigger_reset_cnt)
+
+    async def test_rollback_on_timeout(self):
+        for _ in range(3):
+            await self.run_cycle()
+        self.assertEqual(PhaseSwitchState.VERIFY, self.controller.get_data().phase_switch)
+        # wallbox doesn't report new phases_in
+        self.wallbox._update_data(phases_in=1)
+        self.assertEqual(PhaseSwitchState.VERIFY, await self.run_cycle(120))
+        self.assertEqual(PhaseSwitchState.IDLE, await self.run_cycle())
+        self.assertEqual(2, self.wallbox.trigger_reset_cnt)
+
+    async def test_governor_skips_wallbox_errors(self):
+        self.controller.set_phase_mode(PhaseMode.AUTO)
+        self.controller.set_desired_mode(ChargeMode.PV_ONLY)
+        self.meter.set_data(3000, 500)
+        self.wallbox.inc_error_counter()
+        await self.run_cycle()
+        self.assertEqual(0, self.controller._phase_governor.energy())
+        self.wallbox.reset_error_counter()
+        await self.run_cycle()
+        self.assertNotEqual(0, self.controller._phase_governor.energy())
+
+
+@final
+class ChargeControllerCurrentLimitTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    async def asyncSetUp(self) -> None:
+        self.relay = DisabledPhaseRelay(PhaseRelayConfig(enable_phase_switching=False))
+        self.wallbox = SimulatedWallbox(WallboxConfig())
+        self.wallbox.set_car_status(CarStatus.Charging)
+        self.meter = TestMeter(TestMeterConfig(), self.wallbox)
+        self.meter.set_phase_currents(5, 5, 5)
+        config = ChargeControllerConfig(max_phase_current=25, pv_allow_charging_delay=0)
+        self.controller = ChargeController(config, self.meter, self.wallbox, self.relay)
+        reset_controller_metrics()
+
+    def actions(self, action: str) -> float:
+        return GridCurrentLimiter._metrics_pvc_limit_actions.labels(action)._value.get()  # pyright: ignore[reportUnknownMemberType]
+
+    def test_limiter_requests(self):
+        lim = GridCurrentLimiter(ChargeControllerConfig(max_phase_current=25))
+        self.assertEqual(16, lim.request_current(16, 6))  # limit disabled until first update
+        lim.update(MeterData(current_l1=20, current_l2=5, current_l3=5), WallboxData(phases_in=3))
+        self.assertEqual(5, lim.available)
+        self.assertEqual(6, lim.request_current(16, 6))
+        self.assertEqual((16, 6), (lim.requested, lim.limited_to))
+        self.assertFalse(lim.request_charging(True, 6))
+        self.assertTrue(lim.switched_off)
+        self.assertTrue(lim.request_charging(True, 5))
+        self.assertFalse(lim.switched_off)
+        self.assertFalse(lim.request_charging(False, 5))
+        self.assertEqual(0, lim.requested)
+
+    async def test_disabled(self):
+        controller = ChargeController(ChargeControllerConfig(), self.meter, self.wallbox, self.relay)
+        controller.set_desired_mode(ChargeMode.MAX)
+        self.meter.set_phase_currents(50, 50, 50)
+        await controller.run()
+        await controller.limit_current()
+        self.assertIsNone(controller._limiter.available)
+        self.assertEqual(16, self.wallbox.get_data().max_current)
+        self.assertTrue(self.wallbox.get_data().allow_charging)
+
+    async def test_max_fast_loop(self):
+        await self.wallbox.set_phases_in(3)
+        self.controller.set_desired_mode(ChargeMode.MAX)
+        await self.controller.run()
+        wb = await self.wallbox.read_data()
+        self.assertEqual((16, True), (wb.max_current, wb.allow_charging))
+        self.assertEqual(ChargeMode.MAX, self.controller.get_data().mode)
+
+        # oven on L2 -> reduced by fast loop
+        reduced = self.actions("reduce")
+        self.meter.set_phase_currents(5, 15, 5)
+        await self.controller.limit_current()
+        wb = await self.wallbox.read_data()
+        self.assertEqual((10, True), (wb.max_current, wb.allow_charging))
+        self.assertEqual(reduced + 1, self.actions("reduce"))
+        self.assertTrue(self.controller._limiter.is_throttled())
+
+        # less than min current left -> charging off
+        self.meter.set_phase_currents(5, 22, 5)
+        await self.controller.limit_current()
+        wb = await self.wallbox.read_data()
+        self.assertFalse(wb.allow_charging)
+
+        # fast loop doesn't increase, control cycle raises the current within the limit
+        self.meter.set_phase_currents(5, 12, 5)
+        await self.controller.limit_current()
+        self.assertFalse((await self.wallbox.read_data()).allow_charging)
+        await self.controller.run()
+        wb = await self.wallbox.read_data()
+        self.assertEqual((13, True), (wb.max_current, wb.allow_charging))
+        self.meter.set_phase_currents(5, 5, 5)
+        await self.controller.run()
+        wb = await self.wallbox.read_data()
+        self.assertEqual((16, True), (wb.max_current, wb.allow_charging))
+        self.assertFalse(self.controller._limiter.is_throttled())
+
+    async def test_manual_change_by_user_is_kept(self):
+        self.controller.set_desired_mode(ChargeMode.MANUAL)
+        await self.wallbox.set_phases_in(3)
+        await self.wallbox.set_max_current(16)
+        await self.wallbox.allow_charging(True)
+        await self.wallbox.read_data()
+        self.meter.set_phase_currents(5, 15, 5)
+        await self.controller.run()
+        wb = await self.wallbox.read_data()
+        self.assertEqual(10, wb.max_current)
+        self.meter.set_phase_currents(5, 8, 5)
+        await self.controller.run()
+        self.assertEqual(16, (await self.wallbox.read_data()).max_current)  # restored
+        self.meter.set_phase_currents(5, 15, 5)
+        await self.controller.limit_current()
+        self.assertEqual(10, (await self.wallbox.read_data()).max_current)
+        # user sets 8A via app
+        await self.wallbox.set_max_current(8)
+        self.meter.set_phase_currents(5, 5, 5)
+        await self.controller.run()
+        self.assertEqual(8, (await self.wallbox.read_data()).max_current)
+
+    async def test_pv_only(self):
+        self.controller.set_desired_mode(ChargeMode.PV_ONLY)
+        self.meter.set_data(5000, 0)
+        self.meter.set_phase_currents(15, 0, 0)  # 1 phase charging on L1
+        await self.controller.run()
+        await self.controller.run()
+        wb = await self.wallbox.read_data()
+        self.assertEqual((1, 10, True), (wb.phases_in, wb.max_current, wb.allow_charging))
+        self.assertEqual(10, self.controller._limiter.available)
+
+        # PV surplus below limit -> not throttled
+        self.meter.set_data(1800, 0)
+        await self.controller.run()
+        wb = await self.wallbox.read_data()
+        self.assertEqual(7, wb.max_current)
+        self.assertFalse(self.controller._limiter.is_throttled())
+
+        # limit below min current -> charging off without allow_charging delay
+        self.meter.set_data(5000, 0)
+        self.meter.set_phase_currents(20, 0, 0)
+        await self.controller.run()
+        self.assertFalse((await self.wallbox.read_data()).allow_charging)
@@ -0,0 +1,142 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, time
+from typing import Any, final, override
+
+from pvcontrol.chargecontroller import ChargeController, ChargeControllerConfig, ChargeMode, PhaseMode, Priority
+from pvcontrol.checkpoint import CheckpointConfig, Checkpointer, decode_state, encode_state
+from pvcontrol.ledger import ChargingSession, LedgerConfig, LedgerState, SessionLedger
+from pvcontrol.meter import TestMeter, TestMeterConfig
+from pvcontrol.relay import PhaseRelayConfig, SimulatedPhaseRelay
+from pvcontrol.wallbox import CarStatus, SimulatedWallbox, WallboxConfig
+
+# pyright: reportUninitializedInstanceVariable=false
+# pyright: reportPrivateUsage=false
+
+
+@final
+class CheckpointTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.dir.name, "pvcontrol.checkpoint")
+        self.wallbox = SimulatedWallbox(WallboxConfig())
+        self.meter = TestMeter(TestMeterConfig(), self.wallbox)
+        self.controller = self.new_controller()
+        self.ledger = SessionLedger(LedgerConfig())
+        self.checkpointer = Checkpointer(CheckpointConfig(file=self.file, min_interval=60), self.controller, self.ledger)
+        self.now = 1000.0
+        self.checkpointer._monotonic = lambda: self.now
+
+    @override
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def new_controller(self) -> ChargeController:
+        return ChargeController(ChargeControllerConfig(), self.meter, self.wallbox, SimulatedPhaseRelay(PhaseRelayConfig()))
+
+    def read(self) -> dict[str, Any]:
+        with open(self.file) as f:
+            return json.load(f)
+
+    def test_encoding(self):
+        ctl = self.controller
+        ctl.set_desired_mode(ChargeMode.PV_ALL)
+        ctl.set_desired_priority(Priority.CAR)
+        ctl.set_plan_target(90, time(6, 30))
+        ctl._pv_allow_charging_delay = 90
+        ctl._last_charged_energy = 1234.5
+        ledger = LedgerState(ChargingSession(datetime(2024, 6, 1, 12, 0), None, 1000, 750, 250, 0.75, 7.5, 11000), 1000, 0.25, 30)
+        controller_state, ledger_state = decode_state(json.loads(json.dumps(encode_state(ctl.get_state(), ledger))))
+        self.assertEqual(ctl.get_state(), controller_state)
+        self.assertEqual(ledger, ledger_state)
+        self.assertIsNone(decode_state(encode_state(ctl.get_state(), None))[1])
+        with self.assertRaises(ValueError):
+            decode_state({"version": 0})
+
+    async def test_save_restore(self):
+        ctl = self.controller
+        ctl.set_desired_mode(ChargeMode.PV_ONLY)
+        ctl.set_phase_mode(PhaseMode.CHARGE_1P)
+        ctl._charge_mode_pv_to_off_delay = 150
+        ctl._last_energy_consumption = 5000
+        self.ledger.restore_state(LedgerState(ChargingSession(datetime(2024, 6, 1, 12, 0), energy=500), 500, 0.5, 30))
+        await self.checkpointer.save()
+        self.assertFalse(os.path.exists(f"{self.file}.tmp"))
+
+        ctl2 = self.new_controller()
+        ledger2 = SessionLedger(LedgerConfig())
+        checkpointer = Checkpointer(CheckpointConfig(file=self.file), ctl2, ledger2)
+        self.assertTrue(checkpointer.restore())
+        self.assertEqual(ctl.get_state(), ctl2.get_state())
+        self.assertEqual(ChargeMode.PV_ONLY, ctl2.get_data().desired_mode)
+        self.assertEqual(150, ctl2._charge_mode_pv_to_off_delay)
+        self.assertEqual(self.ledger.get_state(), ledger2.get_state())
+        self.assertIsNotNone(ledger2.get_session())
+
+    def test_restore_missing_or_invalid(self):
+        self.assertFalse(self.checkpointer.restore())
+        with open(self.file, "w") as f:
+            f.write('{"version": 1, "controller": {')
+        self.assertFalse(self.checkpointer.restore())
+        self.assertEqual(ChargeMode.OFF, self.controller.get_data().desired_mode)
+
+    async def test_coalesced_writes(self):
+        ctl = self.controller
+        await self.checkpointer.save()
+        self.assertEqual(0, self.read()["controller"]["pv_allow_charging_delay"])
+        # timer changes are coalesced
+        ctl._pv_allow_charging_delay = 90
+        self.now += 30
+        await self.checkpointer.save()
+        self.assertEqual(0, self.read()["controller"]["pv_allow_charging_delay"])
+        self.now += 30
+        await self.checkpointer.save()
+        self.assertEqual(90, self.read()["controller"]["pv_allow_charging_delay"])
+        # user settings are written immediately
+        ctl.set_desired_mode(ChargeMode.MAX)
+        await self.checkpointer.save()
+        self.assertEqual("MAX", self.read()["controller"]["desired_mode"])
+        # unchanged state is not written again
+        mtime = os.stat(self.file).st_mtime_ns
+        os.utime(self.file, ns=(0, 0))
+        self.now += 120
+        await self.checkpointer.save()
+        self.assertEqual(0, os.stat(self.file).st_mtime_ns)
+        self.assertNotEqual(0, mtime)
+        # force, e.g. on shutdown
+        ctl._pv_allow_charging_delay = 30
+        await self.checkpointer.save(force=True)
+        self.assertEqual(30, self.read()["controller"]["pv_allow_charging_delay"])
+
+    async def test_charging_resumes_after_restart(self):
+        self.wallbox.set_car_status(CarStatus.Charging)
+        self.meter.set_data(3000, 0)
+        ctl = self.controller
+        ctl.set_desired_mode(ChargeMode.PV_ONLY)
+        ctl.set_phase_mode(PhaseMode.CHARGE_1P)
+        for _ in range(6):
+            await ctl.run()
+        self.assertTrue(self.wallbox.get_data().allow_charging)
+        await self.checkpointer.save(force=True)
+        # shutdown
+        await self.wallbox.allow_charging(False)
+
+        ctl2 = self.new_controller()
+        checkpointer = Checkpointer(CheckpointConfig(file=self.file), ctl2)
+        self.assertTrue(checkpointer.restore())
+        await ctl2.run()
+        self.assertTrue(self.wallbox.get_data().allow_charging)
+        self.assertEqual(ChargeMode.PV_ONLY, ctl2.get_data().mode)
+
+    def test_restore_time(self):
+        ledger = SessionLedger(LedgerConfig())
+        ledger.restore_state(LedgerState(ChargingSession(datetime(2024, 6, 1, 12, 0)), 0, 0, 0))
+        checkpointer = Checkpointer(CheckpointConfig(file=self.file), self.controller, ledger)
+        checkpointer._write(json.dumps(encode_state(self.controller.get_state(), ledger.get_state())).encode())
+        ctl = self.new_controller()
+        start = datetime.now()
+        self.assertTrue(Checkpointer(CheckpointConfig(file=self.file), ctl, SessionLedger(LedgerConfig())).restore())
+        self.assertLess((datetime.now() - start).total_seconds(), 0.05)
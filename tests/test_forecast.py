@@ -0,0 +1,76 @@
+import math
+import unittest
+from datetime import UTC, datetime, timedelta
+from typing import final
+
+from pvcontrol.forecast import ForecastConfig, PvForecaster, clear_sky
+
+# pyright: reportPrivateUsage=false
+
+MUNICH = (48.1, 11.6)
+
+
+def _day(forecaster: PvForecaster, day: datetime, scale: float, cycle_time: int = 60) -> None:
+    """Feed one day of PV samples = scale * clear-sky factor."""
+    t = day
+    while t < day + timedelta(days=1):
+        forecaster.add_sample(t, scale * clear_sky(t, *MUNICH))
+        t += timedelta(seconds=cycle_time)
+
+
+@final
+class ClearSkyTest(unittest.TestCase):
+    def test_clear_sky(self):
+        # solar noon in Munich ~11:14 UTC
+        summer = clear_sky(datetime(2024, 6, 21, 11, 14, tzinfo=UTC), *MUNICH)
+        winter = clear_sky(datetime(2024, 12, 21, 11, 14, tzinfo=UTC), *MUNICH)
+        self.assertAlmostEqual(90 - 48.1 + 23.44, math.degrees(math.asin(summer)), delta=0.5)
+        self.assertAlmostEqual(90 - 48.1 - 23.44, math.degrees(math.asin(winter)), delta=0.5)
+        self.assertEqual(0, clear_sky(datetime(2024, 6, 21, 23, 0, tzinfo=UTC), *MUNICH))
+        self.assertLess(clear_sky(datetime(2024, 6, 21, 6, 0, tzinfo=UTC), *MUNICH), summer)
+
+
+@final
+class PvForecasterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.forecaster = PvForecaster(ForecastConfig(latitude=MUNICH[0], longitude=MUNICH[1]))
+        self.day = datetime(2024, 6, 1, tzinfo=UTC)
+
+    def test_no_history(self):
+        f = self.forecaster.get_forecast(self.day + timedelta(hours=10, minutes=5))
+        self.assertEqual(96, len(f.slots))
+        self.assertEqual(self.day + timedelta(hours=10), f.slots[0].start)
+        self.assertEqual(self.day + timedelta(hours=9, minutes=45, days=1), f.slots[-1].start)
+        self.assertEqual(0, f.energy)
+        self.assertEqual(0, f.learned_slots)
+        self.assertTrue(all(s.power_pv == 0 for s in f.slots))
+
+    def test_learn_profile(self):
+        _day(self.forecaster, self.day, 8000)
+        next_day = self.day + timedelta(days=1)
+        f = self.forecaster.get_forecast(next_day)
+        # slots of day 1 are complete, except the last one (closed by the first sample of the next day)
+        self.assertGreater(f.learned_slots, 50)
+        noon = self.forecaster.forecast(next_day + timedelta(hours=11))
+        self.assertAlmostEqual(8000 * clear_sky(next_day + timedelta(hours=11, minutes=7, seconds=30), *MUNICH), noon, delta=50)
+        self.assertEqual(0, self.forecaster.forecast(next_day + timedelta(hours=22)))
+        # rolling forecast is consistent with the per slot forecast
+        for s in f.slots[:-1]:
+            self.assertEqual(self.forecaster.forecast(s.start), s.power_pv)
+        self.assertAlmostEqual(sum(s.power_pv for s in f.slots) / 4, f.energy)
+        self.assertGreater(f.energy, 30000)
+
+    def test_exponential_smoothing(self):
+        cfg = self.forecaster.get_config()
+        _day(self.forecaster, self.day, 8000)
+        _day(self.forecaster, self.day + timedelta(days=1), 4000)  # cloudy day
+        t = self.day + timedelta(days=2, hours=11)
+        expected = (8000 + cfg.smoothing * (4000 - 8000)) * self.forecaster._clear_sky(t)
+        self.forecaster.add_sample(self.day + timedelta(days=2), 0)  # close last slot
+        self.assertAlmostEqual(expected, self.forecaster.forecast(t), delta=10)
+
+    def test_load_history(self):
+        t = self.day + timedelta(hours=11)
+        self.forecaster.load_history([(t, 5000), (t + timedelta(minutes=5), 7000), (t + timedelta(minutes=15), 0)])
+        self.assertEqual(1, self.forecaster.learned_slots())
+        self.assertAlmostEqual(6000, self.forecaster.forecast(t), delta=60)  # ~ same clear-sky factor tomorrow
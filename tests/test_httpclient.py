@@ -0,0 +1,65 @@
+import socket
+import unittest
+from typing import final, override
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from prometheus_client import REGISTRY
+
+from pvcontrol.httpclient import HttpClientConfig, HttpClientFactory, _nodelay_socket
+
+# pyright: reportPrivateUsage=false
+
+
+def connections(reused: str) -> float:
+    return REGISTRY.get_sample_value("pvcontrol_http_connections_total", {"host": "127.0.0.1", "reused": reused}) or 0
+
+
+@final
+class HttpClientFactoryTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    async def asyncSetUp(self) -> None:
+        async def handler(_: web.Request) -> web.Response:
+            return web.Response(text="ok")
+
+        app = web.Application()
+        app.router.add_get("/status", handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    @override
+    async def asyncTearDown(self) -> None:
+        await self.server.close()
+        HttpClientFactory.configure(HttpClientConfig())
+
+    async def test_keepalive(self):
+        new = connections("false")
+        reused = connections("true")
+        count = REGISTRY.get_sample_value("pvcontrol_http_connect_seconds_count", {"host": "127.0.0.1", "tls": "false"}) or 0
+        async with HttpClientFactory.newSession() as session:
+            for _ in range(3):
+                async with session.get(self.server.make_url("/status")) as res:
+                    self.assertEqual(200, res.status)
+                    await res.text()
+        self.assertEqual(new + 1, connections("false"))
+        self.assertEqual(reused + 2, connections("true"))
+        self.assertEqual(
+            count + 1, REGISTRY.get_sample_value("pvcontrol_http_connect_seconds_count", {"host": "127.0.0.1", "tls": "false"})
+        )
+
+    async def test_config(self):
+        HttpClientFactory.configure(HttpClientConfig(limit_per_host=1, keepalive_timeout=10, dns_cache_ttl=60, async_dns=False))
+        async with HttpClientFactory.newSession(verify_ssl=False) as session:
+            connector = session.connector
+            assert connector is not None
+            self.assertEqual(1, connector.limit_per_host)
+            async with session.get(self.server.make_url("/status")) as res:
+                self.assertEqual(200, res.status)
+                await res.text()
+
+    def test_tcp_nodelay(self):
+        sock = _nodelay_socket((socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", ("127.0.0.1", 80)))
+        try:
+            self.assertNotEqual(0, sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        finally:
+            sock.close()
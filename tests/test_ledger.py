@@ -0,0 +1,172 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from typing import final, override
+
+from pvcontrol.chargecontroller import ChargeControllerData, ChargeMode, ControllerCycle, PhaseMode, Priority
+from pvcontrol.ledger import ChargingSession, LedgerConfig, SessionLedger, decode_session, encode_session
+from pvcontrol.meter import MeterData
+from pvcontrol.wallbox import CarStatus, WallboxData
+
+T0 = datetime(2024, 6, 1, 12, 0)
+
+
+def new_cycle(
+    t: datetime,
+    car_status: CarStatus = CarStatus.Charging,
+    power: float = 0,
+    charged_energy: float = 0,
+    power_grid: float = 0,
+    wb_error: int = 0,
+) -> ControllerCycle:
+    return ControllerCycle(
+        time=t,
+        meter=MeterData(power_grid=power_grid),
+        wallbox=WallboxData(error=wb_error, car_status=car_status, power=power, charged_energy=charged_energy),
+        car_soc=None,
+        desired_mode=ChargeMode.PV_ONLY,
+        desired_priority=Priority.AUTO,
+        phase_mode=PhaseMode.AUTO,
+        pv_allow_charging_delay=0,
+        charge_mode_pv_to_off_delay=0,
+        data=ChargeControllerData(),
+    )
+
+
+def charge(ledger: SessionLedger, start: datetime, cycles: int = 4, power: float = 3600, power_grid: float = 900) -> None:
+    """One session: plug in, charge with power for cycles, unplug."""
+    charged = 500.0  # counter of the previous session
+    ledger.record(new_cycle(start, charged_energy=charged))
+    for i in range(1, cycles + 1):
+        charged = 0 if i == 1 else charged + power / 120
+        ledger.record(new_cycle(start + timedelta(seconds=30 * i), power=power, charged_energy=charged, power_grid=power_grid))
+    ledger.record(new_cycle(start + timedelta(seconds=30 * (cycles + 1)), CarStatus.NoVehicle, charged_energy=charged))
+
+
+@final
+class SessionLedgerTest(unittest.TestCase):
+    @override
+    def setUp(self) -> None:
+        self.ledger = SessionLedger(LedgerConfig(grid_price=30, pv_price=10))
+
+    def test_session(self):
+        ledger = self.ledger
+        ledger.record(new_cycle(T0, CarStatus.NoVehicle))
+        self.assertIsNone(ledger.get_session())
+        # plug in, counter still shows the previous session
+        ledger.record(new_cycle(T0 + timedelta(seconds=30), charged_energy=500))
+        self.assertEqual(ChargingSession(T0 + timedelta(seconds=30)), ledger.get_session())
+        # charging starts, counter reset
+        ledger.record(new_cycle(T0 + timedelta(seconds=60), power=4000, charged_energy=0, power_grid=1000))
+        self.assertEqual(0, ledger.get_sessions(1)[0].energy)
+        # energy of the last 30s charged with 1/4 from grid
+        ledger.record(new_cycle(T0 + timedelta(seconds=90), power=4000, charged_energy=4000 / 120, power_grid=-500))
+        s = ledger.get_session()
+        assert s is not None
+        self.assertAlmostEqual(4000 / 120, s.energy)
+        self.assertAlmostEqual(1000 / 120, s.energy_grid)
+        self.assertAlmostEqual(0.75, s.pv_share)
+        # energy of the last 30s charged from PV
+        ledger.record(new_cycle(T0 + timedelta(seconds=120), power=0, charged_energy=8000 / 120))
+        ledger.record(new_cycle(T0 + timedelta(seconds=150), CarStatus.NoVehicle, charged_energy=8000 / 120))
+        self.assertIsNone(ledger.get_session())
+        s = ledger.get_sessions(10)[0]
+        self.assertEqual(T0 + timedelta(seconds=30), s.start)
+        self.assertEqual(T0 + timedelta(seconds=150), s.end)
+        self.assertAlmostEqual(8000 / 120, s.energy)
+        self.assertAlmostEqual(7000 / 120, s.energy_pv)
+        self.assertAlmostEqual(1000 / 120, s.energy_grid)
+        self.assertAlmostEqual(0.875, s.pv_share)
+        self.assertAlmostEqual((1000 / 120 * 30 + 7000 / 120 * 10) / 1000, s.cost)
+        self.assertEqual(4000, s.peak_power)
+
+    def test_wallbox_error(self):
+        ledger = self.ledger
+        ledger.record(new_cycle(T0, charged_energy=0))
+        ledger.record(new_cycle(T0 + timedelta(seconds=30), CarStatus.NoVehicle, wb_error=1))
+        self.assertIsNotNone(ledger.get_session())
+
+    def test_dynamic_price(self):
+        ledger = SessionLedger(LedgerConfig(grid_price=30), lambda t: 10 if t < T0 + timedelta(seconds=60) else None)
+        charge(ledger, T0, cycles=3, power=3600, power_grid=3600)
+        s = ledger.get_sessions(1)[0]
+        self.assertAlmostEqual(60, s.energy_grid)
+        self.assertAlmostEqual((30 * 10 + 30 * 30) / 1000, s.cost)
+
+    def test_sessions_and_totals(self):
+        ledger = self.ledger
+        charge(ledger, T0)
+        charge(ledger, T0 + timedelta(hours=2))
+        charge(ledger, T0 + timedelta(days=1))
+        charge(ledger, T0 + timedelta(days=31))
+        ledger.record(new_cycle(T0 + timedelta(days=32)))
+        sessions = ledger.get_sessions(3)
+        self.assertEqual([T0 + timedelta(days=32), T0 + timedelta(days=31), T0 + timedelta(days=1)], [s.start for s in sessions])
+        self.assertIsNone(sessions[0].end)
+        self.assertEqual(5, len(ledger.get_sessions(10)))
+
+        days = ledger.get_totals("day")
+        self.assertEqual(["2024-06-01", "2024-06-02", "2024-07-02", "2024-07-03"], [d.period for d in days])
+        self.assertEqual([2, 1, 1, 1], [d.sessions for d in days])
+        self.assertAlmostEqual(2 * 90, days[0].energy)
+        self.assertAlmostEqual(2 * 67.5, days[0].energy_pv)
+        self.assertAlmostEqual(0.75, days[0].pv_share)
+        self.assertEqual(3600, days[0].peak_power)
+        self.assertEqual([3, 2], [m.sessions for m in ledger.get_totals("month")])
+        years = ledger.get_totals("year")
+        self.assertEqual(["2024"], [y.period for y in years])
+        self.assertEqual(5, years[0].sessions)
+        self.assertAlmostEqual(4 * 90, years[0].energy)
+
+
+@final
+class LedgerFileTest(unittest.TestCase):
+    @override
+    def setUp(self) -> None:
+        fd, self.file = tempfile.mkstemp(suffix=".ledger")
+        os.close(fd)
+
+    @override
+    def tearDown(self) -> None:
+        for f in [self.file, f"{self.file}.bad"]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def test_encoding(self):
+        s = ChargingSession(T0, T0 + timedelta(hours=3), 10000, 7500, 2500, 0.75, 75, 11000)
+        self.assertEqual(s, decode_session(encode_session(s)))
+        self.assertEqual(36, len(encode_session(s)))
+
+    def test_persistence(self):
+        ledger = SessionLedger(LedgerConfig(file=self.file))
+        charge(ledger, T0)
+        charge(ledger, T0 + timedelta(days=1))
+        ledger.record(new_cycle(T0 + timedelta(days=2)))  # in progress, not persisted
+        ledger.close()
+        # power loss while appending a record
+        with open(self.file, "ab") as f:
+            f.write(b"\0" * 17)
+
+        ledger = SessionLedger(LedgerConfig(file=self.file))
+        sessions = ledger.get_sessions(10)
+        self.assertEqual([T0 + timedelta(days=1), T0], [s.start for s in sessions])
+        self.assertAlmostEqual(90, sessions[0].energy)
+        self.assertEqual(["2024-06-01", "2024-06-02"], [d.period for d in ledger.get_totals("day")])
+        charge(ledger, T0 + timedelta(days=3))
+        ledger.close()
+        ledger = SessionLedger(LedgerConfig(file=self.file))
+        self.assertEqual(3, len(ledger.get_sessions(10)))
+        ledger.close()
+
+    def test_unknown_format(self):
+        with open(self.file, "wb") as f:
+            f.write(b"something else")
+        ledger = SessionLedger(LedgerConfig(file=self.file))
+        self.assertEqual([], ledger.get_sessions(10))
+        charge(ledger, T0)
+        ledger.close()
+        self.assertTrue(os.path.exists(f"{self.file}.bad"))
+        ledger = SessionLedger(LedgerConfig(file=self.file))
+        self.assertEqual(1, len(ledger.get_sessions(10)))
+        ledger.close()
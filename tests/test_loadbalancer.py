@@ -0,0 +1,267 @@
+import asyncio
+import time
+import unittest
+from argparse import Namespace
+from functools import partial
+from typing import Any, final, override
+from unittest.mock import patch
+
+from pvcontrol.chargecontroller import ChargeMode
+from pvcontrol.dependencies import check_load_balancer_config
+from pvcontrol.loadbalancer import ChargePoint, ChargeRequest, LoadBalancer, LoadBalancerConfig, LoadBalancerFactory, allocate_currents
+from pvcontrol.meter import Meter, MeterData
+from pvcontrol.service import BaseConfig
+from pvcontrol.wallbox import CarStatus, SimulatedWallbox, Wallbox, WallboxConfig, WallboxData
+
+# pyright: reportPrivateUsage=false
+
+
+def _3p(min_current: int = 6, max_current: int = 16, pv_only: bool = True) -> ChargeRequest:
+    return ChargeRequest((0, 1, 2), min_current, max_current, pv_only)
+
+
+@final
+class AllocateCurrentsTest(unittest.TestCase):
+    def test_fair_share(self):
+        # 2 x 3 phase, 15kW pv -> 21A in total per phase
+        currents = allocate_currents([_3p(), _3p()], 15000, [32, 32, 32], 230, "fair")
+        self.assertEqual([11, 10], currents)
+
+    def test_priority(self):
+        currents = allocate_currents([_3p(), _3p()], 15000, [32, 32, 32], 230, "priority")
+        self.assertEqual([15, 6], currents)
+
+    def test_not_enough_pv_for_all(self):
+        # 6A 3 phases = 4140W, only one wallbox can charge, priority order decides
+        self.assertEqual([7, 0], allocate_currents([_3p(), _3p()], 5000, [32, 32, 32], 230, "fair"))
+        self.assertEqual([0, 0], allocate_currents([_3p(), _3p()], 4000, [32, 32, 32], 230, "fair"))
+
+    def test_phase_limit(self):
+        # MAX ignores pv but respects the phase limit
+        currents = allocate_currents([_3p(pv_only=False), _3p(pv_only=False)], 0, [20, 20, 20], 230, "fair")
+        self.assertEqual([10, 10], currents)
+        currents = allocate_currents([_3p(pv_only=False), _3p(pv_only=False)], 0, [20, 20, 20], 230, "priority")
+        self.assertEqual([14, 6], currents)
+        currents = allocate_currents([_3p(pv_only=False), _3p(pv_only=False)], 0, [10, 10, 10], 230, "fair")
+        self.assertEqual([10, 0], currents)
+
+    def test_max_before_pv_only(self):
+        # MAX wallbox consumes the pv surplus first
+        currents = allocate_currents([_3p(), _3p(pv_only=False)], 12000, [32, 32, 32], 230, "fair")
+        self.assertEqual([0, 16], currents)
+
+    def test_single_phase(self):
+        # 1 phase wallboxes on L1 and L2 don't compete for the same phase, the 3 phase wallbox is limited by L1
+        requests = [ChargeRequest((0,), 6, 16, False), ChargeRequest((1,), 6, 16, False), _3p(pv_only=False)]
+        currents = allocate_currents(requests, 0, [20, 32, 32], 230, "fair")
+        self.assertEqual([10, 16, 10], currents)
+
+    def test_skip_invalid_request(self):
+        currents = allocate_currents([ChargeRequest((0, 1, 2), 1, 0, True), _3p()], 15000, [32, 32, 32], 230, "fair")
+        self.assertEqual([0, 16], currents)
+
+
+class _SumMeter(Meter[BaseConfig]):
+    """pv and home consumption plus all wallboxes"""
+
+    def __init__(self, wallboxes: list[Wallbox[Any]]):
+        super().__init__(BaseConfig())
+        self.wallboxes = wallboxes
+        self.pv: float = 0
+        self.home: float = 0
+        self.home_currents: tuple[float, float, float] | None = None  # None = meter without per phase currents
+
+    @override
+    async def _read_data(self) -> MeterData:
+        consumption = self.home + sum(wb.get_data().power for wb in self.wallboxes)
+        l1 = l2 = l3 = 0.0
+        if self.home_currents is not None:
+            car = sum(wb.get_data().power / 3 / 230 for wb in self.wallboxes)  # all wallboxes charge on 3 phases
+            l1, l2, l3 = (c + car for c in self.home_currents)
+        return MeterData(
+            power_pv=self.pv, power_consumption=consumption, power_grid=consumption - self.pv, current_l1=l1, current_l2=l2, current_l3=l3
+        )
+
+
+@final
+class LoadBalancerTest(unittest.IsolatedAsyncioTestCase):
+    def _setup(self, n: int, **kwargs: Any) -> None:
+        self.wallboxes = [SimulatedWallbox(WallboxConfig()) for _ in range(n)]  # pyright: ignore[reportUninitializedInstanceVariable]
+        for wb in self.wallboxes:
+            wb.set_car_status(CarStatus.Charging)
+            wb._update_data(phases_in=3)
+        self.meter = _SumMeter(list(self.wallboxes))  # pyright: ignore[reportUninitializedInstanceVariable]
+        charge_points = [ChargePoint(f"wb{i}", wb, priority=n - i, mode=ChargeMode.PV_ONLY) for i, wb in enumerate(self.wallboxes)]
+        self.lb = LoadBalancer(LoadBalancerConfig(**kwargs), self.meter, charge_points)  # pyright: ignore[reportUninitializedInstanceVariable]
+
+    async def _cycle(self) -> list[WallboxData]:
+        await self.lb.run()
+        return [await wb.read_data() for wb in self.wallboxes]
+
+    async def test_pv_surplus_shared(self):
+        self._setup(2)
+        self.meter.pv = 16000
+        self.meter.home = 1000
+        wbs = await self._cycle()
+        self.assertEqual([True, True], [wb.allow_charging for wb in wbs])
+        self.assertEqual([11, 10], [wb.max_current for wb in wbs])
+        self.assertEqual(0, self.lb.get_data().error)
+        self.assertAlmostEqual(15000, self.lb.get_data().available_power)
+
+        # next cycle: wallbox power is not counted as home consumption
+        wbs = await self._cycle()
+        self.assertEqual([11, 10], [wb.max_current for wb in wbs])
+        self.assertAlmostEqual(15000, self.lb.get_data().available_power)
+
+        # less pv -> lower priority wallbox keeps min current for pv_allow_charging_delay, then it is switched off
+        self.meter.pv = 7000
+        for _ in range(3):
+            wbs = await self._cycle()
+            self.assertEqual([True, True], [wb.allow_charging for wb in wbs])
+            self.assertEqual([8, 6], [wb.max_current for wb in wbs])
+        wbs = await self._cycle()
+        self.assertEqual([True, False], [wb.allow_charging for wb in wbs])
+        self.assertEqual(8, wbs[0].max_current)
+        self.assertEqual([8, 0], [cp.data.current for cp in self.lb.get_charge_points()])
+
+    async def test_pv_only_hysteresis_and_delay(self):
+        # min power 6A * 3 * 230V = 4140W, switching on needs 200W more
+        self._setup(1)
+        self.meter.pv = 4200
+        wbs = await self._cycle()
+        self.assertFalse(wbs[0].allow_charging)
+        # surplus swings around min power: stays off
+        for pv in (4500, 4000) * 4:
+            self.meter.pv = pv
+            wbs = await self._cycle()
+            self.assertFalse(wbs[0].allow_charging)
+        # stable surplus: switched on after pv_allow_charging_delay
+        self.meter.pv = 4500
+        for _ in range(3):
+            wbs = await self._cycle()
+            self.assertFalse(wbs[0].allow_charging)
+        wbs = await self._cycle()
+        self.assertTrue(wbs[0].allow_charging)
+        self.assertEqual(6, wbs[0].max_current)
+        # surplus swings around min power: keeps charging with min current
+        for pv in (4000, 4500) * 4:
+            self.meter.pv = pv
+            wbs = await self._cycle()
+            self.assertTrue(wbs[0].allow_charging)
+            self.assertEqual(6, wbs[0].max_current)
+
+    async def test_modes(self):
+        self._setup(2, max_phase_current=25)
+        self.meter.home = 3 * 230 * 5  # 5A per phase
+        self.lb.set_mode("wb0", ChargeMode.MAX)
+        self.lb.set_mode("wb1", ChargeMode.OFF)
+        wbs = await self._cycle()
+        self.assertEqual([True, False], [wb.allow_charging for wb in wbs])
+        self.assertEqual(16, wbs[0].max_current)
+
+        self.lb.set_mode("wb1", ChargeMode.MAX)
+        wbs = await self._cycle()
+        self.assertEqual([10, 10], [wb.max_current for wb in wbs])  # 20A left per phase
+        self.lb.get_config().strategy = "priority"
+        wbs = await self._cycle()
+        self.assertEqual([14, 6], [wb.max_current for wb in wbs])
+        self.lb.get_config().strategy = "fair"
+        self.lb.get_config().max_phase_current = 30
+        wbs = await self._cycle()
+        self.assertEqual([13, 12], [wb.max_current for wb in wbs])
+        self.assertEqual((30, 30, 30), self.lb.get_data().phase_currents)
+
+        with self.assertRaises(ValueError):
+            self.lb.set_mode("wb0", ChargeMode.PV_ALL)
+        with self.assertRaises(KeyError):
+            self.lb.set_mode("unknown", ChargeMode.MAX)
+
+    async def test_per_phase_currents(self):
+        self._setup(2, max_phase_current=25)
+        self.meter.home_currents = (5, 15, 5)  # unbalanced, e.g. oven on L2
+        self.lb.set_mode("wb0", ChargeMode.MAX)
+        self.lb.set_mode("wb1", ChargeMode.MAX)
+        wbs = await self._cycle()
+        self.assertEqual([True, False], [wb.allow_charging for wb in wbs])
+        self.assertEqual(10, wbs[0].max_current)  # limited by L2
+        self.assertEqual((15, 25, 15), self.lb.get_data().phase_currents)
+
+        # next cycle: wallbox currents are not counted as home currents
+        await self._cycle()
+        self.assertEqual([10, 0], [cp.data.current for cp in self.lb.get_charge_points()])
+        self.meter.home_currents = (5, 5, 5)
+        wbs = await self._cycle()
+        self.assertEqual([10, 10], [wb.max_current for wb in wbs])
+
+    async def test_no_car(self):
+        self._setup(2)
+        self.meter.pv = 16000
+        self.wallboxes[1].set_car_status(CarStatus.NoVehicle)
+        wbs = await self._cycle()
+        self.assertEqual([True, False], [wb.allow_charging for wb in wbs])
+        self.assertEqual(16, wbs[0].max_current)
+
+    async def test_wallbox_error_reserves_current(self):
+        self._setup(2, max_phase_current=20)
+        self.lb.set_mode("wb0", ChargeMode.MAX)
+        self.lb.set_mode("wb1", ChargeMode.MAX)
+        await self.wallboxes[1].set_max_current(10)
+        await self.wallboxes[1].allow_charging(True)
+        self.wallboxes[1].inc_error_counter()
+        wbs = await self._cycle()
+        self.assertEqual(10, wbs[0].max_current)
+        self.assertEqual(10, wbs[1].max_current)
+
+    async def test_many_wallboxes_in_one_cycle(self):
+        # 12 wallboxes with slow commands are handled concurrently within one cycle
+        self._setup(12, max_phase_current=100)
+        self.meter.pv = 60000
+
+        async def slow(f: Any, *args: Any) -> None:
+            await asyncio.sleep(0.05)
+            await f(*args)
+
+        for wb in self.wallboxes:
+            for name in ("set_max_current", "allow_charging"):
+                patcher = patch.object(wb, name, partial(slow, getattr(wb, name)))
+                patcher.start()
+                self.addCleanup(patcher.stop)
+
+        start = time.perf_counter()
+        wbs = await self._cycle()
+        self.assertLess(time.perf_counter() - start, 0.5)  # sequential would be 12 * 2 * 50ms
+        currents = [wb.max_current for wb in wbs]
+        self.assertTrue(all(wb.allow_charging for wb in wbs))
+        self.assertLessEqual(max(currents) - min(currents), 1)
+        self.assertLessEqual(sum(currents), 100)
+
+    def test_factory(self):
+        meter = _SumMeter([])
+        lb = LoadBalancerFactory.newLoadBalancer(
+            meter,
+            strategy="priority",
+            wallboxes=[
+                {"name": "garage", "mode": "MAX", "max_supported_current": 32},
+                {"name": "carport", "type": "SimulatedWallbox", "priority": 1, "phase": 2},
+            ],
+        )
+        self.assertEqual(["carport", "garage"], [cp.name for cp in lb.get_charge_points()])
+        garage = lb.get_charge_point("garage")
+        assert garage is not None
+        self.assertEqual(ChargeMode.MAX, garage.data.mode)
+        self.assertEqual(32, garage.wallbox.get_config().max_supported_current)
+        self.assertEqual("SimulatedWallbox[garage]", garage.wallbox.get_service_label())
+        with self.assertRaises(ValueError):
+            LoadBalancerFactory.newLoadBalancer(meter, wallboxes=[{"name": "a"}, {"name": "a"}])
+        with self.assertRaises(ValueError):
+            LoadBalancerFactory.newLoadBalancer(meter, wallboxes=[{"name": "a", "mode": "PLANNED"}])
+        with self.assertRaises(ValueError):
+            LoadBalancerFactory.newLoadBalancer(meter, wallboxes=[{"name": "a", "phase": 4}])
+
+    def test_single_wallbox_settings_rejected(self):
+        args = Namespace(wallbox="SimulatedWallbox", relay="SimulatedPhaseRelay")
+        check_load_balancer_config(args, {"trace": {}, "ledger": {"grid_price": 25}})
+        with self.assertRaisesRegex(ValueError, "trace.file, checkpoint.file"):
+            check_load_balancer_config(args, {"trace": {"file": "t"}, "checkpoint": {"file": "c"}})
+        with self.assertRaisesRegex(ValueError, "--wallbox GoeWallbox"):
+            check_load_balancer_config(Namespace(wallbox="GoeWallbox", relay="SimulatedPhaseRelay"), {})
@@ -0,0 +1,48 @@
+import asyncio
+import time
+import unittest
+from typing import final
+
+from pvcontrol.loopmonitor import LoopMonitor, LoopMonitorConfig
+
+# pyright: reportPrivateUsage=false
+
+
+def blocking_gpio_call():
+    time.sleep(0.3)
+
+
+@final
+class LoopMonitorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_lag(self):
+        monitor = LoopMonitor(LoopMonitorConfig(interval=0.01, threshold=0.1))
+        count = LoopMonitor._metrics_pvc_loop_lag._sum.get()  # pyright: ignore[reportUnknownMemberType]
+        await monitor.start()
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+        self.assertGreater(LoopMonitor._metrics_pvc_loop_lag._sum.get(), count)  # pyright: ignore[reportUnknownMemberType]
+        self.assertEqual([], monitor.get_blocked())
+
+    async def test_blocked(self):
+        monitor = LoopMonitor(LoopMonitorConfig(interval=0.01, threshold=0.1))
+        await monitor.start()
+        await asyncio.sleep(0.05)
+        blocking_gpio_call()
+        await asyncio.sleep(0.05)
+        blocking_gpio_call()
+        await monitor.stop()
+        blocked = monitor.get_blocked()
+        # reported once per blocking episode
+        self.assertEqual(2, len(blocked))
+        self.assertIn("blocking_gpio_call", blocked[0].stack)
+        self.assertIn("test_blocked", blocked[0].stack)
+        self.assertNotEqual("", blocked[0].task)
+
+    async def test_start_stop(self):
+        monitor = LoopMonitor(LoopMonitorConfig())
+        await monitor.start()
+        await monitor.start()
+        await monitor.stop()
+        await monitor.stop()
+        self.assertIsNone(monitor._task)
+        self.assertIsNone(monitor._watchdog)
@@ -1,10 +1,21 @@
+import asyncio
 import json
 import os
+import time
 import unittest
 from typing import Any, final, override
+from unittest.mock import AsyncMock, Mock
+
+import pysmaplus.definitions_webconnect
+import pysmaplus.exceptions
 
 from pvcontrol.meter import (
+    CachingMeter,
+    CompositeMeter,
+    CompositeMeterConfig,
+    Meter,
     MeterData,
+    MeterFactory,
     SmaTripowerMeter,
     SmaTripowerMeterConfig,
     SolarWattMeter,
@@ -12,6 +23,7 @@ from pvcontrol.meter import (
     TestMeter,
     TestMeterConfig,
 )
+from pvcontrol.service import BaseConfig
 from pvcontrol.wallbox import SimulatedWallbox, WallboxConfig
 
 # pyright: reportUninitializedInstanceVariable=false
@@ -284,6 +296,148 @@ class TestMeterBatteryTest(unittest.IsolatedAsyncioTestCase):
             )
 
 
+@final
+class SlowMeter(Meter[BaseConfig]):
+    def __init__(self):
+        super().__init__(BaseConfig())
+        self.reads = 0
+        self.fail = False
+
+    @override
+    async def _read_data(self) -> MeterData:
+        self.reads += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            self.inc_error_counter()
+            return self.get_data()
+        self.reset_error_counter()
+        return MeterData(power_pv=self.reads)
+
+
+@final
+class CachingMeterTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    async def asyncSetUp(self) -> None:
+        self.slow = SlowMeter()
+        self.meter = CachingMeter(self.slow, max_age=0)
+
+    async def test_single_flight(self):
+        data = await asyncio.gather(*(self.meter.read_data() for _ in range(5)))
+        self.assertEqual(1, self.slow.reads)
+        self.assertEqual([MeterData(power_pv=1)] * 5, data)
+        # max_age=0 -> next read goes to device
+        self.assertEqual(MeterData(power_pv=2), await self.meter.read_data())
+        self.assertEqual(MeterData(power_pv=2), self.meter.get_data())
+        self.assertIs(self.slow.get_config(), self.meter.get_config())
+
+    async def test_max_age(self):
+        self.meter = CachingMeter(self.slow, max_age=60)
+        await self.meter.read_data()
+        await self.meter.read_data()
+        self.assertEqual(1, self.slow.reads)
+        self.meter._read_at -= 61
+        await self.meter.read_data()
+        self.assertEqual(2, self.slow.reads)
+
+    async def test_error_not_cached(self):
+        self.meter = CachingMeter(self.slow, max_age=60)
+        self.slow.fail = True
+        await self.meter.read_data()
+        self.assertEqual(1, self.meter.get_error_counter())
+        self.slow.fail = False
+        await self.meter.read_data()
+        self.assertEqual(2, self.slow.reads)
+        self.assertEqual(0, self.meter.get_error_counter())
+
+    async def test_cancelled_reader(self):
+        t1 = asyncio.create_task(self.meter.read_data())
+        await asyncio.sleep(0)
+        t2 = asyncio.create_task(self.meter.read_data())
+        await asyncio.sleep(0)
+        t1.cancel()
+        self.assertEqual(MeterData(power_pv=1), await t2)
+        self.assertEqual(1, self.slow.reads)
+        self.assertIsNone(self.meter._inflight)
+
+    async def test_factory(self):
+        wb = SimulatedWallbox(WallboxConfig())
+        self.assertNotIsInstance(MeterFactory.newMeter("SimulatedMeter", wb), CachingMeter)
+        meter = MeterFactory.newMeter("SimulatedMeter", wb, cache_max_age=5)
+        self.assertIsInstance(meter, CachingMeter)
+        self.assertEqual(3000, meter.get_config().pv_max)
+
+
+@final
+class CompositeMeterTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    async def asyncSetUp(self) -> None:
+        self.wallbox = SimulatedWallbox(WallboxConfig())
+        self.grid_meter = TestMeter(TestMeterConfig(battery_max=1000), self.wallbox)
+        self.pv_meter = SlowMeter()
+        self.battery_meter = SlowMeter()
+        config = CompositeMeterConfig(
+            meters=[
+                {"role": "grid", "battery_capacity": 5000},
+                {"role": "pv"},
+                {"role": "pv", "battery_capacity": 15000},
+            ]
+        )
+        self.meter = CompositeMeter(config, [self.grid_meter, self.pv_meter, self.battery_meter])
+
+    async def test_merge(self):
+        self.grid_meter.set_data(2000, 3000, soc=40)
+        self.battery_meter._read_data = AsyncMock(
+            return_value=MeterData(power_pv=0, power_battery=500, soc_battery=80, energy_consumption_pv=200)
+        )
+        m = await self.meter.read_data()
+        self.assertEqual(0, m.error)
+        self.assertEqual(2000 + 1 + 0, m.power_pv)
+        self.assertEqual(1000, m.power_battery - 500)  # grid meter: 1000W from battery
+        self.assertEqual(m.power_pv + m.power_grid + m.power_battery, m.power_consumption)
+        self.assertEqual((40 * 5000 + 80 * 15000) / 20000, m.soc_battery)
+        self.assertEqual(200, m.energy_consumption_pv - self.grid_meter.get_data().energy_consumption_pv)
+        self.assertEqual(m.energy_consumption_grid + m.energy_consumption_pv, m.energy_consumption)
+
+    async def test_concurrent(self):
+        t = time.perf_counter()
+        await self.meter.read_data()
+        # 2 SlowMeters with 10ms each
+        self.assertLess(time.perf_counter() - t, 0.019)
+
+    async def test_one_failing(self):
+        await self.meter.read_data()
+        self.pv_meter.fail = True
+        m = await self.meter.read_data()
+        self.assertEqual(0, m.error)
+        self.assertEqual(1, self.pv_meter.get_error_counter())
+        self.assertEqual(self.battery_meter.reads, m.power_pv)
+        self.battery_meter.fail = True
+        m = await self.meter.read_data()
+        self.assertEqual(1, self.meter.get_error_counter())
+
+    async def test_grid_failing(self):
+        grid_meter = SlowMeter()
+        meter = CompositeMeter(CompositeMeterConfig(meters=[{"role": "grid"}, {"role": "pv"}]), [grid_meter, self.pv_meter])
+        grid_meter.fail = True
+        await meter.read_data()
+        self.assertEqual(1, meter.get_error_counter())
+
+    async def test_config(self):
+        with self.assertRaises(ValueError):
+            CompositeMeter(CompositeMeterConfig(meters=[{"role": "pv"}]), [self.pv_meter])
+
+    async def test_factory(self):
+        meter = MeterFactory.newMeter(
+            "CompositeMeter",
+            self.wallbox,
+            meters=[{"type": "SimulatedMeter", "role": "grid", "pv_max": 1000}, {"type": "SimulatedMeter", "pv_max": 2000}],
+        )
+        self.assertIsInstance(meter, CompositeMeter)
+        assert isinstance(meter, CompositeMeter)
+        self.assertEqual([1000, 2000], [m.get_config().pv_max for m in meter.get_meters()])
+        self.assertEqual(0, (await meter.read_data()).error)
+
+
 @final
 class SolarWattMeterTest(unittest.IsolatedAsyncioTestCase):
     @override
@@ -302,6 +456,94 @@ class SolarWattMeterTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(MeterData(0, 0, 640, 640, 0, 0, 25272547.582334433, 16948644.65421216, 8323902.928122882), meter_data)
 
 
+@final
+class SmaTripowerMeterMockedTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    async def asyncSetUp(self) -> None:
+        self.meter = SmaTripowerMeter(SmaTripowerMeterConfig(login_backoff_min=30, login_backoff_max=60))
+        await self.meter._session.close()
+        sma = Mock()
+        sma._sid = None
+
+        async def new_session():
+            sma._sid = "sid"
+            return True
+
+        async def close_session():
+            sma._sid = None
+
+        sma.new_session = AsyncMock(side_effect=new_session)
+        sma.close_session = AsyncMock(side_effect=close_session)
+        sma.read = AsyncMock(return_value=True)
+        self.sma = sma
+        self.meter._smaDevice = sma
+        self.meter._sensors_2_meter_data = Mock(return_value=MeterData(power_pv=1000))
+
+    async def test_session_kept(self):
+        self.assertEqual(MeterData(power_pv=1000), await self.meter.read_data())
+        await self.meter.read_data()
+        self.assertEqual(1, self.sma.new_session.await_count)
+        self.assertEqual(2, self.sma.read.await_count)
+
+    async def test_transient_error(self):
+        await self.meter.read_data()
+        self.sma.read.side_effect = pysmaplus.exceptions.SmaConnectionException("timeout")
+        await self.meter.read_data()
+        self.assertEqual(1, self.meter.get_error_counter())
+        self.sma.close_session.assert_not_awaited()
+        self.sma.read.side_effect = None
+        await self.meter.read_data()
+        self.assertEqual(0, self.meter.get_error_counter())
+        self.assertEqual(1, self.sma.new_session.await_count)
+
+    async def test_read_error(self):
+        await self.meter.read_data()
+        self.sma.read.side_effect = pysmaplus.exceptions.SmaReadException("bad reply")
+        await self.meter.read_data()
+        self.sma.close_session.assert_awaited_once()
+        self.sma.read.side_effect = None
+        await self.meter.read_data()
+        self.assertEqual(2, self.sma.new_session.await_count)
+
+    async def test_refresh(self):
+        await self.meter.read_data()
+        self.meter._login_at -= self.meter.get_config().session_refresh_time + 1
+        await self.meter.read_data()
+        self.sma.close_session.assert_awaited_once()
+        self.assertEqual(2, self.sma.new_session.await_count)
+
+    async def test_login_backoff(self):
+        self.sma.new_session.side_effect = pysmaplus.exceptions.SmaAuthenticationException()
+        await self.meter.read_data()
+        await self.meter.read_data()
+        self.assertEqual(1, self.sma.new_session.await_count)
+        self.assertEqual(30, self.meter._login_backoff)
+        self.meter._login_retry_at = 0
+        await self.meter.read_data()
+        self.assertEqual(2, self.sma.new_session.await_count)
+        self.assertEqual(60, self.meter._login_backoff)
+        self.meter._login_retry_at = 0
+        await self.meter.read_data()
+        self.assertEqual(60, self.meter._login_backoff)
+        self.sma.read.assert_not_awaited()
+
+    def test_phase_currents(self):
+        for sensor in self.meter._sensors:
+            sensor.value = 0
+        wc = pysmaplus.definitions_webconnect
+        values = [
+            (wc.metering_current_l1, 10),
+            (wc.metering_active_power_draw_l1, 2300),
+            (wc.metering_current_l2, 5),
+            (wc.metering_active_power_feed_l2, 1150),
+            (wc.metering_current_l3, None),
+        ]
+        for sensor, value in values:
+            self.meter._sensors[sensor.key].value = value
+        m = SmaTripowerMeter._sensors_2_meter_data(self.meter)
+        self.assertEqual((10, -5, 0), (m.current_l1, m.current_l2, m.current_l3))
+
+
 @unittest.skip("needs access to SMA Tripower Inverter")
 @unittest.skipUnless(len(sma_tripower_meter_config) > 0, "needs sma_tripower_meter_config.json")
 @final
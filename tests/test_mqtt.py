@@ -1,14 +1,18 @@
 import asyncio
 import json
 import unittest
+from datetime import datetime, timedelta
 from typing import Any, final, override
 from unittest.mock import AsyncMock, MagicMock, patch
 
 from pvcontrol.car import CarData
 from pvcontrol.chargecontroller import ChargeControllerData, ChargeMode, PhaseMode, Priority
+from pvcontrol.loadbalancer import LoadBalancerFactory
 from pvcontrol.meter import MeterData
-from pvcontrol.mqtt import ENTITY_DEFINITIONS, MqttConfig, MqttPublisher
+from pvcontrol.mqtt import ENTITY_DEFINITIONS, TARIFF_ENTITY_DEFINITIONS, MqttConfig, MqttPublisher
+from pvcontrol.planner import TariffPlanData, TariffPlanSlot
 from pvcontrol.relay import PhaseRelayData
+from pvcontrol.tariff import PriceProviderConfig, PriceSlot, SimulatedPriceProvider
 from pvcontrol.wallbox import CarStatus, WallboxData, WbError
 
 
@@ -614,3 +618,177 @@ class MqttPublisherCommandTest(unittest.IsolatedAsyncioTestCase):
 
         # Message handler task should be restarted (new task)
         self.assertIsNotNone(self.publisher._message_task)
+
+
+@final
+class MqttPublisherLoadBalancerTest(unittest.IsolatedAsyncioTestCase):
+    """Per wallbox state, entities and commands of load balanced wallboxes."""
+
+    @override
+    def setUp(self):
+        self.config = MqttConfig(broker="testhost", port=1883)
+        self.mock_controller = MagicMock()
+        self.mock_controller.get_data.return_value = ChargeControllerData()
+        meter = MagicMock()
+        meter.get_data.return_value = MeterData()
+        wallbox = MagicMock()
+        wallbox.get_data.return_value = WallboxData()
+        relay = MagicMock()
+        relay.get_data.return_value = PhaseRelayData()
+        car = MagicMock()
+        car.get_data.return_value = CarData()
+        self.lb = LoadBalancerFactory.newLoadBalancer(meter, wallboxes=[{"name": "garage"}, {"name": "carport", "mode": "PV_ONLY"}])
+        self.publisher = MqttPublisher(
+            self.config, "1.0.0", controller=self.mock_controller, meter=meter, wallbox=wallbox, relay=relay, car=car, load_balancer=self.lb
+        )
+        self.publisher._state_restore_timeout_s = 0  # skip wait in tests
+
+    def _mock_client(self, mock_client_cls: Any) -> AsyncMock:
+        mock_client = AsyncMock()
+        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
+        mock_client.__aexit__ = AsyncMock(return_value=None)
+        mock_client.publish = AsyncMock()
+        mock_client.subscribe = AsyncMock()
+        mock_client_cls.return_value = mock_client
+        return mock_client
+
+    @patch("pvcontrol.mqtt.aiomqtt.Client")
+    async def test_discovery_and_subscriptions(self, mock_client_cls: Any):
+        mock_client = self._mock_client(mock_client_cls)
+        await self.publisher.start()
+        topics = [c.args[0] for c in mock_client.publish.call_args_list]
+        self.assertIn("homeassistant/sensor/pvcontrol_wallbox_garage_power/config", topics)
+        self.assertIn("homeassistant/select/pvcontrol_wallbox_carport_mode/config", topics)
+        subscribed = [c.args[0] for c in mock_client.subscribe.call_args_list]
+        self.assertIn("pvcontrol/wallboxes/garage/mode/set", subscribed)
+        self.assertIn("pvcontrol/controller/desired_mode/set", subscribed)
+
+    @patch("pvcontrol.mqtt.aiomqtt.Client")
+    async def test_publish_state_per_wallbox(self, mock_client_cls: Any):
+        mock_client = self._mock_client(mock_client_cls)
+        await self.publisher.start()
+        mock_client.publish.reset_mock()
+
+        await self.publisher.publish_state()
+
+        payload = json.loads(mock_client.publish.call_args.kwargs["payload"])
+        self.assertEqual({"garage", "carport"}, set(payload["wallboxes"]))
+        self.assertEqual("PV_ONLY", payload["wallboxes"]["carport"]["mode"])
+        self.assertEqual("NoVehicle", payload["wallboxes"]["garage"]["car_status"])
+        self.assertEqual(0, payload["wallboxes"]["garage"]["current"])
+
+    @patch("pvcontrol.mqtt.aiomqtt.Client")
+    async def test_message_handler_sets_wallbox_mode(self, mock_client_cls: Any):
+        mock_client = self._mock_client(mock_client_cls)
+
+        async def mock_messages():
+            yield MagicMock(payload=b"MAX", topic="pvcontrol/wallboxes/garage/mode/set")
+            yield MagicMock(payload=b"PV_ALL", topic="pvcontrol/wallboxes/carport/mode/set")  # not supported -> ignored
+
+        mock_client.messages = mock_messages()
+        await self.publisher.start()
+        await asyncio.sleep(0.01)
+
+        garage, carport = self.lb.get_charge_point("garage"), self.lb.get_charge_point("carport")
+        assert garage is not None and carport is not None
+        self.assertEqual(ChargeMode.MAX, garage.data.mode)
+        self.assertEqual(ChargeMode.PV_ONLY, carport.data.mode)
+
+    def test_restore_wallbox_modes(self):
+        self.publisher._apply_controller_state({"controller": {}, "wallboxes": {"garage": {"mode": "PV_ONLY"}, "unknown": {"mode": "MAX"}}})
+        garage = self.lb.get_charge_point("garage")
+        assert garage is not None
+        self.assertEqual(ChargeMode.PV_ONLY, garage.data.mode)
+
+
+@final
+class MqttPublisherTariffTest(unittest.IsolatedAsyncioTestCase):
+    """Tariff state, entities and schedule topic."""
+
+    @override
+    def setUp(self):
+        self.config = MqttConfig(broker="testhost", port=1883)
+        self.mock_controller = MagicMock()
+        self.mock_controller.get_data.return_value = ChargeControllerData()
+        meter = MagicMock()
+        meter.get_data.return_value = MeterData()
+        wallbox = MagicMock()
+        wallbox.get_data.return_value = WallboxData()
+        relay = MagicMock()
+        relay.get_data.return_value = PhaseRelayData()
+        car = MagicMock()
+        car.get_data.return_value = CarData()
+        now = datetime.now().replace(minute=0, second=0, microsecond=0)
+        self.prices = SimulatedPriceProvider(PriceProviderConfig())
+        self.prices.set_prices(
+            [PriceSlot(now, now + timedelta(hours=1), 30), PriceSlot(now + timedelta(hours=1), now + timedelta(hours=2), 10)]
+        )
+        self.grid_start = now + timedelta(hours=1)
+        self.plan = TariffPlanData(
+            departure=now + timedelta(hours=2),
+            energy_grid=5000,
+            cost=50,
+            slots=(
+                TariffPlanSlot(now, now + timedelta(hours=1), 30),
+                TariffPlanSlot(self.grid_start, now + timedelta(hours=2), 10, ChargeMode.MAX, power_charging=5000, power_grid=5000),
+            ),
+        )
+        self.mock_controller.get_tariff_plan.return_value = self.plan
+        self.publisher = MqttPublisher(
+            self.config,
+            "1.0.0",
+            controller=self.mock_controller,
+            meter=meter,
+            wallbox=wallbox,
+            relay=relay,
+            car=car,
+            price_provider=self.prices,
+        )
+        self.publisher._state_restore_timeout_s = 0  # skip wait in tests
+
+    def _mock_client(self, mock_client_cls: Any) -> AsyncMock:
+        mock_client = AsyncMock()
+        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
+        mock_client.__aexit__ = AsyncMock(return_value=None)
+        mock_client.publish = AsyncMock()
+        mock_client.subscribe = AsyncMock()
+        mock_client_cls.return_value = mock_client
+        return mock_client
+
+    def _published(self, mock_client: AsyncMock) -> dict[str, Any]:
+        return {c.args[0]: json.loads(c.kwargs["payload"]) for c in mock_client.publish.call_args_list}
+
+    @patch("pvcontrol.mqtt.aiomqtt.Client")
+    async def test_discovery(self, mock_client_cls: Any):
+        mock_client = self._mock_client(mock_client_cls)
+        await self.publisher.start()
+        self.assertEqual(1 + len(ENTITY_DEFINITIONS) + len(TARIFF_ENTITY_DEFINITIONS), mock_client.publish.call_count)
+        topics = [c.args[0] for c in mock_client.publish.call_args_list]
+        self.assertIn("homeassistant/sensor/pvcontrol_tariff_price/config", topics)
+
+    @patch("pvcontrol.mqtt.aiomqtt.Client")
+    async def test_publish_state_and_schedule(self, mock_client_cls: Any):
+        mock_client = self._mock_client(mock_client_cls)
+        await self.publisher.start()
+        mock_client.publish.reset_mock()
+
+        await self.publisher.publish_state()
+
+        published = self._published(mock_client)
+        tariff = published["pvcontrol/state"]["tariff"]
+        self.assertEqual(30, tariff["price"])
+        self.assertEqual(self.grid_start, datetime.fromisoformat(tariff["next_grid_charging"]).replace(tzinfo=None))
+        self.assertEqual(5000, tariff["energy_grid"])
+        self.assertEqual(50, tariff["cost"])
+        schedule = published["pvcontrol/tariff/schedule"]
+        self.assertEqual(["PV_ONLY", "MAX"], [s["mode"] for s in schedule["slots"]])
+        self.assertEqual([30, 10], [s["price"] for s in schedule["slots"]])
+        self.assertTrue(mock_client.publish.call_args_list[-1].kwargs["retain"])
+
+        # unchanged schedule is not published again
+        mock_client.publish.reset_mock()
+        await self.publisher.publish_state()
+        self.assertEqual(["pvcontrol/state"], list(self._published(mock_client)))
+        self.mock_controller.get_tariff_plan.return_value = self.plan.replace(slots=self.plan.slots[1:])
+        await self.publisher.publish_state()
+        self.assertEqual(1, len(self._published(mock_client)["pvcontrol/tariff/schedule"]["slots"]))
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+import unittest
+from typing import final, override
+
+from prometheus_client import REGISTRY
+
+from pvcontrol.meter import SolarWattMeter, SolarWattMeterConfig
+from pvcontrol.offload import Offloader, offload, shutdown_offloader, start_offloader
+
+# pyright: reportPrivateUsage=false
+
+solarwatt_file = f"{os.path.dirname(__file__)}/solarwatt-devices.json"
+
+
+@final
+class OffloaderTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    async def asyncSetUp(self) -> None:
+        self.offloader = Offloader(max_workers=1, max_pending=2, threshold=100)
+
+    @override
+    async def asyncTearDown(self) -> None:
+        self.offloader.shutdown()
+
+    async def test_inline(self):
+        thread = await self.offloader.run("test", 99, lambda: threading.current_thread().name)
+        self.assertEqual(threading.current_thread().name, thread)
+
+    async def test_offloaded(self):
+        count = REGISTRY.get_sample_value("pvcontrol_offload_queue_seconds_count", {"name": "test"}) or 0
+        thread = await self.offloader.run("test", 100, lambda: threading.current_thread().name)
+        self.assertTrue(thread.startswith("pvcontrol-offload"))
+        self.assertEqual(count + 1, REGISTRY.get_sample_value("pvcontrol_offload_queue_seconds_count", {"name": "test"}))
+
+    async def test_exception(self):
+        def fail() -> None:
+            raise ValueError("bad payload")
+
+        with self.assertRaises(ValueError):
+            await self.offloader.run("test", 100, fail)
+
+    async def test_bounded(self):
+        running = 0
+        max_running = 0
+        lock = threading.Lock()
+
+        def job() -> None:
+            nonlocal running, max_running
+            with lock:
+                running += 1
+                max_running = max(max_running, running)
+            time.sleep(0.01)
+            with lock:
+                running -= 1
+
+        await asyncio.gather(*(self.offloader.run("test", 1000, job) for _ in range(6)))
+        self.assertEqual(1, max_running)
+        self.assertEqual(2, self.offloader._pending._value)
+
+    async def test_shared_offloader(self):
+        # not started: inline
+        thread = await offload("test", 1 << 20, lambda: threading.current_thread().name)
+        self.assertEqual(threading.current_thread().name, thread)
+        start_offloader()
+        try:
+            thread = await offload("test", 1 << 20, lambda: threading.current_thread().name)
+            self.assertTrue(thread.startswith("pvcontrol-offload"))
+        finally:
+            shutdown_offloader()
+        thread = await offload("test", 1 << 20, lambda: threading.current_thread().name)
+        self.assertEqual(threading.current_thread().name, thread)
+
+
+@unittest.skipUnless(os.environ.get("PVCONTROL_BENCHMARK"), "set PVCONTROL_BENCHMARK=1 to run benchmarks")
+@final
+class OffloaderBenchmark(unittest.IsolatedAsyncioTestCase):
+    """API tail latency (simulated by a 1ms ticker on the event loop) while the meter parses a 100KB SolarWatt payload."""
+
+    @override
+    async def asyncSetUp(self) -> None:
+        with open(solarwatt_file, "rb") as f:
+            self.body = f.read()
+        self.meter = SolarWattMeter(SolarWattMeterConfig(location_guid="a7460c34-1f6b-45dc-a909-7341753f9802"))
+
+    @override
+    async def asyncTearDown(self) -> None:
+        await self.meter.close()
+
+    async def measure(self, offloader: Offloader) -> list[float]:
+        latencies: list[float] = []
+        done = False
+
+        async def api_requests():
+            while not done:
+                t = time.perf_counter()
+                await asyncio.sleep(0.001)
+                latencies.append(time.perf_counter() - t - 0.001)
+
+        ticker = asyncio.create_task(api_requests())
+        for _ in range(100):
+            await offloader.run("benchmark", len(self.body), lambda: self.meter._json_2_meter_data(json.loads(self.body)))
+            await asyncio.sleep(0.005)
+        done = True
+        await ticker
+        offloader.shutdown()
+        return latencies
+
+    async def test_api_latency(self):
+        inline = await self.measure(Offloader(threshold=len(self.body) + 1))
+        offloaded = await self.measure(Offloader(threshold=len(self.body)))
+        for name, latencies in [("inline", inline), ("offloaded", offloaded)]:
+            q = statistics.quantiles(latencies, n=100)
+            print(f"{name:10s}: p50={q[49] * 1000:.2f}ms, p99={q[98] * 1000:.2f}ms, max={max(latencies) * 1000:.2f}ms")
@@ -0,0 +1,123 @@
+import unittest
+from datetime import datetime, timedelta
+from typing import Any, final, override
+
+from pvcontrol.chargecontroller import ChargeMode
+from pvcontrol.planner import ChargePlanner, TariffPlanner
+from pvcontrol.tariff import PriceSlot
+
+
+@final
+class ChargePlannerTest(unittest.TestCase):
+    @override
+    def setUp(self) -> None:
+        self.pv: dict[int, float] = {}  # hour -> PV surplus
+        self.planner = ChargePlanner(lambda t: self.pv.get(t.hour, 0), 15 * 60)
+        self.now = datetime(2024, 6, 1, 8, 0)
+
+    def plan(self, energy_needed: float, hours: float = 12) -> list[Any]:
+        return self.planner.plan(self.now, self.now + timedelta(hours=hours), energy_needed, 1380, 11040, 500)
+
+    def test_slots(self):
+        slots = self.planner.plan(self.now + timedelta(minutes=10), self.now + timedelta(hours=1, minutes=5), 0, 1380, 11040, 500)
+        self.assertEqual(5, len(slots))
+        self.assertEqual(self.now + timedelta(minutes=10), slots[0].start)
+        self.assertEqual(self.now + timedelta(minutes=15), slots[0].end)
+        self.assertEqual(self.now + timedelta(hours=1, minutes=5), slots[-1].end)
+        self.assertTrue(all(s.mode == ChargeMode.PV_ONLY for s in slots))
+
+    def test_no_pv(self):
+        slots = self.plan(11040)  # 1h MAX
+        self.assertEqual([ChargeMode.MAX] * 4, [s.mode for s in slots[-4:]])
+        self.assertTrue(all(s.mode == ChargeMode.PV_ONLY for s in slots[:-4]))
+        self.assertEqual(11040, sum(s.power_grid * s.hours() for s in slots))
+
+    def test_pv_preferred(self):
+        # 2h of 3kW PV surplus at 10:00, 2h of 1kW at 12:00
+        self.pv = {10: 3000, 11: 3000, 12: 1000, 13: 1000}
+        # PV_ONLY is sufficient
+        slots = self.plan(5000)
+        self.assertTrue(all(s.mode == ChargeMode.PV_ONLY for s in slots))
+        self.assertEqual(6000, sum(s.power_charging * s.hours() for s in slots))
+        # PV_ALL when 1kW PV is available (less grid energy than MAX), later slots preferred
+        slots = self.plan(8000)
+        self.assertEqual([ChargeMode.PV_ONLY] * 2 + [ChargeMode.PV_ALL] * 6, [s.mode for s in slots[16:24]])
+        self.assertTrue(all(s.mode == ChargeMode.PV_ONLY for s in slots[:16] + slots[24:]))
+        self.assertAlmostEqual(6 * 380 / 4, sum(s.power_grid * s.hours() for s in slots))
+        # MAX needed in addition
+        slots = self.plan(20000)
+        self.assertIn(ChargeMode.MAX, [s.mode for s in slots])
+        self.assertGreaterEqual(sum(s.power_charging * s.hours() for s in slots), 20000)
+
+
+def _hourly_prices(start: datetime, prices: list[float]) -> tuple[PriceSlot, ...]:
+    return tuple(PriceSlot(start + timedelta(hours=i), start + timedelta(hours=i + 1), p) for i, p in enumerate(prices))
+
+
+@final
+class TariffPlannerTest(unittest.TestCase):
+    @override
+    def setUp(self) -> None:
+        self.pv: dict[int, float] = {}  # hour -> PV surplus
+        self.planner = TariffPlanner(lambda t: self.pv.get(t.hour, 0), 15 * 60)
+        self.now = datetime(2024, 6, 1, 22, 0)
+        self.departure = datetime(2024, 6, 2, 7, 0)
+        # 22:00 - 07:00
+        self.prices = _hourly_prices(self.now, [30, 25, 20, 10, 12, 15, 18, 22, 28])
+        self.assertTrue(self.planner.update_prices(self.prices))
+
+    def plan(self, energy_needed: float, now: datetime | None = None, max_price: float = 0):
+        return self.planner.plan(now or self.now, self.departure, energy_needed, 1380, 11040, max_price)
+
+    def test_update_prices(self):
+        self.assertFalse(self.planner.update_prices(self.prices))
+        self.assertTrue(self.planner.update_prices(_hourly_prices(self.now, [10])))
+        self.assertEqual(1, len(self.plan(0)))
+
+    def test_cheapest_slots(self):
+        slots = self.plan(15000)
+        self.assertEqual(9, len(slots))
+        self.assertEqual([s.start for s in slots], [p.start for p in self.prices])
+        grid = [s.start.hour for s in slots if s.mode == ChargeMode.MAX]
+        self.assertEqual([1, 2], grid)
+        self.assertEqual(11040, slots[3].power_charging)
+        self.assertAlmostEqual(15000 - 11040, slots[4].power_grid)  # last slot partially
+        self.assertEqual(15000, sum(s.power_grid * s.hours() for s in slots))
+        self.assertTrue(all(s.mode == ChargeMode.PV_ONLY and s.power_charging == 0 for s in slots if s.start.hour not in grid))
+        self.assertEqual([], [s for s in self.plan(0) if s.mode == ChargeMode.MAX])
+
+    def test_current_slot(self):
+        now = datetime(2024, 6, 2, 1, 30)
+        slots = self.plan(17000, now)
+        self.assertEqual(now, slots[0].start)
+        self.assertEqual(0.5, slots[0].hours())
+        # 01:30 - 02:00 (10), 02:00 - 03:00 (12), 03:00 - 04:00 (15)
+        self.assertEqual([1, 2, 3], [s.start.hour for s in slots if s.mode == ChargeMode.MAX])
+
+    def test_max_price(self):
+        slots = self.plan(30000, max_price=12)
+        self.assertEqual([1, 2], [s.start.hour for s in slots if s.mode == ChargeMode.MAX])
+        self.assertAlmostEqual(2 * 11040, sum(s.power_grid * s.hours() for s in slots))
+
+    def test_pv_surplus(self):
+        # PV surplus in the morning covers part of the energy
+        self.pv = {5: 3000, 6: 6000}
+        slots = self.plan(9000 + 5000)
+        self.assertEqual(6000, slots[-1].power_charging)
+        self.assertEqual(0, slots[-1].power_grid)
+        self.assertEqual([1], [s.start.hour for s in slots if s.mode == ChargeMode.MAX])
+        self.assertAlmostEqual(5000, slots[3].power_grid)
+        # cheap slot with PV surplus: only the difference comes from grid
+        self.pv = {1: 3000}
+        slots = self.plan(11040)
+        self.assertEqual(11040, slots[3].power_charging)
+        self.assertEqual(11040 - 3000, slots[3].power_grid)
+
+    def test_no_prices(self):
+        self.planner.update_prices(())
+        self.assertEqual([], self.plan(10000))
+        # departure after last price slot
+        self.planner.update_prices(_hourly_prices(self.now, [30, 10]))
+        slots = self.plan(10000)
+        self.assertEqual(2, len(slots))
+        self.assertEqual(ChargeMode.MAX, slots[1].mode)
@@ -0,0 +1,55 @@
+import threading
+import time
+import unittest
+from collections import Counter
+from typing import final
+
+from pvcontrol.profiler import Profile, ProfilerBusyError, ProfilerConfig, SamplingProfiler
+
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@final
+class SamplingProfilerTest(unittest.TestCase):
+    def test_run(self):
+        stop = threading.Event()
+        t = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+        t.start()
+        try:
+            profile = SamplingProfiler(ProfilerConfig(interval=0.001)).run(0.2)
+        finally:
+            stop.set()
+            t.join()
+        self.assertGreater(profile.duration, 0.19)
+        busy = sum(c for stack, c in profile.samples.items() if stack[0] == "busy" and any("busy_loop" in f for f in stack))
+        self.assertGreater(busy, 10)
+        # own thread is not sampled
+        self.assertFalse(any("SamplingProfiler._sample" in f for stack in profile.samples for f in stack))
+
+    def test_max_seconds(self):
+        profile = SamplingProfiler(ProfilerConfig(max_seconds=0)).run(10)
+        self.assertLess(profile.duration, 0.1)
+
+    def test_busy(self):
+        profiler = SamplingProfiler(ProfilerConfig())
+        t = threading.Thread(target=profiler.run, args=(0.2,))
+        t.start()
+        time.sleep(0.05)
+        self.assertTrue(profiler.is_running())
+        with self.assertRaises(ProfilerBusyError):
+            profiler.run(0.1)
+        t.join()
+        self.assertFalse(profiler.is_running())
+
+    def test_formats(self):
+        profile = Profile(Counter({("main", "a", "b"): 3, ("main", "a"): 1}), 0.01, 0.04)
+        self.assertEqual("main;a;b 3\nmain;a 1\n", profile.collapsed())
+        s = profile.speedscope()
+        self.assertEqual([{"name": "main"}, {"name": "a"}, {"name": "b"}], s["shared"]["frames"])
+        p = s["profiles"][0]
+        self.assertEqual([[0, 1, 2], [0, 1]], p["samples"])
+        self.assertEqual([3, 1], p["weights"])
+        self.assertEqual(4, p["endValue"])
@@ -1,6 +1,8 @@
 import unittest
 from typing import final, override
 
+from pvcontrol.gpio import FakeGpio
+from pvcontrol.raspi_relay import RaspiPhaseRelay
 from pvcontrol.relay import DisabledPhaseRelay, PhaseRelayConfig, PhaseRelayData, PhaseRelayFactory, RelayType, SimulatedPhaseRelay
 
 # pyright: reportUninitializedInstanceVariable=false
@@ -37,6 +39,49 @@ class PhaseRelayTest(unittest.TestCase):
         self.assertEqual(PhaseRelayData(error=0, enabled=True, phase_relay=False, phases=1), self.relay.get_data())
 
 
+@final
+class RaspiPhaseRelayTest(unittest.TestCase):
+    @override
+    def setUp(self) -> None:
+        self.gpio = FakeGpio()
+        self.relay = RaspiPhaseRelay(PhaseRelayConfig(), self.gpio)
+
+    def test_init(self):
+        # relay off = GPIO HIGH
+        self.assertTrue(self.gpio.read(26))
+        self.assertEqual(PhaseRelayData(error=0, enabled=True, phase_relay=False, phases=1), self.relay.get_data())
+
+    def test_keep_state_on_restart(self):
+        self.relay.set_phases(3)
+        relay = RaspiPhaseRelay(PhaseRelayConfig(), self.gpio)
+        self.assertEqual(3, relay.get_phases())
+
+    def test_cached(self):
+        reads = self.gpio.read_count
+        for _ in range(10):
+            self.assertEqual(1, self.relay.get_phases())
+        self.assertEqual(reads, self.gpio.read_count)
+
+    def test_set_phases(self):
+        self.relay.set_phases(3)
+        self.assertFalse(self.gpio.read(26))
+        self.assertEqual(PhaseRelayData(error=0, enabled=True, phase_relay=True, phases=3), self.relay.get_data())
+        reads = self.gpio.read_count
+        self.assertEqual(3, self.relay.get_phases())
+        self.assertEqual(reads, self.gpio.read_count)
+
+    def test_edge_event(self):
+        self.gpio.set_level_externally(26, False)
+        self.assertEqual(3, self.relay.get_phases())
+        self.assertTrue(self.relay.get_data().phase_relay)
+
+    def test_verification_interval(self):
+        self.gpio._levels[26] = False  # change without edge event
+        self.assertEqual(1, self.relay.get_phases())
+        self.relay._verify_at = 0
+        self.assertEqual(3, self.relay.get_phases())
+
+
 class PhaseRelayFactoryTest(unittest.TestCase):
     def test_disabled(self):
         relay = PhaseRelayFactory.newPhaseRelay("", "pi1", enable_phase_switching=False)
@@ -49,3 +94,8 @@ class PhaseRelayFactoryTest(unittest.TestCase):
     def test_enabled(self):
         relay = PhaseRelayFactory.newPhaseRelay("SimulatedPhaseRelay", "pi1", enable_phase_switching=True, installed_on_host="pi1")
         self.assertIsInstance(relay, SimulatedPhaseRelay)
+
+    def test_raspi_fake_gpio(self):
+        relay = PhaseRelayFactory.newPhaseRelay("RaspiPhaseRelay", "pi1", gpio_backend="fake")
+        self.assertIsInstance(relay, RaspiPhaseRelay)
+        self.assertEqual(1, relay.get_phases())
@@ -3,7 +3,7 @@ import time
 import unittest
 from typing import final, override
 
-from pvcontrol.scheduler import AsyncScheduler, Scheduler
+from pvcontrol.scheduler import AdaptiveAsyncScheduler, AsyncScheduler, Scheduler
 
 # pyright: reportUninitializedInstanceVariable=false
 # pyright: reportPrivateUsage=false
@@ -65,3 +65,39 @@ class AsyncSchedulerTest(unittest.IsolatedAsyncioTestCase):
 
         await asyncio.sleep(0.3)
         self.assertLessEqual(self.task.call_cnt, 11)
+
+
+@final
+class AdaptiveAsyncSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    def setUp(self):
+        self.task = Task()
+        self.interval = 0.1
+        self.scheduler = AdaptiveAsyncScheduler(lambda: self.interval, self.task.async_fnc)
+
+    async def test_scheduling(self):
+        await self.scheduler.start()
+        self.assertTrue(self.scheduler.is_started())
+        await asyncio.sleep(0.55)
+        self.assertGreaterEqual(self.task.call_cnt, 5)
+        self.assertLessEqual(self.task.call_cnt, 7)
+
+        # longer interval takes effect after next run
+        self.interval = 10
+        await asyncio.sleep(0.15)
+        cnt = self.task.call_cnt
+        await asyncio.sleep(0.3)
+        self.assertEqual(cnt, self.task.call_cnt)
+
+        await self.scheduler.stop()
+        self.assertFalse(self.scheduler.is_started())
+
+    async def test_trigger(self):
+        self.interval = 10
+        await self.scheduler.start()
+        await asyncio.sleep(0.05)
+        self.assertEqual(1, self.task.call_cnt)
+        self.scheduler.trigger()
+        await asyncio.sleep(0.05)
+        self.assertEqual(2, self.task.call_cnt)
+        await self.scheduler.stop()
@@ -0,0 +1,96 @@
+import dataclasses
+import math
+import os
+import time
+import tracemalloc
+import unittest
+from collections import deque
+from collections.abc import Callable
+from typing import final
+
+from pvcontrol.chargecontroller import ChargeControllerData, ChargeMode
+from pvcontrol.meter import MeterData
+from pvcontrol.service import BaseData
+from pvcontrol.wallbox import CarStatus, WallboxData
+
+# pyright: reportPrivateUsage=false
+
+
+@final
+class BaseDataTest(unittest.TestCase):
+    def test_immutable(self):
+        m = MeterData(power_pv=1000)
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            m.power_pv = 2000  # ty:ignore[invalid-assignment]
+        self.assertFalse(hasattr(m, "__dict__"))
+
+    def test_replace(self):
+        wb = WallboxData(car_status=CarStatus.Charging, max_current=10)
+        wb2 = wb.replace(max_current=12)
+        self.assertEqual(10, wb.max_current)
+        self.assertEqual(12, wb2.max_current)
+        self.assertEqual(CarStatus.Charging, wb2.car_status)
+        self.assertIsInstance(wb2, WallboxData)
+        self.assertEqual(dataclasses.replace(wb, max_current=12), wb2)
+        with self.assertRaises(AttributeError):
+            wb.replace(unknown=1)
+
+    def test_values(self):
+        c = ChargeControllerData(mode=ChargeMode.PV_ONLY)
+        self.assertEqual(dataclasses.astuple(c), c.values())
+        self.assertEqual((3,), BaseData(error=3).values())
+
+    def test_field_names(self):
+        self.assertEqual(("error",), BaseData.field_names())
+        self.assertEqual(
+            ("error", "mode", "desired_mode", "phase_mode", "priority", "desired_priority", "phase_switch"),
+            ChargeControllerData.field_names(),
+        )
+
+    def test_as_dict(self):
+        c = ChargeControllerData(mode=ChargeMode.PV_ONLY)
+        self.assertEqual(dataclasses.asdict(c), c.as_dict())
+
+    def test_meter_data_eq(self):
+        self.assertEqual(MeterData(power_pv=1000), MeterData(power_pv=1000.001))
+        self.assertNotEqual(MeterData(power_pv=1000), MeterData(power_pv=1000.1))
+        self.assertEqual(hash(MeterData(power_pv=1000)), hash(MeterData(power_pv=1000.001)))
+
+
+@unittest.skipUnless(os.environ.get("PVCONTROL_BENCHMARK"), "set PVCONTROL_BENCHMARK=1 to run benchmarks")
+@final
+class BaseDataBenchmark(unittest.TestCase):
+    history_size = 24 * 60 * 2  # one day of 30s cycles
+
+    def test_history_buffer_memory(self):
+        history: deque[MeterData] = deque(maxlen=self.history_size)
+        tracemalloc.start()
+        start = tracemalloc.take_snapshot()
+        for i in range(self.history_size):
+            history.append(MeterData(power_pv=i, power_consumption=i, power_grid=-i, energy_consumption=i))
+        size = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(start, "filename"))
+        tracemalloc.stop()
+        print(f"MeterData history: {self.history_size} records, {size / 1024:.0f} KiB, {size / self.history_size:.0f} bytes/record")
+
+    def test_eq_and_replace(self):
+        m1 = MeterData(power_pv=1000, power_grid=-500)
+        m2 = m1.replace(power_grid=-500.001)
+        m3 = m1.replace()
+        n = 100_000
+
+        def us(f: Callable[[], object]) -> float:
+            t = time.perf_counter()
+            for _ in range(n):
+                f()
+            return (time.perf_counter() - t) / n * 1e6
+
+        def isclose_eq() -> bool:  # field by field with math.isclose()
+            return all(math.isclose(getattr(m1, f), getattr(m2, f), abs_tol=0.01) for f in MeterData.field_names())
+
+        t_eq, t_eq_exact, t_eq_isclose = us(lambda: m1 == m2), us(lambda: m1 == m3), us(isclose_eq)
+        t_replace, t_dc_replace = us(lambda: m1.replace(power_pv=1001)), us(lambda: dataclasses.replace(m1, power_pv=1001))
+        print(f"MeterData eq: {t_eq:.2f}us (exact: {t_eq_exact:.2f}us), isclose per field: {t_eq_isclose:.2f}us")
+        print(f"MeterData replace: {t_replace:.2f}us, dataclasses.replace: {t_dc_replace:.2f}us")
+        # wall-clock timings vary on loaded machines, only catch order of magnitude regressions
+        self.assertLess(t_eq_exact, 10 * t_eq_isclose)
+        self.assertLess(t_replace, 10 * t_dc_replace)
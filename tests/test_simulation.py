@@ -0,0 +1,141 @@
+import os
+import unittest
+from collections.abc import Sequence
+from datetime import date, datetime, timedelta
+from typing import final, override
+
+from pvcontrol.chargecontroller import ChargeControllerConfig
+from pvcontrol.meter import TestMeterConfig
+from pvcontrol.simulation import PowerSample, benchmark, simulate, synthetic_day, synthetic_days
+from pvcontrol.strategy import ChargeStrategy, StrategyInput, get_strategies, new_strategy, register_strategy
+
+
+@register_strategy("test_min_current")
+class MinCurrentStrategy(ChargeStrategy):
+    """Charges with min current whenever there is PV power, used as custom strategy in tests."""
+
+    @override
+    def phase_thresholds(self) -> tuple[float, float]:
+        return 1e9, 1e9  # always 1 phase
+
+    @override
+    def charging_current(self, s: StrategyInput) -> int:
+        return self.min_current if s.meter.power_pv > 0 else 0
+
+
+class MaxCurrentStrategy(MinCurrentStrategy):
+    """Not registered, used as custom strategy configured by module and class name."""
+
+    @override
+    def charging_current(self, s: StrategyInput) -> int:
+        return self.max_current
+
+
+@final
+class StrategyRegistryTest(unittest.TestCase):
+    def test_registry(self):
+        names = get_strategies()
+        for name in ["pv_all", "pv_only", "pv_only_smoothed", "test_min_current"]:
+            self.assertIn(name, names)
+        s = new_strategy("test_min_current", ChargeControllerConfig(), 6, 16)
+        self.assertIsInstance(s, MinCurrentStrategy)
+        self.assertEqual((6, 16), (s.min_current, s.max_current))
+
+    def test_custom_strategy_by_module(self):
+        s = new_strategy(f"{__name__}:MaxCurrentStrategy", ChargeControllerConfig(), 6, 16)
+        self.assertIsInstance(s, MaxCurrentStrategy)
+        self.assertNotIn(f"{__name__}:MaxCurrentStrategy", get_strategies())
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            new_strategy("unknown", ChargeControllerConfig(), 6, 16)
+        with self.assertRaises(ValueError):
+            new_strategy(f"{__name__}:PowerSample", ChargeControllerConfig(), 6, 16)
+        with self.assertRaises(ValueError):
+            new_strategy(f"{__name__}:Unknown", ChargeControllerConfig(), 6, 16)
+
+    def test_incomplete_strategy(self):
+        class IncompleteStrategy(ChargeStrategy):
+            @override
+            def phase_thresholds(self) -> tuple[float, float]:
+                return 0, 0
+
+        with self.assertRaisesRegex(ValueError, "charging_current"):
+            register_strategy("test_incomplete")(IncompleteStrategy)
+        self.assertNotIn("test_incomplete", get_strategies())
+        with self.assertRaises(ValueError):
+            new_strategy(f"{__name__}:ChargeStrategy", ChargeControllerConfig(), 6, 16)
+
+
+def _samples(pvs: Sequence[float], home: float = 400) -> list[PowerSample]:
+    t = datetime(2024, 6, 1, 12, 0)
+    return [PowerSample(t + timedelta(seconds=30 * i), pv, home) for i, pv in enumerate(pvs)]
+
+
+@final
+class SimulationTest(unittest.IsolatedAsyncioTestCase):
+    async def test_simulate_pv_only(self):
+        config = ChargeControllerConfig(pv_allow_charging_delay=0)
+        score = await simulate("pv_only", _samples([3000] * 10), config=config)
+        self.assertEqual("pv_only", score.strategy)
+        # 1 phase, 11A = 2530W of 2600W surplus from 2nd cycle on
+        self.assertAlmostEqual(9 * 2530 / 120, score.energy_pv)
+        self.assertEqual(0, score.energy_grid)
+        self.assertAlmostEqual(2600 / 120 + 9 * 70 / 120, score.energy_unused)
+        self.assertEqual((1, 0), (score.switches, score.phase_switches))
+
+    async def test_simulate_pv_all_uses_grid(self):
+        config = ChargeControllerConfig(pv_allow_charging_delay=0)
+        score = await simulate("pv_all", _samples([1200] * 5), config)
+        self.assertGreater(score.energy_grid, 0)
+        self.assertEqual(0, score.energy_unused - 800 / 120)  # only 1st cycle
+
+    async def test_smoothed_strategy_avoids_flapping(self):
+        # short sunny periods between clouds
+        pvs = [3000 if i % 4 == 0 else 1000 for i in range(60)]
+        config = ChargeControllerConfig(pv_allow_charging_delay=0, strategy_history=4)
+        scores = {s.strategy: s for s in await benchmark(_samples(pvs), config=config, strategies=["pv_only", "pv_only_smoothed"])}
+        self.assertGreater(scores["pv_only"].switches, 10)
+        self.assertLess(scores["pv_only_smoothed"].switches, scores["pv_only"].switches)
+        self.assertLess(scores["pv_only_smoothed"].energy_grid, scores["pv_only"].energy_grid)
+
+    async def test_benchmark_sorted_by_score(self):
+        samples = synthetic_day(date(2024, 6, 1), 5000, clouds=0.2, cycle_time=300)
+        self.assertEqual(samples, synthetic_day(date(2024, 6, 1), 5000, clouds=0.2, cycle_time=300))
+        scores = await benchmark(samples, strategies=["pv_only", "pv_all", "test_min_current"])
+        self.assertEqual(3, len(scores))
+        self.assertEqual(sorted((s.score() for s in scores), reverse=True), [s.score() for s in scores])
+
+    async def test_battery_priority_optimizer(self):
+        # cloudy days: car charging by soc threshold leaves the home battery half empty at sunset
+        samples = synthetic_days(date(2024, 6, 1), 4, 4000, [0.8], cycle_time=300, home_power=500)
+        meter_config = TestMeterConfig(battery_max=5000, battery_capacity=10000)
+        threshold = await simulate("pv_only", samples, ChargeControllerConfig(), meter_config=meter_config)
+        optimized = await simulate("pv_only", samples, ChargeControllerConfig(battery_capacity=10000), meter_config=meter_config)
+        self.assertGreater(optimized.battery_soc_sunset, threshold.battery_soc_sunset + 5)
+        self.assertGreater(optimized.energy_pv, 0)
+
+
+@unittest.skipUnless(os.environ.get("PVCONTROL_BENCHMARK"), "set PVCONTROL_BENCHMARK=1 to run benchmarks")
+@final
+class StrategyBenchmark(unittest.IsolatedAsyncioTestCase):
+    async def test_strategies(self):
+        """Scores of all registered strategies on a clear, a partly cloudy and a cloudy day."""
+        for clouds in [0, 0.3, 0.8]:
+            samples = synthetic_day(date(2024, 6, 1), 7000, clouds=clouds, seed=1)
+            print(f"clouds={clouds}:")
+            for s in await benchmark(samples):
+                print(
+                    f"  {s.strategy:20} score={s.score():6.0f}Wh pv={s.energy_pv:6.0f}Wh grid={s.energy_grid:6.0f}Wh "
+                    f"unused={s.energy_unused:6.0f}Wh switches={s.switches:3} phase_switches={s.phase_switches:2}"
+                )
+
+    async def test_battery_priority(self):
+        """Home battery SOC at sunset and car PV energy with priority AUTO by soc threshold vs by battery priority optimizer."""
+        meter_config = TestMeterConfig(battery_max=5000, battery_capacity=10000)
+        for peak_power, clouds in [(8000, [0, 0.3]), (5000, [0.5, 0.8]), (4000, [0.8])]:
+            samples = synthetic_days(date(2024, 6, 1), 7, peak_power, clouds, home_power=500)
+            print(f"peak_power={peak_power} clouds={clouds}:")
+            for name, capacity in [("soc threshold", 0), ("optimizer", 10000)]:
+                s = await simulate("pv_only", samples, ChargeControllerConfig(battery_capacity=capacity), meter_config=meter_config)
+                print(f"  {name:14} soc_sunset={s.battery_soc_sunset:5.1f}% pv={s.energy_pv:6.0f}Wh grid={s.energy_grid:6.0f}Wh")
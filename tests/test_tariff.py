@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from typing import final, override
+
+from pvcontrol.tariff import (
+    FilePriceProvider,
+    FilePriceProviderConfig,
+    PriceProviderConfig,
+    PriceProviderFactory,
+    PriceSlot,
+    SimulatedPriceProvider,
+    parse_prices,
+)
+
+
+@final
+class ParsePricesTest(unittest.TestCase):
+    def test_parse(self):
+        prices = parse_prices(
+            [
+                {"start": "2024-06-01T01:00:00", "price": 20},
+                {"start": "2024-06-01T00:00:00", "price": 25.5},
+                {"start": "2024-06-01T03:00:00", "end": "2024-06-01T03:15:00", "price": 10},
+            ],
+            3600,
+        )
+        day = datetime(2024, 6, 1)
+        self.assertEqual(
+            (
+                PriceSlot(day, day + timedelta(hours=1), 25.5),
+                PriceSlot(day + timedelta(hours=1), day + timedelta(hours=3), 20),
+                PriceSlot(day + timedelta(hours=3), day + timedelta(hours=3, minutes=15), 10),
+            ),
+            prices,
+        )
+        self.assertEqual((), parse_prices([], 3600))
+
+
+@final
+class SimulatedPriceProviderTest(unittest.IsolatedAsyncioTestCase):
+    async def test_price(self):
+        provider = SimulatedPriceProvider(PriceProviderConfig())
+        t = datetime(2024, 6, 1, 12, 0)
+        self.assertIsNone(provider.price(t))
+        provider.set_prices([PriceSlot(t, t + timedelta(hours=1), 30), PriceSlot(t + timedelta(hours=1), t + timedelta(hours=2), 20)])
+        self.assertEqual(30, provider.price(t))
+        self.assertEqual(30, provider.price(t + timedelta(minutes=59)))
+        self.assertEqual(20, provider.price(t + timedelta(hours=1)))
+        self.assertIsNone(provider.price(t - timedelta(seconds=1)))
+        self.assertIsNone(provider.price(t + timedelta(hours=2)))
+        # prices are kept on read
+        prices = provider.get_data().prices
+        self.assertIs(prices, (await provider.read_data()).prices)
+
+
+@final
+class FilePriceProviderTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    def setUp(self) -> None:
+        fd, self.file = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        self.provider = PriceProviderFactory.newPriceProvider("FilePriceProvider", file=self.file, slot_time=900)
+        self.provider.reset_error_counter()
+
+    @override
+    def tearDown(self) -> None:
+        os.remove(self.file)
+
+    def write(self, prices: list[float], mtime: float):
+        entries = [{"start": (datetime(2024, 6, 1) + timedelta(minutes=15 * i)).isoformat(), "price": p} for i, p in enumerate(prices)]
+        with open(self.file, "w") as f:
+            json.dump(entries, f)
+        os.utime(self.file, (mtime, mtime))
+
+    async def test_read(self):
+        self.assertIsInstance(self.provider, FilePriceProvider)
+        self.write([30, 20, 10], 1000)
+        d = await self.provider.read_data()
+        self.assertEqual(0, d.error)
+        self.assertEqual([30, 20, 10], [s.price for s in d.prices])
+        self.assertEqual(datetime(2024, 6, 1, 0, 45), d.prices[-1].end)
+        # unchanged file is not parsed again
+        self.assertIs(d, await self.provider.read_data())
+        self.write([5], 2000)
+        d = await self.provider.read_data()
+        self.assertEqual([5], [s.price for s in d.prices])
+
+    async def test_read_error_keeps_prices(self):
+        self.write([30, 20], 1000)
+        await self.provider.read_data()
+        with open(self.file, "w") as f:
+            f.write("invalid")
+        os.utime(self.file, (2000, 2000))
+        d = await self.provider.read_data()
+        self.assertEqual(1, d.error)
+        self.assertEqual([30, 20], [s.price for s in d.prices])
+        self.write([10], 3000)
+        d = await self.provider.read_data()
+        self.assertEqual(0, d.error)
+        self.assertEqual([10], [s.price for s in d.prices])
+
+    def test_factory(self):
+        self.assertIsInstance(PriceProviderFactory.newPriceProvider("SimulatedPriceProvider"), SimulatedPriceProvider)
+        self.assertEqual(
+            FilePriceProviderConfig(file="x"), PriceProviderFactory.newPriceProvider("FilePriceProvider", file="x").get_config()
+        )
+        with self.assertRaises(ValueError):
+            PriceProviderFactory.newPriceProvider("unknown")
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import time
+import unittest
+from datetime import datetime
+from typing import final, override
+
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+
+from pvcontrol.chargecontroller import ChargeController, ChargeControllerConfig, ChargeMode
+from pvcontrol.meter import TestMeter, TestMeterConfig
+from pvcontrol.relay import PhaseRelayConfig, SimulatedPhaseRelay
+from pvcontrol.timing import CycleTimer, span
+from pvcontrol.utils import aiohttp_trace_config
+from pvcontrol.wallbox import CarStatus, SimulatedWallbox, WallboxConfig
+
+# pyright: reportPrivateUsage=false
+
+
+@final
+class CycleTimerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_nested_spans(self):
+        timer = CycleTimer(10)
+        t = datetime(2024, 6, 1, 12, 0)
+        with timer.cycle(t):
+            with span("a"):
+                with span("b", "detail"):
+                    await asyncio.sleep(0.01)
+            with span("c"):
+                pass
+        cycles = timer.get_cycles(10)
+        self.assertEqual(1, len(cycles))
+        c = cycles[0]
+        self.assertEqual(t, c.time)
+        self.assertEqual(["a/b", "a", "c"], [s.stage for s in c.spans])
+        self.assertEqual("detail", c.spans[0].detail)
+        self.assertGreaterEqual(c.spans[0].duration, 0.01)
+        self.assertGreaterEqual(c.spans[1].duration, c.spans[0].duration)
+        self.assertGreaterEqual(c.duration, c.spans[1].duration)
+
+    async def test_concurrent_spans(self):
+        async def stage(name: str, delay: float):
+            with span(name):
+                await asyncio.sleep(delay)
+                with span("http"):
+                    await asyncio.sleep(delay)
+
+        timer = CycleTimer(10)
+        with timer.cycle(datetime(2024, 6, 1, 12, 0)):
+            with span("read"):
+                await asyncio.gather(stage("a", 0.01), stage("b", 0.005))
+        spans = timer.get_cycles(1)[0].spans
+        self.assertEqual(["read/b/http", "read/b", "read/a/http", "read/a", "read"], [s.stage for s in spans])
+
+    def test_no_cycle(self):
+        # no-op outside of a cycle
+        with span("a"):
+            pass
+
+    def test_exception(self):
+        timer = CycleTimer(10)
+        with self.assertRaises(ValueError), timer.cycle(datetime.now()), span("a"):
+            raise ValueError()
+        self.assertEqual(["a"], [s.stage for s in timer.get_cycles(1)[0].spans])
+
+    def test_history(self):
+        timer = CycleTimer(3)
+        for h in range(5):
+            with timer.cycle(datetime(2024, 6, 1, h)):
+                pass
+        self.assertEqual([4, 3, 2], [c.time.hour for c in timer.get_cycles(10)])
+        self.assertEqual([4], [c.time.hour for c in timer.get_cycles(1)])
+
+    async def test_http_span(self):
+        async def handler(_: web.Request) -> web.Response:
+            return web.Response(text="ok")
+
+        app = web.Application()
+        app.router.add_get("/status", handler)
+        timer = CycleTimer(10)
+        async with TestServer(app) as server, ClientSession(trace_configs=[aiohttp_trace_config]) as session:
+            with timer.cycle(datetime.now()), span("wallbox_read"):
+                async with session.get(server.make_url("/status")) as res:
+                    await res.text()
+        spans = timer.get_cycles(1)[0].spans
+        self.assertEqual(["wallbox_read/http", "wallbox_read"], [s.stage for s in spans])
+        self.assertEqual("GET 127.0.0.1/status - 200", spans[0].detail)
+
+    async def test_controller_stages(self):
+        wallbox = SimulatedWallbox(WallboxConfig())
+        controller = ChargeController(
+            ChargeControllerConfig(), TestMeter(TestMeterConfig(), wallbox), wallbox, SimulatedPhaseRelay(PhaseRelayConfig())
+        )
+        controller.set_desired_mode(ChargeMode.MAX)
+        wallbox.set_car_status(CarStatus.Charging)
+        await controller.run()  # switches to 3 phases
+        await controller.run()
+        stages = [s.stage for s in controller.get_cycle_timings(1)[0].spans]
+        for stage in ["wallbox_read", "meter_read", "energy", "plan", "mode", "phases", "charging", "charging/wallbox_cmd"]:
+            self.assertIn(stage, stages)
+
+
+@unittest.skipUnless(os.environ.get("PVCONTROL_BENCHMARK"), "set PVCONTROL_BENCHMARK=1 to run benchmarks")
+@final
+class CycleTimerBenchmark(unittest.IsolatedAsyncioTestCase):
+    @override
+    async def asyncSetUp(self) -> None:
+        self.wallbox = SimulatedWallbox(WallboxConfig())
+        self.controller = ChargeController(
+            ChargeControllerConfig(), TestMeter(TestMeterConfig(), self.wallbox), self.wallbox, SimulatedPhaseRelay(PhaseRelayConfig())
+        )
+        self.controller.set_desired_mode(ChargeMode.PV_ONLY)
+        self.wallbox.set_car_status(CarStatus.Charging)
+
+    def test_span_overhead(self):
+        timer = CycleTimer(100)
+        n = 100_000
+        with timer.cycle(datetime.now()):
+            t = time.perf_counter()
+            for _ in range(n):
+                with span("a"):
+                    pass
+            t_span = (time.perf_counter() - t) / n
+        # ~10 spans per cycle + a few http/modbus requests
+        overhead = 15 * t_span
+        # fastest real cycle: 2-3 requests to wallbox and meter in local network
+        cycle_duration = 0.05
+        print(
+            f"span: {t_span * 1e6:.2f}us, per cycle: {overhead * 1e6:.0f}us = {overhead / cycle_duration * 100:.2f}% of a {cycle_duration}s cycle"
+        )
+        self.assertLess(overhead, 0.01 * cycle_duration)
+
+    async def test_cycle_overhead(self):
+        """Controller run() with simulated devices (no I/O) -> relative overhead of spans is much higher than for a real cycle."""
+        n = 2000
+        t = time.perf_counter()
+        for _ in range(n):
+            await self.controller.run()
+        t_run = (time.perf_counter() - t) / n
+        spans = len(self.controller.get_cycle_timings(1)[0].spans)
+        print(f"run() with {spans} spans: {t_run * 1e6:.0f}us")
@@ -0,0 +1,185 @@
+import dataclasses
+import math
+import os
+import random
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from typing import final, override
+
+from pvcontrol.chargecontroller import (
+    ChargeController,
+    ChargeControllerConfig,
+    ChargeControllerData,
+    ChargeMode,
+    ControllerCycle,
+    PhaseMode,
+    PhaseSwitchState,
+    Priority,
+)
+from pvcontrol.meter import MeterData, TestMeter, TestMeterConfig
+from pvcontrol.relay import PhaseRelayConfig, SimulatedPhaseRelay
+from pvcontrol.trace import TraceConfig, TraceRecorder, TraceRing, decode_cycle, encode_cycle, replay
+from pvcontrol.wallbox import CarStatus, SimulatedWallbox, WallboxConfig, WallboxData, WbError
+
+# pyright: reportPrivateUsage=false
+
+
+def new_cycle(i: int = 0, **kwargs: object) -> ControllerCycle:
+    c = ControllerCycle(
+        time=datetime(2024, 6, 1, 12, 0) + timedelta(seconds=30 * i),
+        meter=MeterData(0, 5000, 1000, -4000, 0, 50, 1234.5, 234.5, 1000, -6.5, 1.5, 2),
+        wallbox=WallboxData(0, WbError.OK, CarStatus.Charging, 10, True, 3, 3, 6900, 1000, 100000, 20.5),
+        car_soc=55.5,
+        desired_mode=ChargeMode.PV_ONLY,
+        desired_priority=Priority.AUTO,
+        phase_mode=PhaseMode.AUTO,
+        pv_allow_charging_delay=60,
+        charge_mode_pv_to_off_delay=0,
+        data=ChargeControllerData(mode=ChargeMode.PV_ONLY, desired_mode=ChargeMode.PV_ONLY, phase_switch=PhaseSwitchState.SETTLE),
+        max_current=i % 17,
+        allow_charging=None,
+        phases_in=1,
+        resets=1,
+    )
+    return dataclasses.replace(c, **kwargs)  # pyright: ignore[reportArgumentType]
+
+
+@final
+class EncodingTest(unittest.TestCase):
+    def test_roundtrip(self):
+        c = new_cycle()
+        self.assertEqual(c, decode_cycle(encode_cycle(c)))
+
+    def test_roundtrip_none(self):
+        c = new_cycle(car_soc=None, max_current=None, allow_charging=False, phases_in=None, resets=0)
+        d = decode_cycle(encode_cycle(c))
+        self.assertEqual(c, d)
+        self.assertIsNone(d.car_soc)
+        self.assertIs(False, d.allow_charging)
+
+
+@final
+class TraceRingTest(unittest.TestCase):
+    @override
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "test.trace")
+
+    @override
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def test_wrap_around(self):
+        ring = TraceRing(self.path, 3, record_size=1)
+        for b in b"abcde":
+            ring.append(bytes([b]))
+        self.assertEqual(3, len(ring))
+        self.assertEqual([b"c", b"d", b"e"], ring.read_all())
+        ring.close()
+        self.assertLessEqual(os.path.getsize(self.path), 20 + 3)
+
+    def test_persistence(self):
+        ring = TraceRing(self.path, 3, record_size=1)
+        ring.append(b"a")
+        ring.append(b"b")
+        ring.close()
+        ring = TraceRing(self.path, 3, record_size=1)
+        self.assertEqual([b"a", b"b"], ring.read_all())
+        ring.append(b"c")
+        ring.append(b"d")
+        self.assertEqual([b"b", b"c", b"d"], ring.read_all())
+        ring.close()
+
+    def test_reinit_on_capacity_change(self):
+        ring = TraceRing(self.path, 3, record_size=1)
+        ring.append(b"a")
+        ring.close()
+        ring = TraceRing(self.path, 4, record_size=1)
+        self.assertEqual([], ring.read_all())
+        ring.close()
+
+    def test_readonly(self):
+        with self.assertRaises(FileNotFoundError):
+            TraceRing(self.path, readonly=True)
+        self.assertFalse(os.path.exists(self.path))
+        ring = TraceRing(self.path, 3, record_size=1)
+        for b in b"abcd":
+            ring.append(bytes([b]))
+        ring.close()
+        size = os.path.getsize(self.path)
+        # capacity from header, file is not modified
+        ring = TraceRing(self.path, record_size=1, readonly=True)
+        self.assertEqual([b"b", b"c", b"d"], ring.read_all())
+        ring.close()
+        self.assertEqual(size, os.path.getsize(self.path))
+        with self.assertRaises(ValueError):
+            TraceRing(self.path, record_size=2, readonly=True)
+        with open(self.path, "wb") as f:
+            f.write(b"no trace")
+        with self.assertRaises(ValueError):
+            TraceRing(self.path, readonly=True)
+        with open(self.path, "rb") as f:
+            self.assertEqual(b"no trace", f.read())
+
+    def test_recorder(self):
+        recorder = TraceRecorder(TraceConfig(file=self.path, capacity=10))
+        cycles = [new_cycle(i) for i in range(12)]
+        for c in cycles:
+            recorder._ring.append(encode_cycle(c))
+        self.assertEqual(cycles[2:], recorder.cycles())
+        recorder.close()
+
+
+@final
+class ReplayTest(unittest.IsolatedAsyncioTestCase):
+    @override
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "test.trace")
+
+    @override
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    async def record_session(self, config: ChargeControllerConfig) -> list[ControllerCycle]:
+        """Simulated PV day with clouds and user interactions, recorded into a trace file."""
+        relay = SimulatedPhaseRelay(PhaseRelayConfig())
+        wallbox = SimulatedWallbox(WallboxConfig())
+        meter = TestMeter(TestMeterConfig(), wallbox)
+        controller = ChargeController(config, meter, wallbox, relay)
+        now = datetime(2024, 6, 1, 8, 0)
+        controller._now = lambda: now
+        recorder = TraceRecorder(TraceConfig(file=self.path, capacity=2000))
+        controller.set_desired_mode(ChargeMode.PV_ONLY)
+        wallbox.set_car_status(CarStatus.Charging)
+        rnd = random.Random(7)
+        cloud = 0.0
+        for i in range(1000):
+            pv = 6000 + 2000 * math.sin(math.pi * i / 1000)
+            if rnd.random() < 0.1:
+                cloud = rnd.uniform(0, 0.7)
+            meter.set_data(pv * (1 - cloud), 500)
+            if i == 600:
+                controller.set_desired_mode(ChargeMode.MAX)
+            if i == 700:
+                controller.set_desired_mode(ChargeMode.PV_ALL)
+            await controller.run()
+            recorder.record(controller)
+            await wallbox.read_data()
+            now += timedelta(seconds=30)
+        cycles = recorder.cycles()
+        recorder.close()
+        return cycles
+
+    async def test_replay_same_config(self):
+        config = ChargeControllerConfig()
+        cycles = await self.record_session(config)
+        self.assertEqual(1000, len(cycles))
+        mismatches = await replay(cycles, config)
+        self.assertEqual([], mismatches)
+
+    async def test_replay_changed_config(self):
+        cycles = await self.record_session(ChargeControllerConfig())
+        mismatches = await replay(cycles, ChargeControllerConfig(pv_allow_charging_delay=300, phase_switch_energy_window=0))
+        self.assertGreater(len(mismatches), 0)